@@ -1,4 +1,7 @@
+#define _GNU_SOURCE
+#include <dlfcn.h>
 #include <stdio.h>
+#include <stdlib.h>
 #include <string.h>
 
 /*
@@ -10,12 +13,17 @@
  * Without this, gethostname() on SageMaker returns 'aws', leading OpenMPI to think there is only one processor,
  * screwing up rank initialization and who knows what else (OpenMPI calls gethostname() liberally).
  *
- * The framework training code calls change-hostname.sh, passing in the 'real' hostname ('algo-1', 'algo-2', etc) to
- * replace "PLACEHOLDER_HOSTNAME" before compiling this code into a shared library.
+ * This library is built once, when the image is built. The framework training code sets the 'real' hostname
+ * ('algo-1', 'algo-2', etc) in the SAGEMAKER_HOSTNAME environment variable, which processes started by mpirun inherit
+ * directly or through sshd. Without the variable, the system gethostname() is used.
  */
 int gethostname(char *name, size_t len)
 {
-  const char *val = "PLACEHOLDER_HOSTNAME";
+  const char *val = getenv("SAGEMAKER_HOSTNAME");
+  if (val == NULL || val[0] == '\0') {
+    int (*system_gethostname)(char *, size_t) = (int (*)(char *, size_t)) dlsym(RTLD_NEXT, "gethostname");
+    return system_gethostname(name, len);
+  }
   strncpy(name, val, len);
   return 0;
 }
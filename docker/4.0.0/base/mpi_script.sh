@@ -2,8 +2,9 @@
 # For distributed training: the 'master node' runs mpirun with this script, '/mpi_script.sh'
 # This script creates a file '/mpi_is_running' that worker nodes use to determine whether training (started by MPI from
 # the master node) is still running. Processes on worker nodes use /mpi_is_finished file to determine when to exit.
+# An optional argument names the module to run instead of chainer_framework.training, e.g. a benchmark.
 touch /mpi_is_running
-python -m mpi4py -m chainer_framework.training
+python -m mpi4py -m ${1:-chainer_framework.training}
 EXIT_CODE=$?
 touch /mpi_is_finished
 
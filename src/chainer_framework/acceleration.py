@@ -0,0 +1,273 @@
+"""CPU acceleration of training and inference with iDeep, Intel's MKL-DNN backend for Chainer.
+
+Chainer runs the functions that have an iDeep implementation, such as linear, convolution, ReLU, pooling and batch
+normalization, with iDeep when ``chainer.config.use_ideep`` is 'auto' and their inputs are float32 arrays of a
+supported shape. Links moved to iDeep arrays with ``Link.to_intel64`` don't convert their parameters on every call.
+
+Acceleration modes, set with the `cpu_acceleration` hyperparameter for training and the
+SAGEMAKER_CHAINER_CPU_ACCELERATION environment variable for serving:
+
+* 'auto' (the default): use iDeep if :func:`available`, and the plain NumPy implementations otherwise.
+* 'ideep': use iDeep, and warn if it isn't available.
+* 'none': never use iDeep.
+
+Acceleration only applies to CPU training and inference.
+
+Accelerating a model for serving copies its arrays in every serving worker. In 'auto' mode, models whose arrays are
+memory mappings, such as models preloaded and shared between the workers (see :mod:`chainer_framework.preload`) and
+memory-mapped model artifacts (see :mod:`chainer_framework.artifacts`), are not accelerated, so that the workers keep
+sharing them.
+"""
+import copy
+import json
+import logging
+import mmap
+from contextlib import contextmanager
+
+import chainer
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODES = ('auto', 'ideep', 'none')
+
+# Labels of the function nodes Chainer runs with iDeep, and the numbers of dimensions of their first input iDeep
+# supports.
+_IDEEP_FUNCTIONS = {'LinearFunction': (2, 4),
+                    'Convolution2DFunction': (4,),
+                    'Deconvolution2DFunction': (4,),
+                    'ReLU': (1, 2, 4),
+                    'LocalResponseNormalization': (4,),
+                    'MaxPooling2D': (4,),
+                    'AveragePooling2D': (4,),
+                    'BatchNormalization': (2, 4),
+                    'FixedBatchNormalization': (2, 4),
+                    'Dropout': (2, 4),
+                    'Concat': (2, 4)}
+
+_CPU_INFO_FILE = '/proc/cpuinfo'
+
+
+def _intel64():
+    try:
+        from chainer.backends import intel64
+    except ImportError:
+        # Chainer 3 and older
+        return None
+    return intel64
+
+
+def available():
+    """Returns whether a version of ideep4py that Chainer supports is installed, on a CPU that supports it.
+
+    MKL-DNN needs an x86-64 CPU with AVX2 or later. If the CPU flags can't be read, iDeep is trusted to be usable.
+
+    Returns:
+        bool: whether training and inference can be accelerated with iDeep.
+    """
+    intel64 = _intel64()
+    if intel64 is None or not intel64.is_ideep_available():
+        return False
+    try:
+        with open(_CPU_INFO_FILE) as f:
+            flags = [line.split(':', 1)[1].split() for line in f if line.startswith('flags')]
+    except (IOError, OSError):
+        return True
+    return not flags or 'avx2' in flags[0]
+
+
+def enabled(mode):
+    """Returns whether an acceleration mode uses iDeep on this instance.
+
+    Args:
+        mode (str): 'auto', 'ideep' or 'none', case-insensitive.
+
+    Returns:
+        bool: whether to use iDeep.
+    """
+    mode = str(mode).lower()
+    if mode not in MODES:
+        raise ValueError('the CPU acceleration mode must be one of {}, not {}'.format(', '.join(MODES), mode))
+    if mode == 'none':
+        return False
+    if chainer.cuda.available:
+        if mode == 'ideep':
+            logger.warning('iDeep is a CPU acceleration mode, running on the GPU without it')
+        return False
+    if not available():
+        if mode == 'ideep':
+            logger.warning('iDeep is not available on this instance, running without CPU acceleration')
+        return False
+    return True
+
+
+def using_ideep():
+    """Returns a context manager that runs Chainer functions with iDeep where they support it."""
+    return chainer.using_config('use_ideep', 'auto')
+
+
+class AccelerationRecorder(chainer.FunctionHook):
+    """Records which functions of forward passes run with iDeep, and which with NumPy.
+
+    A function runs with iDeep if it has an iDeep implementation, iDeep is enabled, and its inputs are float32
+    arrays of a shape iDeep supports. The functions that compute gradients in backward passes are not recorded.
+    """
+
+    name = 'AccelerationRecorder'
+
+    def __init__(self):
+        self.calls = []
+        self._backward_depth = 0
+
+    def forward_preprocess(self, function, in_data):
+        if not self._backward_depth:
+            self.calls.append((function.label, [id(data) for data in in_data],
+                               _runs_with_ideep(function.label, in_data)))
+
+    def backward_preprocess(self, function, in_data, out_grad):
+        self._backward_depth += 1
+
+    def backward_postprocess(self, function, in_data, out_grad):
+        self._backward_depth -= 1
+
+    def report(self, model=None):
+        """Summarizes the recorded calls.
+
+        Args:
+            model (chainer.Link): the model that was called, to attribute the calls to the links whose parameters
+                they used.
+
+        Returns:
+            dict: 'functions': for each function label, the number of calls that ran with iDeep ('ideep') and with
+                NumPy ('numpy'); 'accelerated_links' and 'numpy_links': the paths of the links all of whose calls ran
+                with iDeep, and of the other links that were called.
+        """
+        functions = {}
+        for label, _, accelerated in self.calls:
+            counts = functions.setdefault(label, {'ideep': 0, 'numpy': 0})
+            counts['ideep' if accelerated else 'numpy'] += 1
+
+        links = {}
+        if model is not None:
+            link_paths = dict((id(param.array), name.rsplit('/', 1)[0] or '/') for name, param in model.namedparams()
+                              if param.array is not None)
+            for _, array_ids, accelerated in self.calls:
+                for path in set(link_paths[array_id] for array_id in array_ids if array_id in link_paths):
+                    links[path] = links.get(path, True) and accelerated
+        return {'functions': functions,
+                'accelerated_links': sorted(path for path, accelerated in links.items() if accelerated),
+                'numpy_links': sorted(path for path, accelerated in links.items() if not accelerated)}
+
+
+def _runs_with_ideep(label, in_data):
+    intel64 = _intel64()
+    return label in _IDEEP_FUNCTIONS and intel64 is not None and intel64.should_use_ideep('>=auto') and \
+        intel64.inputs_all_ready(in_data[:1], _IDEEP_FUNCTIONS[label])
+
+
+def accelerate(model, sample, rtol=1e-4, atol=1e-5, copy_shared=False):
+    """Returns a copy of a model with its parameters in iDeep arrays, or the model itself if it can't be accelerated
+    safely.
+
+    The copy is only returned if its predictions for ``sample`` with iDeep match the model's without it, and must be
+    called inside :func:`using_ideep`. Which of its layers run with iDeep is logged.
+
+    Args:
+        model (chainer.Link): the model, as returned by model_fn.
+        sample: an input batch for the model, such as the first request.
+        rtol (float): relative tolerance of the equivalence check.
+        atol (float): absolute tolerance of the equivalence check.
+        copy_shared (bool): whether to accelerate a model whose arrays are memory mappings, see
+            :func:`memory_mapped_bytes`, although the copy doesn't share them.
+
+    Returns:
+        chainer.Link: the accelerated copy of the model, or the model.
+    """
+    if not isinstance(model, chainer.Link):
+        return model
+
+    mapped_bytes = memory_mapped_bytes(model)
+    if mapped_bytes:
+        if not copy_shared:
+            logger.warning('{} bytes of the model are memory mapped, and would be copied into every serving worker by '
+                           'iDeep acceleration; serving the original model. Set the acceleration mode to ideep to '
+                           'accelerate it anyway'.format(mapped_bytes))
+            return model
+        logger.warning('iDeep acceleration copies the {} memory mapped bytes of the model into every serving worker'
+                       .format(mapped_bytes))
+
+    expected = _predict(model, sample)
+    try:
+        accelerated = copy.deepcopy(model)
+        accelerated.to_intel64()
+        recorder = AccelerationRecorder()
+        with using_ideep(), recorder:
+            actual = _predict(accelerated, sample)
+    except Exception:
+        logger.exception('accelerating the model with iDeep failed, serving the original model')
+        return model
+
+    if expected.shape != actual.shape or not np.allclose(actual, expected, rtol=rtol, atol=atol):
+        logger.warning('the model predicts differently with iDeep (max difference {}), serving the original model'
+                       .format(np.max(np.abs(actual - expected)) if expected.shape == actual.shape else 'n/a'))
+        return model
+
+    logger.info('iDeep acceleration report: {}'.format(json.dumps(recorder.report(accelerated))))
+    return accelerated
+
+
+def memory_mapped_bytes(model):
+    """Returns the number of bytes of the parameters and persistent arrays of a model that are views of memory
+    mappings, which serving workers share instead of each having a copy."""
+    arrays = [param.array for param in model.params()]
+    arrays += [getattr(link, name) for link in model.links() for name in link._persistent]
+    return sum(array.nbytes for array in arrays if isinstance(array, np.ndarray) and _is_memory_mapped(array))
+
+
+def _is_memory_mapped(array):
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        # arrays created with numpy.frombuffer are views of a memoryview of the buffer
+        array = array.obj if isinstance(array, memoryview) else getattr(array, 'base', None)
+    return False
+
+
+def _predict(model, sample):
+    with chainer.using_config('train', False), chainer.no_backprop_mode():
+        return np.asarray(model(sample).array)
+
+
+@contextmanager
+def accelerated_training(mode):
+    """Runs the training in the enclosed block with iDeep if ``mode`` enables it.
+
+    The model stays in NumPy arrays unless the training script moves it with ``Link.to_intel64``; iDeep converts
+    the inputs of the functions it runs. Which functions and links of the first iteration of any
+    ``chainer.training.StandardUpdater`` run with iDeep is logged.
+
+    Args:
+        mode (str): the acceleration mode, see :func:`enabled`.
+    """
+    if not enabled(mode):
+        yield
+        return
+
+    from chainer.training import StandardUpdater
+
+    update = StandardUpdater.update
+
+    def recorded_update(self):
+        StandardUpdater.update = update
+        recorder = AccelerationRecorder()
+        with recorder:
+            update(self)
+        logger.info('iDeep acceleration of the first iteration: {}'
+                    .format(json.dumps(recorder.report(self.get_optimizer('main').target))))
+
+    StandardUpdater.update = recorded_update
+    try:
+        with using_ideep():
+            yield
+    finally:
+        StandardUpdater.update = update
@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+
+import chainer
+import chainer.links as L
+import numpy as np
+from chainer import serializers
+
+from chainer_framework import optimization, quantization
+
+logger = logging.getLogger(__name__)
+
+NPZ_MODEL_FILE_NAME = 'model.npz'
+MMAP_MODEL_FILE_NAME = 'model.params'
+MMAP_INDEX_FILE_NAME = 'model.params.json'
+
+_FORMAT_VERSION = 1
+_ALIGNMENT = 64
+
+_HALF_PRECISION_LAYERS = (L.Linear, L.Convolution2D)
+
+
+def save(link, model_dir, dtype=None):
+    """Saves the parameters and persistent arrays of a link as a memory-mappable model artifact.
+
+    The artifact has two files: model.params, with every array uncompressed and starting at a multiple of 64 bytes,
+    and model.params.json, an index of the name, dtype, shape and offset of every array, and of the values of
+    persistent scalars such as the number of batches seen by batch normalization. Names are the same as in
+    model.npz files written by ``chainer.serializers.save_npz``.
+
+    Args:
+        link (chainer.Link): the model.
+        model_dir (str): directory to write the artifact to.
+        dtype: if not None, the floating point dtype to store the arrays as, such as np.float16.
+    """
+    arrays, scalars = _named_arrays(link)
+
+    index = {'format_version': _FORMAT_VERSION, 'alignment': _ALIGNMENT, 'arrays': {}, 'scalars': scalars}
+    offset = 0
+    with open(os.path.join(model_dir, MMAP_MODEL_FILE_NAME), 'wb') as f:
+        for name, array in arrays:
+            array = np.ascontiguousarray(_cast(name, chainer.cuda.to_cpu(array), dtype))
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(array.tobytes())
+            index['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset = _aligned(offset + array.nbytes)
+
+    with open(os.path.join(model_dir, MMAP_INDEX_FILE_NAME), 'w') as f:
+        json.dump(index, f, indent=1)
+
+
+def save_npz(path, link, dtype=None):
+    """Saves a link like ``chainer.serializers.save_npz``, optionally with its floating point arrays stored as
+    another dtype. ``chainer.serializers.load_npz`` casts the arrays back to the dtype of the link it loads into.
+
+    Args:
+        path (str): path of the .npz file.
+        link (chainer.Link): the model.
+        dtype: if not None, the floating point dtype to store the arrays as, such as np.float16.
+    """
+    if dtype is None:
+        serializers.save_npz(path, link)
+        return
+
+    serializer = serializers.DictionarySerializer()
+    serializer.save(link)
+    np.savez_compressed(path, **dict((name, _cast(name, np.asarray(chainer.cuda.to_cpu(value)), dtype))
+                                     for name, value in serializer.target.items()))
+
+
+def load(model_dir, link):
+    """Loads a model artifact into a link.
+
+    If the directory has a memory-mappable artifact written by :func:`save`, the link's parameters and persistent
+    arrays become read-only views of the memory mapped file: loading reads no data, and all processes that load the
+    same artifact share its pages in the page cache. Otherwise the model.npz file is loaded with
+    ``chainer.serializers.load_npz``.
+
+    If the artifact was saved as float16, the weights of Linear and Convolution2D links stay float16 views, and the
+    links are replaced by :class:`chainer_framework.quantization.QuantizedLinear` and
+    :class:`chainer_framework.quantization.QuantizedConvolution2D`, which convert them to float32 one block at a
+    time. The other arrays are converted to the dtype of the link's arrays.
+
+    Usage in a model_fn:
+        def model_fn(model_dir):
+            model = MLP(1000, 10)
+            artifacts.load(model_dir, model)
+            return model
+
+    Args:
+        model_dir (str): directory of the model artifact.
+        link (chainer.Link): the model to load the arrays into. Uninitialized parameters are initialized.
+
+    Returns:
+        chainer.Link: the link.
+    """
+    index_file = os.path.join(model_dir, MMAP_INDEX_FILE_NAME)
+    if not os.path.exists(index_file):
+        serializers.load_npz(os.path.join(model_dir, NPZ_MODEL_FILE_NAME), link)
+        return link
+
+    with open(index_file) as f:
+        index = json.load(f)
+    if index['format_version'] != _FORMAT_VERSION:
+        raise ValueError('unsupported model artifact format version {}'.format(index['format_version']))
+
+    model_file = os.path.join(model_dir, MMAP_MODEL_FILE_NAME)
+    # numpy can't memory map empty files
+    data = np.memmap(model_file, dtype=np.uint8, mode='r') if os.path.getsize(model_file) else np.empty(0, np.uint8)
+    logger.info('memory mapped {} arrays of {}'.format(len(index['arrays']), model_file))
+    half_precision_layers = []
+    for path, sublink in link.namedlinks():
+        for name in sublink._params:
+            param = getattr(sublink, name)
+            array = _view(data, index, _key(path, name))
+            dtype = param.array.dtype if param.array is not None else np.dtype(np.float32)
+            if name == 'W' and isinstance(sublink, _HALF_PRECISION_LAYERS) and array.dtype == np.float16 != dtype:
+                half_precision_layers.append(sublink)
+            elif array.dtype != dtype:
+                array = array.astype(dtype)
+            param.data = array
+        for name in sublink._persistent:
+            key = _key(path, name)
+            value = getattr(sublink, name)
+            if key in index['scalars']:
+                setattr(sublink, name, index['scalars'][key])
+            elif value is not None:
+                array = _view(data, index, key)
+                setattr(sublink, name, array if array.dtype == value.dtype else array.astype(value.dtype))
+
+    _replace_half_precision_layers(link, half_precision_layers)
+    return link
+
+
+def _replace_half_precision_layers(link, layers):
+    parents = optimization.parent_links(link)
+    for layer in layers:
+        if id(layer) not in parents:
+            # the model itself can't be replaced
+            layer.W.data = layer.W.array.astype(np.float32)
+            continue
+        replacement = quantization.QuantizedLinear(layer, dtype=np.float16) if isinstance(layer, L.Linear) else \
+            quantization.QuantizedConvolution2D(layer, dtype=np.float16)
+        optimization.replace_link(parents, layer, replacement)
+    if layers:
+        logger.info('serving {} layers with float16 weights'.format(len(layers)))
+
+
+def _named_arrays(link):
+    arrays = [(name[1:], param.data) for name, param in link.namedparams() if param.data is not None]
+    scalars = {}
+    for path, sublink in link.namedlinks():
+        for name in sublink._persistent:
+            value = getattr(sublink, name)
+            if isinstance(value, (np.ndarray, chainer.cuda.ndarray)):
+                arrays.append((_key(path, name), value))
+            elif isinstance(value, (int, float, np.number)):
+                scalars[_key(path, name)] = value.item() if isinstance(value, np.number) else value
+    return arrays, scalars
+
+
+def _cast(name, array, dtype):
+    if dtype is None or array.dtype.kind != 'f' or array.dtype == dtype:
+        return array
+    if array.size and np.nanmax(np.abs(np.where(np.isinf(array), 0, array))) > np.finfo(dtype).max:
+        # saving runs after training, so the array is kept as it is rather than failing and losing the model
+        logger.warning('{} has values out of the range of {}, saving it as {}'
+                       .format(name, np.dtype(dtype), array.dtype))
+        return array
+    return array.astype(dtype)
+
+
+def _view(data, index, name):
+    if name not in index['arrays']:
+        raise KeyError('{} is not a key of the model artifact'.format(name))
+    entry = index['arrays'][name]
+    dtype = np.dtype(entry['dtype'])
+    nbytes = int(np.prod(entry['shape'])) * dtype.itemsize
+    return data[entry['offset']:entry['offset'] + nbytes].view(dtype).reshape(entry['shape'])
+
+
+def _key(path, name):
+    return '{}/{}'.format(path[1:], name) if path != '/' else name
+
+
+def _aligned(size):
+    return (size + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
@@ -0,0 +1,379 @@
+"""An asyncio HTTP front end for the serving stack, which replaces nginx and gunicorn when
+SAGEMAKER_CHAINER_ASYNC_SERVER is 'true'. It needs Python 3.5+.
+
+Each worker process reads request bodies and writes responses on an event loop, so slow uploads and downloads don't
+hold a thread, and runs transform_fn (input_fn, predict_fn and output_fn) in a thread pool of a fixed size. Work is
+admitted by estimating how long a new request would wait for a thread: from the number of requests whose body has
+been read and that wait for or hold a thread, and a moving average of how long transform_fn takes. Requests whose body
+is still uploading don't hold a thread, and don't count. A request that would wait longer than the latency budget, or
+that exceeds the maximum number of requests in flight, uploading or not, is rejected with a 503 and a Retry-After
+header as soon as its headers are read, before its body is uploaded. Clients that send 'Expect: 100-continue' are
+only asked for the body once they are admitted.
+
+The workers are forked after the transformer is created, so they share a model preloaded by model_fn (see
+:mod:`chainer_framework.preload`), and accept connections on the same listening socket.
+"""
+import asyncio
+import concurrent.futures
+import json
+import logging
+import math
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+import container_support as cs
+from container_support.serving import CSV_CONTENT_TYPE, JSON_CONTENT_TYPE, ANY_CONTENT_TYPE, \
+    UnsupportedAcceptTypeError, UnsupportedContentTypeError, UnsupportedInputShapeError
+
+logger = logging.getLogger(__name__)
+
+# Threads that run transform_fn in each worker process. Defaults to 1.
+THREADS_ENV = 'SAGEMAKER_CHAINER_ASYNC_THREADS'
+# Maximum number of requests admitted at once by each worker process. Defaults to 64.
+MAX_IN_FLIGHT_ENV = 'SAGEMAKER_CHAINER_ASYNC_MAX_IN_FLIGHT'
+# Seconds a request may be expected to wait for a thread before it is rejected. Defaults to 10.
+LATENCY_BUDGET_ENV = 'SAGEMAKER_CHAINER_ASYNC_LATENCY_BUDGET'
+
+DEFAULT_THREADS = 1
+DEFAULT_MAX_IN_FLIGHT = 64
+DEFAULT_LATENCY_BUDGET_IN_SECONDS = 10.
+
+_UTF8_CONTENT_TYPES = (JSON_CONTENT_TYPE, CSV_CONTENT_TYPE)
+_MAX_HEADER_BYTES = 64 * 1024
+# weight of the latest transform_fn duration in its moving average
+_SMOOTHING = 0.2
+
+_REASONS = {100: 'Continue', 200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            406: 'Not Acceptable', 408: 'Request Timeout', 411: 'Length Required', 412: 'Precondition Failed',
+            415: 'Unsupported Media Type', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class AdmissionControl(object):
+    """Decides whether a worker admits a request, from the requests in flight and how long transform_fn takes.
+
+    Requests are in flight from when they are admitted, on their headers, until they are answered. They are queued
+    once their body has been read, from when they wait for a thread until transform_fn has run; only queued requests
+    make a new request wait.
+
+    Args:
+        threads (int): threads that run transform_fn.
+        max_in_flight (int): maximum number of requests admitted at once.
+        latency_budget (float): seconds a request may be expected to wait for a thread.
+    """
+
+    def __init__(self, threads, max_in_flight=DEFAULT_MAX_IN_FLIGHT, latency_budget=DEFAULT_LATENCY_BUDGET_IN_SECONDS):
+        self.threads = threads
+        self.max_in_flight = max_in_flight
+        self.latency_budget = latency_budget
+        self.in_flight = 0
+        self.queued = 0
+        self.service_time = None
+        self.admitted = 0
+        self.rejected = 0
+
+    def expected_wait(self):
+        """Returns the seconds a new request is expected to wait for a thread."""
+        waiting = self.queued + 1 - self.threads
+        if waiting <= 0 or self.service_time is None:
+            return 0.
+        return math.ceil(float(waiting) / self.threads) * self.service_time
+
+    def admit(self):
+        """Admits a request if it fits in the budget.
+
+        Returns:
+            float: None if the request is admitted, or else the seconds after which the client should retry.
+        """
+        wait = self.expected_wait()
+        if self.in_flight >= self.max_in_flight or wait > self.latency_budget:
+            self.rejected += 1
+            return max(wait - self.latency_budget, self.service_time or 0., 1.)
+        self.in_flight += 1
+        self.admitted += 1
+        return None
+
+    def queue(self):
+        """Records that the body of an admitted request has been read, and that it waits for a thread."""
+        self.queued += 1
+
+    def done(self, seconds, queued=False):
+        """Records that an admitted request finished after transform_fn ran for ``seconds``, or None if it didn't
+        run, and whether it had been queued."""
+        self.in_flight -= 1
+        if queued:
+            self.queued -= 1
+        if seconds is not None:
+            self.service_time = seconds if self.service_time is None else \
+                _SMOOTHING * seconds + (1 - _SMOOTHING) * self.service_time
+
+
+class _Request(object):
+    def __init__(self, method, path, version, headers):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.headers = headers
+
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        return connection == 'keep-alive' if self.version == 'HTTP/1.0' else connection != 'close'
+
+
+class _HttpError(Exception):
+    def __init__(self, status, message=''):
+        super(_HttpError, self).__init__(message)
+        self.status = status
+
+
+class AsyncServer(object):
+    """Serves /ping and /invocations with a transformer on an event loop, see the module documentation.
+
+    Args:
+        transformer: the transformer of the serving engine, with a transform(data, content_type, accept) method.
+        threads (int): threads that run transform_fn.
+        max_in_flight (int): maximum number of requests admitted at once.
+        latency_budget (float): seconds a request may be expected to wait for a thread.
+        default_accept (str): accept type of requests without one, or with '*/*'.
+        timeout (float): seconds to read the headers or the body of a request, or to write a response.
+    """
+
+    def __init__(self, transformer, threads=DEFAULT_THREADS, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                 latency_budget=DEFAULT_LATENCY_BUDGET_IN_SECONDS, default_accept=JSON_CONTENT_TYPE, timeout=60.):
+        self.transformer = transformer
+        self.admission = AdmissionControl(threads, max_in_flight, latency_budget)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        self.default_accept = default_accept
+        self.timeout = timeout
+
+    async def handle(self, reader, writer):
+        """Handles the requests of a connection."""
+        try:
+            keep_alive = True
+            while keep_alive:
+                keep_alive = await self._handle_request(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            # the client went away, or stopped reading a response
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(_read_head(reader), self.timeout)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            # the client closed the connection, or kept it open without sending a request
+            return False
+        except _HttpError as e:
+            await self._respond(writer, e.status, json.dumps(str(e)), JSON_CONTENT_TYPE, keep_alive=False)
+            return False
+
+        if request.path == '/ping':
+            await self._respond(writer, 200, keep_alive=request.keep_alive())
+            return request.keep_alive()
+        if request.path != '/invocations':
+            await self._respond(writer, 404, keep_alive=False)
+            return False
+        if request.method != 'POST':
+            await self._respond(writer, 405, keep_alive=False)
+            return False
+
+        # rejected requests are answered before their body is read, and the connection is closed instead of reading
+        # the body. Admitted requests are in flight while their body is read, and queued once it has been read.
+        retry_after = self.admission.admit()
+        if retry_after is not None:
+            await self._respond(writer, 503, json.dumps('the server is overloaded'), JSON_CONTENT_TYPE,
+                                keep_alive=False, headers={'Retry-After': str(int(math.ceil(retry_after)))})
+            return False
+
+        service_time = None
+        queued = False
+        try:
+            if request.headers.get('expect', '').lower() == '100-continue':
+                writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            try:
+                body = await asyncio.wait_for(_read_body(reader, request.headers), self.timeout)
+            except asyncio.TimeoutError:
+                await self._respond(writer, 408, keep_alive=False)
+                return False
+            except _HttpError as e:
+                await self._respond(writer, e.status, json.dumps(str(e)), JSON_CONTENT_TYPE, keep_alive=False)
+                return False
+
+            self.admission.queue()
+            queued = True
+            start = time.time()
+            status, data, content_type = await asyncio.get_event_loop().run_in_executor(
+                self.executor, self._transform, body, request.headers)
+            service_time = time.time() - start
+        finally:
+            self.admission.done(service_time, queued)
+
+        await self._respond(writer, status, data, content_type, keep_alive=request.keep_alive())
+        return request.keep_alive()
+
+    def _transform(self, body, headers):
+        # runs in the thread pool, and answers as container_support.serving.Server does
+        content_type = headers.get('contenttype', headers.get('content-type', JSON_CONTENT_TYPE))
+        accept = headers.get('accept') or self.default_accept or JSON_CONTENT_TYPE
+        if accept == ANY_CONTENT_TYPE:
+            accept = self.default_accept
+
+        try:
+            data = body.decode('utf-8') if content_type in _UTF8_CONTENT_TYPES else body
+            output_data, output_content_type = self.transformer.transform(data, content_type, accept)
+            return 200, output_data, output_content_type
+        except UnsupportedContentTypeError as e:
+            return 415, json.dumps(str(e)), JSON_CONTENT_TYPE
+        except UnsupportedAcceptTypeError as e:
+            return 406, json.dumps(str(e)), JSON_CONTENT_TYPE
+        except UnsupportedInputShapeError as e:
+            return 412, json.dumps(str(e)), JSON_CONTENT_TYPE
+        except Exception as e:
+            logger.exception(e)
+            return 500, b'', None
+
+    async def _respond(self, writer, status, data=b'', content_type=None, keep_alive=True, headers=None):
+        data = data.encode('utf-8') if not isinstance(data, bytes) else data
+        lines = ['HTTP/1.1 {} {}'.format(status, _REASONS.get(status, '')),
+                 'Content-Length: {}'.format(len(data)),
+                 'Connection: {}'.format('keep-alive' if keep_alive else 'close')]
+        if content_type:
+            lines.append('Content-Type: {}'.format(content_type))
+        lines.extend('{}: {}'.format(name, value) for name, value in (headers or {}).items())
+        # one write, so that the headers and the body aren't sent in separate segments
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + data)
+        # waits for slow clients without holding a thread
+        await asyncio.wait_for(writer.drain(), self.timeout)
+
+    async def serve(self, sock):
+        """Serves the connections of a listening socket until the task is cancelled."""
+        server = await asyncio.start_server(self.handle, sock=sock, limit=_MAX_HEADER_BYTES)
+        try:
+            await asyncio.Future()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+
+async def _read_head(reader):
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.LimitOverrunError:
+        raise _HttpError(400, 'the request headers are too long')
+
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, path, version = lines[0].split(' ')
+    except ValueError:
+        raise _HttpError(400, 'invalid request line')
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    return _Request(method, path.split('?')[0], version, headers)
+
+
+async def _read_body(reader, headers):
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            try:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            except (ValueError, asyncio.LimitOverrunError):
+                raise _HttpError(400, 'invalid chunk size')
+            chunk = await reader.readexactly(size + 2)
+            if size == 0:
+                return b''.join(chunks)
+            chunks.append(chunk[:-2])
+    if 'content-length' not in headers:
+        raise _HttpError(411, 'requests need a Content-Length header, or a chunked body')
+    try:
+        length = int(headers['content-length'])
+    except ValueError:
+        raise _HttpError(400, 'invalid Content-Length')
+    return await reader.readexactly(length)
+
+
+def from_env(transformer, env):
+    """Returns an AsyncServer configured by the environment variables of this module and the hosting environment."""
+    return AsyncServer(transformer,
+                       threads=int(os.environ.get(THREADS_ENV, DEFAULT_THREADS)),
+                       max_in_flight=int(os.environ.get(MAX_IN_FLIGHT_ENV, DEFAULT_MAX_IN_FLIGHT)),
+                       latency_budget=float(os.environ.get(LATENCY_BUDGET_ENV, DEFAULT_LATENCY_BUDGET_IN_SECONDS)),
+                       default_accept=env.default_accept,
+                       timeout=float(env.model_server_timeout))
+
+
+def run(server, sock):
+    """Runs a server on a listening socket in a new event loop until SIGTERM or SIGINT."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    task = loop.create_task(server.serve(sock))
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, task.cancel)
+    try:
+        loop.run_until_complete(task)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        server.executor.shutdown(wait=False)
+        loop.close()
+
+
+def listen(port, host='0.0.0.0'):
+    """Returns a listening socket, shared by the worker processes forked after it is created."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, int(port)))
+    sock.listen(1024)
+    sock.setblocking(False)
+    return sock
+
+
+def start(engine):
+    """Starts serving with the asyncio front end, in place of container_support's nginx and gunicorn stack.
+
+    Args:
+        engine: the serving engine, which creates the transformer of the user module.
+    """
+    cs.configure_logging()
+    env = cs.HostingEnvironment()
+    env.start_metrics_if_enabled()
+    if env.user_script_name:
+        if not os.path.exists(os.path.join(env.code_dir, env.user_script_name)):
+            env.download_user_module()
+        env.pip_install_requirements()
+
+    engine.load_dependencies()
+    transformer = engine.transformer(env.import_user_module() if env.user_script_name else None)
+    server = from_env(transformer, env)
+    sock = listen(env.http_port)
+    logger.info('serving with the asyncio front end on port {}, {} workers of {} threads'
+                .format(env.http_port, env.model_server_workers, server.admission.threads))
+
+    workers = []
+    for _ in range(env.model_server_workers):
+        pid = os.fork()
+        if pid == 0:
+            run(server, sock)
+            os._exit(0)
+        workers.append(pid)
+
+    def stop(signum, frame):
+        for worker in workers:
+            try:
+                os.kill(worker, signal.SIGTERM)
+            except OSError:
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    # a worker that exits stops the server, as gunicorn's master exiting does
+    os.wait()
+    stop(None, None)
@@ -0,0 +1,105 @@
+import logging
+import sys
+import threading
+import time
+
+import six
+
+from chainer_framework import lifecycle
+
+logger = logging.getLogger(__name__)
+
+
+class Pipeline(object):
+    """Runs the steps that prepare a host for distributed training concurrently.
+
+    Each step starts as soon as all the steps it depends on have finished, so independent steps (for example starting
+    sshd and staging the user module) overlap. The duration of every step is logged. If a step fails, the steps that
+    depend on it are skipped and the first error is raised once all other steps have finished.
+
+    Usage:
+        pipeline = Pipeline()
+        pipeline.add('change_hostname', lambda: _change_hostname(current_host))
+        pipeline.add('start_sshd', _start_ssh_daemon, depends_on=['change_hostname'])
+        pipeline.run()
+    """
+
+    def __init__(self):
+        self._steps = []
+
+    def add(self, name, fn, depends_on=()):
+        """Adds a step to the pipeline.
+
+        Args:
+            name (str): name of the step, used in logs and to declare dependencies.
+            fn (callable): function without arguments that runs the step.
+            depends_on (list[str]): names of steps, already added, that have to finish before this step starts.
+
+        Returns:
+            Pipeline: this pipeline.
+        """
+        names = [step.name for step in self._steps]
+        if name in names:
+            raise ValueError('step {} was already added'.format(name))
+        unknown = [dependency for dependency in depends_on if dependency not in names]
+        if unknown:
+            raise ValueError('step {} depends on unknown steps {}'.format(name, unknown))
+
+        self._steps.append(_Step(name, fn, [step for step in self._steps if step.name in depends_on]))
+        return self
+
+    def run(self):
+        """Runs all steps and waits for them to finish.
+
+        Returns:
+            dict: step name to duration in seconds, for the steps that ran.
+        """
+        start = time.time()
+        threads = [threading.Thread(target=step.run, name='bootstrap-{}'.format(step.name)) for step in self._steps]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        logger.info('bootstrap finished in {:.2f} seconds'.format(time.time() - start))
+
+        failed = [step for step in self._steps if step.exc_info]
+        if failed:
+            six.reraise(*failed[0].exc_info)
+
+        return {step.name: step.duration for step in self._steps if step.duration is not None}
+
+
+class _Step(object):
+    def __init__(self, name, fn, dependencies):
+        self.name = name
+        self.fn = fn
+        self.dependencies = dependencies
+        self.done = threading.Event()
+        self.exc_info = None
+        self.failed = False
+        self.duration = None
+
+    def run(self):
+        try:
+            for dependency in self.dependencies:
+                dependency.done.wait()
+            if any(dependency.failed for dependency in self.dependencies):
+                logger.info('skipping bootstrap step {} because a step it depends on failed'.format(self.name))
+                self.failed = True
+                return
+
+            start = time.time()
+            try:
+                with lifecycle.span(self.name):
+                    self.fn()
+            except Exception:
+                logger.exception('bootstrap step {} failed'.format(self.name))
+                self.exc_info = sys.exc_info()
+                self.failed = True
+                return
+            self.duration = time.time() - start
+            logger.info('bootstrap step {} finished in {:.2f} seconds'.format(self.name, self.duration))
+        finally:
+            self.done.set()
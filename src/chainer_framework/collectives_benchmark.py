@@ -0,0 +1,221 @@
+"""Benchmarks MPI collectives with the same mpirun command that is used for distributed training.
+
+Run inside the container by setting the 'benchmark_collectives' hyperparameter, or locally with:
+
+    mpirun -np 4 python -m chainer_framework.collectives_benchmark --output-dir /tmp/benchmark
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+REPORT_FILE_NAME = 'collectives_benchmark.json'
+
+OPERATIONS = ('allreduce', 'bcast', 'allgather')
+LAYOUTS = ('world', 'intra_node', 'inter_node')
+
+# message sizes in bytes: 1 KiB to 64 MiB
+DEFAULT_SIZES = [2 ** i for i in range(10, 27, 2)]
+DEFAULT_ITERATIONS = 20
+DEFAULT_EXPECTED_INTRA_NODE_GBPS = 10.0
+DEFAULT_EXPECTED_INTER_NODE_GBPS = 5.0
+
+# smaller messages are latency bound, so their bandwidth is not compared against the expectation
+MIN_BANDWIDTH_CHECK_SIZE = 2 ** 20
+
+_TRAINING_CONFIG_DIR = '/opt/ml/input/config'
+
+
+def run(mpi_comm, sizes=DEFAULT_SIZES, iterations=DEFAULT_ITERATIONS,
+        expected_intra_node_gbps=DEFAULT_EXPECTED_INTRA_NODE_GBPS,
+        expected_inter_node_gbps=DEFAULT_EXPECTED_INTER_NODE_GBPS):
+    """Measures allreduce, bcast and allgather latency and bandwidth over all ranks, within each host and across hosts.
+
+    This function must be called collectively on all ranks.
+
+    Args:
+        mpi_comm (mpi4py.MPI.Comm): the communicator to benchmark, usually MPI.COMM_WORLD.
+        sizes (list[int]): message sizes in bytes.
+        iterations (int): number of timed calls for each operation and size.
+        expected_intra_node_gbps (float): bus bandwidth, in Gbit/s, expected between ranks on the same host.
+        expected_inter_node_gbps (float): bus bandwidth, in Gbit/s, expected between ranks on different hosts.
+
+    Returns:
+        dict: the report on rank 0, None on the other ranks.
+    """
+    from mpi4py import MPI
+
+    host = socket.gethostname()
+    hosts = mpi_comm.allgather(host)
+    num_hosts = len(set(hosts))
+
+    intra_node_comm = mpi_comm.Split_type(MPI.COMM_TYPE_SHARED)
+    is_node_leader = intra_node_comm.Get_rank() == 0
+    inter_node_comm = mpi_comm.Split(0 if is_node_leader else MPI.UNDEFINED, mpi_comm.Get_rank())
+
+    layouts = [('world', mpi_comm, expected_inter_node_gbps if num_hosts > 1 else expected_intra_node_gbps),
+               ('intra_node', intra_node_comm, expected_intra_node_gbps),
+               ('inter_node', inter_node_comm, expected_inter_node_gbps)]
+
+    results = []
+    for layout, comm, expected_gbps in layouts:
+        # every rank must take part in the barriers, even the ones left out of the inter node communicator
+        mpi_comm.Barrier()
+        if comm == MPI.COMM_NULL or comm.Get_size() < 2:
+            continue
+        for operation in OPERATIONS:
+            for size in sizes:
+                seconds = _time_operation(comm, operation, size, iterations)
+                if comm.Get_rank() == 0:
+                    results.append(_result(layout, host, operation, size, comm.Get_size(), seconds, expected_gbps))
+
+    gathered = mpi_comm.gather(results, root=0)
+    if mpi_comm.Get_rank() != 0:
+        return None
+
+    results = [result for rank_results in gathered for result in rank_results]
+    return {'hosts': sorted(set(hosts)),
+            'ranks': mpi_comm.Get_size(),
+            'ranks_per_host': {h: hosts.count(h) for h in set(hosts)},
+            'iterations': iterations,
+            'results': results,
+            'below_expected': [result for result in results if result['below_expected']]}
+
+
+def _time_operation(comm, operation, size, iterations):
+    """Returns the average time of one call of the operation on the slowest rank."""
+    from mpi4py import MPI
+
+    count = max(size // 4, 1)
+    send = np.ones(count, dtype=np.float32)
+    if operation == 'allreduce':
+        recv = np.empty_like(send)
+
+        def call():
+            comm.Allreduce(send, recv, op=MPI.SUM)
+    elif operation == 'bcast':
+        def call():
+            comm.Bcast(send, root=0)
+    elif operation == 'allgather':
+        # the message size is the total amount of data gathered on each rank
+        send = np.ones(max(count // comm.Get_size(), 1), dtype=np.float32)
+        recv = np.empty(send.size * comm.Get_size(), dtype=np.float32)
+
+        def call():
+            comm.Allgather(send, recv)
+    else:
+        raise ValueError('unsupported operation: {}'.format(operation))
+
+    call()
+    comm.Barrier()
+    start = time.time()
+    for _ in range(iterations):
+        call()
+    elapsed = (time.time() - start) / iterations
+    return comm.allreduce(elapsed, op=MPI.MAX)
+
+
+def _result(layout, host, operation, size, ranks, seconds, expected_gbps):
+    algorithm_gbps = size * 8 / seconds / 1e9
+    bus_gbps = algorithm_gbps * _bus_bandwidth_factor(operation, ranks)
+    below_expected = size >= MIN_BANDWIDTH_CHECK_SIZE and bus_gbps < expected_gbps
+    return {'layout': layout,
+            'host': host if layout == 'intra_node' else None,
+            'operation': operation,
+            'bytes': size,
+            'ranks': ranks,
+            'latency_us': seconds * 1e6,
+            'algorithm_bandwidth_gbps': algorithm_gbps,
+            'bus_bandwidth_gbps': bus_gbps,
+            'expected_bus_bandwidth_gbps': expected_gbps,
+            'below_expected': below_expected}
+
+
+def _bus_bandwidth_factor(operation, ranks):
+    """Converts algorithm bandwidth to bus bandwidth, which is comparable to the link speed for any number of ranks.
+
+    See https://github.com/NVIDIA/nccl-tests/blob/master/doc/PERFORMANCE.md
+    """
+    if operation == 'allreduce':
+        return 2.0 * (ranks - 1) / ranks
+    if operation == 'allgather':
+        return float(ranks - 1) / ranks
+    return 1.0
+
+
+def write_report(report, output_dir):
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    path = os.path.join(output_dir, REPORT_FILE_NAME)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    return path
+
+
+def _log_report(report):
+    for result in report['results']:
+        logger.info('{layout:>10} {operation:>9} {bytes:>10} bytes on {ranks} ranks: {latency_us:12.1f} us '
+                    '{bus_bandwidth_gbps:8.2f} Gbit/s'.format(**result))
+    for result in report['below_expected']:
+        logger.warning('{layout} {operation} of {bytes} bytes on {ranks} ranks reached '
+                       '{bus_bandwidth_gbps:.2f} Gbit/s, below the expected {expected_bus_bandwidth_gbps:.2f} Gbit/s'
+                       .format(**result))
+
+
+def _parse_args(args):
+    parser = argparse.ArgumentParser(description='Benchmark MPI collectives.')
+    parser.add_argument('--output-dir', help='directory to write {} to'.format(REPORT_FILE_NAME))
+    parser.add_argument('--sizes', type=int, nargs='+', help='message sizes in bytes')
+    parser.add_argument('--iterations', type=int)
+    parser.add_argument('--expected-intra-node-gbps', type=float)
+    parser.add_argument('--expected-inter-node-gbps', type=float)
+    parser.add_argument('--fail-below-expected', action='store_true',
+                        help='exit with a non-zero code if any configuration is below the expected bandwidth')
+    args = parser.parse_args(args)
+
+    # inside a SageMaker training container, hyperparameters provide the defaults
+    hyperparameters, output_dir = {}, '.'
+    if os.path.exists(_TRAINING_CONFIG_DIR):
+        from container_support.environment import TrainingEnvironment
+        env = TrainingEnvironment()
+        hyperparameters, output_dir = env.hyperparameters, env.output_data_dir
+
+    def default(value, name, fallback):
+        return value if value is not None else hyperparameters.get(name, fallback)
+
+    args.output_dir = default(args.output_dir, 'benchmark_output_dir', output_dir)
+    args.sizes = default(args.sizes, 'benchmark_sizes', DEFAULT_SIZES)
+    args.iterations = int(default(args.iterations, 'benchmark_iterations', DEFAULT_ITERATIONS))
+    args.expected_intra_node_gbps = float(default(args.expected_intra_node_gbps, 'expected_intra_node_gbps',
+                                                  DEFAULT_EXPECTED_INTRA_NODE_GBPS))
+    args.expected_inter_node_gbps = float(default(args.expected_inter_node_gbps, 'expected_inter_node_gbps',
+                                                  DEFAULT_EXPECTED_INTER_NODE_GBPS))
+    return args
+
+
+def main(args=None):
+    from mpi4py import MPI
+
+    args = _parse_args(args)
+    report = run(MPI.COMM_WORLD, args.sizes, args.iterations, args.expected_intra_node_gbps,
+                 args.expected_inter_node_gbps)
+
+    failed = False
+    if report is not None:
+        _log_report(report)
+        logger.info('collectives benchmark report: {}'.format(write_report(report, args.output_dir)))
+        failed = args.fail_below_expected and len(report['below_expected']) > 0
+
+    return MPI.COMM_WORLD.bcast(failed, root=0)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(1 if main() else 0)
@@ -0,0 +1,184 @@
+import logging
+import time
+
+import chainer
+import chainermn
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+AUTO = 'auto'
+
+# Candidates benchmarked by 'auto'. Communicators that need CUDA or NCCL fail to construct or to run their first
+# allreduce on CPU-only ranks; they are skipped on every rank and the remaining candidates are compared.
+CPU_CANDIDATES = ('naive', 'flat', 'hierarchical', 'two_dimensional')
+GPU_CANDIDATES = CPU_CANDIDATES + ('pure_nccl',)
+
+# Used when the size of the model is unknown, e.g. when its links are lazily initialized and no sample is given.
+_DEFAULT_BENCHMARK_SIZE = 2 ** 20
+
+
+def create_communicator(communicator_name=AUTO, model=None, device=-1, candidates=None, iterations=5, sample=None,
+                        size=None):
+    """Creates a ChainerMN communicator, picking the fastest one with an allreduce microbenchmark if requested.
+
+    When ``communicator_name`` is 'auto', every candidate communicator is created and used to allreduce a gradient
+    buffer the size of ``model``'s parameters. The communicator with the lowest allreduce time (the maximum over all
+    ranks) is returned, and the results are logged. All ranks make the same choice, and the other communicators are
+    released.
+
+    Links created with an input size of None, such as ``L.Linear(None, n_units)``, have no parameters until their first
+    forward pass. Pass a ``sample`` batch to run the model once and initialize them, or the ``size`` of the model.
+
+    This function must be called collectively on all ranks.
+
+    Args:
+        communicator_name (str): a ChainerMN communicator name, or 'auto'. Scripts usually pass the 'communicator'
+            hyperparameter here.
+        model (chainer.Link): model whose parameters determine the benchmark buffer size.
+        device (int): GPU device id used by this rank, or -1 for CPU.
+        candidates (list[str]): communicators to benchmark. Defaults to CPU_CANDIDATES, or GPU_CANDIDATES when
+            a GPU device is given.
+        iterations (int): number of timed allreduce calls per candidate.
+        sample: a batch of inputs of ``model``, or a tuple of its arguments, run through it to initialize lazily
+            initialized parameters. It must be on the device of the model.
+        size (int): the number of parameters of the model, instead of counting them.
+
+    Returns:
+        chainermn.CommunicatorBase: the communicator.
+    """
+    if communicator_name != AUTO:
+        return chainermn.create_communicator(communicator_name)
+
+    if candidates is None:
+        candidates = GPU_CANDIDATES if device >= 0 else CPU_CANDIDATES
+
+    size = size or _benchmark_size(model, sample)
+    results = benchmark_communicators(candidates, size, device, iterations)
+    if not results:
+        raise RuntimeError('None of the communicators {} could be created'.format(list(candidates)))
+
+    fastest = min(results, key=lambda name: results[name][1])
+    comm = results[fastest][0]
+    # in the same order on every rank, since freeing MPI communicators is collective
+    for name in candidates:
+        if name in results and name != fastest:
+            _release(results[name][0])
+
+    if comm.rank == 0:
+        logger.info('allreduce benchmark of {} float32 parameters over {} ranks:'.format(size, comm.size))
+        for name in candidates:
+            if name in results:
+                logger.info('  {}: {:.6f} seconds per allreduce'.format(name, results[name][1]))
+            else:
+                logger.info('  {}: unavailable'.format(name))
+        logger.info('selected {} communicator'.format(fastest))
+
+    return comm
+
+
+def benchmark_communicators(candidates, size, device=-1, iterations=5):
+    """Measures the allreduce time of each candidate communicator on a gradient buffer of the given size.
+
+    This function must be called collectively on all ranks.
+
+    Args:
+        candidates (list[str]): ChainerMN communicator names.
+        size (int): number of float32 elements to allreduce.
+        device (int): GPU device id used by this rank, or -1 for CPU.
+        iterations (int): number of timed allreduce calls per candidate.
+
+    Returns:
+        dict: communicator name to a (communicator, seconds per allreduce) tuple, for the candidates that are
+            available on every rank.
+    """
+    from mpi4py import MPI
+
+    mpi_comm = MPI.COMM_WORLD
+    results = {}
+    for name in candidates:
+        comm, link = None, _BenchmarkLink(size, device)
+        try:
+            comm = chainermn.create_communicator(name)
+            # the first allreduce also allocates the communicator's buffers
+            comm.allreduce_grad(link)
+            available = True
+        except Exception as e:
+            logger.debug('communicator {} is not available: {}'.format(name, e))
+            available = False
+
+        if not mpi_comm.allreduce(available, op=MPI.LAND):
+            if comm is not None:
+                _release(comm)
+            continue
+
+        mpi_comm.Barrier()
+        start = time.time()
+        for _ in range(iterations):
+            comm.allreduce_grad(link)
+        _synchronize(device)
+        elapsed = mpi_comm.allreduce(time.time() - start, op=MPI.MAX)
+
+        results[name] = (comm, elapsed / iterations)
+    return results
+
+
+def _benchmark_size(model, sample):
+    if model is None:
+        return _DEFAULT_BENCHMARK_SIZE
+    if sample is not None and _has_uninitialized_parameters(model):
+        with chainer.using_config('train', False), chainer.no_backprop_mode():
+            if isinstance(sample, tuple):
+                model(*sample)
+            else:
+                model(sample)
+
+    size = _count_parameters(model)
+    if _has_uninitialized_parameters(model):
+        size = max(size, _DEFAULT_BENCHMARK_SIZE)
+        logger.warning('the model has uninitialized parameters, the allreduce benchmark uses {} parameters instead; '
+                       'pass a sample batch or the size of the model to create_communicator'.format(size))
+    return size
+
+
+def _count_parameters(model):
+    if model is None:
+        return 0
+    return sum(param.size for param in model.params() if param.array is not None)
+
+
+def _has_uninitialized_parameters(model):
+    return any(param.array is None for param in model.params())
+
+
+def _release(comm):
+    """Frees the MPI communicators a ChainerMN communicator split from its own, and drops its NCCL communicators and
+    buffers. ChainerMN communicators have no method that does it."""
+    # MPI_Comm_free is collective, so every rank frees the communicators in the same order
+    for name, value in sorted(vars(comm).items(), key=lambda item: item[0]):
+        if value is None:
+            continue
+        if name.endswith('_mpi_comm'):
+            value.Free()
+        elif name.endswith('nccl_comm'):
+            value.destroy()
+        elif 'buffer' not in name:
+            continue
+        setattr(comm, name, None)
+
+
+def _synchronize(device):
+    if device >= 0:
+        chainer.cuda.Stream.null.synchronize()
+
+
+class _BenchmarkLink(chainer.Link):
+    """A link with a single flat parameter whose gradient is allreduced by the benchmark."""
+
+    def __init__(self, size, device=-1):
+        super(_BenchmarkLink, self).__init__()
+        with self.init_scope():
+            self.w = chainer.Parameter(np.zeros(size, dtype=np.float32))
+        self.w.grad = np.ones(size, dtype=np.float32)
+        if device >= 0:
+            self.to_gpu(device)
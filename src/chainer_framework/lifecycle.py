@@ -0,0 +1,226 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+TRACE_FILE_NAME = 'lifecycle_trace.json'
+
+# Events of the process that runs train() on a worker host, read by the processes that mpirun starts on that host.
+LAUNCHER_EVENTS_FILE = '/tmp/sagemaker_chainer_lifecycle_launcher.json'
+# Events of all processes started by mpirun, gathered by rank 0 for the process that runs mpirun.
+RANK_EVENTS_FILE = '/tmp/sagemaker_chainer_lifecycle_ranks.json'
+
+_CLOCK_SYNC_ROUNDS = 5
+
+# monotonic clocks are shared by all processes of a host, which keeps the events of a host in order even if the
+# system clock is adjusted. Python 2 has no monotonic clock.
+clock = getattr(time, 'monotonic', time.time)
+
+_events = []
+
+
+@contextmanager
+def span(name, **args):
+    """Records the duration of the enclosed block as a lifecycle event.
+
+    Recording an event only appends to a list, so spans can be used around any step of the training lifecycle.
+
+    Args:
+        name (str): name of the event.
+        **args: values shown with the event in the trace viewer.
+    """
+    start = clock()
+    try:
+        yield
+    finally:
+        _record(name, 'X', start, dur=clock() - start, args=args)
+
+
+def begin(name, **args):
+    """Records the start of a lifecycle event that ends with :func:`end`, possibly after the events were saved."""
+    _record(name, 'B', clock(), args=args)
+
+
+def end(name):
+    _record(name, 'E', clock())
+
+
+@contextmanager
+def trace_first_iteration():
+    """Records the first iteration of any ``chainer.training.StandardUpdater`` run in the enclosed block.
+
+    Only the first call to ``StandardUpdater.update`` is wrapped, so later iterations run the original method.
+    """
+    from chainer.training import StandardUpdater
+
+    update = StandardUpdater.update
+
+    def traced_update(self):
+        StandardUpdater.update = update
+        with span('first_iteration'):
+            update(self)
+
+    StandardUpdater.update = traced_update
+    try:
+        yield
+    finally:
+        StandardUpdater.update = update
+
+
+def save_events(path=None):
+    """Saves the events recorded so far by this process, so that :func:`gather_mpi_events` can read them.
+
+    Args:
+        path (str): file to save the events to, LAUNCHER_EVENTS_FILE if not given.
+    """
+    _dump(list(_events), path or LAUNCHER_EVENTS_FILE)
+
+
+def gather_mpi_events(current_host, path=None, launcher_events_file=None, mpi_comm=None):
+    """Gathers the events of all processes started by mpirun, and of the launchers on worker hosts, to rank 0.
+
+    Must be called collectively. The first process of every host estimates the offset of its monotonic clock to the
+    clock of rank 0 with a few message round trips, and all events are shifted to the clock of rank 0 before they
+    are gathered. Rank 0 saves them to ``path``, for :func:`write_trace` in the process that runs mpirun on the same
+    host.
+
+    Args:
+        current_host (str): name of the current host.
+        path (str): file rank 0 saves the gathered events to, RANK_EVENTS_FILE if not given.
+        launcher_events_file (str): file the launcher of a worker host saved its events to with :func:`save_events`,
+            LAUNCHER_EVENTS_FILE if not given.
+        mpi_comm: MPI communicator of all processes, ``MPI.COMM_WORLD`` if not given.
+    """
+    from mpi4py import MPI
+    mpi_comm = mpi_comm or MPI.COMM_WORLD
+    path = path or RANK_EVENTS_FILE
+    launcher_events_file = launcher_events_file or LAUNCHER_EVENTS_FILE
+
+    host_comm = mpi_comm.Split_type(MPI.COMM_TYPE_SHARED)
+    is_host_leader = host_comm.rank == 0
+    leader_comm = mpi_comm.Split(0 if is_host_leader else MPI.UNDEFINED, mpi_comm.rank)
+
+    offset = _estimate_clock_offset(leader_comm) if is_host_leader else None
+    offset = host_comm.bcast(offset, root=0)
+
+    events = [dict(event, process='rank {}'.format(mpi_comm.rank)) for event in _events]
+    # the launcher on the master host runs mpirun and adds its own events when it writes the trace
+    if is_host_leader and mpi_comm.rank != 0 and os.path.exists(launcher_events_file):
+        with open(launcher_events_file) as f:
+            events.extend(dict(event, process='launcher') for event in json.load(f))
+    for event in events:
+        event['ts'] -= offset
+
+    gathered = mpi_comm.gather((current_host, events), root=0)
+    if mpi_comm.rank == 0:
+        _dump(gathered, path)
+
+
+def write_trace(output_dir, current_host, hosts, rank_events_file=None):
+    """Writes the lifecycle events of this host, and those gathered from all processes started by mpirun, as a Chrome
+    Trace Event file, which can be opened with chrome://tracing or https://ui.perfetto.dev.
+
+    Every host is shown as a process, and the launcher threads and ranks on a host as its threads.
+
+    Args:
+        output_dir (str): directory to write lifecycle_trace.json to.
+        current_host (str): name of the current host.
+        hosts (list[str]): names of all hosts, in the order they are shown.
+        rank_events_file (str): file :func:`gather_mpi_events` saved the events of all processes to,
+            RANK_EVENTS_FILE if not given.
+    """
+    rank_events_file = rank_events_file or RANK_EVENTS_FILE
+    host_events = [(current_host, [dict(event, process='launcher') for event in _events])]
+    if os.path.exists(rank_events_file):
+        with open(rank_events_file) as f:
+            host_events.extend(json.load(f))
+
+    trace = _to_chrome_trace(host_events, sorted(hosts))
+    # the output data directory of a host in a distributed job only exists if the user script created it
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    path = os.path.join(output_dir, TRACE_FILE_NAME)
+    with open(path, 'w') as f:
+        json.dump(trace, f)
+    logger.info('lifecycle trace written to {}'.format(path))
+
+
+def _record(name, phase, ts, dur=None, args=None):
+    event = {'name': name, 'ph': phase, 'ts': ts, 'thread': threading.current_thread().name}
+    if dur is not None:
+        event['dur'] = dur
+    if args:
+        event['args'] = args
+    _events.append(event)
+
+
+def _estimate_clock_offset(leader_comm):
+    """Returns how far the clock of this host is ahead of the clock of leader rank 0.
+
+    Uses the round trip with the lowest latency, and assumes the reply was sent halfway through it.
+    """
+    if leader_comm.rank != 0:
+        for _ in range(_CLOCK_SYNC_ROUNDS):
+            leader_comm.recv(source=0)
+            leader_comm.send(clock(), dest=0)
+        return leader_comm.scatter(None, root=0)
+
+    offsets = [0.0]
+    for rank in range(1, leader_comm.size):
+        samples = []
+        for _ in range(_CLOCK_SYNC_ROUNDS):
+            sent = clock()
+            leader_comm.send(None, dest=rank)
+            remote = leader_comm.recv(source=rank)
+            received = clock()
+            samples.append((received - sent, remote - (sent + received) / 2))
+        offsets.append(min(samples)[1])
+    return leader_comm.scatter(offsets, root=0)
+
+
+def _to_chrome_trace(host_events, hosts):
+    all_events = [event for _, events in host_events for event in events]
+    origin = min(event['ts'] for event in all_events) if all_events else clock()
+
+    trace_events = []
+    tids = {}
+    for host, events in host_events:
+        if host not in hosts:
+            hosts.append(host)
+        pid = hosts.index(host)
+        for event in events:
+            thread = event['process'] if event['thread'] == 'MainThread' else \
+                '{} {}'.format(event['process'], event['thread'])
+            if (pid, thread) not in tids:
+                tids[(pid, thread)] = len(tids)
+                trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tids[(pid, thread)],
+                                     'args': {'name': thread}})
+
+            trace_event = {'name': event['name'], 'ph': event['ph'], 'pid': pid, 'tid': tids[(pid, thread)],
+                           'ts': (event['ts'] - origin) * 1e6}
+            if 'dur' in event:
+                trace_event['dur'] = event['dur'] * 1e6
+            if 'args' in event:
+                trace_event['args'] = event['args']
+            trace_events.append(trace_event)
+
+    for pid, host in enumerate(hosts):
+        trace_events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': host}})
+        trace_events.append({'name': 'process_sort_index', 'ph': 'M', 'pid': pid, 'args': {'sort_index': pid}})
+
+    return {'traceEvents': trace_events,
+            'displayTimeUnit': 'ms',
+            # the events are on the monotonic clock of the master host; this is the system time of the first event
+            'otherData': {'start_time': time.time() - clock() + origin}}
+
+
+def _dump(obj, path):
+    # replaced atomically, because another process may read the file at any time
+    tmp_path = '{}.{}'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f)
+    os.rename(tmp_path, path)
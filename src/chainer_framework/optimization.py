@@ -0,0 +1,195 @@
+import copy
+import logging
+
+import chainer
+import chainer.links as L
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_FOLDABLE_LINKS = (L.Linear, L.Convolution2D)
+_FOLDABLE_FUNCTIONS = ('LinearFunction', 'Convolution2DFunction')
+_BATCH_NORMALIZATION_FUNCTIONS = ('FixedBatchNormalization',)
+
+
+class _Identity(chainer.Link):
+    """Replaces links that are no-ops at inference time."""
+
+    def __call__(self, x, *args, **kwargs):
+        return x
+
+    forward = __call__
+
+
+def optimize(model, sample, rtol=1e-4, atol=1e-5):
+    """Returns a copy of a model optimized for inference, or the model itself if it can't be optimized safely.
+
+    Batch normalization links that directly follow a Linear or Convolution2D link are folded into its weights and
+    bias, and replaced by a no-op (see :func:`fold_batch_normalization`). Dropout needs no optimization: ``F.dropout``
+    returns its input when ``chainer.config.train`` is False, and predict_fn doesn't build a computational graph.
+
+    The optimized copy is only returned if its predictions for ``sample`` match the model's.
+
+    Args:
+        model (chainer.Link): the model, as returned by model_fn.
+        sample: an input batch for the model, such as the first request.
+        rtol (float): relative tolerance of the equivalence check.
+        atol (float): absolute tolerance of the equivalence check.
+
+    Returns:
+        chainer.Link: the optimized copy of the model, or the model.
+    """
+    if not isinstance(model, chainer.Link):
+        return model
+
+    try:
+        optimized = copy.deepcopy(model)
+        folded = fold_batch_normalization(optimized, sample)
+    except Exception:
+        logger.exception('optimizing the model failed, serving the original model')
+        return model
+    if not folded:
+        return model
+
+    expected = predict(model, sample)
+    actual = predict(optimized, sample)
+    if expected.shape != actual.shape or not np.allclose(actual, expected, rtol=rtol, atol=atol):
+        logger.warning('the optimized model predicts differently from the original model (max difference {}), '
+                       'serving the original model'.format(np.max(np.abs(actual - expected))
+                                                           if expected.shape == actual.shape else 'n/a'))
+        return model
+
+    logger.info('folded {} batch normalization links into the preceding layers'.format(folded))
+    return optimized
+
+
+def fold_batch_normalization(model, sample):
+    """Folds the statistics and scale of BatchNormalization links into the Linear or Convolution2D links they follow.
+
+    The computational graph of one forward pass on ``sample`` tells which links follow which. A batch normalization
+    link is folded if it normalizes the output of a Linear or Convolution2D link that nothing else uses, and if both
+    links are called once per forward pass. The folded batch normalization links are replaced by no-ops in their
+    parent chains.
+
+    Args:
+        model (chainer.Link): the model, which is modified in place.
+        sample: an input batch for the model.
+
+    Returns:
+        int: the number of folded batch normalization links.
+    """
+    recorder = CallRecorder()
+    with chainer.using_config('train', False), recorder:
+        model(sample)
+
+    links_by_array = {}
+    for link in model.links():
+        if isinstance(link, _FOLDABLE_LINKS) and link.W.array is not None:
+            links_by_array[id(link.W.array)] = link
+        elif isinstance(link, L.BatchNormalization) and getattr(link, 'axis', None) is None:
+            links_by_array[id(link.avg_mean)] = link
+
+    layers_by_node = {}
+    batch_normalization_calls = []
+    call_counts = {}
+    consumer_counts = {}
+    for node, in_data in recorder.calls:
+        for input_node in node.inputs:
+            consumer_counts[id(input_node)] = consumer_counts.get(id(input_node), 0) + 1
+        if node.label in _FOLDABLE_FUNCTIONS and len(in_data) > 1 and id(in_data[1]) in links_by_array:
+            link = links_by_array[id(in_data[1])]
+            layers_by_node[id(node)] = link
+        elif node.label in _BATCH_NORMALIZATION_FUNCTIONS and id(in_data[3]) in links_by_array:
+            link = links_by_array[id(in_data[3])]
+            batch_normalization_calls.append((node, link))
+        else:
+            continue
+        call_counts[id(link)] = call_counts.get(id(link), 0) + 1
+
+    parents = parent_links(model)
+    folded = 0
+    for node, batch_normalization in batch_normalization_calls:
+        input_node = node.inputs[0]
+        layer = layers_by_node.get(id(input_node.creator_node))
+        if layer is None or call_counts[id(layer)] != 1 or call_counts[id(batch_normalization)] != 1 \
+                or consumer_counts[id(input_node)] != 1 or id(batch_normalization) not in parents:
+            continue
+
+        _fold(layer, batch_normalization)
+        replace_link(parents, batch_normalization, _Identity())
+        folded += 1
+    return folded
+
+
+def replace_link(parents, link, replacement):
+    """Replaces a link in its parent chain.
+
+    Args:
+        parents (dict): id of every link to its (parent, name or index), as returned by :func:`parent_links`.
+        link (chainer.Link): the link to replace.
+        replacement (chainer.Link): the link that replaces it.
+    """
+    parent, name = parents[id(link)]
+    if isinstance(parent, chainer.ChainList):
+        parent._children[name] = replacement
+        # chainer.Sequential calls the layers in a separate list
+        layers = getattr(parent, '_layers', None)
+        if layers is not None:
+            layers[:] = [replacement if layer is link else layer for layer in layers]
+    else:
+        setattr(parent, name, replacement)
+    parents[id(replacement)] = parent, name
+
+
+def parent_links(model):
+    """Returns a dict of the id of every link of a model, except the model itself, to its (parent, name or index)."""
+    parents = {}
+    for link in model.links():
+        if isinstance(link, chainer.ChainList):
+            for index, child in enumerate(link._children):
+                parents[id(child)] = (link, index)
+        elif isinstance(link, chainer.Chain):
+            for name in link._children:
+                parents[id(getattr(link, name))] = (link, name)
+    return parents
+
+
+def predict(model, sample):
+    """Returns a model's prediction for a sample as a numpy array."""
+    with chainer.using_config('train', False), chainer.no_backprop_mode():
+        return chainer.cuda.to_cpu(model(sample).array)
+
+
+def _fold(layer, batch_normalization):
+    scale = _gamma(batch_normalization) / (batch_normalization.avg_var + batch_normalization.eps) ** 0.5
+    shift = _beta(batch_normalization) - batch_normalization.avg_mean * scale
+
+    weights = layer.W.array
+    layer.W.array = weights * scale.reshape((-1,) + (1,) * (weights.ndim - 1)).astype(weights.dtype)
+    if layer.b is None:
+        with layer.init_scope():
+            layer.b = chainer.Parameter(shift.astype(weights.dtype))
+    else:
+        layer.b.array = (layer.b.array * scale + shift).astype(layer.b.array.dtype)
+
+
+def _gamma(batch_normalization):
+    gamma = getattr(batch_normalization, 'gamma', None)
+    return gamma.array if gamma is not None else 1
+
+
+def _beta(batch_normalization):
+    beta = getattr(batch_normalization, 'beta', None)
+    return beta.array if beta is not None else 0
+
+
+class CallRecorder(chainer.FunctionHook):
+    """Records the function nodes of a forward pass, and their input arrays."""
+
+    name = 'CallRecorder'
+
+    def __init__(self):
+        self.calls = []
+
+    def forward_postprocess(self, function, in_data):
+        self.calls.append((function, in_data))
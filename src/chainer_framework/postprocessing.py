@@ -0,0 +1,136 @@
+"""Reduces predictions on the server before they are serialized, so that classifiers with many classes don't send
+and encode the scores of every class when callers only want the best few.
+
+SageMaker passes the Accept header to transform_fn, but not custom attributes, so the reduction is requested with
+parameters of the accept type, such as 'application/json; output=top-k; k=5':
+
+* output=softmax: the softmax of the predictions, over their last axis.
+* output=argmax: the index of the largest prediction of each sample, an int64 array with one dimension less.
+* output=top-k: the indices and scores of the k largest predictions of each sample, largest first. k defaults to 5.
+  The scores are the predictions, or their softmax with scores=softmax. JSON responses are an object with an
+  'indices' and a 'scores' array; other formats get an array of the k indices followed by the k scores, as float32.
+
+The top k are selected with ``numpy.argpartition``, in time linear in the number of classes, and only they are
+sorted.
+"""
+import collections
+import re
+
+import numpy as np
+
+OUTPUTS = ('softmax', 'argmax', 'top-k')
+SCORES = ('raw', 'softmax')
+DEFAULT_K = 5
+
+_PARAMETER = re.compile(r'\s*;\s*(output|k|scores)\s*=\s*"?([\w-]+)"?', re.IGNORECASE)
+
+Reduction = collections.namedtuple('Reduction', ['output', 'k', 'scores'])
+"""A reduction of predictions: output, one of :data:`OUTPUTS`; k, the number of predictions top-k keeps; and scores,
+one of :data:`SCORES`."""
+
+TopK = collections.namedtuple('TopK', ['indices', 'scores'])
+"""The indices of the k largest predictions of each sample, and their scores."""
+
+
+def parse(accept, default=None):
+    """Splits the reduction parameters from an accept type.
+
+    Args:
+        accept (str): the accept type, with or without output, k and scores parameters.
+        default (str): parameters used when the accept type has none, such as 'output=top-k; k=5'.
+
+    Returns:
+        tuple: the accept type without the parameters, and the :class:`Reduction`, or None.
+    """
+    parameters = dict((name.lower(), value.lower()) for name, value in _PARAMETER.findall(accept or ''))
+    accept = _PARAMETER.sub('', accept or '').strip() if parameters else accept
+    if not parameters and default:
+        parameters = dict((name.lower(), value.lower()) for name, value in _PARAMETER.findall(';' + default))
+    if not parameters:
+        return accept, None
+
+    output = parameters.get('output')
+    if output not in OUTPUTS:
+        raise ValueError('the output parameter must be one of {}, not {}'.format(', '.join(OUTPUTS), output))
+    scores = parameters.get('scores', 'raw')
+    if scores not in SCORES:
+        raise ValueError('the scores parameter must be one of {}, not {}'.format(', '.join(SCORES), scores))
+    try:
+        k = int(parameters.get('k', DEFAULT_K))
+    except ValueError:
+        k = 0
+    if k <= 0:
+        raise ValueError('the k parameter must be a positive integer, not {}'.format(parameters['k']))
+    return accept, Reduction(output, k, scores)
+
+
+def apply(prediction, reduction):
+    """Applies a reduction to predictions.
+
+    Args:
+        prediction (numpy.ndarray): predictions, with the classes on the last axis.
+        reduction (Reduction): the reduction, see :func:`parse`.
+
+    Returns:
+        numpy.ndarray, or :class:`TopK` for top-k.
+    """
+    prediction = np.asarray(prediction)
+    if prediction.ndim == 0:
+        raise ValueError('predictions must have at least one dimension to be reduced')
+    if reduction.output == 'softmax':
+        return softmax(prediction)
+    if reduction.output == 'argmax':
+        return np.argmax(prediction, axis=-1)
+    return top_k(prediction, reduction.k, reduction.scores == 'softmax')
+
+
+def softmax(prediction):
+    """Returns the softmax of predictions over their last axis, in float32 or wider."""
+    prediction = prediction.astype(np.result_type(prediction.dtype, np.float32), copy=False)
+    exponentials = np.exp(prediction - prediction.max(axis=-1, keepdims=True))
+    return exponentials / exponentials.sum(axis=-1, keepdims=True)
+
+
+def top_k(prediction, k, normalize=False):
+    """Selects the k largest predictions of each sample.
+
+    Args:
+        prediction (numpy.ndarray): predictions, with the classes on the last axis.
+        k (int): the number of predictions to keep, at most the number of classes.
+        normalize (bool): whether the scores are the softmax of the predictions instead of the predictions.
+
+    Returns:
+        TopK: int64 indices and scores of shape prediction.shape[:-1] + (k,), largest first.
+    """
+    classes = prediction.shape[-1]
+    k = min(k, classes)
+    rows = prediction.reshape(-1, classes)
+    samples = np.arange(len(rows))[:, None]
+
+    if k < classes:
+        indices = np.argpartition(rows, classes - k, axis=-1)[:, classes - k:]
+    else:
+        indices = np.broadcast_to(np.arange(classes), rows.shape)
+    scores = rows[samples, indices]
+    order = np.argsort(-scores, axis=-1, kind='mergesort')
+    indices = indices[samples, order].astype(np.int64)
+    scores = scores[samples, order]
+
+    if normalize:
+        # the softmax of the kept predictions, normalized over all the classes
+        maxima = rows.max(axis=-1, keepdims=True)
+        scores = np.exp(scores - maxima) / np.exp(rows - maxima).sum(axis=-1, keepdims=True)
+
+    shape = prediction.shape[:-1] + (k,)
+    return TopK(indices.reshape(shape), scores.reshape(shape))
+
+
+def to_array(top):
+    """Returns top-k predictions as a float32 array of the k indices followed by the k scores of each sample, for
+    the formats that serialize a single array."""
+    return np.concatenate([top.indices, top.scores], axis=-1).astype(np.float32)
+
+
+def to_json(top):
+    """Returns top-k predictions as a JSON-serializable object with an 'indices' and a 'scores' list."""
+    return {'indices': top.indices.tolist(), 'scores': top.scores.tolist()}
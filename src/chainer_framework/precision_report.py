@@ -0,0 +1,133 @@
+"""Reports how much serving a model with float16 or int8 weights changes its accuracy on a labelled validation channel.
+
+The model is loaded with the model_fn of the user module. Its predictions for the validation data are compared with
+those of a copy with reduced precision weights (see :mod:`chainer_framework.quantization`), or, with
+--reference-model-dir, with those of a float32 model loaded from another directory, to evaluate a float16 artifact
+as it is served.
+
+The validation channel holds .npz files with an array of inputs and an array of labels, named 'x' and 't' by default.
+
+Run inside the training container after training, or locally with:
+
+    python -m chainer_framework.precision_report --user-module code/mnist.py --model-dir model \
+        --validation-dir data/validation --dtype float16 --output-dir .
+"""
+import argparse
+import glob
+import importlib
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+
+from chainer_framework import optimization, quantization
+
+logger = logging.getLogger(__name__)
+
+REPORT_FILE_NAME = 'precision_report.json'
+
+_MODEL_DIR = '/opt/ml/model'
+_VALIDATION_DIR = '/opt/ml/input/data/validation'
+_OUTPUT_DIR = '/opt/ml/output/data'
+
+
+def load_validation_data(validation_dir, data_key='x', label_key='t'):
+    """Loads and concatenates the inputs and labels of the .npz files of a validation channel.
+
+    Args:
+        validation_dir (str): directory of the validation channel.
+        data_key (str): name of the array of inputs in the .npz files.
+        label_key (str): name of the array of labels in the .npz files.
+
+    Returns:
+        tuple: the inputs and the labels.
+    """
+    files = sorted(glob.glob(os.path.join(validation_dir, '*.npz')))
+    if not files:
+        raise ValueError('no .npz files in {}'.format(validation_dir))
+
+    data, labels = [], []
+    for path in files:
+        with np.load(path) as f:
+            data.append(f[data_key])
+            labels.append(f[label_key])
+    return np.concatenate(data), np.concatenate(labels)
+
+
+def evaluate(model, reduced, x, t, batch_size=100):
+    """Compares the predictions of a model and of its reduced precision version on labelled data.
+
+    Args:
+        model (chainer.Link): the float32 model.
+        reduced (chainer.Link): the reduced precision model.
+        x (numpy.ndarray): inputs.
+        t (numpy.ndarray): labels, as class indices.
+        batch_size (int): number of inputs predicted at once.
+
+    Returns:
+        dict: 'samples', 'accuracy' and 'reduced_accuracy', 'accuracy_delta' (reduced minus float32),
+            'top1_agreement', 'max_abs_error' and 'relative_error' (of the predictions, in L2 norm).
+    """
+    expected = np.concatenate([optimization.predict(model, x[i:i + batch_size]) for i in range(0, len(x), batch_size)])
+    actual = np.concatenate([optimization.predict(reduced, x[i:i + batch_size]) for i in range(0, len(x), batch_size)])
+
+    accuracy = float(np.mean(expected.argmax(axis=1) == t))
+    reduced_accuracy = float(np.mean(actual.argmax(axis=1) == t))
+    return {'samples': len(x),
+            'accuracy': accuracy,
+            'reduced_accuracy': reduced_accuracy,
+            'accuracy_delta': reduced_accuracy - accuracy,
+            'top1_agreement': float(np.mean(actual.argmax(axis=1) == expected.argmax(axis=1))),
+            'max_abs_error': float(np.max(np.abs(actual - expected))),
+            'relative_error': float(np.linalg.norm(actual - expected) / max(np.linalg.norm(expected), 1e-12))}
+
+
+def _import_user_module(path):
+    directory, name = os.path.split(os.path.abspath(path))
+    sys.path.insert(0, directory)
+    return importlib.import_module(os.path.splitext(name)[0])
+
+
+def _parse_args(args):
+    parser = argparse.ArgumentParser(description='Report the accuracy delta of reduced precision weights.')
+    parser.add_argument('--user-module', required=True, help='path of the script that defines model_fn')
+    parser.add_argument('--model-dir', default=_MODEL_DIR)
+    parser.add_argument('--reference-model-dir',
+                        help='directory of a float32 model to compare with the model in --model-dir as it is loaded, '
+                             'instead of quantizing it')
+    parser.add_argument('--validation-dir', default=_VALIDATION_DIR)
+    parser.add_argument('--data-key', default='x')
+    parser.add_argument('--label-key', default='t')
+    parser.add_argument('--dtype', choices=['float16', 'int8'], default='float16')
+    parser.add_argument('--convolutions', action='store_true', help='also quantize Convolution2D links')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--output-dir', default=_OUTPUT_DIR if os.path.exists(_OUTPUT_DIR) else '.')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = _parse_args(args)
+    user_module = _import_user_module(args.user_module)
+    x, t = load_validation_data(args.validation_dir, args.data_key, args.label_key)
+
+    if args.reference_model_dir:
+        model = user_module.model_fn(args.reference_model_dir)
+        reduced = user_module.model_fn(args.model_dir)
+    else:
+        model = user_module.model_fn(args.model_dir)
+        reduced = quantization.quantize(model, x[:args.batch_size], args.convolutions, np.dtype(args.dtype))
+
+    report = evaluate(model, reduced, x, t, args.batch_size)
+    report['dtype'] = None if args.reference_model_dir else args.dtype
+    logger.info('precision report: {}'.format(json.dumps(report)))
+
+    with open(os.path.join(args.output_dir, REPORT_FILE_NAME), 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
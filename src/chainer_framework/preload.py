@@ -0,0 +1,145 @@
+import functools
+import gc
+import logging
+import mmap
+import os
+
+import chainer
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Set to 'true' to load the model once in the gunicorn master and fork the serving workers from it.
+PRELOAD_ENV = 'SAGEMAKER_CHAINER_PRELOAD_MODEL'
+_GUNICORN_CMD_ARGS_ENV = 'GUNICORN_CMD_ARGS'
+
+_ALIGNMENT = 64
+
+
+def enabled():
+    return os.environ.get(PRELOAD_ENV, 'false').lower() in ('true', '1')
+
+
+def configure_gunicorn():
+    """Makes gunicorn import the serving application, and so load the model, before it forks the workers.
+
+    Must be called in the process that starts gunicorn, before it starts.
+    """
+    args = os.environ.get(_GUNICORN_CMD_ARGS_ENV, '')
+    if '--preload' not in args.split():
+        os.environ[_GUNICORN_CMD_ARGS_ENV] = '{} --preload'.format(args).strip()
+
+
+def shared_model_fn(model_fn):
+    """Wraps a model_fn so that the workers forked after it ran share the model copy-on-write.
+
+    The parameters and persistent arrays of the returned Chainer link are moved into one shared memory mapping (see
+    :func:`share_arrays`), and the objects that exist after loading are moved out of the garbage collector's reach
+    (see :func:`freeze`), so that neither reference counting nor garbage collection in the workers writes to the
+    pages that hold the weights.
+
+    Args:
+        model_fn (function): the model_fn of the user module.
+
+    Returns:
+        function: the wrapped model_fn.
+    """
+    @functools.wraps(model_fn)
+    def preloaded_model_fn(model_dir):
+        model = model_fn(model_dir)
+        if isinstance(model, chainer.Link):
+            shared_bytes = share_arrays(model)
+            logger.info('moved {} bytes of model arrays into shared memory'.format(shared_bytes))
+        freeze()
+        logger.info('memory usage after preloading the model: {}'.format(memory_usage()))
+        return model
+    return preloaded_model_fn
+
+
+def share_arrays(link):
+    """Moves the parameters and persistent arrays of a link into a single anonymous shared memory mapping.
+
+    numpy allocates small arrays on the heap next to Python objects, whose reference counts change all the time, so
+    a forked process would copy those pages. In a shared mapping the arrays stay shared even if a process writes to
+    them, so they are marked read-only. Arrays that already are memory maps, and arrays on a GPU, are left in place.
+
+    Args:
+        link (chainer.Link): the model.
+
+    Returns:
+        int: the number of bytes moved.
+    """
+    arrays = list(_arrays(link))
+    offsets = []
+    size = 0
+    for _, _, array in arrays:
+        offsets.append(size)
+        size += _aligned(array.nbytes)
+    if size == 0:
+        return 0
+
+    buffer = mmap.mmap(-1, size, flags=mmap.MAP_SHARED)
+    for (owner, name, array), offset in zip(arrays, offsets):
+        shared = np.frombuffer(buffer, dtype=array.dtype, count=array.size, offset=offset).reshape(array.shape)
+        shared[...] = array
+        shared.flags.writeable = False
+        if isinstance(owner, chainer.Parameter):
+            owner.data = shared
+        else:
+            setattr(owner, name, shared)
+    return sum(array.nbytes for _, _, array in arrays)
+
+
+def freeze():
+    """Collects garbage, then moves all objects into a generation the garbage collector ignores (Python 3.7+), so
+    that collections in forked workers don't write to the pages that hold them."""
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+    else:
+        logger.info('gc.freeze is not available in this Python version, garbage collections in the workers may copy '
+                    'pages of the preloaded model')
+
+
+def memory_usage(pid='self'):
+    """Returns the memory usage of a process, from /proc/[pid]/smaps_rollup (or smaps on older kernels).
+
+    Pss (proportional set size) divides every shared page between the processes that map it, so the sum of the Pss
+    of the serving workers is the memory they actually use together.
+
+    Args:
+        pid: process id, 'self' for the current process.
+
+    Returns:
+        dict: 'rss', 'pss', 'shared' and 'private' memory in bytes.
+    """
+    path = '/proc/{}/smaps_rollup'.format(pid)
+    if not os.path.exists(path):
+        path = '/proc/{}/smaps'.format(pid)
+
+    totals = {}
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 3 and fields[2] == 'kB':
+                totals[fields[0][:-1]] = totals.get(fields[0][:-1], 0) + int(fields[1]) * 1024
+
+    return {'rss': totals.get('Rss', 0),
+            'pss': totals.get('Pss', 0),
+            'shared': totals.get('Shared_Clean', 0) + totals.get('Shared_Dirty', 0),
+            'private': totals.get('Private_Clean', 0) + totals.get('Private_Dirty', 0)}
+
+
+def _arrays(link):
+    for _, param in link.namedparams():
+        if isinstance(param.data, np.ndarray) and not isinstance(param.data, np.memmap):
+            yield param, 'data', param.data
+    for _, sublink in link.namedlinks():
+        for name in sublink._persistent:
+            value = getattr(sublink, name)
+            if isinstance(value, np.ndarray) and value.ndim > 0 and not isinstance(value, np.memmap):
+                yield sublink, name, value
+
+
+def _aligned(size):
+    return (size + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
@@ -0,0 +1,220 @@
+import copy
+import logging
+import time
+
+import chainer
+import chainer.functions as F
+import chainer.links as L
+import numpy as np
+
+from chainer_framework import optimization
+
+logger = logging.getLogger(__name__)
+
+# Fractions of the largest absolute weight of an output channel that calibration tries as the clipping threshold.
+CLIP_RATIOS = (1.0, 0.9, 0.8, 0.7)
+
+# Rows of a weight matrix dequantized at once, which keeps the dequantized block in the CPU cache.
+_BLOCK_ROWS = 256
+
+
+class QuantizedLinear(chainer.Link):
+    """Inference-only replacement of ``L.Linear`` that stores its weights as int8 with a scale per output unit, or
+    as float16.
+
+    The weights are dequantized to float32 one block of rows at a time and multiplied with float32 accumulation,
+    so the full float32 weight matrix is never materialized. numpy has no int8 matrix product, so this saves memory
+    rather than time: predictions are about as fast as, or slower than, with the float32 link.
+    """
+
+    def __init__(self, linear, clip_ratio=1.0, dtype=np.int8):
+        super(QuantizedLinear, self).__init__()
+        _add_quantized_arrays(self, linear, clip_ratio, dtype)
+
+    def __call__(self, x):
+        xp = chainer.cuda.get_array_module(self.W)
+        x = chainer.as_variable(x).array
+        x = x.reshape(len(x), -1).astype(np.float32, copy=False)
+
+        # computed transposed, so that every block writes to contiguous rows
+        y = xp.empty((len(self.W), len(x)), dtype=np.float32)
+        for start in range(0, len(self.W), _BLOCK_ROWS):
+            block = self.W[start:start + _BLOCK_ROWS].astype(np.float32)
+            xp.dot(block, x.T, out=y[start:start + _BLOCK_ROWS])
+        y = xp.ascontiguousarray(y.T)
+        if self.scale is not None:
+            y *= self.scale
+        if self.b is not None:
+            y += self.b
+        return chainer.Variable(y)
+
+    forward = __call__
+
+
+class QuantizedConvolution2D(chainer.Link):
+    """Inference-only replacement of ``L.Convolution2D`` that stores its weights as int8 with a scale per output
+    channel, or as float16, and dequantizes them for every call."""
+
+    def __init__(self, convolution, clip_ratio=1.0, dtype=np.int8):
+        super(QuantizedConvolution2D, self).__init__()
+        _add_quantized_arrays(self, convolution, clip_ratio, dtype)
+        self.stride = convolution.stride
+        self.pad = convolution.pad
+        # dilation and groups are not available in all Chainer versions
+        self.options = {name: getattr(convolution, name) for name in ('dilate', 'groups') if hasattr(convolution, name)}
+
+    def __call__(self, x):
+        W = self.W.astype(np.float32)
+        if self.scale is not None:
+            W *= self.scale.reshape(-1, 1, 1, 1)
+        return F.convolution_2d(x, W, self.b, self.stride, self.pad, **self.options)
+
+    forward = __call__
+
+
+def _add_quantized_arrays(link, layer, clip_ratio, dtype):
+    # persistent, so that to_gpu and to_cpu move them
+    W, scale = quantize_weights(chainer.cuda.to_cpu(layer.W.array), clip_ratio, dtype)
+    link.add_persistent('W', W)
+    link.add_persistent('scale', scale)
+    link.add_persistent('b', chainer.cuda.to_cpu(layer.b.array) if layer.b is not None else None)
+
+
+def quantize_weights(W, clip_ratio=1.0, dtype=np.int8):
+    """Quantizes weights to int8, symmetrically, with a scale per output channel (the first axis), or to float16.
+
+    Args:
+        W (numpy.ndarray): float weights.
+        clip_ratio (float): fraction of the largest absolute weight of each channel that is mapped to 127. Larger
+            weights are clipped. Ignored for float16.
+        dtype: np.int8 or np.float16.
+
+    Returns:
+        tuple: the quantized weights, and the float32 scale of each channel (None for float16).
+    """
+    if np.dtype(dtype) == np.float16:
+        # float16 weights, such as memory mapped from a half precision artifact, are used as they are
+        return W.astype(np.float16, copy=False), None
+    if np.dtype(dtype) != np.int8:
+        raise ValueError('weights can be quantized to int8 or float16, not {}'.format(np.dtype(dtype)))
+
+    max_abs = np.abs(W.reshape(len(W), -1)).max(axis=1) * clip_ratio
+    scale = np.where(max_abs > 0, max_abs / 127, 1).astype(np.float32)
+    quantized = np.clip(np.round(W / scale.reshape((-1,) + (1,) * (W.ndim - 1))), -127, 127).astype(np.int8)
+    return quantized, scale
+
+
+def quantize(model, calibration_samples=None, convolutions=False, dtype=np.int8, inplace=False):
+    """Returns a copy of a model with its Linear, and optionally Convolution2D, links replaced by int8 or float16
+    versions.
+
+    If int8 calibration samples are given, such as the warm-up samples or the first request, the inputs every layer
+    receives for them are recorded, and the clipping threshold of each layer is chosen from :data:`CLIP_RATIOS` to
+    minimize the error of the layer's output. float16 needs no calibration.
+
+    Args:
+        model (chainer.Link): the model.
+        calibration_samples: an input batch for the model, or None.
+        convolutions (bool): whether to also quantize Convolution2D links.
+        dtype: np.int8 or np.float16.
+        inplace (bool): whether to replace the links of the model itself instead of a copy.
+
+    Returns:
+        chainer.Link: the quantized model.
+    """
+    if np.dtype(dtype) == np.float16:
+        calibration_samples = None
+    quantized = model if inplace else copy.deepcopy(model)
+    layer_types = (L.Linear, L.Convolution2D) if convolutions else (L.Linear,)
+    # links with uninitialized parameters are left alone: the calibration pass would initialize them differently
+    # from the model's
+    layers = [link for link in quantized.links(skipself=True)
+              if isinstance(link, layer_types) and link.W.array is not None]
+
+    inputs = _layer_inputs(quantized, layers, calibration_samples) if calibration_samples is not None else {}
+    parents = optimization.parent_links(quantized)
+    for layer in layers:
+        if id(layer) not in parents:
+            continue
+        clip_ratio = _calibrate(layer, inputs[id(layer)]) if id(layer) in inputs else 1.0
+        quantized_layer = QuantizedLinear(layer, clip_ratio, dtype) if isinstance(layer, L.Linear) else \
+            QuantizedConvolution2D(layer, clip_ratio, dtype)
+        optimization.replace_link(parents, layer, quantized_layer)
+    return quantized
+
+
+def report(model, quantized, samples, iterations=10):
+    """Compares the predictions and latency of a model and its quantized copy.
+
+    Args:
+        model (chainer.Link): the model.
+        quantized (chainer.Link): the quantized copy of the model.
+        samples: an input batch for the model.
+        iterations (int): number of predictions to time for each model.
+
+    Returns:
+        dict: 'max_abs_error', 'relative_error' (of the predictions, in L2 norm), 'top1_agreement' (the fraction of
+            samples with the same highest scoring class), 'original_ms', 'quantized_ms' (median latencies),
+            'speedup', 'original_weight_bytes' and 'quantized_weight_bytes'.
+    """
+    expected = optimization.predict(model, samples)
+    actual = optimization.predict(quantized, samples)
+    original_ms = _median_latency(model, samples, iterations)
+    quantized_ms = _median_latency(quantized, samples, iterations)
+    return {'max_abs_error': float(np.max(np.abs(actual - expected))),
+            'relative_error': float(np.linalg.norm(actual - expected) / max(np.linalg.norm(expected), 1e-12)),
+            'top1_agreement': float(np.mean(actual.argmax(axis=1) == expected.argmax(axis=1)))
+            if expected.ndim == 2 else None,
+            'original_ms': original_ms,
+            'quantized_ms': quantized_ms,
+            'speedup': original_ms / quantized_ms,
+            'original_weight_bytes': _weight_bytes(model),
+            'quantized_weight_bytes': _weight_bytes(quantized)}
+
+
+def _layer_inputs(model, layers, samples):
+    weights = dict((id(layer.W.array), layer) for layer in layers)
+    recorder = optimization.CallRecorder()
+    with chainer.using_config('train', False), chainer.no_backprop_mode(), recorder:
+        model(samples)
+
+    inputs = {}
+    for _, in_data in recorder.calls:
+        if len(in_data) > 1 and id(in_data[1]) in weights:
+            inputs[id(weights[id(in_data[1])])] = chainer.cuda.to_cpu(in_data[0])
+    return inputs
+
+
+def _calibrate(layer, x):
+    expected = _layer_output(layer, x, layer.W.array)
+    errors = []
+    for clip_ratio in CLIP_RATIOS:
+        W, scale = quantize_weights(chainer.cuda.to_cpu(layer.W.array), clip_ratio)
+        dequantized = W.astype(np.float32) * scale.reshape((-1,) + (1,) * (W.ndim - 1))
+        errors.append((float(np.mean((_layer_output(layer, x, dequantized) - expected) ** 2)), clip_ratio))
+    return min(errors)[1]
+
+
+def _layer_output(layer, x, W):
+    if isinstance(layer, L.Linear):
+        return x.reshape(len(x), -1).dot(chainer.cuda.to_cpu(W).T)
+    with chainer.no_backprop_mode():
+        return F.convolution_2d(x, chainer.cuda.to_cpu(W), None, layer.stride, layer.pad).array
+
+
+def _median_latency(model, samples, iterations):
+    latencies = []
+    with chainer.using_config('train', False), chainer.no_backprop_mode():
+        for _ in range(iterations):
+            start = time.time()
+            model(samples)
+            latencies.append((time.time() - start) * 1000)
+    return sorted(latencies)[len(latencies) // 2]
+
+
+def _weight_bytes(model):
+    total = sum(param.array.nbytes for param in model.params() if param.array is not None)
+    for link in model.links():
+        if isinstance(link, (QuantizedLinear, QuantizedConvolution2D)):
+            total += sum(array.nbytes for array in (link.W, link.scale, link.b) if array is not None)
+    return total
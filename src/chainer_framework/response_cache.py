@@ -0,0 +1,371 @@
+"""A response cache in front of transform_fn, shared by the serving workers through a shared memory segment.
+
+Responses are keyed by a hash of the request payload, its content type, the accept type and the model version, so
+retries and repeated requests for the same rows skip input_fn, predict_fn and output_fn. The segment holds a table of
+entries and an arena for the responses: it is bounded in bytes and in entries, least recently used responses are
+evicted first, and responses expire after a TTL. While a worker computes a response, the other requests for the same
+key, in any worker, wait for it instead of computing it again.
+
+Enable it by setting SAGEMAKER_CHAINER_RESPONSE_CACHE_BYTES. Print the statistics of a running server with:
+
+    python -m chainer_framework.response_cache
+"""
+import fcntl
+import functools
+import hashlib
+import json
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Size of the response arena in bytes. The cache is disabled if it's not set or 0.
+CACHE_BYTES_ENV = 'SAGEMAKER_CHAINER_RESPONSE_CACHE_BYTES'
+# Maximum number of cached responses. Defaults to 4096.
+CACHE_ENTRIES_ENV = 'SAGEMAKER_CHAINER_RESPONSE_CACHE_ENTRIES'
+# Seconds a response is served from the cache. Defaults to 60.
+CACHE_TTL_ENV = 'SAGEMAKER_CHAINER_RESPONSE_CACHE_TTL'
+# Version of the model, part of every key. Defaults to a fingerprint of the files in the model directory.
+MODEL_VERSION_ENV = 'SAGEMAKER_CHAINER_MODEL_VERSION'
+
+DEFAULT_ENTRIES = 4096
+DEFAULT_TTL_IN_SECONDS = 60
+
+_SEGMENT_NAME = 'sagemaker_chainer_response_cache'
+_MODEL_DIR = '/opt/ml/model'
+
+# seconds a request waits for another worker to compute the same response before computing it itself
+_COALESCE_TIMEOUT_IN_SECONDS = 30
+_POLL_INTERVAL_IN_SECONDS = 0.002
+_LOG_STATS_EVERY = 1000
+
+_MAGIC = 0x43484e5243414348
+_FORMAT_VERSION = 1
+_HEADER_FIELDS = ('magic', 'format_version', 'capacity_bytes', 'max_entries', 'hits', 'misses', 'coalesced',
+                  'evictions', 'expirations', 'inserts')
+_HEADER_BYTES = 8 * len(_HEADER_FIELDS)
+
+_EMPTY, _PENDING, _READY = 0, 1, 2
+_ENTRY = np.dtype([('key', '<u8', (2,)), ('state', '<i8'), ('offset', '<i8'), ('size', '<i8'),
+                   ('expires', '<f8'), ('last_used', '<f8')])
+
+_TEXT, _BINARY = b't', b'b'
+
+_hash = getattr(hashlib, 'blake2b', None)
+
+
+class ResponseCache(object):
+    """A cache of responses in a shared memory segment, see the module documentation.
+
+    Every process opens the segment itself, so that the file lock that guards it excludes the other workers.
+
+    Args:
+        path (str): path of the segment, in a shared memory file system such as /dev/shm.
+        capacity_bytes (int): size of the response arena.
+        max_entries (int): maximum number of cached responses.
+        ttl (float): seconds a response is served from the cache.
+        model_version (str): version of the model.
+    """
+
+    def __init__(self, path, capacity_bytes, max_entries=DEFAULT_ENTRIES, ttl=DEFAULT_TTL_IN_SECONDS,
+                 model_version=''):
+        self.path = path
+        self.capacity_bytes = int(capacity_bytes)
+        self.max_entries = int(max_entries)
+        self.ttl = float(ttl)
+        self.model_version = model_version
+        self._thread_lock = threading.Lock()
+        self._pid = None
+        self._requests = 0
+
+    def get_or_compute(self, data, content_type, accept, compute):
+        """Returns the cached response to a request, or computes it with ``compute()`` and caches it.
+
+        Args:
+            data (str or bytes): the request payload.
+            content_type (str): the request content type.
+            accept (str): the requested accept type.
+            compute (function): returns the response as (output data, content type).
+
+        Returns:
+            tuple: the response, as (output data, content type).
+        """
+        key = self.key(data, content_type, accept)
+        deadline = time.time() + _COALESCE_TIMEOUT_IN_SECONDS
+        waited = False
+        while True:
+            with self._locked():
+                response = self._lookup(key, count_coalesced=not waited)
+                if isinstance(response, tuple):
+                    return response
+                if response is None or time.time() > deadline:
+                    break
+            waited = True
+            time.sleep(_POLL_INTERVAL_IN_SECONDS)
+
+        try:
+            output = compute()
+        except Exception:
+            with self._locked():
+                self._discard(key)
+            raise
+
+        with self._locked():
+            self._store(key, output)
+        self._log_stats()
+        return output
+
+    def key(self, data, content_type, accept):
+        """Returns the 16 byte key of a request."""
+        digest = _hash(digest_size=16) if _hash else hashlib.md5()
+        for part in (self.model_version, content_type or '', accept or ''):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        digest.update(data.encode('utf-8') if not isinstance(data, bytes) else data)
+        return digest.digest()
+
+    def stats(self):
+        """Returns the statistics of the cache, shared by all workers.
+
+        Returns:
+            dict: 'hits', 'misses', 'coalesced' (requests that waited for another request to compute their
+                response), 'evictions', 'expirations', 'inserts', 'entries', 'bytes' and 'capacity_bytes'.
+        """
+        with self._locked():
+            header, table = self._header, self._table
+            ready = table['state'] == _READY
+            stats = dict((name, int(header[_HEADER_FIELDS.index(name)]))
+                         for name in ('hits', 'misses', 'coalesced', 'evictions', 'expirations', 'inserts'))
+            stats.update({'entries': int(ready.sum()), 'bytes': int(table['size'][ready].sum()),
+                          'capacity_bytes': self.capacity_bytes})
+            return stats
+
+    def _lookup(self, key, count_coalesced):
+        # returns the response, False if another request is computing it, or None after marking it pending
+        now = time.time()
+        index = self._find(key)
+        entry = self._table[index] if index is not None else None
+        if entry is not None and entry['state'] == _READY and entry['expires'] > now:
+            entry['last_used'] = now
+            self._count('hits')
+            start = int(entry['offset'])
+            return _decode(self._arena[start:start + int(entry['size'])])
+        if entry is not None and entry['state'] == _PENDING and entry['expires'] > now:
+            if count_coalesced:
+                self._count('coalesced')
+            return False
+
+        if entry is not None and entry['state'] == _READY:
+            self._count('expirations')
+        if index is None:
+            index = self._free_slot(now)
+        self._count('misses')
+        if index is not None:
+            self._table[index] = (_split(key), _PENDING, 0, 0, now + _COALESCE_TIMEOUT_IN_SECONDS, now)
+        return None
+
+    def _store(self, key, output):
+        index = self._find(key)
+        value = _encode(output)
+        if len(value) > self.capacity_bytes // 4:
+            if index is not None:
+                self._table[index]['state'] = _EMPTY
+            return
+
+        if index is not None:
+            self._table[index]['state'] = _EMPTY
+        now = time.time()
+        offset = self._allocate(len(value), now)
+        index = self._free_slot(now) if offset is not None else None
+        if index is None:
+            return
+        self._arena[offset:offset + len(value)] = value
+        self._table[index] = (_split(key), _READY, offset, len(value), now + self.ttl, now)
+        self._count('inserts')
+
+    def _discard(self, key):
+        index = self._find(key)
+        if index is not None and self._table[index]['state'] == _PENDING:
+            self._table[index]['state'] = _EMPTY
+
+    def _find(self, key):
+        matches = np.nonzero((self._table['state'] != _EMPTY) & (self._table['key'] == _split(key)).all(axis=1))[0]
+        return int(matches[0]) if len(matches) else None
+
+    def _free_slot(self, now):
+        self._expire(now)
+        while True:
+            free = np.nonzero(self._table['state'] == _EMPTY)[0]
+            if len(free):
+                return int(free[0])
+            if not self._evict_least_recently_used():
+                return None
+
+    def _allocate(self, size, now):
+        # first fit between the responses in the arena, evicting until a gap is large enough
+        self._expire(now)
+        while True:
+            table = self._table
+            used = (table['state'] == _READY) & (table['size'] > 0)
+            offsets, sizes = table['offset'][used], table['size'][used]
+            order = np.argsort(offsets)
+            starts = np.concatenate([[0], offsets[order] + sizes[order]])
+            gaps = np.concatenate([offsets[order], [self.capacity_bytes]]) - starts
+            fits = np.nonzero(gaps >= size)[0]
+            if len(fits):
+                return int(starts[fits[0]])
+            if not self._evict_least_recently_used():
+                return None
+
+    def _expire(self, now):
+        table = self._table
+        expired = ((table['state'] == _READY) | (table['state'] == _PENDING)) & (table['expires'] <= now)
+        self._count('expirations', int(((table['state'] == _READY) & expired).sum()))
+        table['state'][expired] = _EMPTY
+
+    def _evict_least_recently_used(self):
+        ready = np.nonzero(self._table['state'] == _READY)[0]
+        if not len(ready):
+            return False
+        self._table['state'][ready[np.argmin(self._table['last_used'][ready])]] = _EMPTY
+        self._count('evictions')
+        return True
+
+    def _count(self, name, value=1):
+        self._header[_HEADER_FIELDS.index(name)] += value
+
+    def _log_stats(self):
+        self._requests += 1
+        if self._requests % _LOG_STATS_EVERY == 0:
+            logger.info('response cache: {}'.format(json.dumps(self.stats())))
+
+    def _locked(self):
+        return _SegmentLock(self)
+
+    def _open(self):
+        # called with the thread lock held, reopens the segment after a fork
+        if self._pid == os.getpid():
+            return
+        size = _HEADER_BYTES + self.max_entries * _ENTRY.itemsize + self.capacity_bytes
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            buffer = mmap.mmap(fd, size, flags=mmap.MAP_SHARED)
+            self._header = np.frombuffer(buffer, dtype='<i8', count=len(_HEADER_FIELDS))
+            self._table = np.frombuffer(buffer, dtype=_ENTRY, count=self.max_entries, offset=_HEADER_BYTES)
+            self._arena = np.frombuffer(buffer, dtype=np.uint8, count=self.capacity_bytes,
+                                        offset=_HEADER_BYTES + self.max_entries * _ENTRY.itemsize)
+            expected = [_MAGIC, _FORMAT_VERSION, self.capacity_bytes, self.max_entries]
+            if list(self._header[:4]) != expected:
+                # a new segment, or one created with other settings
+                self._header[:] = 0
+                self._header[:4] = expected
+                self._table[:] = np.zeros(1, dtype=_ENTRY)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        self._pid = os.getpid()
+
+
+class _SegmentLock(object):
+    """Excludes the other threads of the process, then the other processes."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def __enter__(self):
+        self.cache._thread_lock.acquire()
+        try:
+            self.cache._open()
+            fcntl.flock(self.cache._fd, fcntl.LOCK_EX)
+        except Exception:
+            self.cache._thread_lock.release()
+            raise
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        fcntl.flock(self.cache._fd, fcntl.LOCK_UN)
+        self.cache._thread_lock.release()
+
+
+def enabled():
+    return int(os.environ.get(CACHE_BYTES_ENV, 0) or 0) > 0
+
+
+def from_env():
+    """Returns a ResponseCache configured by the SAGEMAKER_CHAINER_RESPONSE_CACHE_* environment variables."""
+    return ResponseCache(segment_path(),
+                         int(os.environ[CACHE_BYTES_ENV]),
+                         int(os.environ.get(CACHE_ENTRIES_ENV, DEFAULT_ENTRIES)),
+                         float(os.environ.get(CACHE_TTL_ENV, DEFAULT_TTL_IN_SECONDS)),
+                         os.environ.get(MODEL_VERSION_ENV) or model_fingerprint())
+
+
+def cached(transform_fn, cache=None):
+    """Wraps a transformer's transform_fn(data, content_type, accept) so that its responses are cached.
+
+    Args:
+        transform_fn (function): the transform function.
+        cache (ResponseCache): the cache, or None to create one with :func:`from_env` in the first request.
+
+    Returns:
+        function: the wrapped transform function.
+    """
+    caches = [cache]
+
+    @functools.wraps(transform_fn)
+    def cached_transform_fn(data, content_type, accept):
+        if caches[0] is None:
+            caches[0] = from_env()
+        return caches[0].get_or_compute(data, content_type, accept,
+                                        lambda: transform_fn(data, content_type, accept))
+    return cached_transform_fn
+
+
+def segment_path():
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, _SEGMENT_NAME)
+
+
+def model_fingerprint(model_dir=_MODEL_DIR):
+    """Returns a fingerprint of the names, sizes and modification times of the files in the model directory."""
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(model_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            digest.update('{}:{}:{}\n'.format(os.path.relpath(path, model_dir), stat.st_size,
+                                              stat.st_mtime).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _split(key):
+    return np.frombuffer(key, dtype='<u8')
+
+
+def _encode(output):
+    data, content_type = output
+    kind = _BINARY if isinstance(data, bytes) else _TEXT
+    data = data.encode('utf-8') if kind == _TEXT else data
+    content_type = (content_type or '').encode('utf-8')
+    return np.frombuffer(kind + bytearray([len(content_type)]) + content_type + data, dtype=np.uint8)
+
+
+def _decode(value):
+    value = value.tobytes()
+    content_type_length = bytearray(value[1:2])[0]
+    content_type = value[2:2 + content_type_length].decode('utf-8')
+    data = value[2 + content_type_length:]
+    return (data.decode('utf-8') if value[:1] == _TEXT else data), content_type
+
+
+if __name__ == '__main__':
+    print(json.dumps(from_env().stats() if enabled() else {}, indent=2))
@@ -0,0 +1,129 @@
+"""Encodes and decodes arrays in the Arrow IPC streaming format, with pyarrow if it is installed.
+
+A batch is either a single column of fixed size lists or fixed shape tensors, with one sample per row, or one
+column of numbers per feature. The values of a list or tensor column are contiguous, so a single record batch without
+nulls decodes to a read-only view of the payload. Feature columns are copied into a row-major batch.
+"""
+import numpy as np
+
+# pyarrow is optional
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+
+_COLUMN_NAME = 'values'
+
+
+def available():
+    """Returns whether pyarrow is installed."""
+    return pyarrow is not None
+
+
+def loads(data):
+    """Decodes an Arrow IPC stream into a batch with one sample per row. The record batches of the stream are
+    decoded as one batch.
+
+    Args:
+        data (bytes): the payload.
+
+    Returns:
+        numpy.ndarray: an array of shape (rows, features) for feature columns, or (rows,) + the shape of the
+            samples for a list or tensor column.
+    """
+    _check()
+    table = pyarrow.ipc.open_stream(pyarrow.py_buffer(data)).read_all()
+    if table.num_columns == 0:
+        raise ValueError('the Arrow stream has no columns')
+
+    if table.num_columns == 1 and _is_tensor_type(table.schema.types[0]):
+        chunks = [_tensor_values(chunk) for chunk in table.column(0).chunks if len(chunk)]
+        if not chunks:
+            return np.empty((0,) + _sample_shape(table.schema.types[0]), dtype=np.float32)
+        return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+    columns = []
+    for column in table.columns:
+        if not pyarrow.types.is_integer(column.type) and not pyarrow.types.is_floating(column.type):
+            raise ValueError('Arrow columns must be numbers, or a single column of fixed size lists or tensors, '
+                             'not {}'.format(column.type))
+        columns.append([_numpy(chunk) for chunk in column.chunks])
+
+    dtypes = [chunks[0].dtype for chunks in columns if chunks]
+    batch = np.empty((table.num_rows, table.num_columns), dtype=np.result_type(*dtypes) if dtypes else np.float32)
+    for index, chunks in enumerate(columns):
+        start = 0
+        for chunk in chunks:
+            batch[start:start + len(chunk), index] = chunk
+            start += len(chunk)
+    return batch
+
+
+def dumps(data):
+    """Encodes a batch as an Arrow IPC stream of one record batch.
+
+    A one-dimensional batch is written as a column of numbers, a two-dimensional batch as a column of fixed size
+    lists, and a batch of higher dimensional samples as a column of fixed shape tensors. The column is named 'values'.
+
+    Args:
+        data (array-like): a batch.
+
+    Returns:
+        bytes: the payload.
+    """
+    _check()
+    data = np.ascontiguousarray(data)
+    if data.ndim == 0:
+        data = data.reshape(1)
+
+    if data.ndim == 1:
+        column = pyarrow.array(data)
+    elif data.ndim == 2:
+        column = pyarrow.FixedSizeListArray.from_arrays(pyarrow.array(data.reshape(-1)), data.shape[1])
+    else:
+        column = pyarrow.FixedShapeTensorArray.from_numpy_ndarray(data)
+
+    batch = pyarrow.record_batch([column], names=[_COLUMN_NAME])
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def _check():
+    if pyarrow is None:
+        raise ValueError('the Arrow format needs the pyarrow package')
+
+
+def _is_tensor_type(arrow_type):
+    return pyarrow.types.is_fixed_size_list(arrow_type) or _is_fixed_shape_tensor(arrow_type)
+
+
+def _is_fixed_shape_tensor(arrow_type):
+    # fixed shape tensors are available from pyarrow 12
+    return isinstance(arrow_type, getattr(pyarrow, 'FixedShapeTensorType', ()))
+
+
+def _sample_shape(arrow_type):
+    if _is_fixed_shape_tensor(arrow_type):
+        return tuple(arrow_type.shape)
+    return (arrow_type.list_size,)
+
+
+def _tensor_values(chunk):
+    # fixed shape tensors are stored as fixed size lists of all their values
+    shape = _sample_shape(chunk.type)
+    if _is_fixed_shape_tensor(chunk.type):
+        chunk = chunk.storage
+    if chunk.null_count:
+        raise ValueError('Arrow tensor columns must not have nulls')
+    # flatten accounts for the offset of sliced arrays
+    return _numpy(chunk.flatten()).reshape((len(chunk),) + shape)
+
+
+def _numpy(array):
+    if array.null_count:
+        raise ValueError('Arrow columns must not have nulls')
+    return array.to_numpy(zero_copy_only=True)
@@ -0,0 +1,144 @@
+import gzip
+import io
+import re
+import zlib
+
+# zstd is optional
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = 'gzip'
+DEFLATE = 'deflate'
+ZSTD = 'zstd'
+
+_ENCODING_PARAMETER = re.compile(r'\s*;\s*content-encoding\s*=\s*"?([\w-]+)"?', re.IGNORECASE)
+_CHUNK_BYTES = 64 * 1024
+_DEFAULT_ZLIB_LEVEL = 1
+_DEFAULT_ZSTD_LEVEL = 3
+
+
+def encodings():
+    """Returns the content encodings that are available."""
+    return [GZIP, DEFLATE] + ([ZSTD] if zstandard is not None else [])
+
+
+def parse(content_type):
+    """Splits the content-encoding parameter from a content type or accept type.
+
+    SageMaker passes the Content-Type and Accept headers to transform_fn, but not Content-Encoding and
+    Accept-Encoding, so compressed payloads are marked with a parameter of the content type, such as
+    'text/csv; content-encoding=gzip'.
+
+    Args:
+        content_type (str): the content type, with or without a content-encoding parameter.
+
+    Returns:
+        tuple: the content type without the parameter, and the encoding in lower case, or None.
+    """
+    match = _ENCODING_PARAMETER.search(content_type or '')
+    if match is None:
+        return content_type, None
+    return (content_type[:match.start()] + content_type[match.end():]).strip(), match.group(1).lower()
+
+
+def with_encoding(content_type, encoding):
+    """Returns a content type with a content-encoding parameter."""
+    return '{}; content-encoding={}'.format(content_type, encoding)
+
+
+def decompressed_stream(data, encoding):
+    """Returns a binary file object that decompresses a payload as it is read, so that decoders never hold the whole
+    decompressed payload in addition to what they decode.
+
+    Args:
+        data (bytes): the compressed payload.
+        encoding (str): 'gzip', 'deflate' (zlib format, or raw deflate) or 'zstd'.
+
+    Returns:
+        a readable binary file object.
+    """
+    _check(encoding)
+    if encoding == GZIP:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == DEFLATE:
+        # HTTP deflate is the zlib format, but some clients send raw deflate
+        raw = len(data) > 0 and (bytearray(data[:1])[0] & 0x0f) != 8
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS if raw else zlib.MAX_WBITS)
+    else:
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    return _DecompressingReader(data, decompressor)
+
+
+def compress(data, encoding, level=None):
+    """Compresses a payload.
+
+    Args:
+        data (bytes): the payload.
+        encoding (str): 'gzip', 'deflate' or 'zstd'.
+        level (int): the compression level, or None for the default level: 1 for gzip and deflate, which compresses
+            numeric CSV and JSON almost as well as the zlib default of 6 in a fraction of the time, and 3 for zstd.
+
+    Returns:
+        bytes: the compressed payload.
+    """
+    _check(encoding)
+    if encoding == GZIP:
+        buffer = io.BytesIO()
+        level = _DEFAULT_ZLIB_LEVEL if level is None else level
+        with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=level, mtime=0) as f:
+            f.write(data)
+        return buffer.getvalue()
+    if encoding == DEFLATE:
+        return zlib.compress(data, _DEFAULT_ZLIB_LEVEL if level is None else level)
+    return zstandard.ZstdCompressor(level=_DEFAULT_ZSTD_LEVEL if level is None else level).compress(data)
+
+
+def _check(encoding):
+    if encoding not in encodings():
+        raise ValueError('unsupported content encoding: {}'.format(encoding))
+
+
+class _DecompressingReader(io.BufferedIOBase):
+    def __init__(self, data, decompressor):
+        self._data = data
+        self._offset = 0
+        self._decompressor = decompressor
+        self._chunk = b''
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            parts = [self._chunk[self._position:]]
+            while self._decompress_next():
+                parts.append(self._chunk)
+            self._chunk, self._position = b'', 0
+            return b''.join(parts)
+
+        while self._position >= len(self._chunk):
+            if not self._decompress_next():
+                return b''
+        data = self._chunk[self._position:self._position + size]
+        self._position += len(data)
+        return data
+
+    read1 = read
+
+    def _decompress_next(self):
+        # replaces the current chunk with the next decompressed chunk, returns False at the end of the payload
+        self._chunk, self._position = b'', 0
+        while not self._chunk:
+            if self._offset >= len(self._data):
+                if self._decompressor is None:
+                    return False
+                self._chunk = self._decompressor.flush()
+                self._decompressor = None
+                continue
+            compressed = self._data[self._offset:self._offset + _CHUNK_BYTES]
+            self._offset += len(compressed)
+            self._chunk = self._decompressor.decompress(compressed)
+        return True
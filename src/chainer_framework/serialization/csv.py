@@ -1,3 +1,5 @@
+import io
+
 import numpy as np
 from six import StringIO
 
@@ -11,6 +13,11 @@ def loads(data):
     return np.genfromtxt(stream, dtype=np.float32, delimiter=',')
 
 
+def load(stream):
+    """Loads CSV from a binary file object, such as a decompressed request body."""
+    return np.genfromtxt(io.TextIOWrapper(stream, encoding='utf-8'), dtype=np.float32, delimiter=',')
+
+
 def dumps(data):
     stream = StringIO()
     np.savetxt(stream, data, delimiter=',', fmt='%s')
@@ -0,0 +1,239 @@
+"""Decodes JPEG and PNG images, and payloads of several images, into a float32 batch in NCHW layout, with OpenCV if
+it is installed.
+
+Content types:
+
+* image/jpeg and image/png: a single image, decoded as a batch of one.
+* multipart/form-data and multipart/mixed: an image per part, in order.
+* application/x-tar: an image per regular file, in the order of the archive.
+
+Like ``chainercv.utils.read_image``, pixels are float32 values from 0 to 255 in RGB order by default. Each image is
+decoded by a thread of a pool into a uint8 image, which is resized and cropped, then converted and copied into its
+sample of a preallocated batch. Mean and standard deviation normalization is applied to the whole batch at once. The
+images of a batch must have the same size after resizing and cropping.
+
+Payloads that can't be decoded raise ValueError.
+"""
+import atexit
+import collections
+import io
+import os
+import re
+import tarfile
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+# OpenCV is optional
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+JPEG_CONTENT_TYPE = 'image/jpeg'
+PNG_CONTENT_TYPE = 'image/png'
+TAR_CONTENT_TYPE = 'application/x-tar'
+MULTIPART_CONTENT_TYPES = ('multipart/form-data', 'multipart/mixed')
+CONTENT_TYPES = (JPEG_CONTENT_TYPE, PNG_CONTENT_TYPE, TAR_CONTENT_TYPE) + MULTIPART_CONTENT_TYPES
+
+COLORS = ('rgb', 'bgr', 'grayscale')
+
+_BOUNDARY_PARAMETER = re.compile(r';\s*boundary="?([^";]+)"?', re.IGNORECASE)
+
+Preprocessing = collections.namedtuple('Preprocessing', ['resize', 'crop', 'mean', 'std', 'color'])
+"""How images are preprocessed: resize, a (height, width) tuple, or a (size,) tuple to resize the shorter side to
+size and keep the aspect ratio; crop, the (height, width) of the center crop; mean and std, arrays of a value per
+channel, or of a single value; and color, 'rgb', 'bgr' or 'grayscale'. Steps that are None are skipped."""
+
+NO_PREPROCESSING = Preprocessing(None, None, None, None, 'rgb')
+
+# process id, thread count and the thread pool that decodes images. Forked serving workers create their own pool.
+_pool = (None, None, None)
+
+
+def available():
+    """Returns whether OpenCV is installed."""
+    return cv2 is not None
+
+
+def accepts(content_type):
+    """Returns whether a content type, with or without parameters, is one of the image content types."""
+    return _media_type(content_type) in CONTENT_TYPES
+
+
+def parse_preprocessing(resize=None, crop=None, mean=None, std=None, color=None):
+    """Builds the preprocessing steps from strings, such as environment variables.
+
+    Args:
+        resize (str): 'height,width', or a single number to resize the shorter side to.
+        crop (str): 'height,width', or a single number for a square center crop.
+        mean (str): comma-separated values per channel, or a single value, to subtract.
+        std (str): comma-separated values per channel, or a single value, to divide by.
+        color (str): 'rgb' (the default), 'bgr' or 'grayscale'.
+
+    Returns:
+        Preprocessing: the preprocessing steps.
+    """
+    color = (color or 'rgb').lower()
+    if color not in COLORS:
+        raise ValueError('the image color must be one of {}, not {}'.format(', '.join(COLORS), color))
+
+    crop = _numbers(crop, int)
+    return Preprocessing(resize=_numbers(resize, int),
+                         crop=crop * 2 if crop is not None and len(crop) == 1 else crop,
+                         mean=np.array(_numbers(mean, float), dtype=np.float32) if mean else None,
+                         std=np.array(_numbers(std, float), dtype=np.float32) if std else None,
+                         color=color)
+
+
+def _numbers(value, number_type):
+    if not value:
+        return None
+    numbers = tuple(number_type(number) for number in str(value).split(','))
+    if number_type is int and (len(numbers) > 2 or min(numbers) <= 0):
+        raise ValueError('image sizes must be one or two positive numbers, not {}'.format(value))
+    return numbers
+
+
+def loads(data, content_type, preprocessing=NO_PREPROCESSING, threads=1):
+    """Decodes a payload of images into a batch.
+
+    Args:
+        data (bytes): the payload.
+        content_type (str): one of :data:`CONTENT_TYPES`. Multipart content types must have a boundary parameter.
+        preprocessing (Preprocessing): the preprocessing steps, see :func:`parse_preprocessing`.
+        threads (int): the number of threads that decode images.
+
+    Returns:
+        numpy.ndarray: a float32 batch of shape (images, channels, height, width).
+    """
+    _check()
+    images = _split(data, content_type)
+    if not images:
+        raise ValueError('the payload has no images')
+
+    channels = 1 if preprocessing.color == 'grayscale' else 3
+    size = _output_size(preprocessing)
+    first = None
+    if size is None:
+        # the first image decides the size of the batch
+        first = _decode(images[0], 0, preprocessing)
+        size = first.shape[:2]
+
+    batch = np.empty((len(images), channels) + tuple(size), dtype=np.float32)
+
+    def decode(index):
+        image = first if index == 0 and first is not None else _decode(images[index], index, preprocessing)
+        if image.shape[:2] != batch.shape[2:]:
+            raise ValueError('image {} is {}x{}, not {}x{} like the first image of the payload; configure a resize '
+                             'or a crop'.format(index, image.shape[0], image.shape[1], size[0], size[1]))
+        if image.ndim == 2:
+            batch[index, 0] = image
+        elif preprocessing.color == 'rgb':
+            batch[index] = image[:, :, ::-1].transpose(2, 0, 1)
+        else:
+            batch[index] = image.transpose(2, 0, 1)
+
+    _map(decode, range(len(images)), threads)
+
+    if preprocessing.mean is not None:
+        batch -= preprocessing.mean.reshape(1, -1, 1, 1)
+    if preprocessing.std is not None:
+        batch *= (1 / preprocessing.std).reshape(1, -1, 1, 1)
+    return batch
+
+
+def _check():
+    if cv2 is None:
+        raise ValueError('image content types need the opencv-python package')
+
+
+def _media_type(content_type):
+    return (content_type or '').split(';', 1)[0].strip().lower()
+
+
+def _split(data, content_type):
+    media_type = _media_type(content_type)
+    if media_type in (JPEG_CONTENT_TYPE, PNG_CONTENT_TYPE):
+        return [data]
+    if media_type == TAR_CONTENT_TYPE:
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            return [tar.extractfile(member).read() for member in tar if member.isfile()]
+    if media_type in MULTIPART_CONTENT_TYPES:
+        return _multipart_bodies(data, content_type)
+    raise ValueError('{} is not an image content type'.format(content_type))
+
+
+def _multipart_bodies(data, content_type):
+    match = _BOUNDARY_PARAMETER.search(content_type)
+    if match is None:
+        raise ValueError('the multipart content type has no boundary parameter')
+    delimiter = b'--' + match.group(1).encode('ascii')
+
+    bodies = []
+    # the first part is the preamble, and the part after the close delimiter the epilogue
+    for part in data.split(delimiter)[1:]:
+        if part.startswith(b'--'):
+            break
+        _, _, body = part.partition(b'\r\n\r\n')
+        bodies.append(body[:-2] if body.endswith(b'\r\n') else body)
+    return bodies
+
+
+def _output_size(preprocessing):
+    if preprocessing.crop is not None:
+        return preprocessing.crop
+    if preprocessing.resize is not None and len(preprocessing.resize) == 2:
+        return preprocessing.resize
+    return None
+
+
+def _decode(data, index, preprocessing):
+    flags = cv2.IMREAD_GRAYSCALE if preprocessing.color == 'grayscale' else cv2.IMREAD_COLOR
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+    if image is None:
+        raise ValueError('image {} of the payload could not be decoded'.format(index))
+
+    if preprocessing.resize is not None:
+        image = _resize(image, preprocessing.resize)
+    if preprocessing.crop is not None:
+        image = _center_crop(image, preprocessing.crop, index)
+    return image
+
+
+def _resize(image, size):
+    height, width = image.shape[:2]
+    if len(size) == 1:
+        scale = float(size[0]) / min(height, width)
+        size = (max(1, int(round(height * scale))), max(1, int(round(width * scale))))
+    if size == (height, width):
+        return image
+    # area interpolation avoids aliasing when shrinking
+    interpolation = cv2.INTER_AREA if size[0] < height and size[1] < width else cv2.INTER_LINEAR
+    return cv2.resize(image, (size[1], size[0]), interpolation=interpolation)
+
+
+def _center_crop(image, size, index):
+    height, width = image.shape[:2]
+    if size[0] > height or size[1] > width:
+        raise ValueError('image {} is {}x{}, smaller than the {}x{} crop'
+                         .format(index, height, width, size[0], size[1]))
+    top = (height - size[0]) // 2
+    left = (width - size[1]) // 2
+    return image[top:top + size[0], left:left + size[1]]
+
+
+def _map(function, items, threads):
+    global _pool
+    items = list(items)
+    if threads <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+
+    pid, pool_threads, pool = _pool
+    if pid != os.getpid() or pool_threads != threads:
+        if pid == os.getpid():
+            pool.close()
+        pool = ThreadPool(threads)
+        atexit.register(pool.terminate)
+        _pool = (os.getpid(), threads, pool)
+    return pool.map(function, items)
@@ -7,6 +7,12 @@ def loads(data):
     return np.load(stream)
 
 
+def load(stream):
+    """Loads an array in NPY format from a binary file object, such as a decompressed request body, reading it
+    sequentially."""
+    return np.lib.format.read_array(stream)
+
+
 def dumps(data):
     buffer = BytesIO()
     np.save(buffer, data)
@@ -0,0 +1,324 @@
+"""Encodes and decodes arrays as RecordIO-protobuf, the format of SageMaker's built-in algorithms and pipelines.
+
+A payload is a sequence of RecordIO records, each holding an ``aialgs.data.Record`` protobuf message (see
+record.proto in the SageMaker Python SDK). Every record is one sample: the tensor of its 'values' feature, or of its
+only feature. The records of a payload are decoded as one batch.
+
+The protobuf wire format is parsed here rather than with generated classes, so that the packed values of dense tensors
+are mapped onto the payload with ``np.frombuffer`` instead of being decoded one element at a time. Payloads whose
+records all have the same layout, such as those written by ``sagemaker.amazon.common.write_numpy_to_dense_tensor``
+or by :func:`dumps`, are decoded as a strided view of the payload without copying.
+"""
+import struct
+
+import numpy as np
+import six
+
+CONTENT_TYPE = 'application/x-recordio-protobuf'
+
+_MAGIC = 0xced7230a
+_MAGIC_BYTES = struct.pack('<I', _MAGIC)
+_LENGTH_MASK = (1 << 29) - 1
+
+# protobuf wire types
+_VARINT = 0
+_FIXED64 = 1
+_LENGTH_DELIMITED = 2
+_FIXED32 = 5
+
+# field numbers of Record.features, of the key and value of its map entries, and of Tensor.values, keys and shape
+_FEATURES = 1
+_KEY = 1
+_VALUE = 2
+_TENSOR_VALUES = 1
+_TENSOR_KEYS = 2
+_TENSOR_SHAPE = 3
+# field number of each tensor type in Value, and the dtype of its values. The values of Int32Tensor are varints,
+# which can't be mapped onto the payload.
+_TENSOR_DTYPES = {2: np.dtype('<f4'), 3: np.dtype('<f8')}
+_TENSOR_FIELDS = {np.dtype('<f4'): 2, np.dtype('<f8'): 3}
+
+_FEATURE_NAME = 'values'
+
+
+def loads(data):
+    """Decodes a RecordIO-protobuf payload into a batch with one sample per record.
+
+    Args:
+        data (bytes): the payload.
+
+    Returns:
+        numpy.ndarray: an array of shape (records,) + the shape of the records' tensors. It is a read-only view of
+            ``data`` if the records have the same layout.
+    """
+    view = _uniform_view(data)
+    if view is not None:
+        return view
+
+    records = _records(data)
+    if not records:
+        raise ValueError('the RecordIO-protobuf payload has no records')
+
+    tensors = [_record_tensor(data, record) for record in records]
+    shape = tensors[0].shape
+    if any(tensor.shape != shape for tensor in tensors):
+        raise ValueError('the records of a RecordIO-protobuf payload must have tensors of the same shape')
+
+    batch = np.zeros((len(tensors),) + shape, dtype=np.result_type(*[tensor.values.dtype for tensor in tensors]))
+    flat = batch.reshape(len(tensors), -1)
+    for row, tensor in zip(flat, tensors):
+        if tensor.keys is None:
+            row[:] = tensor.values
+        else:
+            row[tensor.keys] = tensor.values
+    return batch
+
+
+def dumps(data):
+    """Encodes a batch as RecordIO-protobuf, one record per sample, with the sample as the dense 'values' feature.
+
+    The records have the same layout, so they are written at once rather than one at a time.
+
+    Args:
+        data (array-like): a batch of float32 or float64 samples. Other types are converted to float32. The samples of
+            a one-dimensional batch are written as vectors of one value.
+
+    Returns:
+        bytes: the payload.
+    """
+    data = np.asarray(data)
+    if data.ndim < 2:
+        data = data.reshape(-1, 1)
+    dtype = data.dtype.newbyteorder('<') if data.dtype.kind == 'f' and data.dtype.itemsize in (4, 8) else '<f4'
+    data = np.ascontiguousarray(data, dtype=dtype)
+    if len(data) == 0:
+        return b''
+
+    values_bytes = data[0].nbytes
+    shape = data.shape[1:]
+    # the shape is only recorded for samples that aren't vectors, as write_numpy_to_dense_tensor does
+    shape_field = _length_delimited(_TENSOR_SHAPE, b''.join(_varint(size) for size in shape)) if len(shape) != 1 \
+        else b''
+    tensor_length = 1 + len(_varint(values_bytes)) + values_bytes + len(shape_field)
+    value_field = _tag(_TENSOR_FIELDS[data.dtype], _LENGTH_DELIMITED) + _varint(tensor_length)
+    entry_length = len(_length_delimited(_KEY, _FEATURE_NAME.encode('utf-8'))) + 1 + \
+        len(_varint(len(value_field) + tensor_length)) + len(value_field) + tensor_length
+    record_length = 1 + len(_varint(entry_length)) + entry_length
+
+    prefix = _tag(_FEATURES, _LENGTH_DELIMITED) + _varint(entry_length) + \
+        _length_delimited(_KEY, _FEATURE_NAME.encode('utf-8')) + \
+        _tag(_VALUE, _LENGTH_DELIMITED) + _varint(len(value_field) + tensor_length) + value_field + \
+        _tag(_TENSOR_VALUES, _LENGTH_DELIMITED) + _varint(values_bytes)
+    prefix = struct.pack('<II', _MAGIC, record_length) + prefix
+    suffix = shape_field + b'\x00' * (-record_length % 4)
+
+    records = np.empty((len(data), len(prefix) + values_bytes + len(suffix)), dtype=np.uint8)
+    records[:, :len(prefix)] = np.frombuffer(prefix, dtype=np.uint8)
+    records[:, len(prefix):len(prefix) + values_bytes] = data.reshape(len(data), -1).view(np.uint8)
+    records[:, len(prefix) + values_bytes:] = np.frombuffer(suffix, dtype=np.uint8)
+    return records.tobytes()
+
+
+class _Tensor(object):
+    def __init__(self, values, values_start, keys, shape):
+        self.values = values
+        # offset of the values in the record, if they are a single packed field
+        self.values_start = values_start
+        self.keys = keys
+        self.shape = shape
+
+
+def _records(data):
+    """Returns the (start, end) of the protobuf message of every record of a RecordIO payload, or, for messages
+    that the writer split into several records, the message itself."""
+    records = []
+    parts = None
+    offset = 0
+    while offset < len(data):
+        if len(data) - offset < 8:
+            raise ValueError('truncated RecordIO record at byte {}'.format(offset))
+        magic, length = struct.unpack_from('<II', data, offset)
+        if magic != _MAGIC:
+            raise ValueError('invalid RecordIO magic number at byte {}'.format(offset))
+        flag, length = length >> 29, length & _LENGTH_MASK
+        start = offset + 8
+        if start + length > len(data):
+            raise ValueError('truncated RecordIO record at byte {}'.format(offset))
+
+        # flags 1, 2 and 3 mark the first, middle and last part of a message that contained the magic number
+        if flag == 0:
+            records.append((start, start + length))
+        elif flag == 1:
+            parts = [data[start:start + length]]
+        elif parts is not None and flag in (2, 3):
+            parts.append(data[start:start + length])
+            if flag == 3:
+                records.append(_MAGIC_BYTES.join(parts))
+                parts = None
+        else:
+            raise ValueError('invalid RecordIO record at byte {}'.format(offset))
+        offset = start + (length + 3) // 4 * 4
+    return records
+
+
+def _uniform_view(data):
+    # the records have the same layout if they have the same length and are identical outside of their values, in
+    # which case the values of every record are at the same offset, and the payload is a matrix of records
+    if len(data) < 8:
+        return None
+    magic, length = struct.unpack_from('<II', data)
+    stride = 8 + (length + 3) // 4 * 4
+    if magic != _MAGIC or length >> 29 or len(data) % stride:
+        return None
+    tensor = _read_tensor(data, 8, 8 + length)
+    if tensor.keys is not None or tensor.values_start is None:
+        return None
+
+    rows = np.frombuffer(data, dtype=np.uint8).reshape(-1, stride)
+    values_start = 8 + tensor.values_start
+    values_end = values_start + tensor.values.nbytes
+    if not (rows[1:, :values_start] == rows[0, :values_start]).all() or \
+            not (rows[1:, values_end:] == rows[0, values_end:]).all():
+        return None
+    return rows[:, values_start:values_end].view(tensor.values.dtype).reshape((len(rows),) + tensor.shape)
+
+
+def _record_tensor(data, record):
+    # a record is the (start, end) of a message in the payload, or a message that was split into several records
+    if isinstance(record, tuple):
+        return _read_tensor(data, *record)
+    return _read_tensor(record, 0, len(record))
+
+
+def _read_tensor(data, start, end):
+    features = {}
+    for field, wire_type, value_start, value_end in _fields(data, start, end):
+        if field == _FEATURES and wire_type == _LENGTH_DELIMITED:
+            key, value = _read_map_entry(data, value_start, value_end)
+            features[key] = value
+    if _FEATURE_NAME in features:
+        value = features[_FEATURE_NAME]
+    elif len(features) == 1:
+        value = list(features.values())[0]
+    else:
+        raise ValueError('a RecordIO-protobuf record must have a "values" feature, or a single feature')
+
+    for field, wire_type, tensor_start, tensor_end in _fields(data, *value):
+        if wire_type == _LENGTH_DELIMITED:
+            if field not in _TENSOR_DTYPES:
+                raise ValueError('only Float32Tensor and Float64Tensor features are supported')
+            return _parse_tensor(data, tensor_start, tensor_end, _TENSOR_DTYPES[field], start)
+    raise ValueError('a RecordIO-protobuf feature has no tensor')
+
+
+def _read_map_entry(data, start, end):
+    key, value = '', (start, start)
+    for field, wire_type, value_start, value_end in _fields(data, start, end):
+        if field == _KEY and wire_type == _LENGTH_DELIMITED:
+            key = data[value_start:value_end].decode('utf-8')
+        elif field == _VALUE and wire_type == _LENGTH_DELIMITED:
+            value = (value_start, value_end)
+    return key, value
+
+
+def _parse_tensor(data, start, end, dtype, record_start):
+    values, values_start, keys, shape = [], None, [], []
+    for field, wire_type, value_start, value_end in _fields(data, start, end):
+        if field == _TENSOR_VALUES and wire_type == _LENGTH_DELIMITED:
+            values.append(np.frombuffer(data, dtype=dtype, count=(value_end - value_start) // dtype.itemsize,
+                                        offset=value_start))
+            values_start = value_start - record_start
+        elif field == _TENSOR_VALUES and wire_type in (_FIXED32, _FIXED64):
+            # values that weren't packed, one field per value
+            values.append(np.frombuffer(data, dtype=dtype, count=1, offset=value_start))
+        elif field in (_TENSOR_KEYS, _TENSOR_SHAPE):
+            target = keys if field == _TENSOR_KEYS else shape
+            if wire_type == _LENGTH_DELIMITED:
+                target.extend(_read_varints(data, value_start, value_end))
+            elif wire_type == _VARINT:
+                target.append(value_start)
+
+    if len(values) != 1:
+        values_start = None
+        values = np.concatenate(values) if values else np.empty(0, dtype)
+    else:
+        values = values[0]
+    keys = np.array(keys, dtype=np.intp) if keys else None
+    if shape:
+        shape = tuple(shape)
+    elif keys is not None:
+        raise ValueError('sparse RecordIO-protobuf tensors must have a shape')
+    else:
+        shape = values.shape
+    if keys is None and int(np.prod(shape)) != len(values):
+        raise ValueError('a RecordIO-protobuf tensor of shape {} has {} values'.format(shape, len(values)))
+    if keys is not None and len(keys) != len(values):
+        raise ValueError('a sparse RecordIO-protobuf tensor has {} keys and {} values'.format(len(keys), len(values)))
+    return _Tensor(values, values_start, keys, shape)
+
+
+def _fields(data, start, end):
+    """Yields (field number, wire type, start, end) of the fields of a protobuf message. For varint fields, start is
+    the value and end is None."""
+    position = start
+    while position < end:
+        key, position = _read_varint(data, position)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == _VARINT:
+            value, position = _read_varint(data, position)
+            yield field, wire_type, value, None
+            continue
+        if wire_type == _LENGTH_DELIMITED:
+            length, position = _read_varint(data, position)
+        elif wire_type == _FIXED64:
+            length = 8
+        elif wire_type == _FIXED32:
+            length = 4
+        else:
+            raise ValueError('unsupported protobuf wire type {}'.format(wire_type))
+        if position + length > end:
+            raise ValueError('truncated protobuf message')
+        yield field, wire_type, position, position + length
+        position += length
+
+
+def _read_varint(data, position):
+    result = 0
+    shift = 0
+    while True:
+        if position >= len(data):
+            raise ValueError('truncated protobuf varint')
+        byte = six.indexbytes(data, position)
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+
+
+def _read_varints(data, start, end):
+    values = []
+    while start < end:
+        value, start = _read_varint(data, start)
+        values.append(value)
+    return values
+
+
+def _varint(value):
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def _tag(field, wire_type):
+    return _varint(field << 3 | wire_type)
+
+
+def _length_delimited(field, data):
+    return _tag(field, _LENGTH_DELIMITED) + _varint(len(data)) + data
@@ -1,4 +1,8 @@
+import functools
+import io
 import json
+import logging
+import os
 
 import numpy as np
 import chainer
@@ -9,18 +13,107 @@ try:
 except ImportError:
     None
 
-from chainer_framework.serialization import npy, csv
+from chainer_framework import acceleration, optimization, postprocessing, preload, quantization, response_cache, \
+    threads
+from chainer_framework.serialization import arrow, compression, image, npy, csv, recordio
 from container_support.app import ServingEngine
 from container_support.serving import JSON_CONTENT_TYPE, CSV_CONTENT_TYPE, NPY_CONTENT_TYPE, \
-    UnsupportedContentTypeError, UnsupportedAcceptTypeError
+    UnsupportedContentTypeError, UnsupportedAcceptTypeError, UnsupportedInputShapeError
 
-engine = ServingEngine()
+logger = logging.getLogger(__name__)
+
+
+class ChainerServingEngine(ServingEngine):
+    """Serving engine that can load the model once, before the serving workers are forked.
+
+    If the SAGEMAKER_CHAINER_PRELOAD_MODEL environment variable is 'true', gunicorn loads the application, and so runs
+    model_fn, in its master process, and the workers share the model's memory copy-on-write instead of each loading
+    their own copy. See :mod:`chainer_framework.preload`. Preloading keeps the model on the CPU; predict_fn moves it to
+    the GPU in each worker. With SAGEMAKER_CHAINER_WARMUP_SAMPLES, the model is optimized and quantized in the master
+    process too, before its arrays are shared.
+
+    If the SAGEMAKER_CHAINER_RESPONSE_CACHE_BYTES environment variable is set, responses are cached in a segment of
+    shared memory, so that the workers answer repeated requests without running transform_fn. See
+    :mod:`chainer_framework.response_cache`.
+
+    The BLAS and OpenMP threads of the workers are budgeted, and the workers can be pinned to their own CPUs, see
+    :mod:`chainer_framework.threads`.
+    """
+
+    def load_dependencies(self):
+        super(ChainerServingEngine, self).load_dependencies()
+        logger.info('thread budget of the serving workers: {}'.format(threads.describe(threads.serving_layout())))
+        if preload.enabled():
+            preload.configure_gunicorn()
+
+    def transformer(self, user_module):
+        if preload.enabled() and hasattr(user_module, 'model_fn'):
+            user_module.model_fn = preload.shared_model_fn(_optimized_model_fn(user_module.model_fn))
+        transformer = super(ChainerServingEngine, self).transformer(user_module)
+        if response_cache.enabled():
+            transformer.transform_fn = response_cache.cached(transformer.transform_fn)
+        if threads.affinity_enabled():
+            transformer.transform_fn = threads.pinned(transformer.transform_fn)
+        return transformer
+
+
+engine = ChainerServingEngine()
+
+# Set to 'true' to optimize the model for inference on the first request, see chainer_framework.optimization.
+OPTIMIZE_MODEL_ENV = 'SAGEMAKER_CHAINER_OPTIMIZE_MODEL'
+# Set to 'linear' to quantize Linear links to int8, or to 'all' to also quantize Convolution2D links.
+QUANTIZE_MODEL_ENV = 'SAGEMAKER_CHAINER_QUANTIZE_MODEL'
+# 'int8' (the default), or 'float16' to store the quantized weights in half precision.
+QUANTIZATION_DTYPE_ENV = 'SAGEMAKER_CHAINER_QUANTIZATION_DTYPE'
+# Largest relative error of the quantized model's predictions for the calibration samples. Defaults to 0.05.
+QUANTIZATION_TOLERANCE_ENV = 'SAGEMAKER_CHAINER_QUANTIZATION_TOLERANCE'
+# Smallest speedup of the quantized model over the float32 model on the warm-up samples for it to be served. Unset by
+# default: quantization saves weight memory, not time, since the weights are dequantized to float32 for the matrix
+# products. The speed is measured in each process that quantizes the model, so workers may decide differently.
+QUANTIZATION_MIN_SPEEDUP_ENV = 'SAGEMAKER_CHAINER_QUANTIZATION_MIN_SPEEDUP'
+# 'auto' (the default) to serve with iDeep on CPU instances where it is available, unless the model is shared between
+# the workers or memory mapped, 'ideep' or 'none'.
+CPU_ACCELERATION_ENV = 'SAGEMAKER_CHAINER_CPU_ACCELERATION'
+# Path of a .npy file of warm-up samples, used instead of the first request to check the optimizations. Quantization is
+# only calibrated and checked on warm-up samples, so that every worker serves the same model.
+WARMUP_SAMPLES_ENV = 'SAGEMAKER_CHAINER_WARMUP_SAMPLES'
+
+# Set to 'true' to serve with the asyncio front end instead of nginx and gunicorn, see chainer_framework.async_server.
+ASYNC_SERVER_ENV = 'SAGEMAKER_CHAINER_ASYNC_SERVER'
+
+# Preprocessing of image payloads, see chainer_framework.serialization.image.parse_preprocessing. 'height,width', or a
+# number to resize the shorter side to.
+IMAGE_RESIZE_ENV = 'SAGEMAKER_CHAINER_IMAGE_RESIZE'
+# 'height,width', or a number, of the center crop.
+IMAGE_CROP_ENV = 'SAGEMAKER_CHAINER_IMAGE_CROP'
+# Comma-separated values per channel to subtract from, and to divide the pixels by.
+IMAGE_MEAN_ENV = 'SAGEMAKER_CHAINER_IMAGE_MEAN'
+IMAGE_STD_ENV = 'SAGEMAKER_CHAINER_IMAGE_STD'
+# 'rgb' (the default), 'bgr' or 'grayscale'.
+IMAGE_COLOR_ENV = 'SAGEMAKER_CHAINER_IMAGE_COLOR'
+# Threads that decode the images of a payload. Defaults to the worker's thread budget, see chainer_framework.threads.
+IMAGE_DECODE_THREADS_ENV = 'SAGEMAKER_CHAINER_IMAGE_DECODE_THREADS'
+
+# Responses smaller than this many bytes are not compressed. Defaults to 1024.
+COMPRESSION_MIN_BYTES_ENV = 'SAGEMAKER_CHAINER_COMPRESSION_MIN_BYTES'
+# Compression level of responses. Defaults to 1 for gzip and deflate, and 3 for zstd.
+COMPRESSION_LEVEL_ENV = 'SAGEMAKER_CHAINER_COMPRESSION_LEVEL'
+
+# Reduction of the predictions of requests whose accept type has no output parameter, such as 'output=top-k; k=5'.
+# See chainer_framework.postprocessing. Defaults to none.
+OUTPUT_ENV = 'SAGEMAKER_CHAINER_OUTPUT'
+
+# id of the model returned by model_fn: (that model, the model predict_fn uses, whether it runs with iDeep)
+_prepared_models = {}
+# id of a model optimized before it was shared with the workers: that model
+_optimized_models = {}
 
 
 @engine.model_fn()
 def model_fn(model_dir):
     """
-    Loads a model
+    Loads a model. :func:`chainer_framework.artifacts.load` loads a model.npz file, or the memory-mappable artifact
+    saved with the `save_mmap_model` hyperparameter, into a Chainer link.
     Args:
         model_dir:
 
@@ -33,13 +126,27 @@ def model_fn(model_dir):
 
 @engine.input_fn()
 def input_fn(serialized_input_data, content_type):
-    """A default input_fn that can handle JSON, CSV and NPZ formats.
+    """A default input_fn that can handle JSON, CSV and NPZ formats, RecordIO-protobuf, and, if pyarrow is installed,
+    Arrow IPC streams. RecordIO-protobuf and Arrow payloads are decoded as one batch with a sample per record or row,
+    see :mod:`chainer_framework.serialization.recordio` and :mod:`chainer_framework.serialization.arrow`.
+
+    If OpenCV is installed, JPEG and PNG images, and multipart and tar payloads of images, are decoded into a float32
+    NCHW batch, resized, cropped and normalized as the SAGEMAKER_CHAINER_IMAGE_* environment variables configure. See
+    :mod:`chainer_framework.serialization.image`. Image payloads that can't be decoded raise
+    UnsupportedInputShapeError, which is answered with a 412 status.
+
+    Payloads compressed with gzip, deflate or zstd (if the zstandard package is installed) are marked with a
+    content-encoding parameter of the content type, such as 'text/csv; content-encoding=gzip', and are decompressed
+    as they are decoded.
 
     Args:
         serialized_input_data: the request payload serialized in the content_type format
         content_type: the request content_type
     Returns: deserialized input_data
     """
+    content_type, encoding = compression.parse(content_type)
+    if encoding is not None:
+        return _load_compressed(serialized_input_data, content_type, encoding)
 
     if content_type == NPY_CONTENT_TYPE:
         return npy.loads(serialized_input_data)
@@ -51,13 +158,74 @@ def input_fn(serialized_input_data, content_type):
     if content_type == CSV_CONTENT_TYPE:
         return csv.loads(serialized_input_data)
 
+    if content_type == recordio.CONTENT_TYPE:
+        return recordio.loads(serialized_input_data)
+
+    if content_type == arrow.CONTENT_TYPE and arrow.available():
+        return arrow.loads(serialized_input_data)
+
+    if image.accepts(content_type) and image.available():
+        return _load_images(serialized_input_data, content_type)
+
     raise UnsupportedContentTypeError(content_type)
 
 
+def _load_images(serialized_input_data, content_type):
+    preprocessing = image.parse_preprocessing(resize=os.environ.get(IMAGE_RESIZE_ENV),
+                                              crop=os.environ.get(IMAGE_CROP_ENV),
+                                              mean=os.environ.get(IMAGE_MEAN_ENV),
+                                              std=os.environ.get(IMAGE_STD_ENV),
+                                              color=os.environ.get(IMAGE_COLOR_ENV))
+    decode_threads = os.environ.get(IMAGE_DECODE_THREADS_ENV) or os.environ.get('OMP_NUM_THREADS') or 1
+    try:
+        return image.loads(serialized_input_data, content_type, preprocessing, int(decode_threads))
+    except ValueError as e:
+        # the images of the request are invalid, rather than the server
+        logger.warning('invalid image payload: {}'.format(e))
+        raise UnsupportedInputShapeError(str(e))
+
+
+def _is_binary_content_type(content_type):
+    # content types decoded from a buffer, rather than from a stream. Image content types can have parameters, such as
+    # the boundary of multipart payloads.
+    if content_type == recordio.CONTENT_TYPE or (content_type == arrow.CONTENT_TYPE and arrow.available()):
+        return True
+    return image.accepts(content_type) and image.available()
+
+
+def _load_compressed(serialized_input_data, content_type, encoding):
+    if encoding not in compression.encodings() or \
+            (content_type not in [NPY_CONTENT_TYPE, JSON_CONTENT_TYPE, CSV_CONTENT_TYPE] and
+             not _is_binary_content_type(content_type)):
+        raise UnsupportedContentTypeError(compression.with_encoding(content_type, encoding))
+
+    stream = compression.decompressed_stream(serialized_input_data, encoding)
+    if content_type == NPY_CONTENT_TYPE:
+        return npy.load(stream)
+    if content_type == JSON_CONTENT_TYPE:
+        return np.array(json.load(io.TextIOWrapper(stream, encoding='utf-8')), dtype=np.float32)
+    if _is_binary_content_type(content_type):
+        return input_fn(stream.read(), content_type)
+    return csv.load(stream)
+
+
 @engine.predict_fn()
 def predict_fn(input_data, model):
     """A default predict_fn for Chainer. Calls a model on data deserialized in input_fn.
 
+    If the SAGEMAKER_CHAINER_OPTIMIZE_MODEL environment variable is 'true', the model is optimized for inference on
+    the first request, or when it is preloaded if there are warm-up samples, see
+    :func:`chainer_framework.optimization.optimize`. If SAGEMAKER_CHAINER_QUANTIZE_MODEL is set on a CPU instance,
+    the model's weights are quantized to int8, or to float16 if SAGEMAKER_CHAINER_QUANTIZATION_DTYPE is 'float16', see
+    :func:`chainer_framework.quantization.quantize`. This shrinks the weights, but doesn't make predictions faster.
+    Models that the workers share, because they are preloaded or memory mapped, are only optimized and quantized
+    before they are shared, since doing it in the workers would copy them. Memory-mappable float16 artifacts loaded
+    with :func:`chainer_framework.artifacts.load` keep their weights in float16 without this setting. Unless
+    SAGEMAKER_CHAINER_CPU_ACCELERATION is 'none', the model runs with iDeep on CPU instances where it is available,
+    see :func:`chainer_framework.acceleration.accelerate`. SAGEMAKER_CHAINER_WARMUP_SAMPLES can point to a .npy file
+    of representative inputs to check these optimizations on instead of the first request. Quantization is only
+    calibrated and checked on warm-up samples.
+
     Args:
         input_data: input data for prediction deserialized by input_fn
         model: model loaded in memory by model_fn
@@ -69,14 +237,127 @@ def predict_fn(input_data, model):
         input_data = cp.array(input_data)
         model.to_gpu()
 
-    predicted_data = model(input_data)
+    model, use_ideep = _prepare_model(model, input_data)
+    if use_ideep:
+        with acceleration.using_ideep(), chainer.no_backprop_mode():
+            return np.asarray(model(input_data).data)
+    with chainer.no_backprop_mode():
+        predicted_data = model(input_data)
     return predicted_data.data
 
 
+def _prepare_model(model, input_data):
+    """Applies the optional load-time optimizations to a model on its first request, unless they were applied before
+    the model was shared with the workers, and caches the result.
+
+    The optimizations are checked on the warm-up samples, or else on the first request. Quantization is only
+    calibrated and checked on the warm-up samples, which are the same in every worker.
+
+    Returns:
+        (chainer.Link, bool): the model to predict with, and whether to run it with iDeep.
+    """
+    if id(model) not in _prepared_models:
+        samples = np.load(os.environ[WARMUP_SAMPLES_ENV]) if WARMUP_SAMPLES_ENV in os.environ else input_data
+        if chainer.cuda.available:
+            samples = cp.array(samples)
+
+        prepared_model = model
+        if id(model) in _optimized_models:
+            pass
+        elif _is_shared(model) and (_is_enabled(OPTIMIZE_MODEL_ENV) or os.environ.get(QUANTIZE_MODEL_ENV)):
+            logger.warning('not optimizing or quantizing the model, which is shared between the workers or memory '
+                           'mapped, in every worker. Set {} and {} to do it once before the workers start'
+                           .format(preload.PRELOAD_ENV, WARMUP_SAMPLES_ENV))
+        else:
+            prepared_model = _optimize(model, samples, calibrate=WARMUP_SAMPLES_ENV in os.environ)
+        use_ideep = False
+        acceleration_mode = os.environ.get(CPU_ACCELERATION_ENV, 'auto')
+        if acceleration.enabled(acceleration_mode):
+            # an explicit 'ideep' accelerates preloaded and memory-mapped models too, at the cost of a copy per worker
+            accelerated_model = acceleration.accelerate(prepared_model, samples,
+                                                        copy_shared=acceleration_mode.lower() == 'ideep')
+            use_ideep = accelerated_model is not prepared_model
+            prepared_model = accelerated_model
+        _prepared_models[id(model)] = (model, prepared_model, use_ideep)
+    return _prepared_models[id(model)][1:]
+
+
+def _optimized_model_fn(model_fn):
+    """Wraps a model_fn so that it optimizes and quantizes the model on the warm-up samples, if there are any, before
+    :func:`chainer_framework.preload.shared_model_fn` shares it with the workers."""
+    @functools.wraps(model_fn)
+    def optimized_model_fn(model_dir):
+        model = model_fn(model_dir)
+        if WARMUP_SAMPLES_ENV in os.environ and isinstance(model, chainer.Link):
+            model = _optimize(model, np.load(os.environ[WARMUP_SAMPLES_ENV]), calibrate=True)
+            _optimized_models[id(model)] = model
+        return model
+    return optimized_model_fn
+
+
+def _optimize(model, samples, calibrate):
+    if _is_enabled(OPTIMIZE_MODEL_ENV):
+        model = optimization.optimize(model, samples)
+    if os.environ.get(QUANTIZE_MODEL_ENV):
+        if chainer.cuda.available:
+            logger.warning('int8 quantization is a CPU inference mode, serving the float32 model on the GPU')
+        else:
+            model = _quantize(model, samples if calibrate else None)
+    return model
+
+
+def _is_shared(model):
+    return isinstance(model, chainer.Link) and acceleration.memory_mapped_bytes(model) > 0
+
+
+def _quantize(model, samples):
+    mode = os.environ[QUANTIZE_MODEL_ENV].lower()
+    if mode not in ('linear', 'all'):
+        raise ValueError('{} must be linear or all, not {}'.format(QUANTIZE_MODEL_ENV, mode))
+    dtype = os.environ.get(QUANTIZATION_DTYPE_ENV, 'int8').lower()
+    if dtype not in ('int8', 'float16'):
+        raise ValueError('{} must be int8 or float16, not {}'.format(QUANTIZATION_DTYPE_ENV, dtype))
+
+    quantized_model = quantization.quantize(model, samples, convolutions=mode == 'all', dtype=np.dtype(dtype))
+    if samples is None:
+        logger.warning('{} is not set, serving the quantized model without calibrating it or checking its error'
+                       .format(WARMUP_SAMPLES_ENV))
+        return quantized_model
+    report = quantization.report(model, quantized_model, samples)
+    logger.info('quantization report: {}'.format(json.dumps(report)))
+
+    tolerance = float(os.environ.get(QUANTIZATION_TOLERANCE_ENV, 0.05))
+    if report['relative_error'] > tolerance:
+        logger.warning('the relative error of the quantized model, {:.4f}, exceeds {}, serving the float32 model'
+                       .format(report['relative_error'], tolerance))
+        return model
+
+    min_speedup = os.environ.get(QUANTIZATION_MIN_SPEEDUP_ENV)
+    if min_speedup is not None and report['speedup'] < float(min_speedup):
+        logger.warning('the quantized model is {:.2f}x as fast as the float32 model, less than {}, serving the float32 '
+                       'model'.format(report['speedup'], min_speedup))
+        return model
+    return quantized_model
+
+
+def _is_enabled(env_name):
+    return os.environ.get(env_name, 'false').lower() in ('true', '1')
+
+
 @engine.output_fn()
 def output_fn(prediction_output, accept):
     """A default output_fn for Chainer. Serializes predictions from predict_fn.
 
+    RecordIO-protobuf responses have a record per sample, and Arrow responses a row per sample, in a column named
+    'values'.
+
+    If the accept type has a content-encoding parameter, such as 'text/csv; content-encoding=gzip', responses of at
+    least SAGEMAKER_CHAINER_COMPRESSION_MIN_BYTES bytes are compressed, and their content type has the same parameter.
+
+    Predictions can be reduced to their softmax, argmax or top k before they are serialized, with parameters of the
+    accept type such as 'application/json; output=top-k; k=5', or for all requests with SAGEMAKER_CHAINER_OUTPUT. See
+    :mod:`chainer_framework.postprocessing`.
+
     Args:
         prediction_output: a prediction result from predict_fn
         accept: type which the output data needs to be serialized
@@ -84,20 +365,59 @@ def output_fn(prediction_output, accept):
     Returns
         output data serialized
     """
+    accept, encoding = compression.parse(accept)
+    if encoding is not None and encoding not in compression.encodings():
+        raise UnsupportedAcceptTypeError(compression.with_encoding(accept, encoding))
+
+    try:
+        accept, reduction = postprocessing.parse(accept, os.environ.get(OUTPUT_ENV))
+    except ValueError as e:
+        logger.warning('unsupported output parameters: {}'.format(e))
+        raise UnsupportedAcceptTypeError(accept)
+
+    if reduction is not None:
+        prediction_output = postprocessing.apply(_to_numpy(prediction_output), reduction)
+        if isinstance(prediction_output, postprocessing.TopK):
+            if accept == JSON_CONTENT_TYPE:
+                return _compress(json.dumps(postprocessing.to_json(prediction_output)), JSON_CONTENT_TYPE, encoding)
+            prediction_output = postprocessing.to_array(prediction_output)
+
+    # the binary formats are encoded from the array, without converting it to a list
+    if accept == recordio.CONTENT_TYPE:
+        return _compress(recordio.dumps(_to_numpy(prediction_output)), recordio.CONTENT_TYPE, encoding)
+
+    if accept == arrow.CONTENT_TYPE and arrow.available():
+        return _compress(arrow.dumps(_to_numpy(prediction_output)), arrow.CONTENT_TYPE, encoding)
+
     prediction_output = prediction_output.tolist() if hasattr(prediction_output, 'tolist') else prediction_output
 
     if accept == JSON_CONTENT_TYPE:
-        return json.dumps(prediction_output), JSON_CONTENT_TYPE
+        return _compress(json.dumps(prediction_output), JSON_CONTENT_TYPE, encoding)
 
     if accept == NPY_CONTENT_TYPE:
-        return npy.dumps(prediction_output), NPY_CONTENT_TYPE
+        return _compress(npy.dumps(prediction_output), NPY_CONTENT_TYPE, encoding)
 
     if accept == CSV_CONTENT_TYPE:
-        return csv.dumps(prediction_output), CSV_CONTENT_TYPE
+        return _compress(csv.dumps(prediction_output), CSV_CONTENT_TYPE, encoding)
 
     raise UnsupportedAcceptTypeError(accept)
 
 
+def _to_numpy(data):
+    # predictions are cupy arrays on GPU instances
+    return chainer.cuda.to_cpu(data) if chainer.cuda.get_array_module(data) is not np else np.asarray(data)
+
+
+def _compress(output_data, content_type, encoding):
+    if encoding is None or len(output_data) < int(os.environ.get(COMPRESSION_MIN_BYTES_ENV, 1024)):
+        return output_data, content_type
+
+    level = os.environ.get(COMPRESSION_LEVEL_ENV)
+    output_data = output_data if isinstance(output_data, bytes) else output_data.encode('utf-8')
+    return compression.compress(output_data, encoding, int(level) if level else None), \
+        compression.with_encoding(content_type, encoding)
+
+
 @engine.transform_fn()
 def transform_fn(model, data, content_type, accept):
     input_data = input_fn(data, content_type)
@@ -0,0 +1,152 @@
+import fcntl
+import hashlib
+import importlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+from contextlib import contextmanager
+
+import container_support as cs
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = '/tmp/sagemaker_chainer_staging'
+
+_LOCK_FILE = '.lock'
+_INDEX_FILE = 'archives.json'
+_COMPLETE_FILE = '.complete'
+
+
+def import_user_module(env, cache_dir=None):
+    """Imports the user module from the per-host staging cache, staging it first if no other process has.
+
+    Replaces ``TrainingEnvironment.import_user_module`` in processes started by mpirun, so that the user code is
+    fetched, extracted and its requirements installed once per host instead of once per process.
+
+    Args:
+        env: training environment object containing the user script name, archive and requirements file.
+        cache_dir (str): the per-host staging cache directory, DEFAULT_CACHE_DIR if not given.
+
+    Returns:
+        module: the user module.
+    """
+    code_dir = stage(env.user_script_archive, env.user_requirements_file, cache_dir)
+    sys.path.insert(0, code_dir)
+
+    script = env.user_script_name
+    if script.endswith('.py'):
+        script = script[:-3]
+    return importlib.import_module(script)
+
+
+def stage(archive, requirements_file=None, cache_dir=None):
+    """Stages a user code archive in the per-host cache and returns the directory it was extracted to.
+
+    The first process fetches the archive, extracts it into a directory named after the archive's sha256 digest,
+    builds wheels of the requirements into the same directory and installs them. Processes that call this function
+    concurrently wait on a file lock and then reuse the staged directory.
+
+    Args:
+        archive (str): S3 URL, file URL or local path of a tar.gz archive of the user code.
+        requirements_file (str): path of a pip requirements file, relative to the root of the archive.
+        cache_dir (str): the per-host staging cache directory, DEFAULT_CACHE_DIR if not given.
+
+    Returns:
+        str: the directory containing the extracted user code.
+    """
+    return _stage(archive, requirements_file, cache_dir or DEFAULT_CACHE_DIR)[0]
+
+
+def _stage(archive, requirements_file, cache_dir):
+    """Returns the staged code directory, and whether this call staged it."""
+    if not os.path.exists(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # another process created it first
+            pass
+
+    with _lock(os.path.join(cache_dir, _LOCK_FILE)):
+        index_file = os.path.join(cache_dir, _INDEX_FILE)
+        index = _read_index(index_file)
+
+        digest = index.get(archive)
+        if digest and os.path.exists(os.path.join(cache_dir, digest, _COMPLETE_FILE)):
+            return os.path.join(cache_dir, digest, 'code'), False
+
+        logger.info('staging {} in {}'.format(archive, cache_dir))
+        download_dir = tempfile.mkdtemp(dir=cache_dir)
+        staged = False
+        try:
+            archive_file = os.path.join(download_dir, 'sourcedir.tar.gz')
+            _fetch(archive, archive_file)
+            digest = _sha256(archive_file)
+
+            staging_dir = os.path.join(cache_dir, digest)
+            if not os.path.exists(os.path.join(staging_dir, _COMPLETE_FILE)):
+                _fill(archive_file, requirements_file, staging_dir)
+                staged = True
+        finally:
+            shutil.rmtree(download_dir, ignore_errors=True)
+
+        index[archive] = digest
+        with open(index_file, 'w') as f:
+            json.dump(index, f)
+
+        return os.path.join(staging_dir, 'code'), staged
+
+
+def _fill(archive_file, requirements_file, staging_dir):
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    code_dir = os.path.join(staging_dir, 'code')
+    with tarfile.open(archive_file, 'r:*') as tar:
+        tar.extractall(code_dir)
+
+    requirements_path = os.path.join(code_dir, requirements_file) if requirements_file else None
+    if requirements_path and os.path.exists(requirements_path):
+        wheel_dir = os.path.join(staging_dir, 'wheels')
+        logger.info('building wheels of the requirements in {}'.format(requirements_path))
+        subprocess.check_call([sys.executable, '-m', 'pip', 'wheel', '-r', requirements_path, '-w', wheel_dir])
+        subprocess.check_call([sys.executable, '-m', 'pip', 'install', '--no-index', '--find-links', wheel_dir,
+                               '-r', requirements_path])
+    elif requirements_path:
+        logger.warn('Requirements file:{} was not found'.format(requirements_path))
+
+    open(os.path.join(staging_dir, _COMPLETE_FILE), 'w').close()
+
+
+def _fetch(archive, path):
+    if archive.startswith('s3://'):
+        cs.download_s3_resource(archive, path)
+    else:
+        shutil.copyfile(archive[len('file://'):] if archive.startswith('file://') else archive, path)
+
+
+def _sha256(path, chunk_size=1024 * 1024):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _read_index(index_file):
+    if not os.path.exists(index_file):
+        return {}
+    with open(index_file) as f:
+        return json.load(f)
+
+
+@contextmanager
+def _lock(path):
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
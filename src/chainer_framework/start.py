@@ -1,10 +1,31 @@
-from container_support import ContainerSupport
-from chainer_framework import training
-from chainer_framework import serving
+import logging
+import sys
+
+from chainer_framework import threads
+
+# numpy sizes the thread pool of its BLAS library when it is imported
+threads.configure_entry_point(sys.argv[1] if len(sys.argv) > 1 else None)
+
+from container_support import ContainerSupport  # noqa: E402
+from chainer_framework import training  # noqa: E402
+from chainer_framework import serving  # noqa: E402
 
 cs = ContainerSupport()
 cs.register_engine(training.engine)
 cs.register_engine(serving.engine)
 
+logger = logging.getLogger(__name__)
+
 if __name__ == '__main__':
-    cs.run()
\ No newline at end of file
+    use_async_server = sys.argv[1:2] == ['serve'] and serving._is_enabled(serving.ASYNC_SERVER_ENV)
+    if use_async_server and sys.version_info < (3, 5):
+        logger.error('{} needs Python 3.5 or later, serving with nginx and gunicorn instead'
+                     .format(serving.ASYNC_SERVER_ENV))
+        use_async_server = False
+
+    if use_async_server:
+        # imported here, as it needs Python 3.5
+        from chainer_framework import async_server
+        async_server.start(serving.engine)
+    else:
+        cs.run()
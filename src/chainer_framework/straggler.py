@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import socket
+import time
+
+import numpy as np
+from chainer.training import extension
+
+logger = logging.getLogger(__name__)
+
+TIMELINE_FILE_NAME = "straggler_timeline.jsonl"
+
+
+class StragglerMonitor(extension.Extension):
+    """A trainer extension that detects ranks which are consistently slower than the rest of the job.
+
+    Each rank measures the wall time of every iteration and the time it spends inside the communicator's
+    ``allreduce_grad``. Every ``interval`` iterations the per-rank averages are gathered to rank 0 through the
+    communicator's ``mpi_comm``. Because allreduce synchronizes all ranks, every rank sees the same step time; a slow
+    host shows up as a rank with a high compute time (step time minus communication time) while the healthy ranks
+    spend that difference waiting in the allreduce.
+
+    A rank is flagged when its compute time is more than ``factor`` times the lower median over all ranks. A high
+    communication time is not a sign of a slow rank, since it is the time a healthy rank waits for the slow one.
+    A warning is logged when a rank has been flagged for ``patience`` consecutive windows, and a message when it stops
+    being flagged. Rank 0 appends one JSON line per window, grouped by host, to ``straggler_timeline.jsonl`` in the
+    trainer output directory, with the times of every rank and the stragglers of the window.
+
+    Usage:
+        trainer.extend(StragglerMonitor(comm))
+
+    Args:
+        comm: a ChainerMN communicator.
+        interval (int): number of iterations to average over before gathering times to rank 0.
+        factor (float): how many times slower than the median a rank has to be to be flagged.
+        patience (int): number of consecutive flagged windows before a rank is reported as a straggler.
+        out (str): directory to write the timeline to. Defaults to the trainer output directory.
+    """
+    trigger = 1, 'iteration'
+    priority = extension.PRIORITY_READER
+    name = 'StragglerMonitor'
+
+    def __init__(self, comm, interval=100, factor=1.5, patience=3, out=None):
+        self._comm = comm
+        self._interval = interval
+        self._factor = factor
+        self._patience = patience
+        self._out = out
+        self._host = socket.gethostname()
+
+        self._last_time = None
+        self._step_times = []
+        self._comm_time = 0.0
+        self._comm_times = []
+        self._flagged_windows = {}
+        self._stragglers = set()
+
+        self._wrap_allreduce_grad()
+
+    def _wrap_allreduce_grad(self):
+        allreduce_grad = self._comm.allreduce_grad
+
+        def timed_allreduce_grad(*args, **kwargs):
+            start = time.time()
+            try:
+                return allreduce_grad(*args, **kwargs)
+            finally:
+                self._comm_time += time.time() - start
+
+        self._comm.allreduce_grad = timed_allreduce_grad
+
+    def __call__(self, trainer):
+        now = time.time()
+        if self._last_time is not None:
+            self._step_times.append(now - self._last_time)
+            self._comm_times.append(self._comm_time)
+        self._last_time = now
+        self._comm_time = 0.0
+
+        iteration = trainer.updater.iteration
+        if iteration % self._interval == 0 and self._step_times:
+            self._gather(iteration, self._out or trainer.out)
+            self._step_times = []
+            self._comm_times = []
+
+    def _gather(self, iteration, out):
+        record = {'rank': self._comm.rank,
+                  'host': self._host,
+                  'step_time': float(np.mean(self._step_times)),
+                  'comm_time': float(np.mean(self._comm_times))}
+        records = self._comm.mpi_comm.gather(record, root=0)
+
+        if self._comm.rank == 0:
+            stragglers = self._update_flags(records)
+            _write_timeline(out, iteration, records, stragglers)
+
+    def _update_flags(self, records):
+        flagged = set(_find_stragglers(records, self._factor))
+        self._flagged_windows = {rank: self._flagged_windows.get(rank, 0) + 1 for rank in flagged}
+
+        stragglers = sorted(rank for rank, windows in self._flagged_windows.items() if windows >= self._patience)
+        hosts = {record['rank']: record['host'] for record in records}
+        # logged when a rank becomes a straggler and when it recovers, the timeline has the windows in between
+        for rank in stragglers:
+            if rank not in self._stragglers:
+                logger.warning("rank {} on host {} has been more than {}x slower than the median for {} consecutive "
+                               "windows".format(rank, hosts[rank], self._factor, self._flagged_windows[rank]))
+        for rank in sorted(self._stragglers.difference(stragglers)):
+            logger.info("rank {} on host {} is no longer more than {}x slower than the median"
+                        .format(rank, hosts.get(rank), self._factor))
+        self._stragglers = set(stragglers)
+        return stragglers
+
+
+def _find_stragglers(records, factor):
+    """Finds ranks whose compute time is more than ``factor`` times the lower median.
+
+    Communication times are not compared: the ranks that wait in the allreduce for a slow rank have the highest
+    communication times, while the slow rank has the lowest. The lower median, the median of an odd number of ranks
+    and the faster of the two middle ranks otherwise, keeps a slow rank of two from raising the reference it is
+    compared to.
+
+    Args:
+        records (list[dict]): one dict per rank with 'rank', 'step_time' and 'comm_time' keys.
+        factor (float): how many times slower than the median a rank has to be to be flagged.
+
+    Returns:
+        list[int]: the flagged ranks, in the order of ``records``.
+    """
+    compute_times = [max(record['step_time'] - record['comm_time'], 0.0) for record in records]
+    median_compute_time = sorted(compute_times)[(len(compute_times) - 1) // 2]
+
+    # a zero median means most ranks did no work, so there is nothing to compare to
+    if median_compute_time <= 0:
+        return []
+    return [record['rank'] for record, compute_time in zip(records, compute_times)
+            if compute_time > factor * median_compute_time]
+
+
+def _write_timeline(out, iteration, records, stragglers):
+    hosts = {}
+    for record in sorted(records, key=lambda r: r['rank']):
+        hosts.setdefault(record['host'], []).append({
+            'rank': record['rank'],
+            'step_time': record['step_time'],
+            'comm_time': record['comm_time'],
+            'compute_time': max(record['step_time'] - record['comm_time'], 0.0)})
+
+    entry = {'iteration': iteration, 'time': time.time(), 'hosts': hosts, 'stragglers': stragglers}
+
+    if not os.path.exists(out):
+        os.makedirs(out)
+    with open(os.path.join(out, TIMELINE_FILE_NAME), 'a') as f:
+        f.write(json.dumps(entry) + '\n')
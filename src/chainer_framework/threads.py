@@ -0,0 +1,239 @@
+"""Thread budgets of the serving workers and training processes of an instance.
+
+numpy's BLAS library, OpenBLAS in these images, starts a thread pool with a thread per core when numpy is imported,
+and OpenMP libraries do the same. With several serving workers or MPI processes per instance, every process does,
+and the instance runs many more threads than it has cores. A budget splits the CPUs the container may use, those of
+its affinity mask limited by its cgroup CPU quota, evenly between the processes of the instance, and sets
+OMP_NUM_THREADS, OPENBLAS_NUM_THREADS and MKL_NUM_THREADS before they import numpy. Thread counts already set in the
+environment are kept.
+
+Processes can also be pinned to disjoint sets of CPUs, so that their threads don't migrate between cores.
+
+More threads per process lower the latency of a single request or batch; more processes with fewer threads each
+raise the throughput of concurrent requests. For serving, SAGEMAKER_MODEL_SERVER_WORKERS sets the number of workers,
+SAGEMAKER_CHAINER_THREADS_PER_WORKER the number of threads of each, and SAGEMAKER_CHAINER_CPU_AFFINITY pins them. For
+training, see the `threads_per_process` and `cpu_affinity` hyperparameters of :func:`chainer_framework.training.train`.
+
+This module only imports the standard library, so that it can be imported before numpy.
+"""
+import collections
+import fcntl
+import json
+import logging
+import math
+import multiprocessing
+import os
+
+logger = logging.getLogger(__name__)
+
+THREAD_ENVS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+# Number of BLAS and OpenMP threads of each serving worker. Defaults to an even share of the CPU budget.
+THREADS_PER_WORKER_ENV = 'SAGEMAKER_CHAINER_THREADS_PER_WORKER'
+# Set to 'true' to run each serving worker, or each training process, on its own CPUs.
+CPU_AFFINITY_ENV = 'SAGEMAKER_CHAINER_CPU_AFFINITY'
+# Read by container_support, which starts a serving worker per CPU by default.
+_MODEL_SERVER_WORKERS_ENV = 'SAGEMAKER_MODEL_SERVER_WORKERS'
+
+_CGROUP_V2_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+_CGROUP_V1_CPU_QUOTA = '/sys/fs/cgroup/cpu/cpu.cfs_quota_us'
+_CGROUP_V1_CPU_PERIOD = '/sys/fs/cgroup/cpu/cpu.cfs_period_us'
+_TASKS_DIR = '/proc/self/task'
+# A lock file per CPU set, held by the serving worker that runs on it.
+_SLOT_LOCK_DIR = '/tmp/sagemaker_chainer_cpu_slots'
+
+Layout = collections.namedtuple('Layout', ['processes', 'threads', 'budget', 'cpu_sets'])
+"""How the CPUs of an instance are split: the number of processes, the threads of each, the number of CPUs all the
+processes may keep busy together, and the ids of the CPUs of each process."""
+
+# the file that holds the lock of this serving worker's CPU set, and the id of the process that holds it
+_slot_lock = None
+_pinned_pid = None
+
+
+def available_cpus():
+    """Returns the ids of the CPUs this process may run on."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        # Python 2
+        return list(range(multiprocessing.cpu_count()))
+
+
+def cpu_quota():
+    """Returns how many CPUs the cgroup CPU quota of the container allows it to keep busy, or None if it has no
+    quota."""
+    try:
+        with open(_CGROUP_V2_CPU_MAX) as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == 'max' else float(quota) / float(period)
+    except (IOError, OSError, ValueError):
+        pass
+
+    try:
+        with open(_CGROUP_V1_CPU_QUOTA) as f:
+            quota = int(f.read())
+        with open(_CGROUP_V1_CPU_PERIOD) as f:
+            period = int(f.read())
+    except (IOError, OSError, ValueError):
+        return None
+    return float(quota) / period if quota > 0 and period > 0 else None
+
+
+def plan(processes, threads=None, cpus=None, quota=None):
+    """Splits the CPU budget of an instance between processes.
+
+    Args:
+        processes (int): the number of serving workers or training processes on the instance.
+        threads (int): the number of threads of each process, instead of an even share of the budget.
+        cpus (list[int]): the ids of the CPUs to split, :func:`available_cpus` if not given.
+        quota (float): the CPU quota, :func:`cpu_quota` if not given.
+
+    Returns:
+        Layout: the layout. The processes get disjoint CPU sets if there are at least as many CPUs as processes.
+    """
+    processes = max(1, int(processes))
+    cpus = available_cpus() if cpus is None else list(cpus)
+    quota = cpu_quota() if quota is None else quota
+    budget = len(cpus) if quota is None else max(1, min(len(cpus), int(math.ceil(quota))))
+    threads = int(threads) if threads else max(1, budget // processes)
+
+    cpus_per_process = max(1, len(cpus) // processes)
+    cpu_sets = [[cpus[(index * cpus_per_process + offset) % len(cpus)] for offset in range(cpus_per_process)]
+                for index in range(processes)]
+    return Layout(processes, threads, budget, cpu_sets)
+
+
+def thread_environment(threads):
+    """Returns the environment variables that size the BLAS and OpenMP thread pools of a process."""
+    return dict((name, str(threads)) for name in THREAD_ENVS)
+
+
+def configure(layout):
+    """Sets the thread counts of a layout in the environment of this process, for the processes it starts, and for
+    itself if it hasn't imported numpy yet. Thread counts already set are kept.
+
+    Args:
+        layout (Layout): the layout.
+    """
+    for name, value in thread_environment(layout.threads).items():
+        os.environ.setdefault(name, value)
+
+
+def serving_layout():
+    """Returns the layout of the serving workers, from SAGEMAKER_MODEL_SERVER_WORKERS and
+    SAGEMAKER_CHAINER_THREADS_PER_WORKER."""
+    workers = os.environ.get(_MODEL_SERVER_WORKERS_ENV) or multiprocessing.cpu_count()
+    return plan(int(workers), os.environ.get(THREADS_PER_WORKER_ENV))
+
+
+def configure_entry_point(command):
+    """Sets the thread counts of the processes of the container, before the entry point imports numpy.
+
+    Serving workers get an even share of the budget. Training in this process gets all of it; mpirun passes the
+    thread counts of the processes it starts, see :func:`chainer_framework.training._get_mpi_command`.
+
+    Args:
+        command (str): 'serve' or 'train', the command the container was started with.
+    """
+    configure(serving_layout() if command == 'serve' else plan(1))
+
+
+def describe(layout=None):
+    """Returns a JSON description of a layout, or of the thread counts and CPUs of this process."""
+    if layout is None:
+        return json.dumps({'pid': os.getpid(), 'cpus': available_cpus(),
+                           'threads': dict((name, os.environ.get(name)) for name in THREAD_ENVS)})
+    return json.dumps(dict(layout._asdict(), quota=cpu_quota()))
+
+
+def pin(cpus):
+    """Runs all the threads of this process, and the threads they start, on the given CPUs."""
+    try:
+        tasks = [int(task) for task in os.listdir(_TASKS_DIR)]
+    except OSError:
+        tasks = [0]
+    for task in tasks:
+        try:
+            os.sched_setaffinity(task, cpus)
+        except OSError:
+            # the thread exited
+            pass
+
+
+def claim_slot(slots):
+    """Claims the lowest slot no other process holds, for the life of this process.
+
+    Slots are held with file locks, which the system releases when a process exits, so a worker that replaces one
+    that died takes over its slot.
+
+    Args:
+        slots (int): the number of slots.
+
+    Returns:
+        int: the slot, or None if all are held.
+    """
+    global _slot_lock
+    if not os.path.isdir(_SLOT_LOCK_DIR):
+        try:
+            os.makedirs(_SLOT_LOCK_DIR)
+        except OSError:
+            # created by another worker
+            pass
+
+    for slot in range(slots):
+        lock = open(os.path.join(_SLOT_LOCK_DIR, str(slot)), 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            lock.close()
+            continue
+        _slot_lock = lock
+        return slot
+    return None
+
+
+def pin_serving_worker():
+    """Pins this serving worker to the CPU set of the first free slot of :func:`serving_layout`, once per process.
+
+    Does nothing unless SAGEMAKER_CHAINER_CPU_AFFINITY is 'true'.
+    """
+    global _pinned_pid
+    if _pinned_pid == os.getpid() or not affinity_enabled():
+        return
+    _pinned_pid = os.getpid()
+
+    layout = serving_layout()
+    slot = claim_slot(layout.processes)
+    if slot is None:
+        logger.warning('all {} CPU sets are taken, serving worker {} runs on all CPUs'
+                       .format(layout.processes, os.getpid()))
+        return
+    pin(layout.cpu_sets[slot])
+    logger.info('serving worker {} runs on CPUs {}'.format(os.getpid(), layout.cpu_sets[slot]))
+
+
+def pinned(transform_fn):
+    """Wraps a transform_fn so that the serving worker that first calls it is pinned, see
+    :func:`pin_serving_worker`."""
+    def pinned_transform_fn(*args, **kwargs):
+        pin_serving_worker()
+        return transform_fn(*args, **kwargs)
+    return pinned_transform_fn
+
+
+def pin_mpi_process():
+    """Pins a process started by mpirun to the CPU set of its local rank among the processes on its host.
+
+    Does nothing unless SAGEMAKER_CHAINER_CPU_AFFINITY is 'true'.
+    """
+    local_rank = os.environ.get('OMPI_COMM_WORLD_LOCAL_RANK')
+    if local_rank is None or not affinity_enabled():
+        return
+    layout = plan(int(os.environ['OMPI_COMM_WORLD_LOCAL_SIZE']))
+    pin(layout.cpu_sets[int(local_rank)])
+
+
+def affinity_enabled():
+    """Returns whether SAGEMAKER_CHAINER_CPU_AFFINITY is 'true'."""
+    return os.environ.get(CPU_AFFINITY_ENV, 'false').lower() in ('true', '1')
@@ -1,12 +1,17 @@
+import compileall
+import glob
 import logging
 import os
 import shlex
 import socket
 import subprocess
 import time
+from multiprocessing.pool import ThreadPool
 
-from chainer_framework.timeout import timeout
-from chainer import serializers
+from chainer_framework import acceleration, artifacts, lifecycle, staging, threads
+from chainer_framework.bootstrap import Pipeline
+from chainer_framework.timeout import TimeoutError
+import numpy as np
 
 from container_support.app import TrainingEngine
 import container_support as cs
@@ -20,9 +25,31 @@ _PORT = 7777
 _MPI_SCRIPT = "/mpi_script.sh"
 _MPI_IS_RUNNING = "/mpi_is_running"
 _MPI_IS_FINISHED = "/mpi_is_finished"
+_MPI_HOSTFILE = "/mpi_hostfile"
+# Set to the time mpirun was started, so that the processes it starts can report how long they took to be ready.
+_MPI_LAUNCH_TIME_ENV = "SAGEMAKER_MPI_LAUNCH_TIME"
 _CHANGE_HOSTNAME_LIBRARY = "/libchangehostname.so"
+# Read by the prebuilt change hostname library. sshd passes it on to processes that mpirun starts over ssh.
+_HOSTNAME_ENV = "SAGEMAKER_HOSTNAME"
+_SSH_ENVIRONMENT_FILE = os.path.expanduser("~/.ssh/environment")
+_SSH_KNOWN_HOSTS_FILE = os.path.expanduser("~/.ssh/known_hosts")
+_SSH_HOST_KEY_FILES = "/etc/ssh/ssh_host_*_key.pub"
+_SSH_CONNECT_TIMEOUT_IN_SECONDS = 5
+_MAX_SSH_PROBE_THREADS = 64
+
+# Jobs with at least this many hosts use the large cluster launch mode, see _get_large_cluster_launch_options.
+_LARGE_CLUSTER_HOST_THRESHOLD = 32
+_COLLECTIVES_BENCHMARK_MODULE = "chainer_framework.collectives_benchmark"
+
+_MB = 1024 * 1024
+# (largest model size in bytes, TCP socket buffer size, TCP eager limit) tiers used by _get_mpi_transport_options.
+_TCP_TUNING = [(1 * _MB, _MB // 2, 1 * _MB),
+               (64 * _MB, 2 * _MB, _MB // 4),
+               (float('inf'), 4 * _MB, _MB // 4)]
 
 MODEL_FILE_NAME = "model.npz"
+# model_dtype hyperparameter: dtype to cast the saved floating point arrays to, None to keep them as they are
+_MODEL_DTYPES = {'float32': None, 'float16': np.float16}
 
 @engine.train()
 def train(user_module, training_environment):
@@ -42,6 +69,32 @@ def train(user_module, training_environment):
     * `process_slots_per_host`: the number of process slots per host.
     * `num_processes`: the total number of processes to run.
     * `additional_mpi_options`: a string of options to pass to mpirun.
+    * `mpi_launch_mode`, `mpi_ssh_concurrency`, `mpi_routed_radix`, `mpi_rsh_agent`: control how mpirun starts
+        processes on many hosts. See :func:`_get_large_cluster_launch_options`.
+    * `mpi_model_size_mb`, `mpi_network_interfaces`, `mpi_btl`, `mpi_tcp_sndbuf`, `mpi_tcp_rcvbuf`,
+        `mpi_tcp_eager_limit`, `mpi_tcp_links`: tune the MPI transport. See :func:`_get_mpi_transport_options`.
+    * `prefetch_channel_data`: read the training data channels while distributed training starts, so that
+        the data is in the page cache when the training processes load it.
+    * `save_mmap_model`: if the model is saved by default, also save it as a memory-mappable artifact that serving
+        processes load without copying. See :func:`chainer_framework.artifacts.save`.
+    * `model_dtype`: 'float32' (the default) or 'float16', the dtype the model is saved as by default. float16
+        artifacts are half the size, and serving keeps the weights of memory-mappable float16 artifacts in float16.
+        Arrays with values out of the float16 range are saved in their own dtype.
+        :mod:`chainer_framework.precision_report` measures the accuracy delta on a validation channel.
+    * `threads_per_process`: the number of BLAS and OpenMP threads of each process mpirun starts. Defaults to an even
+        share of the CPUs of a host between its processes. See :mod:`chainer_framework.threads`.
+    * `cpu_affinity`: run each process mpirun starts on its own share of the CPUs of its host.
+    * `cpu_acceleration`: 'auto' (the default) to train with iDeep on CPU instances where it is available, 'ideep'
+        to warn if it isn't, or 'none'. See :mod:`chainer_framework.acceleration`.
+    * `benchmark_collectives`: instead of running the user script, benchmark MPI collectives with the same mpirun
+        command and write a report to the output data directory. See :mod:`chainer_framework.collectives_benchmark`.
+
+    The startup and lifecycle of the job, from bootstrapping the hosts to saving the model, is written as a Chrome
+    Trace Event file to `lifecycle_trace.json` in the output data directory. See :mod:`chainer_framework.lifecycle`.
+
+    Training scripts can read the `communicator` hyperparameter and pass it to
+    :func:`chainer_framework.communicators.create_communicator`. Setting it to 'auto' selects the fastest ChainerMN
+    communicator with a short allreduce benchmark sized to the model.
 
     For more on how distributed training uses these parameters, please see :func:`_get_mpi_command`.
 
@@ -51,65 +104,161 @@ def train(user_module, training_environment):
                                training arguments and hyperparameters
     """
 
-    use_mpi = bool(training_environment.hyperparameters.get('use_mpi', len(training_environment.hosts) > 1))
+    # fails before training rather than when saving the trained model
+    _get_model_dtype(training_environment)
 
+    benchmark_collectives = bool(training_environment.hyperparameters.get('benchmark_collectives', False))
+    use_mpi = benchmark_collectives or \
+        bool(training_environment.hyperparameters.get('use_mpi', len(training_environment.hosts) > 1))
+
+    current_host = training_environment.current_host
+    hosts = training_environment.hosts
     if use_mpi:
-        current_host = training_environment.current_host
-        hosts = training_environment.hosts
-        _change_hostname(current_host)
-        if current_host == _get_master_host_name(hosts):
-            _wait_for_worker_nodes_to_start_sshd([host for host in hosts if host != current_host])
-            _run_mpi_on_all_nodes(training_environment)
+        is_master = current_host == _get_master_host_name(hosts)
+
+        _get_bootstrap_pipeline(training_environment, is_master).run()
+
+        if is_master:
+            _run_mpi_on_all_nodes(training_environment,
+                                  _COLLECTIVES_BENCHMARK_MODULE if benchmark_collectives else None)
         else:
-            _start_ssh_daemon()
             _wait_for_training_to_finish(training_environment)
     else:
         _run_training(training_environment, user_module)
 
+    lifecycle.write_trace(training_environment.output_data_dir, current_host, hosts)
+
+
+def _get_bootstrap_pipeline(training_environment, is_master):
+    """Builds the steps that prepare this host for distributed training, so that independent steps run concurrently.
+
+    The master host waits for the worker hosts' ssh daemons while it stages the user module, and worker hosts start
+    their ssh daemon once the hostname has been changed, so that processes started by mpirun see the right hostname.
+
+    Args:
+        training_environment: training environment object containing environment variables,
+                              training arguments and hyperparameters.
+        is_master (bool): whether this host runs mpirun.
+
+    Returns:
+        chainer_framework.bootstrap.Pipeline: the bootstrap pipeline.
+    """
+    current_host = training_environment.current_host
+
+    pipeline = Pipeline()
+    pipeline.add('change_hostname', lambda: _change_hostname(current_host))
+    if is_master:
+        worker_hosts = [host for host in training_environment.hosts if host != current_host]
+        pipeline.add('wait_for_sshd', lambda: _wait_for_worker_nodes_to_start_sshd(worker_hosts))
+    else:
+        pipeline.add('start_sshd', _start_ssh_daemon, depends_on=['change_hostname'])
+    pipeline.add('stage_user_module', lambda: _stage_user_module(training_environment))
+    if _is_large_cluster_launch(training_environment):
+        pipeline.add('write_known_hosts', lambda: _write_known_hosts(training_environment.hosts))
+    if training_environment.hyperparameters.get('prefetch_channel_data', False):
+        pipeline.add('prefetch_channel_data', lambda: _prefetch_channel_data(training_environment))
+    return pipeline
+
+
+def _stage_user_module(training_environment):
+    """Stages and byte-compiles the user module once per host, so that each process started by mpirun only imports it.
+
+    See :func:`chainer_framework.staging.stage`.
+    """
+    code_dir = staging.stage(training_environment.user_script_archive, training_environment.user_requirements_file)
+    compileall.compile_dir(code_dir, quiet=1)
+
+
+def _prefetch_channel_data(training_environment, chunk_size=16 * 1024 * 1024):
+    """Reads every file of the training data channels to load them into the page cache."""
+    for channel_dir in training_environment.channel_dirs.values():
+        for root, _, files in os.walk(channel_dir):
+            for name in files:
+                with open(os.path.join(root, name), 'rb') as f:
+                    while f.read(chunk_size):
+                        pass
+
 
 def _run_training(env, user_module):
     training_parameters = env.matching_parameters(user_module.train)
+    logger.info('threads and CPUs of this process: {}'.format(threads.describe()))
     logger.info('Invoking user training script.')
-    model = user_module.train(**training_parameters)
+    cpu_acceleration = env.hyperparameters.get('cpu_acceleration', 'auto')
+    with lifecycle.span('train'), lifecycle.trace_first_iteration(), \
+            acceleration.accelerated_training(cpu_acceleration):
+        model = user_module.train(**training_parameters)
 
     hosts = env.hosts
     on_master_node = env.current_host == _get_master_host_name(hosts)
     if model and on_master_node:
-        if hasattr(user_module, 'save'):
-            user_module.save(model, env.model_dir)
-        else:
-            _default_save(env, model)
+        with lifecycle.span('save_model'):
+            if hasattr(user_module, 'save'):
+                user_module.save(model, env.model_dir)
+            else:
+                _default_save(env, model)
     if not model and on_master_node:
         logger.warn("Model object is empty. No model was saved! train() should return a model.")
 
 
 def _default_save(env, model):
-    serializers.save_npz(os.path.join(env.model_dir, MODEL_FILE_NAME), model)
+    try:
+        dtype = _get_model_dtype(env)
+    except ValueError as e:
+        # the trained model is saved as it is rather than lost
+        logger.warning('{}, saving the model without converting it'.format(e))
+        dtype = None
+    artifacts.save_npz(os.path.join(env.model_dir, MODEL_FILE_NAME), model, dtype)
+    if env.hyperparameters.get('save_mmap_model', False):
+        artifacts.save(model, env.model_dir, dtype)
+
+
+def _get_model_dtype(training_environment):
+    model_dtype = str(training_environment.hyperparameters.get('model_dtype', 'float32')).lower()
+    if model_dtype not in _MODEL_DTYPES:
+        raise ValueError('model_dtype must be one of {}, not {}'.format(', '.join(sorted(_MODEL_DTYPES)), model_dtype))
+    return _MODEL_DTYPES[model_dtype]
 
 
 def _change_hostname(current_host):
-    """Compiles a shared library to correct the behavior of the gethostname system call, which OpenMPI depends on.
+    """Sets the hostname returned by the change hostname library, which corrects the behavior of the gethostname
+    system call that OpenMPI depends on.
+
+    The library is built into the image and preloaded into every process mpirun starts. It reads the hostname from
+    the SAGEMAKER_HOSTNAME environment variable. Processes started on this host by a local mpirun inherit it from
+    this process; processes started over ssh get it from ~/.ssh/environment.
 
     Args:
         current_host (str): name of the current host, such as algo-1, algo-2, etc.
     """
-    os.system("change-hostname.sh {}".format(current_host))
+    os.environ[_HOSTNAME_ENV] = current_host
+    with open(_SSH_ENVIRONMENT_FILE, 'w') as f:
+        f.write("{}={}\n".format(_HOSTNAME_ENV, current_host))
 
 
 def _get_master_host_name(hosts):
     return sorted(hosts)[0]
 
 
-def _run_mpi_on_all_nodes(training_environment):
-    mpi_command = _get_mpi_command(training_environment)
+def _run_mpi_on_all_nodes(training_environment, module=None):
+    mpi_command = _get_mpi_command(training_environment, module)
+    if _is_large_cluster_launch(training_environment):
+        _write_hostfile(training_environment.hosts, _get_process_slots_per_host(training_environment), _MPI_HOSTFILE)
     logger.info("mpi_command: " + mpi_command)
-    subprocess.check_call(shlex.split(mpi_command))
+    os.environ[_MPI_LAUNCH_TIME_ENV] = str(time.time())
+    with lifecycle.span('mpirun'):
+        subprocess.check_call(shlex.split(mpi_command))
+
+
+def _get_process_slots_per_host(training_environment):
+    num_gpus = training_environment.available_gpus
+    return int(training_environment.hyperparameters.get('process_slots_per_host', num_gpus if num_gpus > 0 else 1))
 
 
-def _get_mpi_command(training_environment):
+def _get_mpi_command(training_environment, module=None):
     """Constructs a command to run distributed training with MPI using mpirun.
 
-    Runs /mpi_script.sh on all hosts listed in the training environment. How many processes in total is determined
+    Runs /mpi_script.sh on all hosts listed in the training environment. /mpi_script.sh runs the given module, or
+    chainer_framework.training if no module is given. How many processes in total is determined
     by the 'num_processes' hyperparameter, or one per GPU, or one per CPU, as applicable. The 'process_slots_per_host'
     hyperparameter can be used to override how many processes can be placed on each host.
 
@@ -118,12 +267,16 @@ def _get_mpi_command(training_environment):
 
     This command passes many options to the mpirun command:
 
-    * --host [host:slots]: A comma-delimited list of hosts and the number of process slots on each host.
+    * --host [host:slots]: A comma-delimited list of hosts and the number of process slots on each host. In the large
+         cluster launch mode, --hostfile /mpi_hostfile is used instead, together with the options chosen by
+         :func:`_get_large_cluster_launch_options`.
     * -mca btl_tcp_if_include [network_interface_name]: Tell OpenMPI to use the given network interface name for
          byte transfer layer communication.
     * -mca oob_tcp_if_include [network_interface_name]: Tell OpenMPI to use the given network interface name for
          out-of-band communication.
-    * -mca btl ^openib: Don't look for openib components (this just avoids a warning)
+    * -mca btl ^openib: Don't look for openib components (this just avoids a warning). With more than one process
+         slot per host, -mca btl self,vader,tcp is used instead so ranks on the same host use shared memory.
+    * transport tuning options chosen by :func:`_get_mpi_transport_options`.
     * -x PATH: pass $PATH from the current environment to the execution environments on remote hosts
     * -x LD_LIBRARY_PATH: pass $LD_LIBRARY_PATH from the current environment to the execution environments on remote
          hosts
@@ -133,44 +286,255 @@ def _get_mpi_command(training_environment):
     * -x NCCL_DEBUG=INFO: Enable info level logging for NCCL.
     * -x NCCL_SOCKET_IFNAME=[network_interface_name]: Tell NCCL to use the given network interface name for socket
          communication.
+    * -x SAGEMAKER_MPI_LAUNCH_TIME: pass the time mpirun was started, to measure how long processes take to start.
+    * -x OMP_NUM_THREADS, OPENBLAS_NUM_THREADS, MKL_NUM_THREADS: size the thread pools of each process to its share
+         of the CPUs of its host, or to the 'threads_per_process' hyperparameter. See :func:`_get_thread_options`.
+    * --bind-to none: let the threads of a process run on more than one core. With the 'cpu_affinity' hyperparameter,
+         -x SAGEMAKER_CHAINER_CPU_AFFINITY=true makes each process pin itself to its share of the CPUs instead.
     * -np [num_processes]: total number of processes to run across all nodes.
 
     Args:
         training_environment: training environment object containing environment variables,
                               training arguments and hyperparameters.
+        module (str): name of the python module /mpi_script.sh runs on each process.
 
     Returns:
         str: The mpirun command to run.
     """
-    num_gpus = training_environment.available_gpus
     hyperparameters = training_environment.hyperparameters
-    process_slots_per_host = int(hyperparameters.get('process_slots_per_host', num_gpus if num_gpus > 0 else 1))
+    process_slots_per_host = _get_process_slots_per_host(training_environment)
 
     num_hosts = len(training_environment.hosts)
     num_processes = int(hyperparameters.get('num_processes', process_slots_per_host * num_hosts))
 
-    # By default, use one process per GPU, or one process per node (if training with CPU).
-    host_list = training_environment.hosts if process_slots_per_host == 1 else \
-        [host + ':{}'.format(process_slots_per_host) for host in training_environment.hosts]
+    if _is_large_cluster_launch(training_environment):
+        # a hostfile keeps the command line short, however many hosts there are
+        host_option = "--hostfile {}".format(_MPI_HOSTFILE)
+        launch_options = _get_large_cluster_launch_options(training_environment)
+    else:
+        # By default, use one process per GPU, or one process per node (if training with CPU).
+        host_list = training_environment.hosts if process_slots_per_host == 1 else \
+            [host + ':{}'.format(process_slots_per_host) for host in training_environment.hosts]
+        host_option = "--host {}".format(",".join(host_list))
+        launch_options = []
+    if 'mpi_rsh_agent' in hyperparameters:
+        launch_options.append(('plm_rsh_agent', hyperparameters['mpi_rsh_agent']))
 
     additional_mpi_options = str(hyperparameters.get('additional_mpi_options', ''))
 
-    mpi_command = 'mpirun --allow-run-as-root --host {}'.format(",".join(host_list)) \
-                  + " -mca btl_tcp_if_include {}".format(training_environment.network_interface_name) \
+    network_interfaces = _get_network_interfaces(training_environment)
+    transport_options = _get_mpi_transport_options(training_environment, process_slots_per_host)
+    thread_options = _get_thread_options(training_environment, min(process_slots_per_host, num_processes))
+
+    mpi_command = 'mpirun --allow-run-as-root {}'.format(host_option) \
+                  + "".join(" -mca {} {}".format(name, value) for name, value in launch_options) \
+                  + " -mca btl_tcp_if_include {}".format(network_interfaces) \
                   + " -mca oob_tcp_if_include {}".format(training_environment.network_interface_name) \
-                  + " -mca btl ^openib" \
+                  + "".join(" -mca {} {}".format(name, value) for name, value in transport_options) \
                   + " -x PATH" \
                   + " -x LD_LIBRARY_PATH" \
                   + " -x LD_PRELOAD={}".format(_CHANGE_HOSTNAME_LIBRARY) \
                   + " -mca orte_abort_on_non_zero_status 1" \
                   + " -x NCCL_DEBUG=INFO" \
-                  + " -x NCCL_SOCKET_IFNAME={}".format(training_environment.network_interface_name) \
+                  + " -x NCCL_SOCKET_IFNAME={}".format(network_interfaces) \
+                  + " -x {}".format(_MPI_LAUNCH_TIME_ENV) \
+                  + "".join(" {}".format(option) for option in thread_options) \
                   + " -np {} ".format(num_processes) \
                   + " {} ".format(additional_mpi_options) \
                   + " {}".format(_MPI_SCRIPT)
+    if module:
+        mpi_command += " {}".format(module)
     return mpi_command
 
 
+def _get_thread_options(training_environment, processes_per_host):
+    """Chooses the mpirun options that split the CPUs of each host between the processes mpirun starts on it.
+
+    Hosts are assumed to be of the same instance type, so the budget of this host applies to all of them.
+
+    Args:
+        training_environment: training environment object containing environment variables,
+                              training arguments and hyperparameters.
+        processes_per_host (int): the number of processes on each host.
+
+    Returns:
+        list[str]: mpirun options.
+    """
+    hyperparameters = training_environment.hyperparameters
+    layout = threads.plan(processes_per_host, hyperparameters.get('threads_per_process'))
+    logger.info('thread budget of the processes on each host: {}'.format(threads.describe(layout)))
+
+    thread_environment = threads.thread_environment(layout.threads)
+    options = ['-x {}={}'.format(name, thread_environment[name]) for name in sorted(thread_environment)]
+    options.append('--bind-to none')
+    if hyperparameters.get('cpu_affinity', False):
+        options.append('-x {}=true'.format(threads.CPU_AFFINITY_ENV))
+    return options
+
+
+def _is_large_cluster_launch(training_environment):
+    """Returns whether mpirun uses the large cluster launch mode.
+
+    The 'mpi_launch_mode' hyperparameter is 'large_cluster', 'default', or 'auto' (the default), which uses the large
+    cluster launch mode for jobs with at least 32 hosts.
+    """
+    launch_mode = training_environment.hyperparameters.get('mpi_launch_mode', 'auto')
+    if launch_mode == 'auto':
+        return len(training_environment.hosts) >= _LARGE_CLUSTER_HOST_THRESHOLD
+    if launch_mode not in ('large_cluster', 'default'):
+        raise ValueError("mpi_launch_mode must be one of 'auto', 'large_cluster' or 'default', not {}"
+                         .format(launch_mode))
+    return launch_mode == 'large_cluster'
+
+
+def _get_large_cluster_launch_options(training_environment):
+    """Chooses the OpenMPI options of the large cluster launch mode.
+
+    OpenMPI already starts processes on many hosts as a tree by default: the daemons started on remote hosts start
+    the daemons on further hosts over ssh, up to 128 connections at a time (plm_rsh_num_concurrent), and the daemons
+    communicate through a tree with a fan out of 64 (routed radix). So this mode only overrides those defaults when
+    hyperparameters ask for it:
+
+    * plm_rsh_num_concurrent: the number of concurrent ssh connections each daemon opens, from the
+         'mpi_ssh_concurrency' hyperparameter.
+    * routed_radix: the fan out of the tree the daemons communicate through, from the 'mpi_routed_radix'
+         hyperparameter.
+
+    Tree spawn needs every host to reach the other hosts' ssh daemons without prompts, so the bootstrap writes the
+    hosts' keys to known_hosts before mpirun starts, see :func:`_write_known_hosts`, and mpirun reads the hosts from a
+    hostfile.
+
+    Args:
+        training_environment: training environment object containing environment variables,
+                              training arguments and hyperparameters.
+
+    Returns:
+        list[tuple]: (MCA parameter name, value) pairs.
+    """
+    hyperparameters = training_environment.hyperparameters
+    options = []
+    if 'mpi_ssh_concurrency' in hyperparameters:
+        options.append(('plm_rsh_num_concurrent', int(hyperparameters['mpi_ssh_concurrency'])))
+    if 'mpi_routed_radix' in hyperparameters:
+        options.append(('routed_radix', int(hyperparameters['mpi_routed_radix'])))
+    for name, value in options:
+        logger.info("mpi launch: -mca {} {} (large cluster launch mode)".format(name, value))
+    return options
+
+
+def _write_hostfile(hosts, process_slots_per_host, path):
+    with open(path, 'w') as f:
+        for host in hosts:
+            f.write("{} slots={}\n".format(host, process_slots_per_host))
+
+
+def _write_known_hosts(hosts):
+    """Adds the ssh host keys of all hosts to known_hosts, so that ssh connections between hosts don't need to
+    exchange and record keys while mpirun starts.
+
+    All hosts run the same image, so they share the host keys generated when the image was built.
+    """
+    entries = []
+    for key_file in sorted(glob.glob(_SSH_HOST_KEY_FILES)):
+        with open(key_file) as f:
+            key_type, key = f.read().split()[:2]
+        entries.append("{} {} {}\n".format(",".join(hosts), key_type, key))
+
+    with open(_SSH_KNOWN_HOSTS_FILE, 'a') as f:
+        f.writelines(entries)
+
+
+def _get_network_interfaces(training_environment):
+    """Returns the comma-separated network interfaces used for byte transfer layer and NCCL traffic.
+
+    The 'mpi_network_interfaces' hyperparameter, a list or a comma-separated string, stripes traffic over several
+    interfaces. Out-of-band communication always stays on the primary network interface.
+    """
+    interfaces = training_environment.hyperparameters.get('mpi_network_interfaces')
+    if not interfaces:
+        return training_environment.network_interface_name
+
+    if not isinstance(interfaces, (list, tuple)):
+        interfaces = str(interfaces).split(',')
+    interfaces = ','.join(interface.strip() for interface in interfaces)
+    logger.info("mpi transport: striping over network interfaces {} (mpi_network_interfaces)".format(interfaces))
+    return interfaces
+
+
+def _get_mpi_transport_options(training_environment, process_slots_per_host):
+    """Chooses OpenMPI byte transfer layer components and TCP tuning parameters for the job layout.
+
+    * btl: 'self,vader,tcp' when several processes share a host, so that they exchange data through shared memory
+         (vader) instead of the TCP stack, otherwise '^openib'. Overridden by the 'mpi_btl' hyperparameter.
+    * btl_vader_single_copy_mechanism: 'none' when vader is used, because cross-memory attach needs ptrace
+         permissions that containers usually don't have.
+    * btl_tcp_sndbuf, btl_tcp_rcvbuf: socket buffer sizes picked from the model size given by the
+         'mpi_model_size_mb' hyperparameter. Without a model size, 0 lets the kernel autotune the buffers.
+         Overridden by the 'mpi_tcp_sndbuf' and 'mpi_tcp_rcvbuf' hyperparameters.
+    * btl_tcp_eager_limit, btl_tcp_rndv_eager_limit: the largest message sent without a rendezvous handshake,
+         picked from the model size. Small models are sent eagerly in one message. Overridden by the
+         'mpi_tcp_eager_limit' hyperparameter.
+    * btl_tcp_links: number of TCP connections per peer and interface, from the 'mpi_tcp_links' hyperparameter.
+
+    Every choice is logged with the reason it was made.
+
+    Args:
+        training_environment: training environment object containing environment variables,
+                              training arguments and hyperparameters.
+        process_slots_per_host (int): the number of process slots per host.
+
+    Returns:
+        list[tuple]: (MCA parameter name, value) pairs.
+    """
+    hyperparameters = training_environment.hyperparameters
+    options = []
+
+    def choose(name, value, reason):
+        logger.info("mpi transport: -mca {} {} ({})".format(name, value, reason))
+        options.append((name, value))
+
+    if 'mpi_btl' in hyperparameters:
+        btl = str(hyperparameters['mpi_btl'])
+        choose('btl', btl, 'mpi_btl')
+    elif process_slots_per_host > 1:
+        btl = 'self,vader,tcp'
+        choose('btl', btl, 'shared memory between the {} process slots per host'.format(process_slots_per_host))
+    else:
+        btl = '^openib'
+        choose('btl', btl, 'one process slot per host')
+
+    if 'vader' in btl and not btl.startswith('^'):
+        choose('btl_vader_single_copy_mechanism', 'none', 'cross-memory attach is not permitted in containers')
+
+    model_size_mb = hyperparameters.get('mpi_model_size_mb')
+    if model_size_mb is not None:
+        model_size = float(model_size_mb) * _MB
+        buffer_size, eager_limit = next((buffer_size, eager_limit) for max_model_size, buffer_size, eager_limit
+                                        in _TCP_TUNING if model_size <= max_model_size)
+        reason = 'model size of {} MB'.format(model_size_mb)
+    else:
+        buffer_size, eager_limit = 0, None
+        reason = 'kernel autotuning, model size unknown'
+
+    for name in ['sndbuf', 'rcvbuf']:
+        hyperparameter = 'mpi_tcp_{}'.format(name)
+        if hyperparameter in hyperparameters:
+            choose('btl_tcp_{}'.format(name), int(hyperparameters[hyperparameter]), hyperparameter)
+        else:
+            choose('btl_tcp_{}'.format(name), buffer_size, reason)
+
+    if 'mpi_tcp_eager_limit' in hyperparameters:
+        eager_limit, reason = int(hyperparameters['mpi_tcp_eager_limit']), 'mpi_tcp_eager_limit'
+    if eager_limit is not None:
+        choose('btl_tcp_eager_limit', eager_limit, reason)
+        choose('btl_tcp_rndv_eager_limit', eager_limit, reason)
+
+    if 'mpi_tcp_links' in hyperparameters:
+        choose('btl_tcp_links', int(hyperparameters['mpi_tcp_links']), 'mpi_tcp_links')
+
+    return options
+
+
 def _start_ssh_daemon():
     subprocess.Popen(["/usr/sbin/sshd", "-D"])
 
@@ -178,24 +542,44 @@ def _start_ssh_daemon():
 def _wait_for_training_to_finish(training_environment):
     current_host = training_environment.current_host
 
+    # the events are saved for the processes mpirun starts on this host, which merge them into the master's trace
+    lifecycle.save_events()
+
     logger.info("worker node {} is waiting for MPI to start training process ".format(current_host))
-    _wait_for_mpi_to_start_running()
+    with lifecycle.span('wait_for_mpi_to_start_running'):
+        _wait_for_mpi_to_start_running()
 
     logger.info("MPI started training process on worker node {}".format(current_host))
 
+    # the merged trace only sees the start of the wait, this host's own trace has all of it
+    lifecycle.begin('wait_until_mpi_stops_running')
+    lifecycle.save_events()
     _wait_until_mpi_stops_running()
+    lifecycle.end('wait_until_mpi_stops_running')
     logger.info("Training process started by MPI on worker node {} stopped" .format(current_host))
 
 
 def _wait_for_worker_nodes_to_start_sshd(hosts, interval=1, timeout_in_seconds=180):
-    with timeout(seconds=timeout_in_seconds):
+    # a deadline instead of a signal based timeout, because this runs in a bootstrap pipeline thread
+    deadline = time.time() + timeout_in_seconds
+    pool = ThreadPool(max(min(len(hosts), _MAX_SSH_PROBE_THREADS), 1))
+    try:
         while len(hosts) > 0:
             logger.info("hosts that aren't SSHable yet: " + str(hosts))
-            for host in hosts:
-                host_is_sshable = _can_connect(host, 22, socket.socket(socket.AF_INET, socket.SOCK_STREAM))
-                if host_is_sshable:
-                    hosts.remove(host)
+            # probe all hosts concurrently, so that the wait doesn't grow with the number of hosts
+            hosts_are_sshable = pool.map(_can_connect_to_sshd, hosts)
+            hosts[:] = [host for host, host_is_sshable in zip(hosts, hosts_are_sshable) if not host_is_sshable]
             time.sleep(interval)
+            if len(hosts) > 0 and time.time() > deadline:
+                raise TimeoutError('timed out after {} seconds'.format(timeout_in_seconds))
+    finally:
+        pool.close()
+
+
+def _can_connect_to_sshd(host):
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.settimeout(_SSH_CONNECT_TIMEOUT_IN_SECONDS)
+    return _can_connect(host, 22, s)
 
 
 def _can_connect(host, port, s):
@@ -227,6 +611,29 @@ def _wait_until_mpi_stops_running():
     return os.path.isfile(_MPI_IS_FINISHED)
 
 
+def _log_launch_latency():
+    """Logs how long after mpirun started the first, median and last processes were ready to train.
+
+    Must be called collectively by all processes started by mpirun.
+    """
+    launch_time = os.environ.get(_MPI_LAUNCH_TIME_ENV)
+    if not launch_time:
+        return
+
+    from mpi4py import MPI
+    latencies = MPI.COMM_WORLD.gather(time.time() - float(launch_time), root=0)
+    if latencies:
+        latencies = sorted(latencies)
+        logger.info("{} processes ready after mpirun launch: first {:.2f} seconds, median {:.2f} seconds, "
+                    "last {:.2f} seconds".format(len(latencies), latencies[0], latencies[len(latencies) // 2],
+                                                 latencies[-1]))
+
+
 if __name__=="__main__":
+    threads.pin_mpi_process()
     env = TrainingEnvironment()
-    _run_training(env, env.import_user_module())
+    with lifecycle.span('import_user_module'):
+        user_module = staging.import_user_module(env)
+    _log_launch_latency()
+    _run_training(env, user_module)
+    lifecycle.gather_mpi_events(env.current_host)
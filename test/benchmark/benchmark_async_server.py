@@ -0,0 +1,197 @@
+"""Compares the asyncio front end with the gunicorn and gevent stack of container_support, on the same transformer.
+
+Both servers run ``chainer_framework.serving.transform_fn`` with an MLP with the architecture of the test MNIST
+scripts, in the same number of worker processes. Closed-loop clients send JSON batches as fast as they are answered,
+while slow clients upload their bodies and read their responses in small pieces. The latencies are those of the
+closed-loop clients; 503 responses are counted separately.
+
+gunicorn and gevent must be installed, as they are in the serving containers.
+
+Usage:
+    python -m test.benchmark.benchmark_async_server --clients 8 --slow-clients 16 --seconds 10 --output async.json
+"""
+import argparse
+import json
+import multiprocessing
+import socket
+import threading
+import time
+
+import chainer
+import chainer.functions as F
+import chainer.links as L
+import numpy as np
+from six.moves import http_client
+
+from chainer_framework import async_server, serving
+
+
+class MLP(chainer.Chain):
+    def __init__(self, n_units, n_out):
+        super(MLP, self).__init__()
+        with self.init_scope():
+            self.l1 = L.Linear(784, n_units)
+            self.l2 = L.Linear(n_units, n_units)
+            self.l3 = L.Linear(n_units, n_out)
+
+    def __call__(self, x):
+        h1 = F.relu(self.l1(x))
+        h2 = F.relu(self.l2(h1))
+        return self.l3(h2)
+
+
+class Transformer(object):
+    def __init__(self, units):
+        self.model = MLP(units, 10)
+
+    def transform(self, data, content_type, accept):
+        return serving.transform_fn(self.model, data, content_type, accept)
+
+
+class _Env(object):
+    default_accept = 'application/json'
+
+
+def _serve_gunicorn(port, args):
+    import gunicorn.app.base
+    from container_support.serving import Server
+
+    class Application(gunicorn.app.base.BaseApplication):
+        def load_config(self):
+            for key, value in {'bind': '127.0.0.1:{}'.format(port), 'workers': args.workers,
+                               'worker_class': 'gevent', 'worker_connections': 1000 * args.workers,
+                               'timeout': 60, 'loglevel': 'warning'}.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return Server('model server', Transformer(args.units), _Env()).app
+
+    Application().run()
+
+
+def _serve_async(port, args):
+    server = async_server.AsyncServer(Transformer(args.units), threads=args.threads, max_in_flight=args.max_in_flight,
+                                      latency_budget=args.latency_budget)
+    sock = async_server.listen(port, '127.0.0.1')
+    # daemonic workers are terminated when this process returns on SIGTERM
+    for _ in range(args.workers - 1):
+        multiprocessing.Process(target=async_server.run, args=(server, sock), daemon=True).start()
+    async_server.run(server, sock)
+
+
+def _free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _wait_until_listening(port):
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            connection = http_client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/ping')
+            if connection.getresponse().status == 200:
+                return
+        except (socket.error, http_client.HTTPException):
+            time.sleep(0.1)
+    raise RuntimeError('the server did not start')
+
+
+def _client(port, payload, deadline, results):
+    connection = http_client.HTTPConnection('127.0.0.1', port, timeout=60)
+    while time.time() < deadline:
+        start = time.time()
+        try:
+            connection.request('POST', '/invocations', payload, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+        except (socket.error, http_client.HTTPException):
+            connection.close()
+            connection = http_client.HTTPConnection('127.0.0.1', port, timeout=60)
+            results.append(('error', time.time() - start))
+            continue
+        if response.status == 503:
+            # the connection is closed after a 503, and the client backs off as Retry-After asks, up to the deadline
+            connection.close()
+            connection = http_client.HTTPConnection('127.0.0.1', port, timeout=60)
+            results.append((503, time.time() - start))
+            time.sleep(min(float(response.getheader('Retry-After', 1)), max(deadline - time.time(), 0)))
+        else:
+            results.append((response.status, time.time() - start))
+
+
+def _slow_client(port, payload, deadline, piece_bytes, pause):
+    while time.time() < deadline:
+        try:
+            sock = socket.create_connection(('127.0.0.1', port), timeout=60)
+            sock.sendall('POST /invocations HTTP/1.1\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n'
+                         .format(len(payload)).encode('latin-1'))
+            for start in range(0, len(payload), piece_bytes):
+                sock.sendall(payload[start:start + piece_bytes])
+                time.sleep(pause)
+            while sock.recv(piece_bytes):
+                time.sleep(pause)
+            sock.close()
+        except socket.error:
+            time.sleep(pause)
+
+
+def _run(serve, args, payload):
+    port = _free_port()
+    process = multiprocessing.Process(target=serve, args=(port, args))
+    process.start()
+    try:
+        _wait_until_listening(port)
+        deadline = time.time() + args.seconds
+        results = []
+        threads = [threading.Thread(target=_client, args=(port, payload, deadline, results))
+                   for _ in range(args.clients)]
+        threads += [threading.Thread(target=_slow_client, args=(port, payload, deadline, 1024, 0.05))
+                    for _ in range(args.slow_clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        process.terminate()
+        process.join()
+
+    latencies = np.array([latency for status, latency in results if status == 200]) * 1000
+    return {'ok': len(latencies),
+            'rejected': sum(1 for status, _ in results if status == 503),
+            'errors': sum(1 for status, _ in results if status not in (200, 503)),
+            'requests_per_second': len(latencies) / float(args.seconds),
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--slow-clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=async_server.DEFAULT_THREADS)
+    parser.add_argument('--max-in-flight', type=int, default=async_server.DEFAULT_MAX_IN_FLIGHT)
+    parser.add_argument('--latency-budget', type=float, default=async_server.DEFAULT_LATENCY_BUDGET_IN_SECONDS)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--units', type=int, default=1000)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    payload = json.dumps(np.random.RandomState(0).rand(args.batch_size, 784).astype(np.float32).tolist())
+    payload = payload.encode('utf-8')
+    results = {'gunicorn_gevent': _run(_serve_gunicorn, args, payload),
+               'asyncio': _run(_serve_async, args, payload),
+               'arguments': vars(args)}
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
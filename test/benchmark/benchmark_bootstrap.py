@@ -0,0 +1,78 @@
+"""Measures how long distributed training takes to start, on clusters simulated by ``test.utils.local_cluster``.
+
+For every number of hosts, a job whose user script returns at once runs on a local cluster, with one process per
+host. The report has, from the lifecycle trace of the master host, the durations of the bootstrap steps of the
+master, the time from the start of mpirun until the first and the last process imported the user module, the
+duration of mpirun, and the wall time until all hosts exited. Worker hosts poll for the end of mpirun every 5 seconds,
+which is included in the wall time.
+
+Usage:
+    python -m test.benchmark.benchmark_bootstrap --hosts 2 4 8 --output bootstrap.json
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from test.utils.local_cluster import LocalCluster
+
+_USER_SCRIPT = """
+def train():
+    pass
+"""
+
+_BOOTSTRAP_STEPS = ['change_hostname', 'wait_for_sshd', 'stage_user_module']
+
+
+def _run(num_hosts, source_dir):
+    with LocalCluster(num_hosts, source_dir, 'user_script.py', {'use_mpi': True}) as cluster:
+        start = time.time()
+        cluster.start()
+        exit_codes = cluster.wait(timeout=600)
+        wall_time = time.time() - start
+        if set(exit_codes.values()) != {0}:
+            raise RuntimeError('training failed: {}'.format(exit_codes))
+        trace = cluster.trace()
+
+    spans = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+    master_spans = dict((event['name'], event) for event in spans if event['pid'] == 0)
+    mpirun = master_spans['mpirun']
+    imports = sorted(event['ts'] + event['dur'] - mpirun['ts'] for event in spans
+                     if event['name'] == 'import_user_module')
+
+    result = {'hosts': num_hosts, 'wall_time': wall_time, 'mpirun': mpirun['dur'] / 1e6,
+              'first_rank_ready': imports[0] / 1e6, 'last_rank_ready': imports[-1] / 1e6}
+    for step in _BOOTSTRAP_STEPS:
+        result[step] = master_spans[step]['dur'] / 1e6
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hosts', type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument('--output', default='bootstrap.json')
+    args = parser.parse_args()
+
+    source_dir = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(source_dir, 'user_script.py'), 'w') as f:
+            f.write(_USER_SCRIPT)
+
+        results = []
+        for num_hosts in args.hosts:
+            result = _run(num_hosts, source_dir)
+            print('{hosts} hosts: wait_for_sshd {wait_for_sshd:.2f}s, stage_user_module {stage_user_module:.2f}s, '
+                  'ranks ready after {first_rank_ready:.2f}s to {last_rank_ready:.2f}s, mpirun {mpirun:.2f}s, '
+                  'wall time {wall_time:.2f}s'.format(**result))
+            results.append(result)
+    finally:
+        shutil.rmtree(source_dir, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""Micro-benchmarks of the serialization modules and of the JSON, CSV and NPY branches of input_fn and output_fn,
+checked against the committed baseline in test/benchmark/baselines/codecs.json.
+
+Every decoder and encoder is timed, and its allocations measured with tracemalloc, on payloads of every shape in
+:data:`SHAPES` (one row, a square batch, a tall and skinny batch and a wide batch) and every dtype in :data:`DTYPES`.
+transform_fn is also measured end to end on a Linear model, for float32 JSON requests.
+
+Allocations are deterministic, and are what the baseline gates: a case regresses if its allocations grow by more than
+--memory-tolerance plus --memory-slack bytes, and the script then exits with status 1. Times are reported, as the
+median of several runs divided by the time of a fixed calibration workload measured right before and after the case,
+so that they can be compared with the baseline's on other machines. They vary from run to run by more than most
+regressions, so they are only gated when --time-tolerance is given, for comparisons on one quiet machine. Cases that
+aren't in the baseline, and those that need packages that aren't installed (pyarrow), are reported but not checked.
+pyarrow allocates outside of tracemalloc's view, so the allocations of the Arrow cases only count the Python objects
+around its buffers.
+
+Update the baseline with --update-baseline when a change makes a case faster or smaller, or when a slowdown is
+intended, and commit it with the change.
+
+Usage:
+    python -m test.benchmark.benchmark_codecs
+    python -m test.benchmark.benchmark_codecs --filter 'csv' --output codecs.json
+    python -m test.benchmark.benchmark_codecs --time-tolerance 1.0
+    python -m test.benchmark.benchmark_codecs --update-baseline
+"""
+import argparse
+import gc
+import json
+import os
+import re
+import sys
+import timeit
+import tracemalloc
+
+import chainer
+import chainer.links as L
+import numpy as np
+
+from chainer_framework import serving
+from chainer_framework.serialization import arrow, csv, npy, recordio
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'codecs.json')
+
+SHAPES = {'1xN': (1, 784), 'NxM': (100, 100), 'tall': (5000, 4), 'wide': (4, 5000)}
+DTYPES = ('float32', 'float64')
+
+JSON_CONTENT_TYPE = 'application/json'
+CSV_CONTENT_TYPE = 'text/csv'
+
+# name: (serialize the input of the function, function)
+DECODERS = {
+    'csv.loads': (lambda array: csv.dumps(array), csv.loads),
+    'npy.loads': (npy.dumps, npy.loads),
+    'recordio.loads': (recordio.dumps, recordio.loads),
+    'arrow.loads': (arrow.dumps, arrow.loads),
+    'input_fn json': (lambda array: json.dumps(array.tolist()),
+                      lambda data: serving.input_fn(data, JSON_CONTENT_TYPE)),
+}
+ENCODERS = {
+    'csv.dumps': csv.dumps,
+    'npy.dumps': npy.dumps,
+    'recordio.dumps': recordio.dumps,
+    'arrow.dumps': arrow.dumps,
+    'output_fn json': lambda array: serving.output_fn(array, JSON_CONTENT_TYPE),
+    'output_fn csv': lambda array: serving.output_fn(array, CSV_CONTENT_TYPE),
+    'output_fn npy': lambda array: serving.output_fn(array, serving.NPY_CONTENT_TYPE),
+}
+
+
+def cases():
+    """Returns (name, function) of every case that can run here."""
+    all_cases = []
+    for shape_name, shape in sorted(SHAPES.items()):
+        for dtype in DTYPES:
+            array = np.random.RandomState(0).rand(*shape).astype(dtype)
+            suffix = ' {} {}'.format(shape_name, dtype)
+            for name, (serialize, decode) in sorted(DECODERS.items()):
+                if name.startswith('arrow') and not arrow.available():
+                    continue
+                all_cases.append((name + suffix, _bind(decode, serialize(array))))
+            for name, encode in sorted(ENCODERS.items()):
+                if name.startswith('arrow') and not arrow.available():
+                    continue
+                all_cases.append((name + suffix, _bind(encode, array)))
+            if dtype == 'float32':
+                all_cases.append(('transform_fn json' + suffix, _transform_fn(array)))
+    return all_cases
+
+
+def _bind(function, argument):
+    return lambda: function(argument)
+
+
+def _transform_fn(array):
+    model = L.Linear(array.shape[1], 10, initialW=chainer.initializers.Normal(scale=0.01, dtype=np.float32))
+    data = json.dumps(array.tolist())
+    return lambda: serving.transform_fn(model, data, JSON_CONTENT_TYPE, JSON_CONTENT_TYPE)
+
+
+def calibration():
+    """A fixed workload of the kinds of work codecs do: Python objects, text, and numpy conversions."""
+    values = [float(i) / 7 for i in range(20000)]
+    text = json.dumps(values)
+    return np.array(json.loads(text), dtype=np.float32).tolist()
+
+
+def time_per_call(function, min_seconds=0.02, repeat=7):
+    """Returns the median time of a call, over `repeat` runs of enough calls to take at least `min_seconds`."""
+    timer = timeit.Timer(function)
+    number = max(1, int(min_seconds / max(timer.timeit(1), 1e-9)))
+    return float(np.median(timer.repeat(repeat=repeat, number=number))) / number
+
+
+def allocated_bytes(function):
+    """Returns the peak of the memory allocated during a call, as tracemalloc sees it."""
+    function()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - start
+
+
+def run(pattern=None):
+    calibration_times = []
+    results = {}
+    for name, function in cases():
+        if pattern and not re.search(pattern, name):
+            continue
+        # calibrated around every case, so that changes of the machine's speed during the run cancel out
+        before = time_per_call(calibration, repeat=5)
+        seconds = time_per_call(function)
+        after = time_per_call(calibration, repeat=5)
+        calibration_times.extend([before, after])
+        results[name] = {'microseconds': seconds * 1e6,
+                         'normalized': seconds / ((before + after) / 2),
+                         'allocated_bytes': allocated_bytes(function)}
+        print('{:40s} {:12.1f} us {:10.4f} x {:12d} B'.format(name, results[name]['microseconds'],
+                                                              results[name]['normalized'],
+                                                              results[name]['allocated_bytes']))
+    calibration_seconds = float(np.median(calibration_times)) if calibration_times else 0.
+    return {'calibration_microseconds': calibration_seconds * 1e6, 'numpy': np.__version__,
+            'python': sys.version.split()[0], 'cases': results}
+
+
+def compare(report, baseline, memory_tolerance=0.1, memory_slack=4096, time_tolerance=None):
+    """Returns the regressions of a report against a baseline, as messages. Times are only compared if
+    `time_tolerance` is not None."""
+    regressions = []
+    for name, result in sorted(report['cases'].items()):
+        expected = baseline['cases'].get(name)
+        if expected is None:
+            continue
+        if time_tolerance is not None and result['normalized'] > expected['normalized'] * (1 + time_tolerance):
+            ratio = result['normalized'] / expected['normalized']
+            regressions.append('{}: {:.2f}x the baseline time'.format(name, ratio))
+        if result['allocated_bytes'] > expected['allocated_bytes'] * (1 + memory_tolerance) + memory_slack:
+            regressions.append('{}: allocates {} bytes, baseline {}'.format(name, result['allocated_bytes'],
+                                                                            expected['allocated_bytes']))
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filter', help='regular expression of the names of the cases to run')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='write the results into the baseline, keeping the cases that did not run')
+    parser.add_argument('--time-tolerance', type=float,
+                        help='also fail if a normalized time grows by more than this fraction; times are not gated '
+                             'by default')
+    parser.add_argument('--memory-tolerance', type=float, default=0.1)
+    parser.add_argument('--memory-slack', type=int, default=4096)
+    parser.add_argument('--output')
+    args = parser.parse_args(args)
+
+    report = run(args.filter)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    baseline = {'cases': {}}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.update_baseline:
+        baseline['cases'].update(report['cases'])
+        baseline.update((key, value) for key, value in report.items() if key != 'cases')
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print('updated {}'.format(args.baseline))
+        return report
+
+    missing = sorted(set(report['cases']) - set(baseline['cases']))
+    if missing:
+        print('not in the baseline: {}'.format(', '.join(missing)))
+    regressions = compare(report, baseline, args.memory_tolerance, args.memory_slack, args.time_tolerance)
+    for regression in regressions:
+        print('regression: {}'.format(regression))
+    if regressions:
+        sys.exit(1)
+    print('no regressions against {}'.format(args.baseline))
+    return report
+
+
+if __name__ == '__main__':
+    main()
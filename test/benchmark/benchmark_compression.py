@@ -0,0 +1,76 @@
+"""Compares the end-to-end throughput of compressed and uncompressed CSV and JSON payloads.
+
+Each request goes through ``chainer_framework.serving.transform_fn`` with a linear model, with the client side work
+too: serializing and compressing the request, and decompressing and parsing the response. Throughput at a network
+bandwidth is estimated as 1 / (CPU time + bytes transferred / bandwidth), since loopback isn't network bound.
+
+Usage:
+    python -m test.benchmark.benchmark_compression --rows 10000 --bandwidth-mbps 100 1000 --output compression.json
+"""
+import argparse
+import json
+import time
+
+import chainer.links as L
+import numpy as np
+
+from chainer_framework import serving
+from chainer_framework.serialization import compression, csv
+
+
+def _serialize(array, content_type):
+    return csv.dumps(array) if content_type == serving.CSV_CONTENT_TYPE else json.dumps(array.tolist())
+
+
+def _request(model, array, content_type, encoding):
+    start = time.time()
+    data = _serialize(array, content_type)
+    request_type = accept = content_type
+    if encoding:
+        data = compression.compress(data.encode('utf-8'), encoding)
+        request_type = accept = compression.with_encoding(content_type, encoding)
+
+    response, response_type = serving.transform_fn(model, data, request_type, accept)
+
+    response_type, response_encoding = compression.parse(response_type)
+    if response_encoding:
+        response = compression.decompressed_stream(response, response_encoding).read().decode('utf-8')
+    if response_type == serving.CSV_CONTENT_TYPE:
+        csv.loads(response)
+    else:
+        json.loads(response)
+    return time.time() - start, len(data) + len(response)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--features', type=int, default=32)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--bandwidth-mbps', type=float, nargs='+', default=[100, 1000])
+    parser.add_argument('--output', default='compression.json')
+    args = parser.parse_args()
+
+    model = L.Linear(args.features, 4)
+    # features rounded like typical tabular data
+    array = np.random.RandomState(0).rand(args.rows, args.features).astype(np.float32).round(3)
+
+    results = []
+    for content_type in [serving.CSV_CONTENT_TYPE, serving.JSON_CONTENT_TYPE]:
+        for encoding in [None] + compression.encodings():
+            measurements = sorted(_request(model, array, content_type, encoding) for _ in range(args.iterations))
+            seconds, transferred = measurements[len(measurements) // 2]
+            result = {'content_type': content_type, 'encoding': encoding, 'cpu_ms': seconds * 1000,
+                      'bytes': transferred}
+            for bandwidth in args.bandwidth_mbps:
+                result['requests_per_second_at_{:g}_mbps'.format(bandwidth)] = \
+                    1 / (seconds + transferred * 8 / (bandwidth * 1e6))
+            print(json.dumps(result))
+            results.append(result)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Measures the size, load time and resident memory of float32 and float16 model artifacts.
+
+Saves an MLP with the architecture of the test MNIST scripts as model.npz and as a memory-mappable artifact, in
+float32 and in float16 (see the `model_dtype` hyperparameter), then loads each artifact in a new process and predicts
+a batch. Memory is the Pss of the process after the prediction, minus its Pss before creating the model. Load time
+excludes creating the model.
+
+Usage:
+    python -m test.benchmark.benchmark_half_precision --units 4096 --output half_precision.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import chainer
+import chainer.functions as F
+import chainer.links as L
+import numpy as np
+from chainer import serializers
+
+from chainer_framework import artifacts, preload
+
+
+class MLP(chainer.Chain):
+    def __init__(self, n_units, n_out):
+        super(MLP, self).__init__()
+        with self.init_scope():
+            self.l1 = L.Linear(784, n_units)
+            self.l2 = L.Linear(n_units, n_units)
+            self.l3 = L.Linear(n_units, n_out)
+
+    def __call__(self, x):
+        h1 = F.relu(self.l1(x))
+        h2 = F.relu(self.l2(h1))
+        return self.l3(h2)
+
+
+def _load(model_dir, units, artifact, batch_size):
+    before = preload.memory_usage()['pss']
+    model = MLP(units, 10)
+    start = time.time()
+    if artifact == 'npz':
+        serializers.load_npz(os.path.join(model_dir, artifacts.NPZ_MODEL_FILE_NAME), model)
+    else:
+        model = artifacts.load(model_dir, model)
+    load_seconds = time.time() - start
+
+    x = np.random.RandomState(0).rand(batch_size, 784).astype(np.float32)
+    start = time.time()
+    with chainer.using_config('train', False), chainer.no_backprop_mode():
+        y = model(x).array
+    predict_seconds = time.time() - start
+    return {'load_ms': load_seconds * 1000, 'predict_ms': predict_seconds * 1000,
+            'pss_bytes': preload.memory_usage()['pss'] - before, 'prediction': y.tolist()}
+
+
+def _run(model_dir, units, artifact, batch_size):
+    # a new process, so that memory and load time include no state of the other runs
+    output = subprocess.check_output([sys.executable, '-m', 'test.benchmark.benchmark_half_precision', '--load',
+                                      model_dir, '--units', str(units), '--artifact', artifact,
+                                      '--batch-size', str(batch_size)])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--units', type=int, default=4096)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--artifact', choices=['npz', 'mmap'])
+    parser.add_argument('--load', help=argparse.SUPPRESS)
+    parser.add_argument('--output', default='half_precision.json')
+    args = parser.parse_args()
+
+    if args.load:
+        print(json.dumps(_load(args.load, args.units, args.artifact, args.batch_size)))
+        return
+
+    model = MLP(args.units, 10)
+    results = []
+    directory = tempfile.mkdtemp()
+    try:
+        for dtype in ['float32', 'float16']:
+            model_dir = os.path.join(directory, dtype)
+            os.makedirs(model_dir)
+            cast = np.float16 if dtype == 'float16' else None
+            artifacts.save_npz(os.path.join(model_dir, artifacts.NPZ_MODEL_FILE_NAME), model, cast)
+            artifacts.save(model, model_dir, cast)
+            for artifact, file_name in [('npz', artifacts.NPZ_MODEL_FILE_NAME),
+                                        ('mmap', artifacts.MMAP_MODEL_FILE_NAME)]:
+                result = _run(model_dir, args.units, artifact, args.batch_size)
+                result.update({'dtype': dtype, 'artifact': artifact,
+                               'artifact_bytes': os.path.getsize(os.path.join(model_dir, file_name))})
+                results.append(result)
+    finally:
+        shutil.rmtree(directory)
+
+    for result in results:
+        reference = [r for r in results if r['artifact'] == result['artifact'] and r['dtype'] == 'float32'][0]
+        prediction, expected = np.array(result['prediction']), np.array(reference['prediction'])
+        result['relative_error'] = float(np.linalg.norm(prediction - expected) / np.linalg.norm(expected))
+    for result in results:
+        del result['prediction']
+        print(json.dumps(result))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Compares the CPU inference latency and training throughput of models with and without iDeep (see
+``chainer_framework.acceleration``).
+
+The models are the MLP of the test MNIST scripts, with larger layers, and chainercv's ResNet50 or VGG16 with random
+weights, which is enough to measure speed. For each model and batch size the report has the median inference latency
+and the training samples per second, with NumPy and, if ``acceleration.available()``, with iDeep, and the links that
+ran with iDeep. Without ideep4py installed only the NumPy numbers are measured.
+
+Usage:
+    python -m test.benchmark.benchmark_ideep --models mlp resnet50 --batch-size 1 32 --output ideep.json
+"""
+import argparse
+import copy
+import json
+import time
+
+import chainer
+import chainer.functions as F
+import chainer.links as L
+import numpy as np
+
+from chainer_framework import acceleration
+
+
+class MLP(chainer.Chain):
+    def __init__(self, n_units, n_out):
+        super(MLP, self).__init__()
+        with self.init_scope():
+            self.l1 = L.Linear(None, n_units)
+            self.l2 = L.Linear(None, n_units)
+            self.l3 = L.Linear(None, n_out)
+
+    def __call__(self, x):
+        h1 = F.relu(self.l1(x))
+        h2 = F.relu(self.l2(h1))
+        return self.l3(h2)
+
+
+def _model(name, units):
+    """Returns the model and the shape of one of its inputs."""
+    if name == 'resnet50':
+        from chainercv.links import ResNet50
+        return ResNet50(n_class=1000, arch='he'), (3, 224, 224)
+    if name == 'vgg16':
+        from chainercv.links import VGG16
+        return VGG16(n_class=1000), (3, 224, 224)
+    return MLP(units, 10), (784,)
+
+
+def _median_latency(model, data, iterations):
+    latencies = []
+    with chainer.using_config('train', False), chainer.no_backprop_mode():
+        model(data)
+        for _ in range(iterations):
+            start = time.time()
+            model(data)
+            latencies.append(time.time() - start)
+    return sorted(latencies)[len(latencies) // 2]
+
+
+def _training_throughput(model, data, iterations):
+    classifier = L.Classifier(model)
+    optimizer = chainer.optimizers.SGD()
+    optimizer.setup(classifier)
+    labels = np.zeros(len(data), dtype=np.int32)
+
+    optimizer.update(classifier, data, labels)
+    start = time.time()
+    for _ in range(iterations):
+        optimizer.update(classifier, data, labels)
+    return iterations * len(data) / (time.time() - start)
+
+
+def _measure(model, data, args):
+    return {'median_ms': _median_latency(model, data, args.iterations) * 1000,
+            'training_samples_per_second': _training_throughput(model, data, args.training_iterations)}
+
+
+def _accelerated_links(model, data):
+    recorder = acceleration.AccelerationRecorder()
+    with acceleration.using_ideep(), recorder, chainer.using_config('train', False), chainer.no_backprop_mode():
+        model(data)
+    return recorder.report(model)['accelerated_links']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', nargs='+', choices=['mlp', 'resnet50', 'vgg16'], default=['mlp', 'resnet50'])
+    parser.add_argument('--units', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[1, 32])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--training-iterations', type=int, default=5)
+    parser.add_argument('--output', default='ideep.json')
+    args = parser.parse_args()
+
+    ideep = acceleration.available()
+    if not ideep:
+        print('iDeep is not available, measuring without it only')
+
+    results = []
+    for name in args.models:
+        model, input_shape = _model(name, args.units)
+        for batch_size in args.batch_size:
+            data = np.random.rand(batch_size, *input_shape).astype(np.float32)
+            result = {'model': name, 'batch_size': batch_size, 'numpy': _measure(copy.deepcopy(model), data, args)}
+            if ideep:
+                accelerated = copy.deepcopy(model)
+                accelerated.to_intel64()
+                with acceleration.using_ideep():
+                    result['ideep'] = _measure(accelerated, data, args)
+                result['ideep']['accelerated_links'] = _accelerated_links(accelerated, data)
+                result['inference_speedup'] = result['numpy']['median_ms'] / result['ideep']['median_ms']
+                result['training_speedup'] = result['ideep']['training_samples_per_second'] / \
+                    result['numpy']['training_samples_per_second']
+            print(json.dumps(result))
+            results.append(result)
+
+    with open(args.output, 'w') as f:
+        json.dump({'ideep_available': ideep, 'chainer': chainer.__version__, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
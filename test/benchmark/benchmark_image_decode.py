@@ -0,0 +1,91 @@
+"""Compares the payload size and decode time of image batches sent as JSON float arrays and as JPEG or PNG images
+(see ``chainer_framework.serialization.image``).
+
+The images are smooth synthetic photographs: random noise upsampled to the image size, which compresses like
+natural images rather than like noise. The JSON payload is the preprocessed batch a client would otherwise send,
+of shape (batch, 3, crop, crop). Image payloads are tar archives of the full size images, decoded, resized, cropped
+and normalized by the server, with each number of decode threads.
+
+Usage:
+    python -m test.benchmark.benchmark_image_decode --batch-size 1 16 --threads 1 2 4 --output image_decode.json
+"""
+import argparse
+import io
+import json
+import tarfile
+import time
+
+import cv2
+import numpy as np
+
+from chainer_framework import serving
+from chainer_framework.serialization import image
+from container_support.serving import JSON_CONTENT_TYPE
+
+_MEAN = '123.68,116.78,103.94'
+
+
+def _photo(random, size):
+    noise = random.randint(0, 256, (size // 32, size // 32, 3)).astype(np.uint8)
+    return cv2.resize(noise, (size, size), interpolation=cv2.INTER_CUBIC)
+
+
+def _tar(images, extension):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for index, pixels in enumerate(images):
+            payload = cv2.imencode(extension, pixels)[1].tobytes()
+            info = tarfile.TarInfo('{}{}'.format(index, extension))
+            info.size = len(payload)
+            tar.addfile(info, io.BytesIO(payload))
+    return buffer.getvalue()
+
+
+def _median_seconds(function, iterations):
+    function()
+    times = []
+    for _ in range(iterations):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[1, 16])
+    parser.add_argument('--image-size', type=int, default=256)
+    parser.add_argument('--crop', type=int, default=224)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--output', default='image_decode.json')
+    args = parser.parse_args()
+
+    random = np.random.RandomState(0)
+    preprocessing = image.parse_preprocessing(crop=str(args.crop), mean=_MEAN)
+    results = []
+    for batch_size in args.batch_size:
+        images = [_photo(random, args.image_size) for _ in range(batch_size)]
+        payloads = {'jpeg': _tar(images, '.jpg'), 'png': _tar(images, '.png')}
+        batch = image.loads(payloads['png'], image.TAR_CONTENT_TYPE, preprocessing)
+        json_payload = json.dumps(batch.tolist())
+
+        result = {'batch_size': batch_size, 'json_bytes': len(json_payload),
+                  'json_decode_ms': _median_seconds(lambda: serving.input_fn(json_payload, JSON_CONTENT_TYPE),
+                                                    args.iterations) * 1000}
+        for name, payload in payloads.items():
+            result['{}_bytes'.format(name)] = len(payload)
+            result['{}_size_reduction'.format(name)] = float(len(json_payload)) / len(payload)
+            for threads in args.threads:
+                seconds = _median_seconds(lambda: image.loads(payload, image.TAR_CONTENT_TYPE, preprocessing, threads),
+                                          args.iterations)
+                result['{}_decode_ms_{}_threads'.format(name, threads)] = seconds * 1000
+        print(json.dumps(result))
+        results.append(result)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
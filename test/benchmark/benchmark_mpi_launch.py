@@ -0,0 +1,106 @@
+"""Measures how long mpirun takes to start one process on every host of a simulated cluster.
+
+Runs on a single machine with OpenMPI installed: a fake rsh agent replaces ssh and runs the commands for all hosts
+locally, so the launch path (hostfile, tree spawn, concurrency and routing options) is exercised without containers.
+Compares the default and the large cluster launch modes of ``chainer_framework.training`` and writes a JSON report.
+
+Usage:
+    python -m test.benchmark.benchmark_mpi_launch --hosts 8 16 32 --output mpi_launch.json
+"""
+import argparse
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import time
+
+from mock import MagicMock, patch
+
+from chainer_framework import training
+
+_AGENT = """#!/bin/sh
+# drops the host name and runs the command locally
+shift
+exec /bin/sh -c "$*"
+"""
+
+# every rank writes its own file, because mpirun may interleave the output of ranks
+_RANK_SCRIPT = """#!/bin/sh
+python -c "import os, time; print(time.time() - float(os.environ['{}']))" > "$(dirname "$0")/ready/$$"
+""".format(training._MPI_LAUNCH_TIME_ENV)
+
+
+def _write_script(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+    os.chmod(path, 0o755)
+    return path
+
+
+def _simulated_env(num_hosts, launch_mode, agent):
+    env = MagicMock()
+    env.hosts = ['algo-{}'.format(i) for i in range(1, num_hosts + 1)]
+    env.current_host = 'algo-1'
+    env.network_interface_name = 'lo'
+    env.available_gpus = 0
+    env.hyperparameters = {'mpi_launch_mode': launch_mode, 'mpi_rsh_agent': agent, 'mpi_network_interfaces': 'lo'}
+    return env
+
+
+def _launch(env, work_dir):
+    ready_dir = os.path.join(work_dir, 'ready')
+    shutil.rmtree(ready_dir, ignore_errors=True)
+    os.mkdir(ready_dir)
+
+    with patch.object(training, '_MPI_SCRIPT', os.path.join(work_dir, 'rank.sh')), \
+            patch.object(training, '_MPI_HOSTFILE', os.path.join(work_dir, 'hostfile')), \
+            patch.object(training, '_CHANGE_HOSTNAME_LIBRARY', ''):
+        mpi_command = training._get_mpi_command(env)
+        if training._is_large_cluster_launch(env):
+            training._write_hostfile(env.hosts, 1, training._MPI_HOSTFILE)
+
+    # the simulated hosts share one machine, so the PMIx shared memory store can't be used
+    process_env = dict(os.environ, PMIX_MCA_gds='hash')
+    process_env[training._MPI_LAUNCH_TIME_ENV] = str(time.time())
+    subprocess.check_call(shlex.split(mpi_command), env=process_env)
+    elapsed = time.time() - float(process_env[training._MPI_LAUNCH_TIME_ENV])
+
+    latencies = []
+    for name in os.listdir(ready_dir):
+        with open(os.path.join(ready_dir, name)) as f:
+            latencies.append(float(f.read()))
+    latencies.sort()
+    return {'hosts': len(env.hosts),
+            'first_ready': latencies[0],
+            'median_ready': latencies[len(latencies) // 2],
+            'last_ready': latencies[-1],
+            'total': elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hosts', type=int, nargs='+', default=[8, 16, 32])
+    parser.add_argument('--output', default='mpi_launch.json')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    agent = _write_script(os.path.join(work_dir, 'agent.sh'), _AGENT)
+    _write_script(os.path.join(work_dir, 'rank.sh'), _RANK_SCRIPT)
+
+    results = []
+    for num_hosts in args.hosts:
+        for launch_mode in ('default', 'large_cluster'):
+            result = _launch(_simulated_env(num_hosts, launch_mode, agent), work_dir)
+            result['launch_mode'] = launch_mode
+            print('{hosts} hosts, {launch_mode}: first {first_ready:.2f}s, median {median_ready:.2f}s, '
+                  'last {last_ready:.2f}s, total {total:.2f}s'.format(**result))
+            results.append(result)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Measures the CPU latency of a ResNet-style model before and after ``chainer_framework.optimization.optimize``.
+
+Uses chainercv's ResNet50 (with random weights, which is enough to measure latency) if chainercv is installed, or a
+small ResNet-style model built from convolution, batch normalization and residual blocks otherwise.
+
+Usage:
+    python -m test.benchmark.benchmark_optimization --model resnet50 --batch-size 1 --output optimization.json
+"""
+import argparse
+import json
+import time
+
+import chainer
+import chainer.functions as F
+import chainer.links as L
+import numpy as np
+
+from chainer_framework import optimization
+
+
+class _ResidualBlock(chainer.Chain):
+    def __init__(self, channels):
+        super(_ResidualBlock, self).__init__()
+        with self.init_scope():
+            self.conv1 = L.Convolution2D(channels, channels, 3, pad=1, nobias=True)
+            self.bn1 = L.BatchNormalization(channels)
+            self.conv2 = L.Convolution2D(channels, channels, 3, pad=1, nobias=True)
+            self.bn2 = L.BatchNormalization(channels)
+
+    def __call__(self, x):
+        h = F.relu(self.bn1(self.conv1(x)))
+        return F.relu(self.bn2(self.conv2(h)) + x)
+
+
+class SmallResNet(chainer.Chain):
+    def __init__(self, channels=64, blocks=8, classes=1000):
+        super(SmallResNet, self).__init__()
+        with self.init_scope():
+            self.conv = L.Convolution2D(3, channels, 7, stride=2, pad=3, nobias=True)
+            self.bn = L.BatchNormalization(channels)
+            self.blocks = chainer.ChainList(*[_ResidualBlock(channels) for _ in range(blocks)])
+            self.fc = L.Linear(channels, classes)
+
+    def __call__(self, x):
+        h = F.max_pooling_2d(F.relu(self.bn(self.conv(x))), 3, stride=2)
+        for block in self.blocks:
+            h = block(h)
+        return self.fc(F.average(h, axis=(2, 3)))
+
+
+def _model(name):
+    if name == 'resnet50':
+        from chainercv.links import ResNet50
+        return ResNet50(n_class=1000, arch='he')
+    return SmallResNet()
+
+
+def _latencies(model, data, iterations):
+    latencies = []
+    with chainer.using_config('train', False), chainer.no_backprop_mode():
+        model(data)
+        for _ in range(iterations):
+            start = time.time()
+            model(data)
+            latencies.append(time.time() - start)
+    return sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', choices=['resnet50', 'small_resnet'], default='resnet50')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--output', default='optimization.json')
+    args = parser.parse_args()
+
+    model = _model(args.model)
+    data = np.random.rand(args.batch_size, 3, 224, 224).astype(np.float32)
+    # a few training iterations give batch normalization non-trivial statistics
+    with chainer.using_config('train', True):
+        for _ in range(2):
+            model(np.random.rand(2, 3, 224, 224).astype(np.float32))
+
+    optimized = optimization.optimize(model, data)
+    folded = sum(isinstance(link, optimization._Identity) for link in optimized.links())
+
+    result = {'model': args.model, 'batch_size': args.batch_size, 'folded_batch_normalizations': folded,
+              'max_abs_difference': float(np.max(np.abs(optimization.predict(optimized, data) -
+                                                        optimization.predict(model, data))))}
+    for name, candidate in [('original', model), ('optimized', optimized)]:
+        latencies = _latencies(candidate, data, args.iterations)
+        result['{}_median_ms'.format(name)] = latencies[len(latencies) // 2] * 1000
+        result['{}_p90_ms'.format(name)] = latencies[int(len(latencies) * 0.9)] * 1000
+    print(json.dumps(result, indent=2))
+
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
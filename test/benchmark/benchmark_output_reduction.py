@@ -0,0 +1,58 @@
+"""Compares the response size and output_fn time of full predictions and of predictions reduced on the server (see
+``chainer_framework.postprocessing``), for classifiers with many classes.
+
+Usage:
+    python -m test.benchmark.benchmark_output_reduction --classes 10000 100000 --batch-size 32 --output reduction.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from chainer_framework import serving
+
+_OUTPUTS = [('full', ''), ('argmax', '; output=argmax'), ('top-5', '; output=top-k; k=5'),
+            ('top-5-softmax', '; output=top-k; k=5; scores=softmax')]
+
+
+def _median_seconds(function, iterations):
+    function()
+    times = []
+    for _ in range(iterations):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--classes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--accept', nargs='+', default=['application/json', 'text/csv'])
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--output', default='reduction.json')
+    args = parser.parse_args()
+
+    results = []
+    for classes in args.classes:
+        prediction = np.random.RandomState(0).randn(args.batch_size, classes).astype(np.float32)
+        for accept in args.accept:
+            result = {'classes': classes, 'batch_size': args.batch_size, 'accept': accept}
+            for name, parameters in _OUTPUTS:
+                output_data, _ = serving.output_fn(prediction, accept + parameters)
+                result['{}_bytes'.format(name)] = len(output_data)
+                result['{}_ms'.format(name)] = _median_seconds(
+                    lambda: serving.output_fn(prediction, accept + parameters), args.iterations) * 1000
+            result['top-5_size_reduction'] = float(result['full_bytes']) / result['top-5_bytes']
+            result['top-5_speedup'] = result['full_ms'] / result['top-5_ms']
+            print(json.dumps(result))
+            results.append(result)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Measures the memory used by serving workers with and without preloading the model.
+
+Forks serving workers the way gunicorn does and runs predictions in each of them for a while, then reads the
+workers' memory usage from /proc. Without preloading, every worker loads its own copy of the model after the fork.
+With preloading, the model is loaded once with ``chainer_framework.preload.shared_model_fn`` before the fork.
+The proportional set size (Pss) per worker shows how much of the model the workers still share under load.
+
+Usage:
+    python -m test.benchmark.benchmark_preload --workers 4 --model-mb 200 --output preload.json
+"""
+import argparse
+import json
+import os
+import time
+
+import chainer
+import chainer.functions as F
+import chainer.links as L
+import numpy as np
+
+from chainer_framework import preload
+
+_MB = 1024 * 1024
+
+
+class MLP(chainer.ChainList):
+    def __init__(self, units, layers):
+        super(MLP, self).__init__(*[L.Linear(units, units) for _ in range(layers)])
+
+    def __call__(self, x):
+        for link in self:
+            x = F.relu(link(x))
+        return x
+
+
+def _model_fn(units, layers):
+    def model_fn(model_dir):
+        return MLP(units, layers)
+    return model_fn
+
+
+def _serve(model_fn, model, seconds, units):
+    """Runs in a forked worker: loads the model if it wasn't preloaded, predicts, and returns its memory usage."""
+    model = model or model_fn(None)
+    data = np.random.rand(8, units).astype(np.float32)
+    deadline = time.time() + seconds
+    requests = 0
+    with chainer.using_config('train', False), chainer.no_backprop_mode():
+        while time.time() < deadline:
+            model(data)
+            requests += 1
+    usage = preload.memory_usage()
+    usage['requests'] = requests
+    return usage
+
+
+def _run(mode, workers, units, layers, seconds):
+    model_fn = _model_fn(units, layers)
+    model = preload.shared_model_fn(model_fn)(None) if mode == 'preload' else None
+
+    children = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            with os.fdopen(write_fd, 'w') as f:
+                json.dump(_serve(model_fn, model, seconds, units), f)
+            os._exit(0)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+
+    usages = []
+    for pid, read_fd in children:
+        with os.fdopen(read_fd) as f:
+            usages.append(json.load(f))
+        os.waitpid(pid, 0)
+
+    return {'mode': mode,
+            'workers': workers,
+            'pss_per_worker_mb': sum(usage['pss'] for usage in usages) / float(workers) / _MB,
+            'private_per_worker_mb': sum(usage['private'] for usage in usages) / float(workers) / _MB,
+            'shared_per_worker_mb': sum(usage['shared'] for usage in usages) / float(workers) / _MB,
+            'total_pss_mb': sum(usage['pss'] for usage in usages) / float(_MB),
+            'requests': sum(usage['requests'] for usage in usages)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--model-mb', type=int, default=200)
+    parser.add_argument('--units', type=int, default=1024)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--output', default='preload.json')
+    args = parser.parse_args()
+
+    layers = max(1, args.model_mb * _MB // (args.units * args.units * 4))
+    results = [_run(mode, args.workers, args.units, layers, args.seconds) for mode in ('per_worker', 'preload')]
+    for result in results:
+        print('{mode}: {workers} workers, Pss {pss_per_worker_mb:.1f} MB per worker (private '
+              '{private_per_worker_mb:.1f} MB, shared {shared_per_worker_mb:.1f} MB), total Pss {total_pss_mb:.1f} MB, '
+              '{requests} requests'.format(**result))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
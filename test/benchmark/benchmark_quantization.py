@@ -0,0 +1,67 @@
+"""Measures the accuracy, latency and weight memory of int8 quantized models (see ``chainer_framework.quantization``).
+
+The MLP has the architecture of the test MNIST scripts, with larger layers; its weights are random, and the
+reference predictions are the float32 model's. Its inputs are random MNIST-sized images, or the first images of the
+MNIST test set with --mnist.
+
+Usage:
+    python -m test.benchmark.benchmark_quantization --units 1000 --batch-size 1 64 256 --output quantization.json
+"""
+import argparse
+import json
+
+import chainer
+import chainer.functions as F
+import chainer.links as L
+import numpy as np
+
+from chainer_framework import quantization
+
+
+class MLP(chainer.Chain):
+    def __init__(self, n_units, n_out):
+        super(MLP, self).__init__()
+        with self.init_scope():
+            self.l1 = L.Linear(None, n_units)
+            self.l2 = L.Linear(None, n_units)
+            self.l3 = L.Linear(None, n_out)
+
+    def __call__(self, x):
+        h1 = F.relu(self.l1(x))
+        h2 = F.relu(self.l2(h1))
+        return self.l3(h2)
+
+
+def _samples(batch_size, mnist):
+    if mnist:
+        _, test = chainer.datasets.get_mnist()
+        return np.stack([test[i][0] for i in range(batch_size)])
+    return np.random.rand(batch_size, 784).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--units', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[1, 64, 256])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--mnist', action='store_true')
+    parser.add_argument('--output', default='quantization.json')
+    args = parser.parse_args()
+
+    model = MLP(args.units, 10)
+    model(_samples(1, args.mnist))
+    results = []
+    for batch_size in args.batch_size:
+        samples = _samples(batch_size, args.mnist)
+        quantized = quantization.quantize(model, samples)
+        result = quantization.report(model, quantized, samples, args.iterations)
+        result.update({'units': args.units, 'batch_size': batch_size})
+        print(json.dumps(result))
+        results.append(result)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
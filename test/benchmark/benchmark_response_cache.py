@@ -0,0 +1,106 @@
+"""Measures the throughput of serving workers with and without the shared response cache.
+
+Worker processes send JSON requests through ``chainer_framework.serving.transform_fn`` with an MLP with the
+architecture of the test MNIST scripts. The payloads are drawn from a Zipf distribution over a set of distinct
+payloads, like retries and dashboards that poll the same rows.
+
+Usage:
+    python -m test.benchmark.benchmark_response_cache --workers 4 --requests 500 --output response_cache.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+import chainer
+import chainer.functions as F
+import chainer.links as L
+import numpy as np
+
+from chainer_framework import response_cache, serving
+
+
+class MLP(chainer.Chain):
+    def __init__(self, n_units, n_out):
+        super(MLP, self).__init__()
+        with self.init_scope():
+            self.l1 = L.Linear(784, n_units)
+            self.l2 = L.Linear(n_units, n_units)
+            self.l3 = L.Linear(n_units, n_out)
+
+    def __call__(self, x):
+        h1 = F.relu(self.l1(x))
+        h2 = F.relu(self.l2(h1))
+        return self.l3(h2)
+
+
+def _worker(model, payloads, indices, cache, results):
+    def transform_fn(data, content_type, accept):
+        return serving.transform_fn(model, data, content_type, accept)
+
+    if cache is not None:
+        transform_fn = response_cache.cached(transform_fn, cache)
+
+    latencies = []
+    for index in indices:
+        start = time.time()
+        transform_fn(payloads[index], 'application/json', 'application/json')
+        latencies.append(time.time() - start)
+    results.put(latencies)
+
+
+def _run(model, payloads, args, cache):
+    random = np.random.RandomState(0)
+    results = multiprocessing.Queue()
+    processes = []
+    start = time.time()
+    for _ in range(args.workers):
+        indices = np.minimum(random.zipf(args.zipf, args.requests) - 1, len(payloads) - 1)
+        process = multiprocessing.Process(target=_worker, args=(model, payloads, indices, cache, results))
+        process.start()
+        processes.append(process)
+    latencies = sorted(sum([results.get() for _ in processes], []))
+    for process in processes:
+        process.join()
+    elapsed = time.time() - start
+
+    result = {'requests_per_second': len(latencies) / elapsed,
+              'p50_ms': latencies[len(latencies) // 2] * 1000,
+              'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000}
+    if cache is not None:
+        result.update(cache.stats())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=500, help='requests per worker')
+    parser.add_argument('--payloads', type=int, default=200, help='distinct payloads')
+    parser.add_argument('--batch-size', type=int, default=8, help='rows per payload')
+    parser.add_argument('--zipf', type=float, default=1.2, help='exponent of the Zipf distribution of payloads')
+    parser.add_argument('--units', type=int, default=1000)
+    parser.add_argument('--cache-bytes', type=int, default=64 * 1024 * 1024)
+    parser.add_argument('--output', default='response_cache.json')
+    args = parser.parse_args()
+
+    model = MLP(args.units, 10)
+    random = np.random.RandomState(1)
+    payloads = [json.dumps(random.rand(args.batch_size, 784).astype(np.float32).round(3).tolist())
+                for _ in range(args.payloads)]
+
+    results = {'without_cache': _run(model, payloads, args, None)}
+    path = os.path.join(tempfile.mkdtemp(), 'response_cache')
+    results['with_cache'] = _run(model, payloads, args, response_cache.ResponseCache(path, args.cache_bytes))
+    os.remove(path)
+    results['speedup'] = results['with_cache']['requests_per_second'] / results['without_cache']['requests_per_second']
+    print(json.dumps(results, indent=2))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+"""Load-tests the Chainer serving stack on localhost, without Docker, and checks the results against the committed
+baseline in test/benchmark/baselines/serving_load.json.
+
+A server process runs ``chainer_framework.serving.transform_fn`` on a synthetic MLP of a configurable size, behind
+the asyncio front end (:mod:`chainer_framework.async_server`) or, with --server gunicorn, behind container_support's
+gunicorn and gevent stack, if they are installed. An open-loop load generator sends requests at each of the given
+rates, with exponentially distributed gaps, whether or not the previous requests were answered, and cycles through
+every pair of content type and accept type. Latencies are measured from the time a request was due, so requests that
+wait for a connection count against the server.
+
+The report has, for every rate, the throughput and the p50, p99 and p999 latencies, overall and for every pair of
+content type and accept type. The script exits with status 1 if the throughput of a rate dropped, its latencies grew,
+or more of its requests failed, by more than the tolerances. The latencies of the baseline are scaled by the
+calibration of both runs: the time transform_fn takes in this process for a request of every pair, measured before
+and after the load, so that a run on a slower machine is compared with proportionally higher latencies. Near the
+capacity of the server, latencies are dominated by queueing and vary a lot from run to run, so the default rates stay
+well below the capacity of one worker. Even so, latencies may double by default, and tail percentiles are only
+compared with enough samples, see :func:`compare`. A baseline only applies to runs with the same model, server and
+load arguments; other runs are reported but not checked.
+
+Update the baseline with --update-baseline when a change makes serving faster, or when a slowdown is intended, and
+commit it with the change.
+
+Usage:
+    python -m test.benchmark.benchmark_serving_load
+    python -m test.benchmark.benchmark_serving_load --rates 50,100,200 --seconds 5 --output load.json
+    python -m test.benchmark.benchmark_serving_load --update-baseline
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+import chainer
+import chainer.functions as F
+import chainer.links as L
+import numpy as np
+from six.moves import http_client
+
+from chainer_framework import async_server, serving
+from chainer_framework.serialization import arrow, csv, npy, recordio
+
+JSON_CONTENT_TYPE = 'application/json'
+CSV_CONTENT_TYPE = 'text/csv'
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'serving_load.json')
+
+# the arguments that change what is measured: a baseline only applies to runs with the same
+_MEASURED_ARGUMENTS = ('server', 'rates', 'seconds', 'inputs', 'units', 'layers', 'outputs', 'batch_size', 'workers',
+                       'threads', 'max_in_flight', 'latency_budget', 'max_connections', 'seed')
+
+
+class MLP(chainer.ChainList):
+    def __init__(self, n_in, n_units, n_out, n_layers):
+        hidden = [L.Linear(n_units, n_units) for _ in range(n_layers - 2)]
+        super(MLP, self).__init__(*([L.Linear(n_in, n_units)] + hidden + [L.Linear(n_units, n_out)]))
+
+    def __call__(self, x):
+        for link in self[:-1]:
+            x = F.relu(link(x))
+        return self[-1](x)
+
+
+class Transformer(object):
+    def __init__(self, args):
+        chainer.config.train = False
+        self.model = MLP(args.inputs, args.units, args.outputs, args.layers)
+
+    def transform(self, data, content_type, accept):
+        return serving.transform_fn(self.model, data, content_type, accept)
+
+
+class _Env(object):
+    default_accept = JSON_CONTENT_TYPE
+
+
+def content_types():
+    """Returns the content types the serving stack supports here, and how to serialize a batch in each of them."""
+    types = [(JSON_CONTENT_TYPE, lambda batch: json.dumps(batch.tolist()).encode('utf-8')),
+             (CSV_CONTENT_TYPE, lambda batch: csv.dumps(batch).encode('utf-8')),
+             (serving.NPY_CONTENT_TYPE, npy.dumps),
+             (recordio.CONTENT_TYPE, recordio.dumps)]
+    if arrow.available():
+        types.append((arrow.CONTENT_TYPE, arrow.dumps))
+    return types
+
+
+def _serve_asyncio(sock, args):
+    server = async_server.AsyncServer(Transformer(args), threads=args.threads, max_in_flight=args.max_in_flight,
+                                      latency_budget=args.latency_budget)
+    # daemonic workers are terminated when this process returns on SIGTERM
+    for _ in range(args.workers - 1):
+        multiprocessing.Process(target=async_server.run, args=(server, sock), daemon=True).start()
+    async_server.run(server, sock)
+
+
+def _serve_gunicorn(sock, args):
+    import gunicorn.app.base
+    from container_support.serving import Server
+
+    host, port = sock.getsockname()
+    sock.close()
+
+    class Application(gunicorn.app.base.BaseApplication):
+        def load_config(self):
+            for key, value in {'bind': '{}:{}'.format(host, port), 'workers': args.workers, 'worker_class': 'gevent',
+                               'worker_connections': 1000 * args.workers, 'loglevel': 'warning'}.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return Server('model server', Transformer(args), _Env()).app
+
+    Application().run()
+
+
+class _Connections(object):
+    """A pool of keep-alive connections, which opens new connections while the pool is empty, up to a limit."""
+
+    def __init__(self, port, limit):
+        self.port = port
+        self.idle = []
+        self.semaphore = asyncio.Semaphore(limit)
+
+    async def request(self, body, content_type, accept, timeout):
+        async with self.semaphore:
+            reused = bool(self.idle)
+            reader, writer = self.idle.pop() if reused else await asyncio.open_connection('127.0.0.1', self.port)
+            try:
+                status, keep_alive = await asyncio.wait_for(_exchange(reader, writer, body, content_type, accept),
+                                                            timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if not reused:
+                    raise
+                # the server closed the idle connection: retry once on a new one, as HTTP clients do
+                reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+                status, keep_alive = await asyncio.wait_for(_exchange(reader, writer, body, content_type, accept),
+                                                            timeout)
+            except BaseException:
+                writer.close()
+                raise
+            if keep_alive:
+                self.idle.append((reader, writer))
+            else:
+                writer.close()
+            return status
+
+
+async def _exchange(reader, writer, body, content_type, accept):
+    writer.write('POST /invocations HTTP/1.1\r\nHost: localhost\r\nContent-Type: {}\r\nAccept: {}\r\n'
+                 'Content-Length: {}\r\n\r\n'.format(content_type, accept, len(body)).encode('latin-1') + body)
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    headers = dict((name.strip().lower(), value.strip()) for name, _, value in
+                   (line.partition(':') for line in head[1:] if line))
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    return int(head[0].split(' ')[1]), headers.get('connection', '').lower() != 'close'
+
+
+async def _load(port, payloads, rate, seconds, args):
+    connections = _Connections(port, args.max_connections)
+    random = np.random.RandomState(args.seed)
+    results = []
+
+    async def send(due, pair):
+        content_type, accept = pair
+        try:
+            status = await connections.request(payloads[content_type], content_type, accept, args.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            status = None
+        results.append((pair, status, time.time() - due))
+
+    pairs = [(content_type, accept) for content_type in payloads for accept in payloads]
+    tasks = []
+    start = time.time()
+    due = start
+    index = 0
+    while due < start + seconds:
+        delay = due - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(send(due, pairs[index % len(pairs)])))
+        index += 1
+        due += random.exponential(1. / rate)
+    await asyncio.gather(*tasks)
+    elapsed = time.time() - start
+
+    for reader, writer in connections.idle:
+        writer.close()
+    return results, elapsed
+
+
+def _summary(results, seconds):
+    latencies = np.array([latency for _, status, latency in results if status == 200]) * 1000
+    summary = {'sent': len(results),
+               'ok': len(latencies),
+               'rejected': sum(1 for _, status, _ in results if status == 503),
+               'errors': sum(1 for _, status, _ in results if status not in (200, 503)),
+               'throughput': len(latencies) / seconds}
+    for name, percentile in (('p50_ms', 50), ('p99_ms', 99), ('p999_ms', 99.9)):
+        summary[name] = float(np.percentile(latencies, percentile)) if len(latencies) else None
+    return summary
+
+
+def _payloads(args):
+    batch = np.random.RandomState(args.seed).rand(args.batch_size, args.inputs).astype(np.float32)
+    return dict((content_type, serialize(batch)) for content_type, serialize in content_types())
+
+
+def calibrate(args, iterations=20):
+    """Returns the median time transform_fn takes in this process for a request, in milliseconds, averaged over the
+    pairs of content type and accept type: the work of the server, without the HTTP front end or the load."""
+    transformer = Transformer(args)
+    payloads = _payloads(args)
+    times = []
+    for content_type, payload in sorted(payloads.items()):
+        data = payload.decode('utf-8') if content_type in (JSON_CONTENT_TYPE, CSV_CONTENT_TYPE) else payload
+        for accept in sorted(payloads):
+            transformer.transform(data, content_type, accept)
+            pair_times = []
+            for _ in range(iterations):
+                start = time.time()
+                transformer.transform(data, content_type, accept)
+                pair_times.append(time.time() - start)
+            times.append(np.median(pair_times))
+    return float(np.mean(times)) * 1000
+
+
+def run(port, args):
+    """Runs the load at every rate, and returns the report."""
+    payloads = _payloads(args)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        # every pair once, so that the model is prepared before the measurements
+        loop.run_until_complete(_load(port, payloads, 1000., len(payloads) ** 2 / 1000., args))
+
+        points = []
+        for rate in args.rates:
+            results, elapsed = loop.run_until_complete(_load(port, payloads, rate, args.seconds, args))
+            point = _summary(results, elapsed)
+            point['rate'] = rate
+            point['pairs'] = {}
+            for pair in sorted(set(pair for pair, _, _ in results)):
+                point['pairs']['{} -> {}'.format(*pair)] = _summary([r for r in results if r[0] == pair], elapsed)
+            points.append(point)
+            print('{:8.1f} req/s offered: {:8.1f} req/s, p50 {} ms, p99 {} ms, p999 {} ms, {} rejected, {} errors'
+                  .format(rate, point['throughput'], _ms(point['p50_ms']), _ms(point['p99_ms']),
+                          _ms(point['p999_ms']), point['rejected'], point['errors']))
+    finally:
+        loop.close()
+    return {'server': args.server, 'points': points}
+
+
+def _ms(value):
+    return 'n/a' if value is None else '{:.1f}'.format(value)
+
+
+def compare(report, baseline, throughput_tolerance=0.1, latency_tolerance=1., latency_slack_ms=1.,
+            min_tail_samples=10):
+    """Returns the regressions of a report against a baseline, as messages.
+
+    A rate regresses if its throughput is lower than (1 - throughput_tolerance) times the baseline's, if a latency
+    percentile is higher than (1 + latency_tolerance) times the baseline's, scaled by the ratio of the calibrations,
+    plus latency_slack_ms, or if more of its requests fail. A percentile is only compared if both runs have at least
+    min_tail_samples successful responses above it: with a few, it is the latency of one request.
+    """
+    scale = report['calibration_ms'] / baseline['calibration_ms'] if baseline.get('calibration_ms') else 1.
+    baseline_points = dict((point['rate'], point) for point in baseline['points'])
+    regressions = []
+    for point in report['points']:
+        expected = baseline_points.get(point['rate'])
+        if expected is None:
+            continue
+        if point['throughput'] < (1 - throughput_tolerance) * expected['throughput']:
+            regressions.append('{} req/s: throughput {:.1f} req/s, baseline {:.1f} req/s'
+                               .format(point['rate'], point['throughput'], expected['throughput']))
+        for name, percentile in (('p50_ms', 50), ('p99_ms', 99), ('p999_ms', 99.9)):
+            if min(point['ok'], expected['ok']) * (100 - percentile) / 100 < min_tail_samples:
+                continue
+            if point[name] is None or expected[name] is None:
+                continue
+            if point[name] > (1 + latency_tolerance) * expected[name] * scale + latency_slack_ms:
+                regressions.append('{} req/s: {} {:.1f}, baseline {:.1f} scaled to {:.1f}'
+                                   .format(point['rate'], name, point[name], expected[name], expected[name] * scale))
+        if point['errors'] + point['rejected'] > expected['errors'] + expected['rejected'] + 0.01 * point['sent']:
+            regressions.append('{} req/s: {} failed requests, baseline {}'.format(
+                point['rate'], point['errors'] + point['rejected'], expected['errors'] + expected['rejected']))
+    return regressions
+
+
+def different_arguments(report, baseline):
+    """Returns the measured arguments of a report that differ from the baseline's, as 'name=value' strings."""
+    return ['{}={}'.format(name, report['arguments'][name]) for name in _MEASURED_ARGUMENTS
+            if report['arguments'][name] != baseline['arguments'].get(name)]
+
+
+def _wait_until_listening(port, process):
+    deadline = time.time() + 60
+    while time.time() < deadline and process.is_alive():
+        try:
+            connection = http_client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/ping')
+            if connection.getresponse().status == 200:
+                return
+        except (socket.error, http_client.HTTPException):
+            time.sleep(0.1)
+    raise RuntimeError('the server did not start')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=['asyncio', 'gunicorn'], default='asyncio')
+    parser.add_argument('--rates', type=lambda rates: [float(rate) for rate in rates.split(',')],
+                        default=[10., 25., 50.], help='comma separated request rates, in requests per second')
+    parser.add_argument('--seconds', type=float, default=5., help='duration of the load at every rate')
+    parser.add_argument('--inputs', type=int, default=784)
+    parser.add_argument('--units', type=int, default=1000)
+    parser.add_argument('--layers', type=int, default=3)
+    parser.add_argument('--outputs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=async_server.DEFAULT_THREADS)
+    parser.add_argument('--max-in-flight', type=int, default=async_server.DEFAULT_MAX_IN_FLIGHT)
+    parser.add_argument('--latency-budget', type=float, default=async_server.DEFAULT_LATENCY_BUDGET_IN_SECONDS)
+    parser.add_argument('--max-connections', type=int, default=256)
+    parser.add_argument('--timeout', type=float, default=30.)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--update-baseline', action='store_true', help='write the report into the baseline')
+    parser.add_argument('--throughput-tolerance', type=float, default=0.1)
+    parser.add_argument('--latency-tolerance', type=float, default=1.)
+    parser.add_argument('--latency-slack-ms', type=float, default=1.)
+    parser.add_argument('--output')
+    args = parser.parse_args(args)
+
+    calibration_ms = calibrate(args)
+    sock = async_server.listen(0, '127.0.0.1')
+    port = sock.getsockname()[1]
+    process = multiprocessing.Process(target=_serve_asyncio if args.server == 'asyncio' else _serve_gunicorn,
+                                      args=(sock, args))
+    process.start()
+    sock.close()
+    try:
+        _wait_until_listening(port, process)
+        report = run(port, args)
+    finally:
+        process.terminate()
+        process.join()
+    # calibrated before and after the load, so that changes of the machine's speed during the run cancel out
+    report['calibration_ms'] = (calibration_ms + calibrate(args)) / 2
+    report['arguments'] = dict((name, value) for name, value in vars(args).items()
+                               if name not in ('baseline', 'update_baseline', 'output'))
+    print('calibration: {:.2f} ms per request'.format(report['calibration_ms']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print('updated {}'.format(args.baseline))
+        return report
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    different = different_arguments(report, baseline)
+    if different:
+        print('not compared with {}, which was recorded with other arguments than {}'
+              .format(args.baseline, ', '.join(different)))
+        return report
+    regressions = compare(report, baseline, args.throughput_tolerance, args.latency_tolerance, args.latency_slack_ms)
+    for regression in regressions:
+        print('regression: {}'.format(regression))
+    if regressions:
+        sys.exit(1)
+    print('no regressions against {}'.format(args.baseline))
+    return report
+
+
+if __name__ == '__main__':
+    main()
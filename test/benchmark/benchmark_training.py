@@ -0,0 +1,256 @@
+"""Measures the CPU training throughput of ``chainer_framework.training.train`` on synthetic MNIST-shaped data.
+
+Every configuration trains the same MLP for the same number of iterations with the same batch size per rank, through
+``training.train`` on a SageMaker directory layout in a temporary directory:
+
+* single: one process, without MPI.
+* mpi: ``use_mpi`` forced, with every combination of --ranks and --process-slots-per-host that fits on one host
+  (as many slots as ranks or more). mpirun starts the ranks on this machine, and each rank runs what
+  ``python -m chainer_framework.training`` runs in the container, from the temporary directory instead of /opt/ml.
+
+For each configuration the report has the samples per second of all ranks together after the first iteration, the
+time from the call to ``train`` to the end of the first iteration, the total wall time of ``train`` and the scaling
+efficiency: the samples per second per rank, relative to the single process configuration. OpenMPI and ChainerMN must
+be installed for the mpi configurations. Reports of different versions can be compared configuration by
+configuration; they include the versions of the packages and the number of CPUs they were measured with.
+
+Usage:
+    python -m test.benchmark.benchmark_training --ranks 1 2 4 --process-slots-per-host 1 2 4 --output training.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+
+import chainer
+import numpy as np
+from mock import patch
+
+from chainer_framework import lifecycle, staging, threads, training
+from container_support import ContainerEnvironment
+from container_support.environment import TrainingEnvironment
+
+_HOST = 'localhost'
+_SCRIPT_NAME = 'benchmark_script.py'
+_ITERATIONS_FILE = 'iterations.json'
+
+_USER_SCRIPT = '''
+import json
+import os
+import time
+
+import chainer
+import chainer.functions as F
+import chainer.links as L
+import numpy as np
+from chainer import training
+from chainer.datasets import tuple_dataset
+
+
+class MLP(chainer.Chain):
+    def __init__(self, n_units, n_out):
+        super(MLP, self).__init__()
+        with self.init_scope():
+            self.l1 = L.Linear(None, n_units)
+            self.l2 = L.Linear(None, n_units)
+            self.l3 = L.Linear(None, n_out)
+
+    def __call__(self, x):
+        h1 = F.relu(self.l1(x))
+        h2 = F.relu(self.l2(h1))
+        return self.l3(h2)
+
+
+class IterationClock(training.Extension):
+    trigger = 1, 'iteration'
+
+    def __init__(self):
+        self.times = []
+
+    def __call__(self, trainer):
+        self.times.append(time.time())
+
+
+def train(channel_input_dirs, hyperparameters, output_data_dir):
+    data = np.load(os.path.join(channel_input_dirs['train'], 'train.npz'))
+    images, labels = data['x'].astype(np.float32) / 255., data['y'].astype(np.int32)
+    dataset = tuple_dataset.TupleDataset(images, labels)
+
+    model = L.Classifier(MLP(hyperparameters['units'], 10))
+    optimizer = chainer.optimizers.Adam()
+    rank, size = 0, 1
+    if hyperparameters.get('use_mpi', False):
+        import chainermn
+        from chainer_framework.communicators import create_communicator
+
+        comm = create_communicator(hyperparameters['communicator'], model, sample=(images[:1], labels[:1]))
+        rank, size = comm.rank, comm.size
+        optimizer = chainermn.create_multi_node_optimizer(optimizer, comm)
+        dataset = chainermn.scatter_dataset(dataset if rank == 0 else None, comm, shuffle=True)
+    optimizer.setup(model)
+
+    updater = training.StandardUpdater(chainer.iterators.SerialIterator(dataset, hyperparameters['batch_size']),
+                                       optimizer)
+    trainer = training.Trainer(updater, (hyperparameters['iterations'], 'iteration'), out=output_data_dir)
+    clock = IterationClock()
+    trainer.extend(clock)
+    trainer.run()
+
+    if rank == 0:
+        with open(os.path.join(output_data_dir, '{}'), 'w') as f:
+            json.dump({{'ranks': size, 'iteration_end_times': clock.times}}, f)
+    return model
+'''.format(_ITERATIONS_FILE)
+
+
+def _write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def _create_base_dir(args, hyperparameters):
+    """Creates the directories and configuration files of a single host training job, and returns its base dir."""
+    base_dir = tempfile.mkdtemp()
+    for directory in ['input/config', 'input/data/train', 'output/data', 'model', 'code']:
+        os.makedirs(os.path.join(base_dir, directory))
+
+    random = np.random.RandomState(0)
+    np.savez(os.path.join(base_dir, 'input/data/train/train.npz'),
+             x=random.randint(0, 256, (args.samples, 784)).astype(np.uint8),
+             y=random.randint(0, 10, args.samples).astype(np.int8))
+
+    script = os.path.join(base_dir, 'code', _SCRIPT_NAME)
+    with open(script, 'w') as f:
+        f.write(_USER_SCRIPT)
+    archive = os.path.join(base_dir, 'code', 'sourcedir.tar.gz')
+    with tarfile.open(archive, 'w:gz') as tar:
+        tar.add(script, _SCRIPT_NAME)
+
+    hyperparameters = dict(hyperparameters, batch_size=args.batch_size, units=args.units, iterations=args.iterations,
+                           communicator=args.communicator)
+    hyperparameters.update({ContainerEnvironment.SAGEMAKER_REGION_PARAM_NAME: 'us-west-2',
+                            ContainerEnvironment.USER_SCRIPT_NAME_PARAM: _SCRIPT_NAME,
+                            ContainerEnvironment.USER_SCRIPT_ARCHIVE_PARAM: archive})
+    _write_json(os.path.join(base_dir, 'input/config/hyperparameters.json'),
+                {name: json.dumps(value) for name, value in hyperparameters.items()})
+    _write_json(os.path.join(base_dir, 'input/config/resourceconfig.json'),
+                {'current_host': _HOST, 'hosts': [_HOST], 'network_interface_name': 'lo'})
+    _write_json(os.path.join(base_dir, 'input/config/inputdataconfig.json'), {'train': {}})
+    return base_dir
+
+
+def _train(base_dir):
+    """Runs in a child process, so that every configuration starts from a fresh framework state."""
+    env = TrainingEnvironment(base_dir)
+    mpi_script = os.path.join(base_dir, 'mpi_script.sh')
+    with open(mpi_script, 'w') as f:
+        f.write('#!/bin/sh\ncd {}\nexec {} -m mpi4py -m test.benchmark.benchmark_training --rank {}\n'
+                .format(os.getcwd(), sys.executable, base_dir))
+    os.chmod(mpi_script, 0o755)
+
+    with patch.object(training, '_MPI_SCRIPT', mpi_script), \
+            patch.object(training, '_CHANGE_HOSTNAME_LIBRARY', ''), \
+            patch.object(training, '_change_hostname'):
+        training.train(staging.import_user_module(env), env)
+
+
+def _rank(base_dir):
+    """Runs in every process started by mpirun, like ``python -m chainer_framework.training``."""
+    threads.pin_mpi_process()
+    env = TrainingEnvironment(base_dir)
+    with lifecycle.span('import_user_module'):
+        user_module = staging.import_user_module(env)
+    training._log_launch_latency()
+    training._run_training(env, user_module)
+    lifecycle.gather_mpi_events(env.current_host)
+
+
+def _run(args, name, hyperparameters):
+    base_dir = _create_base_dir(args, hyperparameters)
+    try:
+        start = time.time()
+        process = multiprocessing.Process(target=_train, args=(base_dir,))
+        process.start()
+        process.join()
+        wall_time = time.time() - start
+        if process.exitcode != 0:
+            raise RuntimeError('training {} failed with exit code {}'.format(name, process.exitcode))
+
+        with open(os.path.join(base_dir, 'output/data', _ITERATIONS_FILE)) as f:
+            iterations = json.load(f)
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+    times = iterations['iteration_end_times']
+    samples = (len(times) - 1) * args.batch_size * iterations['ranks']
+    return {'configuration': name,
+            'ranks': iterations['ranks'],
+            'use_mpi': bool(hyperparameters.get('use_mpi', False)),
+            'process_slots_per_host': hyperparameters.get('process_slots_per_host'),
+            'samples_per_second': samples / (times[-1] - times[0]),
+            'time_to_first_iteration': times[0] - start,
+            'wall_time': wall_time}
+
+
+def _configurations(args):
+    configurations = [('single', {})]
+    for ranks in args.ranks:
+        for slots in args.process_slots_per_host:
+            if slots >= ranks:
+                configurations.append(('mpi ranks={} process_slots_per_host={}'.format(ranks, slots),
+                                       {'use_mpi': True, 'num_processes': ranks, 'process_slots_per_host': slots}))
+    return configurations
+
+
+def _versions():
+    versions = {'python': platform.python_version(), 'chainer': chainer.__version__, 'numpy': np.__version__,
+                'cpus': multiprocessing.cpu_count()}
+    try:
+        import chainermn
+        versions['chainermn'] = chainermn.__version__
+    except ImportError:
+        pass
+    return versions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ranks', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--process-slots-per-host', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--units', type=int, default=1000)
+    parser.add_argument('--samples', type=int, default=10000)
+    parser.add_argument('--communicator', default='naive')
+    parser.add_argument('--rank', metavar='BASE_DIR', help=argparse.SUPPRESS)
+    parser.add_argument('--output', default='training.json')
+    args = parser.parse_args()
+
+    if args.rank:
+        _rank(args.rank)
+        return
+
+    results = []
+    for name, hyperparameters in _configurations(args):
+        result = _run(args, name, hyperparameters)
+        results.append(result)
+        single = results[0]['samples_per_second']
+        result['scaling_efficiency'] = result['samples_per_second'] / (result['ranks'] * single)
+        print('{configuration}: {samples_per_second:.0f} samples/s, first iteration after '
+              '{time_to_first_iteration:.2f}s, wall time {wall_time:.2f}s, '
+              'scaling efficiency {scaling_efficiency:.2f}'.format(**result))
+
+    report = {'results': results, 'versions': _versions(),
+              'arguments': {name: value for name, value in vars(args).items() if name != 'rank'}}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import os
+import time
+
+from test.utils.local_cluster import LocalCluster
+
+resource_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'resources', 'failure_scenarios')
+
+
+def _wait_for(condition, timeout=60):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.1)
+    assert condition()
+
+
+def _spans(trace, name):
+    return [event for event in trace['traceEvents'] if event['name'] == name and event['ph'] == 'X']
+
+
+def test_all_processes_finish_with_mpi():
+    hyperparameters = {'use_mpi': True,
+                       'process_slots_per_host': 2,
+                       'num_processes': 4}
+
+    with LocalCluster(2, resource_path, 'all_processes_finish_customer_script.py', hyperparameters) as cluster:
+        cluster.start()
+
+        assert cluster.wait(timeout=120) == {'algo-1': 0, 'algo-2': 0}
+        assert os.path.exists(os.path.join(cluster.host_dir('algo-2'), 'output', 'data', 'algo-2',
+                                           'process_could_complete'))
+        # the processes mpirun started on both hosts merged their events into the trace of the master
+        assert len(_spans(cluster.trace(), 'import_user_module')) == 4
+
+
+def test_master_waits_for_the_sshd_of_workers():
+    with LocalCluster(2, resource_path, 'all_processes_finish_customer_script.py') as cluster:
+        cluster.start(['algo-1'])
+        time.sleep(3)
+        cluster.start(['algo-2'])
+
+        assert cluster.wait(timeout=120) == {'algo-1': 0, 'algo-2': 0}
+        wait_for_sshd, = _spans(cluster.trace(), 'wait_for_sshd')
+        assert wait_for_sshd['dur'] >= 3 * 1e6
+
+
+def test_training_jobs_do_not_stall():
+    hyperparameters = {'use_mpi': True,
+                       'process_slots_per_host': 1,
+                       'num_processes': 2}
+
+    with LocalCluster(2, resource_path, 'training_jobs_do_not_stall_customer_script.py', hyperparameters) as cluster:
+        cluster.start()
+
+        exit_codes = cluster.wait(timeout=120)
+
+        # the worker may fail too, if mpirun aborts before the worker's rank starts
+        assert None not in exit_codes.values()
+        assert exit_codes['algo-1'] == 1
+        assert os.path.exists(os.path.join(cluster.host_dir('algo-1'), 'output', 'failure'))
+
+
+def test_distributed_failure():
+    hyperparameters = {'process_slots_per_host': 1,
+                       'num_processes': 2,
+                       'node_to_fail': 1}
+
+    with LocalCluster(2, resource_path, 'failure_script.py', hyperparameters) as cluster:
+        cluster.start()
+
+        assert cluster.wait(timeout=120)['algo-1'] == 1
+        assert os.path.exists(os.path.join(cluster.host_dir('algo-1'), 'output', 'failure'))
+
+
+def test_lost_worker_host_fails_the_job():
+    hyperparameters = {'process_slots_per_host': 2,
+                       'num_processes': 4}
+
+    with LocalCluster(2, resource_path, 'all_processes_finish_customer_script.py', hyperparameters) as cluster:
+        cluster.start()
+        _wait_for(lambda: os.path.exists(os.path.join(cluster.host_dir('algo-2'), 'mpi_is_running')))
+        cluster.kill('algo-2')
+
+        assert cluster.wait(timeout=60)['algo-1'] == 1
+        assert os.path.exists(os.path.join(cluster.host_dir('algo-1'), 'output', 'failure'))
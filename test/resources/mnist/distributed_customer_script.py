@@ -11,6 +11,9 @@ from chainer import serializers, training
 from chainer.training import extensions
 from chainer.datasets import tuple_dataset
 
+from chainer_framework.communicators import create_communicator
+from chainer_framework.straggler import StragglerMonitor
+
 
 class MLP(chainer.Chain):
 
@@ -53,9 +56,12 @@ def train(channel_input_dirs, hyperparameters, num_gpus, output_data_dir):
     epochs = hyperparameters.get('epochs', 20)
     frequency = hyperparameters.get('frequency', epochs)
     units = hyperparameters.get('unit', 1000)
-    communicator = 'naive' if num_gpus == 0 else hyperparameters.get('communicator', 'pure_nccl')
+    communicator = hyperparameters.get('communicator', 'auto' if num_gpus == 0 else 'pure_nccl')
 
-    comm = chainermn.create_communicator(communicator)
+    model = L.Classifier(MLP(units, 10))
+    # the links of the MLP are lazily initialized, a sample batch sizes the communicator benchmark to the model
+    sample = (np.zeros((1, 784), dtype=np.float32), np.zeros(1, dtype=np.int32))
+    comm = create_communicator(communicator, model, sample=sample)
     device = comm.intra_rank if num_gpus > 0 else -1
 
     print('==========================================')
@@ -65,7 +71,6 @@ def train(channel_input_dirs, hyperparameters, num_gpus, output_data_dir):
     print('Num epoch: {}'.format(epochs))
     print('==========================================')
 
-    model = L.Classifier(MLP(units, 10))
     if device >= 0:
         chainer.cuda.get_device(device).use()
 
@@ -98,6 +103,7 @@ def train(channel_input_dirs, hyperparameters, num_gpus, output_data_dir):
     evaluator = extensions.Evaluator(test_iter, model, device=device)
     evaluator = chainermn.create_multi_node_evaluator(evaluator, comm)
     trainer.extend(evaluator)
+    trainer.extend(StragglerMonitor(comm, interval=hyperparameters.get('straggler_interval', 100)))
 
     # Some display and output extensions are necessary only for one worker.
     # (Otherwise, there would just be repeated outputs.)
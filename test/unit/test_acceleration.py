@@ -0,0 +1,189 @@
+import json
+
+import chainer
+import chainer.functions as F
+import chainer.links as L
+import numpy as np
+import pytest
+from chainer import training
+from chainer.backends import intel64
+from mock import patch
+
+from chainer_framework import acceleration, preload
+
+
+class Model(chainer.Chain):
+    def __init__(self):
+        super(Model, self).__init__()
+        with self.init_scope():
+            self.embed = L.EmbedID(10, 4)
+            self.l1 = L.Linear(4, 3)
+            self.l2 = L.Linear(3, 2)
+
+    def __call__(self, x):
+        return self.l2(F.relu(self.l1(self.embed(x))))
+
+
+@pytest.fixture()
+def sample():
+    return np.array([1, 2, 3], dtype=np.int32)
+
+
+def _linear_runs_with_ideep(label, in_data):
+    return label == 'LinearFunction'
+
+
+def test_available_requires_avx2(tmpdir):
+    cpu_info = tmpdir.join('cpuinfo')
+    cpu_info.write('processor\t: 0\nflags\t\t: fpu sse4_2 avx\n')
+
+    with patch.object(intel64, 'is_ideep_available', return_value=True), \
+            patch.object(acceleration, '_CPU_INFO_FILE', str(cpu_info)):
+        assert not acceleration.available()
+
+        cpu_info.write('processor\t: 0\nflags\t\t: fpu sse4_2 avx avx2\n')
+        assert acceleration.available()
+
+
+def test_available_requires_ideep():
+    with patch.object(intel64, 'is_ideep_available', return_value=False):
+        assert not acceleration.available()
+
+
+@pytest.mark.parametrize('mode, is_available, expected', [('auto', True, True), ('IDEEP', True, True),
+                                                          ('auto', False, False), ('ideep', False, False),
+                                                          ('none', True, False)])
+def test_enabled(mode, is_available, expected):
+    with patch('chainer_framework.acceleration.available', return_value=is_available):
+        assert acceleration.enabled(mode) == expected
+
+
+def test_enabled_warns_if_ideep_is_required_but_not_available():
+    with patch('chainer_framework.acceleration.available', return_value=False), \
+            patch.object(acceleration, 'logger') as logger:
+        acceleration.enabled('ideep')
+
+    assert logger.warning.called
+
+
+def test_enabled_rejects_unknown_modes():
+    with pytest.raises(ValueError):
+        acceleration.enabled('mkldnn')
+
+
+def test_runs_with_ideep():
+    in_data = (np.zeros((2, 3), dtype=np.float32),)
+    with patch.object(intel64, 'should_use_ideep', return_value=True), \
+            patch.object(intel64, 'inputs_all_ready', return_value=True) as inputs_all_ready:
+        assert acceleration._runs_with_ideep('Convolution2DFunction', in_data)
+        assert not acceleration._runs_with_ideep('Softmax', in_data)
+
+    assert inputs_all_ready.call_args[0] == (in_data, (4,))
+
+
+def test_runs_with_ideep_if_enabled():
+    with patch.object(intel64, 'should_use_ideep', return_value=False):
+        assert not acceleration._runs_with_ideep('LinearFunction', (np.zeros((2, 3), dtype=np.float32),))
+
+
+def test_recorder_report(sample):
+    model = Model()
+    recorder = acceleration.AccelerationRecorder()
+
+    with patch('chainer_framework.acceleration._runs_with_ideep', side_effect=_linear_runs_with_ideep), recorder:
+        model(sample)
+
+    report = recorder.report(model)
+    assert report['functions']['LinearFunction'] == {'ideep': 2, 'numpy': 0}
+    assert report['functions']['ReLU'] == {'ideep': 0, 'numpy': 1}
+    assert report['accelerated_links'] == ['/l1', '/l2']
+    assert report['numpy_links'] == ['/embed']
+
+
+def test_accelerate(sample):
+    model = Model()
+
+    with patch.object(chainer.Link, 'to_intel64', autospec=True) as to_intel64, \
+            patch('chainer_framework.acceleration._runs_with_ideep', side_effect=_linear_runs_with_ideep), \
+            patch.object(acceleration, 'logger') as logger:
+        accelerated = acceleration.accelerate(model, sample)
+
+    assert accelerated is not model
+    assert to_intel64.call_args[0] == (accelerated,)
+    report = json.loads(logger.info.call_args[0][0].split(': ', 1)[1])
+    assert report['accelerated_links'] == ['/l1', '/l2']
+
+
+def test_accelerate_returns_model_if_predictions_differ(sample):
+    model = Model()
+
+    def to_intel64(link):
+        link.l2.b.array += 1
+
+    with patch.object(chainer.Link, 'to_intel64', autospec=True, side_effect=to_intel64):
+        assert acceleration.accelerate(model, sample) is model
+
+
+def test_accelerate_returns_model_if_it_fails(sample):
+    model = Model()
+
+    with patch.object(chainer.Link, 'to_intel64', autospec=True, side_effect=RuntimeError('iDeep is not available')):
+        assert acceleration.accelerate(model, sample) is model
+
+
+def test_accelerate_keeps_memory_mapped_models_shared(sample):
+    model = Model()
+    preload.share_arrays(model)
+
+    with patch.object(chainer.Link, 'to_intel64', autospec=True) as to_intel64:
+        assert acceleration.accelerate(model, sample) is model
+        assert not to_intel64.called
+
+        with patch('chainer_framework.acceleration._runs_with_ideep', side_effect=_linear_runs_with_ideep):
+            assert acceleration.accelerate(model, sample, copy_shared=True) is not model
+
+
+def test_memory_mapped_bytes(tmpdir):
+    model = Model()
+    assert acceleration.memory_mapped_bytes(model) == 0
+
+    path = str(tmpdir.join('weights'))
+    mapped = np.memmap(path, dtype=np.uint8, mode='w+', shape=(1024,))
+    model.l1.W.array = mapped[:48].view(np.float32).reshape(3, 4)
+    assert acceleration.memory_mapped_bytes(model) == 48
+
+    preload.share_arrays(model)
+    assert acceleration.memory_mapped_bytes(model) == sum(param.array.nbytes for param in model.params())
+
+
+def test_accelerated_training(sample):
+    model = L.Classifier(Model())
+    optimizer = chainer.optimizers.SGD()
+    optimizer.setup(model)
+    iterator = chainer.iterators.SerialIterator([sample] * 2, 1)
+    updater = training.StandardUpdater(iterator, optimizer,
+                                       converter=lambda batch, device: (batch[0], np.zeros(len(sample), np.int32)))
+    update = training.StandardUpdater.update
+
+    with patch('chainer_framework.acceleration.enabled', return_value=True), \
+            patch('chainer_framework.acceleration._runs_with_ideep', side_effect=_linear_runs_with_ideep), \
+            patch.object(acceleration, 'logger') as logger:
+        with acceleration.accelerated_training('auto'):
+            assert chainer.config.use_ideep == 'auto'
+            updater.update()
+            updater.update()
+
+    assert updater.iteration == 2
+    assert training.StandardUpdater.update == update
+    assert logger.info.call_count == 1
+    report = json.loads(logger.info.call_args[0][0].split(': ', 1)[1])
+    assert report['accelerated_links'] == ['/predictor/l1', '/predictor/l2']
+
+
+def test_accelerated_training_does_nothing_if_not_enabled():
+    update = training.StandardUpdater.update
+
+    with patch('chainer_framework.acceleration.enabled', return_value=False):
+        with acceleration.accelerated_training('none'):
+            assert chainer.config.use_ideep == 'never'
+            assert training.StandardUpdater.update == update
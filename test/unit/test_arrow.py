@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from chainer_framework.serialization import arrow
+
+pyarrow = pytest.importorskip('pyarrow')
+
+
+def _stream(table, max_chunksize=None):
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        for batch in table.to_batches(max_chunksize=max_chunksize):
+            writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+@pytest.mark.parametrize('array', [
+    np.arange(12, dtype=np.float32).reshape(4, 3),
+    np.arange(24, dtype=np.float64).reshape(2, 3, 4)])
+def test_dumps_and_loads_as_a_view(array):
+    data = arrow.dumps(array)
+
+    batch = arrow.loads(data)
+
+    assert batch.dtype == array.dtype
+    assert np.array_equal(array, batch)
+    assert np.shares_memory(batch, np.frombuffer(data, dtype=np.uint8))
+
+
+def test_loads_feature_columns():
+    table = pyarrow.table({'a': pyarrow.array([1., 2., 3.], pyarrow.float32()),
+                           'b': pyarrow.array([4, 5, 6], pyarrow.int16())})
+
+    batch = arrow.loads(_stream(table, max_chunksize=2))
+
+    assert batch.dtype == np.float32
+    assert np.array_equal(np.array([[1, 4], [2, 5], [3, 6]]), batch)
+
+
+def test_loads_record_batches_as_one_batch():
+    array = np.arange(30, dtype=np.float32).reshape(10, 3)
+    column = pyarrow.FixedSizeListArray.from_arrays(pyarrow.array(array.reshape(-1)), 3)
+    table = pyarrow.table({'values': column})
+
+    assert np.array_equal(array, arrow.loads(_stream(table, max_chunksize=3)))
+    assert np.array_equal(array[2:5], arrow.loads(_stream(table.slice(2, 3))))
+
+
+@pytest.mark.parametrize('table', [
+    pyarrow.table({'values': pyarrow.array([1., None])}),
+    pyarrow.table({'values': pyarrow.array(['a', 'b'])})])
+def test_loads_invalid_columns(table):
+    with pytest.raises(ValueError):
+        arrow.loads(_stream(table))
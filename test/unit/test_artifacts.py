@@ -0,0 +1,149 @@
+import json
+import os
+
+import chainer
+import chainer.links as L
+import numpy as np
+import pytest
+from chainer import serializers
+
+from chainer_framework import artifacts, quantization
+
+
+class Model(chainer.Chain):
+    def __init__(self):
+        super(Model, self).__init__()
+        with self.init_scope():
+            self.l1 = L.Linear(3, 5)
+            self.bn = L.BatchNormalization(5)
+            self.l2 = L.Linear(None, 2)
+
+    def __call__(self, x):
+        return self.l2(self.bn(self.l1(x)))
+
+
+@pytest.fixture()
+def data():
+    return np.random.rand(4, 3).astype(np.float32)
+
+
+@pytest.fixture()
+def model(data):
+    model = Model()
+    with chainer.using_config('train', True):
+        model(data)
+    return model
+
+
+def _predict(model, data):
+    with chainer.using_config('train', False):
+        return model(data).data
+
+
+def test_save_and_load(model, data, tmpdir):
+    artifacts.save(model, str(tmpdir))
+
+    loaded_model = artifacts.load(str(tmpdir), Model())
+
+    assert np.array_equal(_predict(model, data), _predict(loaded_model, data))
+    assert isinstance(loaded_model.l1.W.data, np.memmap)
+    assert isinstance(loaded_model.bn.avg_var, np.memmap)
+    assert not loaded_model.l2.W.data.flags.writeable
+    assert loaded_model.bn.N == model.bn.N
+
+
+def test_save_aligns_arrays_and_uses_npz_names(model, tmpdir):
+    artifacts.save(model, str(tmpdir))
+
+    with open(str(tmpdir.join(artifacts.MMAP_INDEX_FILE_NAME))) as f:
+        index = json.load(f)
+    serializers.save_npz(str(tmpdir.join('model.npz')), model)
+    with np.load(str(tmpdir.join('model.npz'))) as npz:
+        assert sorted(list(index['arrays']) + list(index['scalars'])) == sorted(npz.files)
+    assert all(entry['offset'] % 64 == 0 for entry in index['arrays'].values())
+    assert index['arrays']['l1/W'] == {'dtype': '<f4', 'shape': [5, 3], 'offset': index['arrays']['l1/W']['offset']}
+
+
+def test_load_npz_artifact(model, data, tmpdir):
+    serializers.save_npz(str(tmpdir.join(artifacts.NPZ_MODEL_FILE_NAME)), model)
+
+    loaded_model = artifacts.load(str(tmpdir), Model())
+
+    assert np.array_equal(_predict(model, data), _predict(loaded_model, data))
+    assert not isinstance(loaded_model.l1.W.data, np.memmap)
+
+
+def test_load_missing_array(model, tmpdir):
+    artifacts.save(L.Linear(3, 5), str(tmpdir))
+
+    with pytest.raises(KeyError):
+        artifacts.load(str(tmpdir), model)
+
+
+def test_load_unsupported_format_version(model, tmpdir):
+    artifacts.save(model, str(tmpdir))
+    index_file = str(tmpdir.join(artifacts.MMAP_INDEX_FILE_NAME))
+    with open(index_file) as f:
+        index = json.load(f)
+    index['format_version'] = 2
+    with open(index_file, 'w') as f:
+        json.dump(index, f)
+
+    with pytest.raises(ValueError):
+        artifacts.load(str(tmpdir), model)
+
+
+def test_load_empty_link(tmpdir):
+    artifacts.save(chainer.Link(), str(tmpdir))
+
+    assert os.path.getsize(str(tmpdir.join(artifacts.MMAP_MODEL_FILE_NAME))) == 0
+    artifacts.load(str(tmpdir), chainer.Link())
+
+
+def test_save_and_load_float16(model, data, tmpdir):
+    artifacts.save(model, str(tmpdir), dtype=np.float16)
+
+    loaded_model = artifacts.load(str(tmpdir), Model())
+
+    assert os.path.getsize(str(tmpdir.join(artifacts.MMAP_MODEL_FILE_NAME))) < sum(
+        param.array.nbytes for param in model.params()) / 2 + 64 * 8
+    assert isinstance(loaded_model.l1, quantization.QuantizedLinear)
+    assert loaded_model.l1.W.dtype == np.float16
+    assert isinstance(loaded_model.l1.W, np.memmap)
+    assert loaded_model.l1.b.dtype == np.float32
+    assert loaded_model.bn.avg_var.dtype == np.float32
+    np.testing.assert_allclose(_predict(loaded_model, data), _predict(model, data), rtol=1e-2, atol=1e-2)
+
+
+def test_load_float16_into_linear(tmpdir):
+    link = L.Linear(3, 2)
+    artifacts.save(link, str(tmpdir), dtype=np.float16)
+
+    loaded_link = artifacts.load(str(tmpdir), L.Linear(3, 2))
+
+    assert loaded_link.W.array.dtype == np.float32
+    np.testing.assert_allclose(loaded_link.W.array, link.W.array, rtol=1e-3)
+
+
+def test_save_keeps_out_of_range_arrays(tmpdir):
+    link = L.Linear(3, 2)
+    link.W.array[0, 0] = 1e6
+
+    artifacts.save(link, str(tmpdir), dtype=np.float16)
+
+    loaded_link = artifacts.load(str(tmpdir), L.Linear(3, 2))
+    assert loaded_link.W.array.dtype == np.float32
+    assert np.array_equal(loaded_link.W.array, link.W.array)
+    np.testing.assert_allclose(loaded_link.b.array, link.b.array, rtol=1e-3)
+
+
+def test_save_npz_float16(model, data, tmpdir):
+    path = str(tmpdir.join('model.npz'))
+    artifacts.save_npz(path, model, np.float16)
+
+    with np.load(path) as saved:
+        assert saved['l1/W'].dtype == np.float16
+        assert saved['bn/N'].dtype.kind == 'i'
+    loaded_model = Model()
+    serializers.load_npz(path, loaded_model)
+    np.testing.assert_allclose(_predict(loaded_model, data), _predict(model, data), rtol=1e-2, atol=1e-2)
@@ -0,0 +1,256 @@
+import socket
+import sys
+import threading
+import time
+
+import pytest
+from mock import MagicMock
+
+if sys.version_info < (3, 5):
+    pytest.skip('the asyncio front end needs Python 3.5', allow_module_level=True)
+
+import asyncio  # noqa: E402
+from six.moves import http_client  # noqa: E402
+
+from container_support.serving import UnsupportedContentTypeError  # noqa: E402
+
+from chainer_framework import async_server  # noqa: E402
+
+
+class BlockingTransformer(object):
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def transform(self, data, content_type, accept):
+        self.calls.append((data, content_type, accept))
+        self.release.wait(10)
+        return 'prediction', accept
+
+
+@pytest.fixture()
+def serve():
+    servers = []
+
+    def serve(server):
+        sock = async_server.listen(0, '127.0.0.1')
+        loop = asyncio.new_event_loop()
+        task = loop.create_task(server.serve(sock))
+
+        def run():
+            try:
+                loop.run_until_complete(task)
+            except asyncio.CancelledError:
+                pass
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        servers.append((loop, task, thread))
+        return sock.getsockname()[1]
+
+    yield serve
+
+    for loop, task, thread in servers:
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join()
+        loop.close()
+
+
+def _request(port, body=b'[[1, 2]]', headers=None, connection=None):
+    connection = connection or http_client.HTTPConnection('127.0.0.1', port, timeout=10)
+    connection.request('POST', '/invocations', body, headers or {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    return response, response.read()
+
+
+def _wait_for(condition):
+    deadline = time.time() + 10
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+
+def test_ping(serve):
+    connection = http_client.HTTPConnection('127.0.0.1', serve(async_server.AsyncServer(MagicMock())), timeout=10)
+    connection.request('GET', '/ping')
+
+    assert connection.getresponse().status == 200
+
+
+def test_invocations(serve):
+    transformer = MagicMock()
+    transformer.transform.return_value = ('[[2, 4]]', 'application/json')
+    port = serve(async_server.AsyncServer(transformer, default_accept='text/csv'))
+
+    response, body = _request(port)
+
+    assert response.status == 200
+    assert response.getheader('Content-Type') == 'application/json'
+    assert body == b'[[2, 4]]'
+    transformer.transform.assert_called_once_with('[[1, 2]]', 'application/json', 'text/csv')
+
+
+def test_invocations_keep_alive_and_binary_bodies(serve):
+    transformer = MagicMock()
+    transformer.transform.side_effect = lambda data, content_type, accept: (data[::-1], accept)
+    connection = http_client.HTTPConnection('127.0.0.1', serve(async_server.AsyncServer(transformer)), timeout=10)
+
+    for body in (b'\x00\x01', b'\x02\x03\x04'):
+        response, data = _request(None, body, {'Content-Type': 'application/x-npy', 'Accept': 'application/x-npy'},
+                                  connection)
+
+        assert response.status == 200
+        assert data == body[::-1]
+
+
+def test_invocations_errors(serve):
+    transformer = MagicMock()
+    transformer.transform.side_effect = [UnsupportedContentTypeError('text/plain'), ValueError('bug')]
+    port = serve(async_server.AsyncServer(transformer))
+
+    response, body = _request(port, headers={'Content-Type': 'text/plain'})
+    assert response.status == 415
+    assert b'text/plain' in body
+
+    assert _request(port)[0].status == 500
+
+
+def test_chunked_body_and_expect_continue(serve):
+    transformer = MagicMock()
+    transformer.transform.side_effect = lambda data, content_type, accept: (data, accept)
+    port = serve(async_server.AsyncServer(transformer))
+
+    sock = socket.create_connection(('127.0.0.1', port), timeout=10)
+    sock.sendall(b'POST /invocations HTTP/1.1\r\nContent-Type: application/json\r\nExpect: 100-continue\r\n'
+                 b'Transfer-Encoding: chunked\r\n\r\n')
+    assert sock.recv(1024).startswith(b'HTTP/1.1 100 Continue')
+    sock.sendall(b'3\r\n[[1\r\n4\r\n, 2]\r\n1\r\n]\r\n0\r\n\r\n')
+
+    response = http_client.HTTPResponse(sock)
+    response.begin()
+    assert response.status == 200
+    assert response.read() == b'[[1, 2]]'
+
+
+def test_rejects_requests_over_the_latency_budget(serve):
+    transformer = BlockingTransformer()
+    server = async_server.AsyncServer(transformer, latency_budget=0.5)
+    server.admission.service_time = 2.
+    port = serve(server)
+
+    thread = threading.Thread(target=_request, args=(port,))
+    thread.start()
+    _wait_for(lambda: transformer.calls)
+
+    response, _ = _request(port)
+
+    assert response.status == 503
+    assert response.getheader('Retry-After') == '2'
+    transformer.release.set()
+    thread.join()
+    assert server.admission.admitted == 1
+    assert server.admission.rejected == 1
+    assert server.admission.in_flight == 0
+
+
+def test_admits_requests_while_others_upload_slowly(serve):
+    transformer = BlockingTransformer()
+    transformer.release.set()
+    server = async_server.AsyncServer(transformer, threads=1, latency_budget=0.5)
+    server.admission.service_time = 2.
+    port = serve(server)
+
+    uploads = []
+    for _ in range(3):
+        upload = socket.create_connection(('127.0.0.1', port))
+        upload.sendall(b'POST /invocations HTTP/1.1\r\nContent-Type: application/json\r\nContent-Length: 100\r\n\r\n[')
+        uploads.append(upload)
+    _wait_for(lambda: server.admission.in_flight == 3)
+
+    response, body = _request(port)
+
+    assert response.status == 200
+    assert server.admission.queued == 0
+    for upload in uploads:
+        upload.close()
+
+
+def test_rejects_requests_over_the_maximum_in_flight(serve):
+    transformer = BlockingTransformer()
+    server = async_server.AsyncServer(transformer, threads=2, max_in_flight=2)
+    port = serve(server)
+
+    threads = [threading.Thread(target=_request, args=(port,)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    _wait_for(lambda: len(transformer.calls) == 2)
+
+    assert _request(port)[0].status == 503
+    transformer.release.set()
+    for thread in threads:
+        thread.join()
+    assert _request(port)[0].status == 200
+
+
+def test_closes_connections_of_clients_that_stop_reading():
+    server = async_server.AsyncServer(MagicMock(), timeout=0.01)
+    writer = MagicMock()
+    writer.drain.side_effect = lambda: asyncio.sleep(1)
+
+    async def handle():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b'GET /ping HTTP/1.1\r\n\r\n')
+        await server.handle(reader, writer)
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(handle())
+    finally:
+        loop.close()
+    writer.close.assert_called_once_with()
+
+
+def test_admission_control():
+    admission = async_server.AdmissionControl(threads=2, max_in_flight=10, latency_budget=1.)
+
+    # until transform_fn has run once, requests are only limited by max_in_flight
+    for _ in range(3):
+        assert admission.admit() is None
+        admission.queue()
+    admission.done(0.5, queued=True)
+    assert admission.service_time == 0.5
+    assert admission.expected_wait() == 0.5
+
+    admission.done(1., queued=True)
+    assert admission.service_time == pytest.approx(0.6)
+    assert admission.expected_wait() == 0.
+
+    for _ in range(3):
+        assert admission.admit() is None
+        admission.queue()
+    # 4 requests queued on 2 threads: the next request waits for 2 of them
+    assert admission.expected_wait() == pytest.approx(1.2)
+    assert admission.admit() == pytest.approx(1.)
+    assert admission.rejected == 1
+
+
+def test_admission_control_does_not_count_uploading_requests_as_waiting():
+    admission = async_server.AdmissionControl(threads=2, max_in_flight=10, latency_budget=1.)
+    admission.service_time = 2.
+
+    # slow uploads hold no thread
+    for _ in range(5):
+        assert admission.admit() is None
+    assert admission.expected_wait() == 0.
+    assert admission.in_flight == 5
+
+    # 2 requests queued on 2 threads: the next request waits for one of them
+    admission.queue()
+    admission.queue()
+    assert admission.expected_wait() == pytest.approx(2.)
+    assert admission.admit() == pytest.approx(2.)
+
+    admission.done(None)
+    admission.done(2., queued=True)
+    assert admission.in_flight == 3
+    assert admission.queued == 1
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+from mock import MagicMock
+
+from chainer_framework.bootstrap import Pipeline
+
+
+def test_run_returns_durations():
+    pipeline = Pipeline()
+    pipeline.add('first', lambda: None)
+    pipeline.add('second', lambda: None, depends_on=['first'])
+
+    timings = pipeline.run()
+
+    assert sorted(timings) == ['first', 'second']
+
+
+def test_independent_steps_run_concurrently():
+    started = []
+    both_started = threading.Event()
+    lock = threading.Lock()
+
+    def step():
+        with lock:
+            started.append(True)
+            if len(started) == 2:
+                both_started.set()
+        # only returns if the other step started while this one is running
+        assert both_started.wait(5)
+
+    pipeline = Pipeline()
+    pipeline.add('a', step)
+    pipeline.add('b', step)
+
+    pipeline.run()
+
+
+def test_dependencies_run_first():
+    order = []
+
+    def slow_step():
+        time.sleep(0.05)
+        order.append('slow')
+
+    pipeline = Pipeline()
+    pipeline.add('slow', slow_step)
+    pipeline.add('dependent', lambda: order.append('dependent'), depends_on=['slow'])
+
+    pipeline.run()
+
+    assert order == ['slow', 'dependent']
+
+
+def test_failure_skips_dependents_and_is_raised():
+    dependent = MagicMock()
+    independent = MagicMock()
+
+    def failing_step():
+        raise RuntimeError('expected')
+
+    pipeline = Pipeline()
+    pipeline.add('failing', failing_step)
+    pipeline.add('dependent', dependent, depends_on=['failing'])
+    pipeline.add('independent', independent)
+
+    with pytest.raises(RuntimeError):
+        pipeline.run()
+
+    dependent.assert_not_called()
+    independent.assert_called_once()
+
+
+def test_add_unknown_dependency():
+    with pytest.raises(ValueError):
+        Pipeline().add('step', lambda: None, depends_on=['unknown'])
+
+
+def test_add_duplicate_step():
+    pipeline = Pipeline().add('step', lambda: None)
+
+    with pytest.raises(ValueError):
+        pipeline.add('step', lambda: None)
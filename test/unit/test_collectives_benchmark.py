@@ -0,0 +1,77 @@
+import json
+import os
+import shutil
+import tempfile
+
+import pytest
+from mock import patch
+
+from chainer_framework.collectives_benchmark import _bus_bandwidth_factor, _parse_args, _result, write_report, \
+    DEFAULT_SIZES, DEFAULT_EXPECTED_INTRA_NODE_GBPS, MIN_BANDWIDTH_CHECK_SIZE, REPORT_FILE_NAME
+
+
+@pytest.fixture()
+def output_dir():
+    d = tempfile.mkdtemp()
+    yield d
+    shutil.rmtree(d)
+
+
+def test_bus_bandwidth_factor():
+    assert _bus_bandwidth_factor('allreduce', 4) == 1.5
+    assert _bus_bandwidth_factor('allgather', 4) == 0.75
+    assert _bus_bandwidth_factor('bcast', 4) == 1.0
+
+
+def test_result_bandwidth():
+    result = _result('world', 'algo-1', 'allreduce', 10 ** 9, 2, 1.0, expected_gbps=1.0)
+
+    assert result['latency_us'] == 1e6
+    assert result['algorithm_bandwidth_gbps'] == 8.0
+    assert result['bus_bandwidth_gbps'] == 8.0
+    assert not result['below_expected']
+    assert result['host'] is None
+
+
+def test_result_below_expected():
+    result = _result('intra_node', 'algo-1', 'bcast', MIN_BANDWIDTH_CHECK_SIZE, 2, 1.0, expected_gbps=1.0)
+
+    assert result['below_expected']
+    assert result['host'] == 'algo-1'
+
+
+def test_result_small_messages_are_not_compared():
+    result = _result('world', 'algo-1', 'bcast', 1024, 2, 1.0, expected_gbps=1.0)
+
+    assert not result['below_expected']
+
+
+def test_write_report(output_dir):
+    report = {'results': [], 'below_expected': []}
+
+    path = write_report(report, os.path.join(output_dir, 'benchmark'))
+
+    assert path == os.path.join(output_dir, 'benchmark', REPORT_FILE_NAME)
+    with open(path) as f:
+        assert json.load(f) == report
+
+
+def test_parse_args_defaults():
+    with patch('os.path.exists', return_value=False):
+        args = _parse_args([])
+
+    assert args.output_dir == '.'
+    assert args.sizes == DEFAULT_SIZES
+    assert args.expected_intra_node_gbps == DEFAULT_EXPECTED_INTRA_NODE_GBPS
+    assert not args.fail_below_expected
+
+
+def test_parse_args_overrides():
+    with patch('os.path.exists', return_value=False):
+        args = _parse_args(['--output-dir', '/tmp/out', '--sizes', '1024', '4096', '--iterations', '3',
+                            '--fail-below-expected'])
+
+    assert args.output_dir == '/tmp/out'
+    assert args.sizes == [1024, 4096]
+    assert args.iterations == 3
+    assert args.fail_below_expected
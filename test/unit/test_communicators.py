@@ -0,0 +1,128 @@
+import chainer
+import chainer.links as L
+import numpy as np
+import pytest
+from mock import call, MagicMock, patch
+
+from chainer_framework.communicators import create_communicator, CPU_CANDIDATES, GPU_CANDIDATES, \
+    _count_parameters, _DEFAULT_BENCHMARK_SIZE, _release
+
+
+def _comm():
+    comm = MagicMock()
+    comm.rank = 0
+    comm.size = 2
+    return comm
+
+
+def test_create_communicator_by_name():
+    with patch('chainermn.create_communicator') as mock_create_communicator, \
+            patch('chainer_framework.communicators.benchmark_communicators') as mock_benchmark:
+
+        comm = create_communicator('naive')
+
+        mock_create_communicator.assert_called_once_with('naive')
+        mock_benchmark.assert_not_called()
+        assert comm == mock_create_communicator.return_value
+
+
+def test_create_communicator_auto_selects_fastest():
+    naive, flat = _comm(), _comm()
+    with patch('chainer_framework.communicators.benchmark_communicators') as mock_benchmark, \
+            patch('chainer_framework.communicators._release') as mock_release:
+        mock_benchmark.return_value = {'naive': (naive, 0.2), 'flat': (flat, 0.1)}
+
+        comm = create_communicator('auto', L.Linear(3, 2))
+
+        mock_benchmark.assert_called_once_with(CPU_CANDIDATES, 8, -1, 5)
+        assert comm == flat
+        mock_release.assert_called_once_with(naive)
+
+
+def test_create_communicator_auto_initializes_lazy_links_with_a_sample():
+    model = L.Classifier(chainer.Sequential(L.Linear(None, 4)))
+    sample = (np.zeros((2, 3), dtype=np.float32), np.zeros(2, dtype=np.int32))
+    with patch('chainer_framework.communicators.benchmark_communicators') as mock_benchmark:
+        mock_benchmark.return_value = {'naive': (_comm(), 0.1)}
+
+        create_communicator('auto', model, sample=sample)
+
+        mock_benchmark.assert_called_once_with(CPU_CANDIDATES, 16, -1, 5)
+
+
+def test_create_communicator_auto_warns_about_uninitialized_parameters():
+    with patch('chainer_framework.communicators.benchmark_communicators') as mock_benchmark, \
+            patch('chainer_framework.communicators.logger') as mock_logger:
+        mock_benchmark.return_value = {'naive': (_comm(), 0.1)}
+
+        create_communicator('auto', L.Linear(None, 4))
+
+        mock_benchmark.assert_called_once_with(CPU_CANDIDATES, _DEFAULT_BENCHMARK_SIZE, -1, 5)
+        mock_logger.warning.assert_called_once()
+
+
+def test_create_communicator_auto_with_size():
+    with patch('chainer_framework.communicators.benchmark_communicators') as mock_benchmark:
+        mock_benchmark.return_value = {'naive': (_comm(), 0.1)}
+
+        create_communicator('auto', L.Linear(None, 4), size=1000)
+
+        mock_benchmark.assert_called_once_with(CPU_CANDIDATES, 1000, -1, 5)
+
+
+def test_create_communicator_auto_on_gpu_includes_nccl():
+    with patch('chainer_framework.communicators.benchmark_communicators') as mock_benchmark:
+        mock_benchmark.return_value = {'pure_nccl': (_comm(), 0.1)}
+
+        create_communicator('auto', device=0)
+
+        mock_benchmark.assert_called_once_with(GPU_CANDIDATES, _DEFAULT_BENCHMARK_SIZE, 0, 5)
+
+
+def test_create_communicator_auto_without_available_candidates():
+    with patch('chainer_framework.communicators.benchmark_communicators') as mock_benchmark:
+        mock_benchmark.return_value = {}
+
+        with pytest.raises(RuntimeError):
+            create_communicator('auto')
+
+
+def test_count_parameters_ignores_uninitialized_parameters():
+    model = chainer.ChainList(L.Linear(3, 2), L.Linear(None, 4, nobias=True))
+
+    assert _count_parameters(model) == 8
+    assert _count_parameters(None) == 0
+
+
+def test_release():
+    class Communicator(object):
+        pass
+
+    comm = Communicator()
+    comm.mpi_comm = MagicMock()
+    comm.inter_mpi_comm = MagicMock()
+    comm.intra_mpi_comm = None
+    comm.intra_nccl_comm = MagicMock()
+    comm.gpu_buffer_a = object()
+    inter_mpi_comm, intra_nccl_comm = comm.inter_mpi_comm, comm.intra_nccl_comm
+
+    _release(comm)
+
+    inter_mpi_comm.Free.assert_called_once_with()
+    intra_nccl_comm.destroy.assert_called_once_with()
+    comm.mpi_comm.Free.assert_not_called()
+    assert comm.inter_mpi_comm is None and comm.intra_nccl_comm is None and comm.gpu_buffer_a is None
+
+
+def test_release_frees_communicators_in_the_same_order_on_every_rank():
+    class Communicator(object):
+        pass
+
+    frees = MagicMock()
+    comm = Communicator()
+    comm.intra_mpi_comm = frees.intra_mpi_comm
+    comm.inter_mpi_comm = frees.inter_mpi_comm
+
+    _release(comm)
+
+    assert frees.mock_calls == [call.inter_mpi_comm.Free(), call.intra_mpi_comm.Free()]
@@ -0,0 +1,76 @@
+import gzip
+import io
+import zlib
+
+import pytest
+
+from chainer_framework.serialization import compression
+
+DATA = b''.join(b'%d,%d\n' % (i, 2 * i) for i in range(20000))
+
+
+@pytest.mark.parametrize('content_type, expected', [
+    ('text/csv', ('text/csv', None)),
+    ('text/csv; content-encoding=gzip', ('text/csv', 'gzip')),
+    ('application/json;Content-Encoding="ZSTD"', ('application/json', 'zstd')),
+    ('text/csv; content-encoding=deflate; charset=utf-8', ('text/csv; charset=utf-8', 'deflate')),
+    (None, (None, None))])
+def test_parse(content_type, expected):
+    assert compression.parse(content_type) == expected
+
+
+def test_with_encoding():
+    assert compression.with_encoding('text/csv', 'gzip') == 'text/csv; content-encoding=gzip'
+
+
+@pytest.mark.parametrize('encoding', compression.encodings())
+def test_compress_and_decompress(encoding):
+    compressed = compression.compress(DATA, encoding)
+
+    assert len(compressed) < len(DATA) / 2
+    assert compression.decompressed_stream(compressed, encoding).read() == DATA
+
+
+@pytest.mark.parametrize('encoding', compression.encodings())
+def test_decompressed_stream_reads_in_parts(encoding):
+    stream = compression.decompressed_stream(compression.compress(DATA, encoding), encoding)
+
+    parts = []
+    part = stream.read(1000)
+    while part:
+        assert len(part) <= 1000
+        parts.append(part)
+        part = stream.read(1000)
+
+    assert b''.join(parts) == DATA
+
+
+def test_decompress_other_implementations():
+    assert compression.decompressed_stream(gzip_compress(DATA), 'gzip').read() == DATA
+    assert compression.decompressed_stream(zlib.compress(DATA), 'deflate').read() == DATA
+    # raw deflate, without the zlib header
+    assert compression.decompressed_stream(zlib.compress(DATA)[2:-4], 'deflate').read() == DATA
+
+
+def test_compression_level():
+    assert len(compression.compress(DATA, 'gzip', level=1)) > len(compression.compress(DATA, 'gzip', level=9))
+
+
+def test_unsupported_encoding():
+    with pytest.raises(ValueError):
+        compression.compress(DATA, 'br')
+    with pytest.raises(ValueError):
+        compression.decompressed_stream(DATA, 'br')
+
+
+def test_zstd():
+    pytest.importorskip('zstandard')
+
+    assert 'zstd' in compression.encodings()
+
+
+def gzip_compress(data):
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as f:
+        f.write(data)
+    return buffer.getvalue()
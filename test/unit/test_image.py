@@ -0,0 +1,137 @@
+import io
+import tarfile
+
+import numpy as np
+import pytest
+
+from chainer_framework.serialization import image
+
+cv2 = pytest.importorskip('cv2')
+
+
+def _image(height, width, seed=0):
+    # BGR, as OpenCV stores images
+    return np.random.RandomState(seed).randint(0, 256, (height, width, 3)).astype(np.uint8)
+
+
+def _png(pixels):
+    return cv2.imencode('.png', pixels)[1].tobytes()
+
+
+def _chw_rgb(pixels):
+    return pixels[:, :, ::-1].transpose(2, 0, 1).astype(np.float32)
+
+
+def _tar(payloads):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        directory = tarfile.TarInfo('images')
+        directory.type = tarfile.DIRTYPE
+        tar.addfile(directory)
+        for index, payload in enumerate(payloads):
+            info = tarfile.TarInfo('images/{}.png'.format(index))
+            info.size = len(payload)
+            tar.addfile(info, io.BytesIO(payload))
+    return buffer.getvalue()
+
+
+def _multipart(payloads, boundary='frontier'):
+    parts = [b'preamble\r\n']
+    for payload in payloads:
+        parts.append(b'--' + boundary.encode('ascii') + b'\r\nContent-Type: image/png\r\n\r\n' + payload + b'\r\n')
+    parts.append(b'--' + boundary.encode('ascii') + b'--\r\n')
+    return b''.join(parts)
+
+
+def test_accepts():
+    assert image.accepts('image/jpeg')
+    assert image.accepts('multipart/form-data; boundary=frontier')
+    assert not image.accepts('application/json')
+
+
+def test_loads_png():
+    pixels = _image(5, 7)
+
+    batch = image.loads(_png(pixels), 'image/png')
+
+    assert batch.dtype == np.float32
+    assert batch.shape == (1, 3, 5, 7)
+    assert np.array_equal(batch[0], _chw_rgb(pixels))
+
+
+def test_loads_jpeg():
+    pixels = np.full((16, 16, 3), 128, dtype=np.uint8)
+
+    batch = image.loads(cv2.imencode('.jpg', pixels)[1].tobytes(), 'image/jpeg')
+
+    assert batch.shape == (1, 3, 16, 16)
+    assert np.allclose(batch, 128, atol=2)
+
+
+@pytest.mark.parametrize('threads', [1, 3])
+def test_loads_tar(threads):
+    images = [_image(4, 6, seed) for seed in range(5)]
+
+    batch = image.loads(_tar([_png(pixels) for pixels in images]), 'application/x-tar', threads=threads)
+
+    assert np.array_equal(batch, np.stack([_chw_rgb(pixels) for pixels in images]))
+
+
+def test_loads_multipart():
+    images = [_image(4, 6, seed) for seed in range(3)]
+
+    batch = image.loads(_multipart([_png(pixels) for pixels in images]),
+                        'multipart/form-data; boundary="frontier"', threads=2)
+
+    assert np.array_equal(batch, np.stack([_chw_rgb(pixels) for pixels in images]))
+
+
+def test_loads_multipart_without_boundary():
+    with pytest.raises(ValueError):
+        image.loads(_multipart([_png(_image(4, 6))]), 'multipart/mixed')
+
+
+def test_loads_images_of_different_sizes_needs_a_resize_or_crop():
+    payload = _tar([_png(_image(4, 6)), _png(_image(8, 6))])
+
+    with pytest.raises(ValueError):
+        image.loads(payload, 'application/x-tar')
+
+    batch = image.loads(payload, 'application/x-tar', image.parse_preprocessing(crop='4'))
+    assert batch.shape == (2, 3, 4, 4)
+
+
+def test_loads_with_preprocessing():
+    pixels = _image(40, 60)
+    preprocessing = image.parse_preprocessing(resize='20', crop='10,20', mean='1,2,3', std='2', color='bgr')
+
+    batch = image.loads(_png(pixels), 'image/png', preprocessing)
+
+    resized = cv2.resize(pixels, (30, 20), interpolation=cv2.INTER_AREA)
+    expected = (resized[5:15, 5:25].transpose(2, 0, 1) - np.array([1, 2, 3]).reshape(3, 1, 1)) / 2
+    assert batch.shape == (1, 3, 10, 20)
+    assert np.allclose(batch[0], expected)
+
+
+def test_loads_grayscale():
+    pixels = _image(4, 6)
+
+    batch = image.loads(_png(pixels), 'image/png', image.parse_preprocessing(resize='8,12', color='grayscale'))
+
+    assert batch.shape == (1, 1, 8, 12)
+
+
+def test_loads_rejects_crops_larger_than_the_image():
+    with pytest.raises(ValueError):
+        image.loads(_png(_image(4, 6)), 'image/png', image.parse_preprocessing(crop='5'))
+
+
+def test_loads_rejects_payloads_that_are_not_images():
+    with pytest.raises(ValueError):
+        image.loads(b'not an image', 'image/jpeg')
+
+
+@pytest.mark.parametrize('kwargs', [{'resize': '1,2,3'}, {'crop': '0'}, {'color': 'cmyk'}])
+def test_parse_preprocessing_rejects_invalid_values(kwargs):
+    with pytest.raises(ValueError):
+        image.parse_preprocessing(**kwargs)
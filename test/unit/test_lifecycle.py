@@ -0,0 +1,167 @@
+import json
+
+import chainer
+import numpy as np
+import pytest
+from chainer import training
+from mock import MagicMock, patch
+
+from chainer_framework import lifecycle
+from chainer_framework.lifecycle import TRACE_FILE_NAME
+
+
+@pytest.fixture(autouse=True)
+def events():
+    with patch.object(lifecycle, '_events', []) as events:
+        yield events
+
+
+def _event(name, ts, dur=None):
+    event = {'name': name, 'ph': 'X', 'ts': ts, 'thread': 'MainThread'}
+    if dur is not None:
+        event['dur'] = dur
+    return event
+
+
+def _mpi(rank, host_rank):
+    mpi = MagicMock()
+    mpi.MPI.COMM_WORLD.rank = rank
+    mpi.MPI.COMM_WORLD.Split_type.return_value.rank = host_rank
+    mpi.MPI.COMM_WORLD.Split_type.return_value.bcast.side_effect = lambda offset, root: 10.0
+    return mpi
+
+
+def test_span_records_duration(events):
+    with patch.object(lifecycle, 'clock', side_effect=[1.0, 3.5]):
+        with lifecycle.span('step', hosts=2):
+            pass
+
+    assert events == [{'name': 'step', 'ph': 'X', 'ts': 1.0, 'dur': 2.5, 'thread': 'MainThread',
+                       'args': {'hosts': 2}}]
+
+
+def test_span_records_failed_steps(events):
+    with pytest.raises(RuntimeError):
+        with lifecycle.span('step'):
+            raise RuntimeError('expected')
+
+    assert [event['name'] for event in events] == ['step']
+
+
+def test_begin_and_end(events):
+    lifecycle.begin('wait')
+    lifecycle.end('wait')
+
+    assert [(event['name'], event['ph']) for event in events] == [('wait', 'B'), ('wait', 'E')]
+
+
+def test_trace_first_iteration(events):
+    iterator = chainer.iterators.SerialIterator([np.zeros(1, dtype=np.float32)] * 3, 1)
+    optimizer = chainer.optimizers.SGD()
+    optimizer.setup(chainer.Link())
+    updater = training.StandardUpdater(iterator, optimizer, loss_func=lambda x: chainer.Variable(np.zeros(())))
+    update = training.StandardUpdater.update
+
+    with lifecycle.trace_first_iteration():
+        updater.update()
+        updater.update()
+
+    assert updater.iteration == 2
+    assert [event['name'] for event in events] == ['first_iteration']
+    assert training.StandardUpdater.update == update
+
+
+def test_save_events(events, tmpdir):
+    path = str(tmpdir.join('events.json'))
+    events.append(_event('step', 1.0, 2.0))
+
+    lifecycle.save_events(path)
+
+    with open(path) as f:
+        assert json.load(f) == events
+
+
+def test_write_trace_merges_hosts(events, tmpdir):
+    events.append(_event('mpirun', 2.0, 8.0))
+    rank_events_file = str(tmpdir.join('ranks.json'))
+    with open(rank_events_file, 'w') as f:
+        json.dump([['algo-1', [dict(_event('train', 3.0, 5.0), process='rank 0')]],
+                   ['algo-2', [dict(_event('start_sshd', 1.0, 0.5), process='launcher', thread='bootstrap-start_sshd'),
+                               dict(_event('train', 3.0, 5.0), process='rank 1')]]], f)
+
+    lifecycle.write_trace(str(tmpdir), 'algo-1', ['algo-2', 'algo-1'], rank_events_file)
+
+    with open(str(tmpdir.join(TRACE_FILE_NAME))) as f:
+        trace = json.load(f)
+    trace_events = [event for event in trace['traceEvents'] if event['ph'] != 'M']
+    assert [(event['name'], event['pid'], event['ts'], event['dur']) for event in trace_events] == \
+        [('mpirun', 0, 1e6, 8e6), ('train', 0, 2e6, 5e6), ('start_sshd', 1, 0, 0.5e6), ('train', 1, 2e6, 5e6)]
+    names = dict(((event['pid'], event.get('tid')), event['args']['name'])
+                 for event in trace['traceEvents'] if event['name'] in ['process_name', 'thread_name'])
+    assert names == {(0, None): 'algo-1', (1, None): 'algo-2', (0, 0): 'launcher', (0, 1): 'rank 0',
+                     (1, 2): 'launcher bootstrap-start_sshd', (1, 3): 'rank 1'}
+
+
+def test_write_trace_creates_the_output_data_dir_of_a_host(events, tmpdir):
+    events.append(_event('wait_for_mpi_to_start_running', 2.0, 8.0))
+    output_dir = tmpdir.join('algo-2')
+
+    with patch.object(lifecycle, 'RANK_EVENTS_FILE', str(tmpdir.join('missing.json'))):
+        lifecycle.write_trace(str(output_dir), 'algo-2', ['algo-1', 'algo-2'])
+
+    assert output_dir.join(TRACE_FILE_NAME).check()
+
+
+def test_gather_mpi_events_on_worker_host(events, tmpdir):
+    events.append(_event('train', 13.0, 5.0))
+    launcher_events_file = str(tmpdir.join('launcher.json'))
+    with open(launcher_events_file, 'w') as f:
+        json.dump([_event('start_sshd', 11.0, 1.0)], f)
+    mpi = _mpi(rank=2, host_rank=0)
+
+    with patch.dict('sys.modules', {'mpi4py': mpi}), \
+            patch('chainer_framework.lifecycle._estimate_clock_offset', return_value=10.0):
+        lifecycle.gather_mpi_events('algo-2', str(tmpdir.join('ranks.json')), launcher_events_file)
+
+    host, gathered = mpi.MPI.COMM_WORLD.gather.call_args[0][0]
+    assert host == 'algo-2'
+    assert [(event['name'], event['process'], event['ts']) for event in gathered] == \
+        [('train', 'rank 2', 3.0), ('start_sshd', 'launcher', 1.0)]
+
+
+def test_gather_mpi_events_saves_on_rank_0(events, tmpdir):
+    path = str(tmpdir.join('ranks.json'))
+    mpi = _mpi(rank=0, host_rank=0)
+    mpi.MPI.COMM_WORLD.gather.return_value = [['algo-1', []], ['algo-2', []]]
+
+    with patch.dict('sys.modules', {'mpi4py': mpi}), \
+            patch('chainer_framework.lifecycle._estimate_clock_offset', return_value=0.0):
+        lifecycle.gather_mpi_events('algo-1', path, str(tmpdir.join('launcher.json')))
+
+    with open(path) as f:
+        assert json.load(f) == [['algo-1', []], ['algo-2', []]]
+
+
+def test_estimate_clock_offset_uses_fastest_round_trip():
+    leader_comm = MagicMock()
+    leader_comm.rank = 0
+    leader_comm.size = 2
+    leader_comm.recv.side_effect = [105.0, 102.5, 110.0, 120.0, 130.0]
+    leader_comm.scatter.side_effect = lambda offsets, root: offsets[0]
+    # the second round trip is the fastest, the remote clock read 102.5 halfway through it
+    clock = [0.0, 2.0, 2.0, 3.0, 3.0, 9.0, 9.0, 12.0, 12.0, 16.0]
+
+    with patch.object(lifecycle, 'clock', side_effect=clock):
+        lifecycle._estimate_clock_offset(leader_comm)
+
+    assert leader_comm.scatter.call_args[0][0] == [0.0, 100.0]
+
+
+def test_estimate_clock_offset_replies_on_other_hosts():
+    leader_comm = MagicMock()
+    leader_comm.rank = 1
+
+    offset = lifecycle._estimate_clock_offset(leader_comm)
+
+    assert leader_comm.send.call_count == lifecycle._CLOCK_SYNC_ROUNDS
+    assert offset == leader_comm.scatter.return_value
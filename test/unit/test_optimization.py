@@ -0,0 +1,115 @@
+import chainer
+import chainer.functions as F
+import chainer.links as L
+import numpy as np
+import pytest
+from mock import patch
+
+from chainer_framework import optimization
+
+
+class Model(chainer.Chain):
+    def __init__(self):
+        super(Model, self).__init__()
+        with self.init_scope():
+            self.conv = L.Convolution2D(3, 4, 3, pad=1, nobias=True)
+            self.conv_bn = L.BatchNormalization(4)
+            self.fc = L.Linear(None, 5)
+            self.fc_bn = L.BatchNormalization(5)
+
+    def __call__(self, x):
+        h = F.relu(self.conv_bn(self.conv(x)))
+        return self.fc_bn(self.fc(F.dropout(h)))
+
+
+class ResidualModel(chainer.Chain):
+    def __init__(self):
+        super(ResidualModel, self).__init__()
+        with self.init_scope():
+            self.conv = L.Convolution2D(3, 3, 3, pad=1)
+            self.bn = L.BatchNormalization(3)
+
+    def __call__(self, x):
+        # the convolution's output is also used by the residual connection
+        h = self.conv(x)
+        return self.bn(h) + h
+
+
+@pytest.fixture()
+def sample():
+    return np.random.rand(2, 3, 6, 6).astype(np.float32)
+
+
+def _trained(model, sample):
+    with chainer.using_config('train', True):
+        for _ in range(3):
+            model(sample * np.random.rand())
+    return model
+
+
+def test_optimize_folds_batch_normalization(sample):
+    model = _trained(Model(), sample)
+
+    optimized = optimization.optimize(model, sample)
+
+    assert optimized is not model
+    assert isinstance(optimized.conv_bn, optimization._Identity)
+    assert isinstance(optimized.fc_bn, optimization._Identity)
+    assert optimized.conv.b is not None
+    np.testing.assert_allclose(optimization.predict(optimized, sample), optimization.predict(model, sample),
+                               rtol=1e-4, atol=1e-5)
+    # the model is not modified
+    assert isinstance(model.conv_bn, L.BatchNormalization)
+
+
+class Sequential(chainer.ChainList):
+    def __call__(self, x):
+        for link in self:
+            x = link(x)
+        return x
+
+
+def test_optimize_chain_list(sample):
+    model = _trained(Sequential(L.Linear(None, 4), L.BatchNormalization(4)), sample)
+
+    optimized = optimization.optimize(model, sample)
+
+    assert isinstance(optimized[1], optimization._Identity)
+
+
+@pytest.mark.skipif(not hasattr(chainer, 'Sequential'), reason='chainer.Sequential requires Chainer 5')
+def test_optimize_sequential(sample):
+    model = _trained(chainer.Sequential(L.Linear(None, 4), L.BatchNormalization(4), F.relu), sample)
+
+    optimized = optimization.optimize(model, sample)
+
+    assert isinstance(optimized[1], optimization._Identity)
+    np.testing.assert_allclose(optimization.predict(optimized, sample), optimization.predict(model, sample),
+                               rtol=1e-4, atol=1e-5)
+
+
+def test_fold_batch_normalization_skips_shared_outputs(sample):
+    model = _trained(ResidualModel(), sample)
+
+    assert optimization.fold_batch_normalization(model, sample) == 0
+    assert optimization.optimize(model, sample) is model
+
+
+def test_optimize_falls_back_if_predictions_differ(sample):
+    model = _trained(Model(), sample)
+
+    with patch('chainer_framework.optimization._fold', side_effect=lambda layer, bn: layer.W.array.fill(0)):
+        assert optimization.optimize(model, sample) is model
+
+
+def test_optimize_falls_back_if_optimization_fails(sample):
+    model = _trained(Model(), sample)
+
+    with patch('chainer_framework.optimization.fold_batch_normalization', side_effect=RuntimeError('expected')):
+        assert optimization.optimize(model, sample) is model
+
+
+def test_optimize_ignores_models_that_are_not_links(sample):
+    model = object()
+
+    assert optimization.optimize(model, sample) is model
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from chainer_framework import postprocessing
+from chainer_framework.postprocessing import Reduction
+
+
+@pytest.mark.parametrize('accept, default, expected', [
+    ('application/json', None, ('application/json', None)),
+    ('application/json; output=argmax', None, ('application/json', Reduction('argmax', 5, 'raw'))),
+    ('text/csv; Output="TOP-K"; k=3; scores=softmax', None, ('text/csv', Reduction('top-k', 3, 'softmax'))),
+    ('text/csv', 'output=top-k; k=2', ('text/csv', Reduction('top-k', 2, 'raw'))),
+    ('text/csv; output=softmax', 'output=top-k; k=2', ('text/csv', Reduction('softmax', 5, 'raw'))),
+    (None, None, (None, None))])
+def test_parse(accept, default, expected):
+    assert postprocessing.parse(accept, default) == expected
+
+
+@pytest.mark.parametrize('accept', ['application/json; output=max', 'application/json; output=top-k; k=0',
+                                    'application/json; output=top-k; k=many', 'application/json; k=3',
+                                    'application/json; output=top-k; scores=log'])
+def test_parse_rejects_invalid_parameters(accept):
+    with pytest.raises(ValueError):
+        postprocessing.parse(accept)
+
+
+def test_softmax():
+    prediction = np.array([[1, 2, 3], [1000, 1000, 1000]], dtype=np.float32)
+
+    probabilities = postprocessing.apply(prediction, Reduction('softmax', 5, 'raw'))
+
+    expected = np.exp([1, 2, 3]) / np.exp([1, 2, 3]).sum()
+    assert probabilities.dtype == np.float32
+    assert np.allclose(probabilities, [expected, [1. / 3] * 3])
+
+
+def test_argmax():
+    prediction = np.array([[0.1, 0.7, 0.2], [0.5, 0.3, 0.2]])
+
+    assert postprocessing.apply(prediction, Reduction('argmax', 5, 'raw')).tolist() == [1, 0]
+
+
+def test_top_k():
+    prediction = np.random.RandomState(0).rand(4, 1000).astype(np.float32)
+
+    top = postprocessing.apply(prediction, Reduction('top-k', 5, 'raw'))
+
+    expected = np.argsort(-prediction, axis=-1)[:, :5]
+    assert top.indices.dtype == np.int64
+    assert np.array_equal(top.indices, expected)
+    assert np.array_equal(top.scores, np.take_along_axis(prediction, expected, axis=-1))
+
+
+def test_top_k_with_softmax_scores():
+    prediction = np.array([[1., 3., 2.]])
+
+    top = postprocessing.top_k(prediction, 2, normalize=True)
+
+    assert top.indices.tolist() == [[1, 2]]
+    assert np.allclose(top.scores, postprocessing.softmax(prediction)[:, [1, 2]])
+
+
+def test_top_k_keeps_at_most_every_class():
+    top = postprocessing.top_k(np.array([[3., 1., 2.]]), 10)
+
+    assert top.indices.tolist() == [[0, 2, 1]]
+    assert top.scores.tolist() == [[3., 2., 1.]]
+
+
+def test_top_k_of_a_single_sample():
+    top = postprocessing.top_k(np.array([3., 1., 2.]), 2)
+
+    assert top.indices.tolist() == [0, 2]
+
+
+def test_to_array_and_to_json():
+    top = postprocessing.top_k(np.array([[3., 1., 2.]]), 2)
+
+    assert postprocessing.to_array(top).tolist() == [[0., 2., 3., 2.]]
+    assert postprocessing.to_json(top) == {'indices': [[0, 2]], 'scores': [[3., 2.]]}
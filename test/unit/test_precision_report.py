@@ -0,0 +1,110 @@
+import json
+
+import chainer
+import numpy as np
+import pytest
+
+from chainer_framework import artifacts, precision_report
+from chainer_framework.precision_report import REPORT_FILE_NAME
+
+USER_MODULE = """
+import chainer
+import chainer.links as L
+
+from chainer_framework import artifacts
+
+
+class MLP(chainer.Chain):
+    def __init__(self):
+        super(MLP, self).__init__()
+        with self.init_scope():
+            self.l1 = L.Linear(3, 3)
+
+    def __call__(self, x):
+        return self.l1(x)
+
+
+def model_fn(model_dir):
+    return artifacts.load(model_dir, MLP())
+"""
+
+
+class Identity(chainer.Link):
+    def __call__(self, x):
+        return chainer.Variable(x)
+
+
+class Reversed(chainer.Link):
+    def __call__(self, x):
+        return chainer.Variable(x[:, ::-1])
+
+
+@pytest.fixture()
+def validation_dir(tmpdir):
+    directory = tmpdir.mkdir('validation')
+    np.savez(str(directory.join('part-0.npz')), x=np.eye(3, dtype=np.float32), t=np.array([0, 1, 2]))
+    np.savez(str(directory.join('part-1.npz')), x=np.eye(3, dtype=np.float32)[::-1], t=np.array([0, 1, 0]))
+    return str(directory)
+
+
+@pytest.fixture()
+def user_module(tmpdir):
+    path = tmpdir.join('precision_report_user_module.py')
+    path.write(USER_MODULE)
+    return path
+
+
+def test_load_validation_data(validation_dir):
+    x, t = precision_report.load_validation_data(validation_dir)
+
+    assert x.shape == (6, 3)
+    assert list(t) == [0, 1, 2, 0, 1, 0]
+
+
+def test_load_validation_data_without_files(tmpdir):
+    with pytest.raises(ValueError):
+        precision_report.load_validation_data(str(tmpdir))
+
+
+def test_evaluate(validation_dir):
+    x, t = precision_report.load_validation_data(validation_dir)
+
+    report = precision_report.evaluate(Identity(), Reversed(), x, t, batch_size=4)
+
+    assert report['samples'] == 6
+    assert report['accuracy'] == pytest.approx(5.0 / 6)
+    assert report['reduced_accuracy'] == pytest.approx(3.0 / 6)
+    assert report['accuracy_delta'] == pytest.approx(-2.0 / 6)
+    assert report['top1_agreement'] == pytest.approx(2.0 / 6)
+
+
+def test_main(validation_dir, user_module, tmpdir):
+    model_dir = tmpdir.mkdir('model')
+    artifacts.save(_user_model(user_module), str(model_dir))
+
+    report = precision_report.main(['--user-module', str(user_module), '--model-dir', str(model_dir),
+                                    '--validation-dir', validation_dir, '--output-dir', str(tmpdir)])
+
+    assert report['dtype'] == 'float16'
+    assert report['samples'] == 6
+    assert report['relative_error'] < 0.01
+    with open(str(tmpdir.join(REPORT_FILE_NAME))) as f:
+        assert json.load(f) == report
+
+
+def test_main_with_reference_model(validation_dir, user_module, tmpdir):
+    model = _user_model(user_module)
+    reference_model_dir, model_dir = tmpdir.mkdir('reference'), tmpdir.mkdir('model')
+    artifacts.save(model, str(reference_model_dir))
+    artifacts.save(model, str(model_dir), dtype=np.float16)
+
+    report = precision_report.main(['--user-module', str(user_module), '--model-dir', str(model_dir),
+                                    '--reference-model-dir', str(reference_model_dir),
+                                    '--validation-dir', validation_dir, '--output-dir', str(tmpdir)])
+
+    assert report['dtype'] is None
+    assert 0 < report['relative_error'] < 0.01
+
+
+def _user_model(user_module):
+    return precision_report._import_user_module(str(user_module)).MLP()
@@ -0,0 +1,83 @@
+import gc
+import os
+
+import chainer
+import chainer.links as L
+import numpy as np
+import pytest
+from mock import patch
+
+from chainer_framework import preload
+
+
+@pytest.fixture()
+def model():
+    return chainer.ChainList(L.Linear(3, 4), L.BatchNormalization(4))
+
+
+def test_enabled():
+    with patch.dict('os.environ', {preload.PRELOAD_ENV: 'True'}):
+        assert preload.enabled()
+    with patch.dict('os.environ', {preload.PRELOAD_ENV: 'false'}):
+        assert not preload.enabled()
+
+
+def test_configure_gunicorn():
+    with patch.dict('os.environ', {'GUNICORN_CMD_ARGS': '--log-level info'}):
+        preload.configure_gunicorn()
+        preload.configure_gunicorn()
+
+        assert os.environ['GUNICORN_CMD_ARGS'] == '--log-level info --preload'
+
+
+def test_share_arrays(model):
+    weights = model[0].W.data.copy()
+    model[1].avg_mean[...] = 2
+
+    shared_bytes = preload.share_arrays(model)
+
+    arrays = [model[0].W.data, model[0].b.data, model[1].gamma.data, model[1].beta.data, model[1].avg_mean,
+              model[1].avg_var]
+    assert shared_bytes == sum(array.nbytes for array in arrays)
+    assert np.array_equal(model[0].W.data, weights)
+    assert np.array_equal(model[1].avg_mean, np.full(4, 2, dtype=np.float32))
+    assert not any(array.flags.writeable for array in arrays)
+    # the arrays are packed into one buffer, each starting at a multiple of 64 bytes
+    addresses = sorted(array.__array_interface__['data'][0] for array in arrays)
+    assert [address - addresses[0] for address in addresses] == [0, 64, 128, 192, 256, 320]
+
+
+def test_share_arrays_keeps_memory_maps(model, tmpdir):
+    memmap = np.memmap(str(tmpdir.join('W')), dtype=np.float32, mode='w+', shape=(4, 3))
+    model[0].W.data = memmap
+
+    preload.share_arrays(model)
+
+    assert model[0].W.data is memmap
+
+
+def test_shared_model_fn(model):
+    with patch('chainer_framework.preload.share_arrays') as mock_share_arrays, \
+            patch('chainer_framework.preload.freeze') as mock_freeze:
+        model_fn = preload.shared_model_fn(lambda model_dir: model)
+
+        assert model_fn('/opt/ml/model') is model
+        mock_share_arrays.assert_called_once_with(model)
+        mock_freeze.assert_called_once()
+
+
+@pytest.mark.skipif(not hasattr(gc, 'freeze'), reason='gc.freeze requires Python 3.7')
+def test_freeze():
+    try:
+        preload.freeze()
+
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+
+
+def test_memory_usage():
+    usage = preload.memory_usage()
+
+    assert usage['rss'] > 0
+    assert usage['shared'] + usage['private'] == usage['rss']
@@ -0,0 +1,157 @@
+import chainer
+import chainer.functions as F
+import chainer.links as L
+import numpy as np
+import pytest
+
+from chainer_framework import optimization, quantization
+
+
+class Model(chainer.Chain):
+    def __init__(self):
+        super(Model, self).__init__()
+        with self.init_scope():
+            self.conv = L.Convolution2D(3, 4, 3, pad=1)
+            self.fc1 = L.Linear(None, 300)
+            self.fc2 = L.Linear(300, 10, nobias=True)
+
+    def __call__(self, x):
+        h = F.relu(self.conv(x))
+        return self.fc2(F.relu(self.fc1(h)))
+
+
+@pytest.fixture()
+def sample():
+    return np.random.rand(4, 3, 6, 6).astype(np.float32)
+
+
+def test_quantize_weights_scale_per_channel():
+    W = np.array([[1.0, -0.5, 0.25], [0.0, 0.0, 0.0], [-2.0, 1.0, 0.0]], dtype=np.float32)
+
+    quantized, scale = quantization.quantize_weights(W)
+
+    assert quantized.dtype == np.int8
+    np.testing.assert_allclose(scale, [1.0 / 127, 1.0, 2.0 / 127])
+    np.testing.assert_array_equal(quantized[0], [127, -64, 32])
+    np.testing.assert_array_equal(quantized[1], [0, 0, 0])
+    np.testing.assert_array_equal(quantized[2], [-127, 64, 0])
+
+
+def test_quantize_weights_clips():
+    W = np.array([[1.0, 0.5]], dtype=np.float32)
+
+    quantized, scale = quantization.quantize_weights(W, clip_ratio=0.5)
+
+    np.testing.assert_array_equal(quantized, [[127, 127]])
+    np.testing.assert_allclose(scale, [0.5 / 127])
+
+
+def test_quantized_linear_matches_linear():
+    linear = L.Linear(600, 300)
+    x = np.random.rand(3, 600).astype(np.float32)
+
+    y = quantization.QuantizedLinear(linear)(x)
+
+    assert isinstance(y, chainer.Variable)
+    expected = linear(x).array
+    assert np.linalg.norm(y.array - expected) / np.linalg.norm(expected) < 0.01
+
+
+def test_quantized_convolution_matches_convolution(sample):
+    convolution = L.Convolution2D(3, 8, 3, stride=2, pad=1)
+
+    y = quantization.QuantizedConvolution2D(convolution)(sample)
+
+    expected = convolution(sample).array
+    assert y.shape == expected.shape
+    assert np.linalg.norm(y.array - expected) / np.linalg.norm(expected) < 0.01
+
+
+def test_quantize_replaces_linear_links(sample):
+    model = Model()
+    model(sample)
+
+    quantized = quantization.quantize(model, sample)
+
+    assert isinstance(quantized.fc1, quantization.QuantizedLinear)
+    assert isinstance(quantized.fc2, quantization.QuantizedLinear)
+    assert isinstance(quantized.conv, L.Convolution2D)
+    assert isinstance(model.fc1, L.Linear)
+
+
+def test_quantize_convolutions(sample):
+    model = Model()
+    model(sample)
+
+    quantized = quantization.quantize(model, convolutions=True)
+
+    assert isinstance(quantized.conv, quantization.QuantizedConvolution2D)
+
+
+def test_quantize_skips_uninitialized_links():
+    quantized = quantization.quantize(Model())
+
+    assert isinstance(quantized.fc1, L.Linear)
+    assert isinstance(quantized.fc2, quantization.QuantizedLinear)
+
+
+def test_calibration_clips_outliers():
+    random = np.random.RandomState(0)
+    linear = L.Linear(100, 1, nobias=True)
+    linear.W.array[...] = random.uniform(-0.1, 0.1, (1, 100))
+    # an outlier weight for an input that is always 0
+    linear.W.array[0, 0] = 10.0
+    x = random.rand(8, 100).astype(np.float32)
+    x[:, 0] = 0
+
+    assert quantization._calibrate(linear, x) < 1.0
+
+
+def test_report(sample):
+    model = Model()
+    model(sample)
+    quantized = quantization.quantize(model, sample)
+
+    report = quantization.report(model, quantized, sample, iterations=2)
+
+    assert report['relative_error'] < 0.05
+    assert 0 <= report['top1_agreement'] <= 1
+    assert report['quantized_weight_bytes'] < report['original_weight_bytes']
+    assert report['speedup'] > 0
+    np.testing.assert_allclose(report['max_abs_error'],
+                               np.max(np.abs(optimization.predict(quantized, sample) -
+                                             optimization.predict(model, sample))))
+
+
+def test_quantize_with_calibration_skips_uninitialized_links(sample):
+    model = Model()
+
+    quantized = quantization.quantize(model, sample)
+
+    assert isinstance(quantized.fc1, L.Linear)
+
+
+def test_quantize_weights_float16():
+    W = np.random.rand(3, 4).astype(np.float32)
+
+    quantized, scale = quantization.quantize_weights(W, dtype=np.float16)
+
+    assert quantized.dtype == np.float16
+    assert scale is None
+
+
+def test_quantize_weights_unsupported_dtype():
+    with pytest.raises(ValueError):
+        quantization.quantize_weights(np.ones((2, 2), dtype=np.float32), dtype=np.int16)
+
+
+def test_quantize_float16(sample):
+    model = Model()
+    model(sample)
+
+    quantized = quantization.quantize(model, sample, convolutions=True, dtype=np.float16)
+
+    assert quantized.fc1.W.dtype == np.float16
+    assert quantized.conv.W.dtype == np.float16
+    np.testing.assert_allclose(optimization.predict(quantized, sample), optimization.predict(model, sample),
+                               rtol=1e-2, atol=1e-3)
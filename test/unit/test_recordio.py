@@ -0,0 +1,114 @@
+import struct
+
+import numpy as np
+import pytest
+
+from chainer_framework.serialization import recordio
+
+
+def _varint(value):
+    encoded = b''
+    while value > 0x7f:
+        encoded += struct.pack('B', value & 0x7f | 0x80)
+        value >>= 7
+    return encoded + struct.pack('B', value)
+
+
+def _field(number, data):
+    return _varint(number << 3 | 2) + _varint(len(data)) + data
+
+
+def _record(values=None, keys=None, shape=None, tensor_field=2, name=b'values', packed=True):
+    """Encodes an aialgs.data.Record message with a single feature."""
+    dtype = '<f4' if tensor_field == 2 else '<f8'
+    tensor = b''
+    if values is not None and packed:
+        tensor += _field(1, np.asarray(values, dtype=dtype).tobytes())
+    elif values is not None:
+        wire_type = 5 if tensor_field == 2 else 1
+        tensor += b''.join(_varint(1 << 3 | wire_type) + np.asarray([value], dtype=dtype).tobytes()
+                           for value in values)
+    if keys is not None:
+        tensor += _field(2, b''.join(_varint(key) for key in keys))
+    if shape is not None:
+        tensor += _field(3, b''.join(_varint(size) for size in shape))
+    return _field(1, _field(1, name) + _field(2, _field(tensor_field, tensor)))
+
+
+def _recordio(*records):
+    """Frames messages as RecordIO records, as sagemaker.amazon.common does."""
+    return b''.join(struct.pack('<II', 0xced7230a, len(record)) + record + b'\x00' * (-len(record) % 4)
+                    for record in records)
+
+
+def test_dumps_matches_write_numpy_to_dense_tensor():
+    expected = _recordio(_record([1, 2, 3]), _record([4, 5, 6]))
+
+    assert recordio.dumps(np.array([[1, 2, 3], [4, 5, 6]], dtype=np.float32)) == expected
+
+
+def test_loads_dense_records_as_a_view():
+    array = np.random.RandomState(0).rand(100, 7).astype(np.float32)
+    data = _recordio(*[_record(row) for row in array])
+
+    batch = recordio.loads(data)
+
+    assert np.array_equal(array, batch)
+    assert np.shares_memory(batch, np.frombuffer(data, dtype=np.uint8))
+
+
+@pytest.mark.parametrize('array', [
+    np.arange(30, dtype=np.float32).reshape(5, 2, 3),
+    np.arange(6, dtype=np.float64).reshape(3, 2),
+    np.arange(4, dtype=np.float32).reshape(4, 1)])
+def test_dumps_and_loads(array):
+    batch = recordio.loads(recordio.dumps(array))
+
+    assert batch.dtype == array.dtype
+    assert np.array_equal(array, batch)
+
+
+def test_dumps_one_dimensional_batch():
+    assert np.array_equal(np.array([[1], [2]]), recordio.loads(recordio.dumps(np.array([1, 2]))))
+
+
+def test_loads_records_of_different_layouts():
+    data = _recordio(_record([1, 2, 3, 4]),
+                     _record([5, 6], keys=[0, 3], shape=[4]),
+                     _record([7, 8, 9, 10], tensor_field=3, name=b'features'),
+                     _record([11, 12, 13, 14], packed=False))
+
+    batch = recordio.loads(data)
+
+    assert batch.dtype == np.float64
+    assert np.array_equal(np.array([[1, 2, 3, 4], [5, 0, 0, 6], [7, 8, 9, 10], [11, 12, 13, 14]]), batch)
+
+
+def test_loads_a_message_split_around_the_magic_number():
+    magic = struct.pack('<I', 0xced7230a)
+    values = np.frombuffer(magic + struct.pack('<f', 1) + magic, dtype=np.float32)
+    message = _record(values)
+    # RecordIO writers split messages that contain the magic number into records flagged 1 (first), 2 and 3 (last)
+    parts = message.split(magic)
+    flags = [1] + [2] * (len(parts) - 2) + [3]
+    data = b''.join(struct.pack('<II', 0xced7230a, flag << 29 | len(part)) + part + b'\x00' * (-len(part) % 4)
+                    for flag, part in zip(flags, parts)) + _recordio(message)
+
+    batch = recordio.loads(data)
+
+    assert len(parts) == 3
+    assert np.array_equal(np.stack([values, values]), batch)
+
+
+@pytest.mark.parametrize('data, message', [
+    (b'', 'no records'),
+    (b'\x00' * 8, 'magic'),
+    (_recordio(_record([1, 2]))[:-4], 'truncated'),
+    (_recordio(_record([1, 2]), _record([1, 2, 3])), 'same shape'),
+    (_recordio(_record([1, 2], keys=[0, 1])), 'shape'),
+    (_recordio(_field(1, _field(1, b'a')) + _field(1, _field(1, b'b'))), 'single feature'),
+    (_recordio(_field(1, _field(1, b'values') + _field(2, _field(7, b'\x01\x02')))), 'Float32Tensor')])
+def test_loads_invalid_payloads(data, message):
+    with pytest.raises(ValueError) as error:
+        recordio.loads(data)
+    assert message in str(error.value)
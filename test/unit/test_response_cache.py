@@ -0,0 +1,195 @@
+import multiprocessing
+import os
+import threading
+
+import pytest
+from mock import MagicMock, patch
+
+from chainer_framework import response_cache
+from chainer_framework.response_cache import ResponseCache
+
+
+@pytest.fixture()
+def path(tmpdir):
+    return str(tmpdir.join('segment'))
+
+
+@pytest.fixture()
+def cache(path):
+    return ResponseCache(path, capacity_bytes=4096, max_entries=8, ttl=60, model_version='1')
+
+
+def _compute(output):
+    return MagicMock(return_value=output)
+
+
+def test_hit_after_miss(cache):
+    compute = _compute(('[1, 2]', 'application/json'))
+
+    assert cache.get_or_compute('[[1]]', 'application/json', 'application/json', compute) == \
+        ('[1, 2]', 'application/json')
+    assert cache.get_or_compute('[[1]]', 'application/json', 'application/json', compute) == \
+        ('[1, 2]', 'application/json')
+
+    compute.assert_called_once()
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['inserts'], stats['entries']) == (1, 1, 1, 1)
+
+
+def test_binary_response(cache):
+    compute = _compute((b'\x93NUMPY\x00', 'application/x-npy'))
+
+    cache.get_or_compute(b'\x00\x01', 'application/x-npy', 'application/x-npy', compute)
+    response = cache.get_or_compute(b'\x00\x01', 'application/x-npy', 'application/x-npy', compute)
+
+    assert response == (b'\x93NUMPY\x00', 'application/x-npy')
+    compute.assert_called_once()
+
+
+def test_key_includes_request_types_and_model_version(cache, path):
+    keys = set([cache.key('1', 'text/csv', 'application/json'), cache.key('1', 'application/json', 'text/csv'),
+                cache.key('2', 'text/csv', 'application/json'),
+                ResponseCache(path, 4096, model_version='2').key('1', 'text/csv', 'application/json')])
+
+    assert len(keys) == 4
+    assert cache.key(u'1', 'text/csv', 'application/json') == cache.key(b'1', 'text/csv', 'application/json')
+
+
+def test_expired_responses_are_computed_again(path):
+    cache = ResponseCache(path, capacity_bytes=4096, ttl=0)
+    compute = _compute(('1', 'text/csv'))
+
+    cache.get_or_compute('1', 'text/csv', 'text/csv', compute)
+    cache.get_or_compute('1', 'text/csv', 'text/csv', compute)
+
+    assert compute.call_count == 2
+    assert cache.stats()['expirations'] == 1
+
+
+def test_least_recently_used_responses_are_evicted_first(path):
+    # responses take 60 bytes: 50 bytes of data, its content type and 2 bytes of metadata
+    cache = ResponseCache(path, capacity_bytes=250, max_entries=8)
+    for request in ['a', 'b', 'c', 'd', 'a']:
+        cache.get_or_compute(request, 'text/csv', 'text/csv', _compute(('x' * 50, 'text/csv')))
+
+    cache.get_or_compute('e', 'text/csv', 'text/csv', _compute(('x' * 50, 'text/csv')))
+
+    assert cache.stats()['evictions'] == 1
+    for request, cached in [('a', True), ('c', True), ('d', True), ('e', True), ('b', False)]:
+        compute = _compute(('x' * 50, 'text/csv'))
+        cache.get_or_compute(request, 'text/csv', 'text/csv', compute)
+        assert compute.called != cached, request
+
+
+def test_number_of_entries_is_bounded(path):
+    cache = ResponseCache(path, capacity_bytes=4096, max_entries=2)
+    for request in ['a', 'b', 'c']:
+        cache.get_or_compute(request, 'text/csv', 'text/csv', _compute(('1', 'text/csv')))
+
+    stats = cache.stats()
+    assert (stats['entries'], stats['evictions']) == (2, 1)
+
+
+def test_large_responses_are_not_cached(cache):
+    compute = _compute(('x' * 2048, 'text/csv'))
+
+    cache.get_or_compute('1', 'text/csv', 'text/csv', compute)
+    cache.get_or_compute('1', 'text/csv', 'text/csv', compute)
+
+    assert compute.call_count == 2
+    assert cache.stats()['entries'] == 0
+
+
+def test_failed_requests_are_not_cached(cache):
+    with pytest.raises(ValueError):
+        cache.get_or_compute('1', 'text/csv', 'text/csv', MagicMock(side_effect=ValueError('bad request')))
+
+    compute = _compute(('1', 'text/csv'))
+    cache.get_or_compute('1', 'text/csv', 'text/csv', compute)
+
+    compute.assert_called_once()
+
+
+def test_concurrent_requests_are_coalesced(cache):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(10)
+        return '1', 'text/csv'
+
+    responses = []
+
+    def request():
+        responses.append(cache.get_or_compute('1', 'text/csv', 'text/csv', compute))
+
+    first = threading.Thread(target=request)
+    first.start()
+    started.wait(10)
+    second = threading.Thread(target=request)
+    second.start()
+    while cache.stats()['coalesced'] == 0:
+        pass
+    release.set()
+    first.join()
+    second.join()
+
+    assert len(calls) == 1
+    assert responses == [('1', 'text/csv')] * 2
+
+
+def _store_in_child(cache):
+    cache.get_or_compute('1', 'text/csv', 'text/csv', lambda: ('from child', 'text/csv'))
+
+
+def test_segment_is_shared_between_processes(cache):
+    cache.stats()
+    process = multiprocessing.get_context('fork').Process(target=_store_in_child, args=(cache,)) \
+        if hasattr(multiprocessing, 'get_context') else multiprocessing.Process(target=_store_in_child, args=(cache,))
+    process.start()
+    process.join()
+
+    compute = _compute(('from parent', 'text/csv'))
+    assert cache.get_or_compute('1', 'text/csv', 'text/csv', compute) == ('from child', 'text/csv')
+    compute.assert_not_called()
+
+
+def test_segment_with_other_settings_is_reset(cache, path):
+    cache.get_or_compute('1', 'text/csv', 'text/csv', _compute(('1', 'text/csv')))
+
+    other = ResponseCache(path, capacity_bytes=8192, max_entries=8, model_version='1')
+
+    assert other.stats()['entries'] == 0
+    assert os.path.getsize(path) > 8192
+
+
+def test_cached(cache):
+    transform_fn = MagicMock(return_value=('1', 'text/csv'))
+    cached_transform_fn = response_cache.cached(transform_fn, cache)
+
+    cached_transform_fn('1', 'text/csv', 'text/csv')
+    assert cached_transform_fn('1', 'text/csv', 'text/csv') == ('1', 'text/csv')
+
+    transform_fn.assert_called_once_with('1', 'text/csv', 'text/csv')
+
+
+def test_from_env(path):
+    with patch.dict('os.environ', {response_cache.CACHE_BYTES_ENV: '1024', response_cache.CACHE_TTL_ENV: '5',
+                                   response_cache.MODEL_VERSION_ENV: 'v2'}), \
+            patch('chainer_framework.response_cache.segment_path', return_value=path):
+        assert response_cache.enabled()
+        cache = response_cache.from_env()
+
+    assert (cache.capacity_bytes, cache.max_entries, cache.ttl, cache.model_version) == \
+        (1024, response_cache.DEFAULT_ENTRIES, 5.0, 'v2')
+
+
+def test_model_fingerprint(tmpdir):
+    tmpdir.join('model.npz').write('1')
+    fingerprint = response_cache.model_fingerprint(str(tmpdir))
+
+    tmpdir.join('model.npz').write('12')
+
+    assert response_cache.model_fingerprint(str(tmpdir)) != fingerprint
@@ -1,14 +1,20 @@
 import pytest
 import json
 import numpy as np
+from mock import MagicMock, patch
 
+import chainer.links as L
 from chainer import Variable
 
 from container_support.serving import JSON_CONTENT_TYPE, CSV_CONTENT_TYPE, \
-    UnsupportedContentTypeError, UnsupportedAcceptTypeError
+    UnsupportedContentTypeError, UnsupportedAcceptTypeError, UnsupportedInputShapeError
 
-from chainer_framework.serialization import csv, npy
-from chainer_framework.serving import model_fn, input_fn, predict_fn, output_fn, transform_fn, NPY_CONTENT_TYPE
+from chainer_framework.serialization import arrow, compression, csv, image, npy, recordio
+from chainer_framework import preload, response_cache, threads
+from chainer_framework.serving import COMPRESSION_LEVEL_ENV, COMPRESSION_MIN_BYTES_ENV, CPU_ACCELERATION_ENV, \
+    OPTIMIZE_MODEL_ENV, OUTPUT_ENV, QUANTIZATION_MIN_SPEEDUP_ENV, QUANTIZE_MODEL_ENV, QUANTIZATION_DTYPE_ENV, \
+    WARMUP_SAMPLES_ENV, _prepared_models, engine, model_fn, input_fn, predict_fn, output_fn, transform_fn, \
+    NPY_CONTENT_TYPE
 
 
 @pytest.fixture()
@@ -47,6 +53,33 @@ def test_input_fn_npz(np_array):
     assert np.array_equal(np_array, deserialized_np_array)
 
 
+def test_input_fn_images():
+    with patch.dict('os.environ', {'SAGEMAKER_CHAINER_IMAGE_CROP': '224', 'SAGEMAKER_CHAINER_IMAGE_MEAN': '1,2,3',
+                                   'SAGEMAKER_CHAINER_IMAGE_DECODE_THREADS': '4'}), \
+            patch('chainer_framework.serialization.image.available', return_value=True), \
+            patch('chainer_framework.serialization.image.loads') as loads:
+        assert input_fn(b'payload', 'multipart/form-data; boundary=frontier') == loads.return_value
+
+    data, content_type, preprocessing, threads = loads.call_args[0]
+    assert (data, content_type, threads) == (b'payload', 'multipart/form-data; boundary=frontier', 4)
+    assert preprocessing.crop == (224, 224)
+    assert preprocessing.resize is None
+    assert np.array_equal(preprocessing.mean, [1, 2, 3])
+
+
+def test_input_fn_invalid_images():
+    with patch('chainer_framework.serialization.image.available', return_value=True), \
+            patch('chainer_framework.serialization.image.loads', side_effect=ValueError('the payload has no images')):
+        with pytest.raises(UnsupportedInputShapeError):
+            input_fn(b'', image.TAR_CONTENT_TYPE)
+
+
+def test_input_fn_images_without_opencv():
+    with patch('chainer_framework.serialization.image.available', return_value=False):
+        with pytest.raises(UnsupportedContentTypeError):
+            input_fn(b'payload', image.JPEG_CONTENT_TYPE)
+
+
 def test_input_fn_csv(np_array):
     flattened_np_array = np.ndarray.flatten(np_array)
     csv_data = csv.dumps(np.ndarray.flatten(np_array))
@@ -118,4 +151,340 @@ def test_transform_fn_npz(np_array):
 
     transformed_numpy_array = npy.loads(transformed_data)
     assert np.array_equal(transformed_numpy_array, fake_predict(np_array))
-    assert NPY_CONTENT_TYPE == content_type
\ No newline at end of file
+    assert NPY_CONTENT_TYPE == content_type
+
+
+def test_engine_preloads_user_model_fn():
+    user_module = MagicMock()
+    model_fn = user_module.model_fn
+
+    with patch.dict('os.environ', {preload.PRELOAD_ENV: 'true'}), \
+            patch('chainer_framework.preload.shared_model_fn') as mock_shared_model_fn:
+        engine.transformer(user_module)
+
+        assert user_module.model_fn == mock_shared_model_fn.return_value
+        optimized_model_fn = mock_shared_model_fn.call_args[0][0]
+        assert optimized_model_fn('model_dir') is model_fn.return_value
+        model_fn.assert_called_once_with('model_dir')
+
+
+def test_predict_fn_optimizes_model_once(np_array):
+    model = FakeModel()
+
+    with patch.dict('os.environ', {OPTIMIZE_MODEL_ENV: 'true'}), \
+            patch('chainer_framework.optimization.optimize', return_value=FakeModel()) as mock_optimize:
+        predict_fn(np_array, model)
+        predicted_data = predict_fn(np_array, model)
+
+        mock_optimize.assert_called_once_with(model, np_array)
+        assert np.array_equal(fake_predict(np_array), predicted_data)
+
+
+def test_engine_optimizes_preloaded_model_before_sharing_it(tmpdir):
+    user_module = MagicMock()
+    user_module.model_fn.return_value = L.Linear(2, 2)
+    optimized_model = L.Linear(2, 2)
+    warmup_samples = str(tmpdir.join('warmup.npy'))
+    np.save(warmup_samples, np.zeros((3, 2), dtype=np.float32))
+    input_data = np.ones((2, 2), dtype=np.float32)
+
+    with patch.dict('os.environ', {preload.PRELOAD_ENV: 'true', OPTIMIZE_MODEL_ENV: 'true',
+                                   WARMUP_SAMPLES_ENV: warmup_samples}), \
+            patch('chainer_framework.preload.shared_model_fn', side_effect=lambda fn: fn), \
+            patch('chainer_framework.optimization.optimize', return_value=optimized_model) as mock_optimize:
+        engine.transformer(user_module)
+        model = user_module.model_fn('model_dir')
+        predict_fn(input_data, model)
+
+        assert model is optimized_model
+        mock_optimize.assert_called_once()
+        assert np.array_equal(mock_optimize.call_args[0][1], np.zeros((3, 2)))
+
+
+def test_predict_fn_does_not_optimize_shared_model(np_array):
+    model = L.Linear(2, 2)
+
+    with patch.dict('os.environ', {OPTIMIZE_MODEL_ENV: 'true', QUANTIZE_MODEL_ENV: 'linear'}), \
+            patch('chainer_framework.acceleration.memory_mapped_bytes', return_value=16), \
+            patch('chainer_framework.optimization.optimize') as mock_optimize, \
+            patch('chainer_framework.quantization.quantize') as mock_quantize:
+        predict_fn(np_array.astype(np.float32), model)
+
+        mock_optimize.assert_not_called()
+        mock_quantize.assert_not_called()
+        assert _prepared_models[id(model)][1] is model
+
+
+def test_predict_fn_quantizes_model_with_warmup_samples(np_array, tmpdir):
+    model = FakeModel()
+    quantized_model = FakeModel()
+    warmup_samples = str(tmpdir.join('warmup.npy'))
+    np.save(warmup_samples, np.zeros((3, 2)))
+
+    with patch.dict('os.environ', {QUANTIZE_MODEL_ENV: 'linear', WARMUP_SAMPLES_ENV: warmup_samples}), \
+            patch('chainer_framework.quantization.quantize', return_value=quantized_model) as mock_quantize, \
+            patch('chainer_framework.quantization.report', return_value={'relative_error': 0.01, 'speedup': 1.5}):
+        predict_fn(np_array, model)
+
+        assert np.array_equal(mock_quantize.call_args[0][1], np.zeros((3, 2)))
+        assert mock_quantize.call_args[1] == {'convolutions': False, 'dtype': np.int8}
+        assert _prepared_models[id(model)][1] is quantized_model
+
+
+def test_predict_fn_quantizes_model_without_calibration_without_warmup_samples(np_array):
+    model = FakeModel()
+    quantized_model = FakeModel()
+
+    with patch.dict('os.environ', {QUANTIZE_MODEL_ENV: 'linear'}), \
+            patch('chainer_framework.quantization.quantize', return_value=quantized_model) as mock_quantize, \
+            patch('chainer_framework.quantization.report') as mock_report:
+        predict_fn(np_array, model)
+
+        assert mock_quantize.call_args[0][1] is None
+        mock_report.assert_not_called()
+        assert _prepared_models[id(model)][1] is quantized_model
+
+
+def test_predict_fn_serves_float_model_if_quantization_is_inaccurate(np_array, tmpdir):
+    model = FakeModel()
+    warmup_samples = str(tmpdir.join('warmup.npy'))
+    np.save(warmup_samples, np.zeros((3, 2)))
+
+    with patch.dict('os.environ', {QUANTIZE_MODEL_ENV: 'all', QUANTIZATION_DTYPE_ENV: 'float16',
+                                   WARMUP_SAMPLES_ENV: warmup_samples}), \
+            patch('chainer_framework.quantization.quantize') as mock_quantize, \
+            patch('chainer_framework.quantization.report', return_value={'relative_error': 0.2, 'speedup': 1.5}):
+        predict_fn(np_array, model)
+
+        assert mock_quantize.call_args[1] == {'convolutions': True, 'dtype': np.float16}
+        assert _prepared_models[id(model)][1] is model
+
+
+def test_predict_fn_serves_slower_quantized_model(np_array, tmpdir):
+    model = FakeModel()
+    quantized_model = FakeModel()
+    warmup_samples = str(tmpdir.join('warmup.npy'))
+    np.save(warmup_samples, np.zeros((3, 2)))
+
+    with patch.dict('os.environ', {QUANTIZE_MODEL_ENV: 'linear', WARMUP_SAMPLES_ENV: warmup_samples}), \
+            patch('chainer_framework.quantization.quantize', return_value=quantized_model), \
+            patch('chainer_framework.quantization.report', return_value={'relative_error': 0.01, 'speedup': 0.8}):
+        predict_fn(np_array, model)
+
+        assert _prepared_models[id(model)][1] is quantized_model
+
+
+def test_predict_fn_serves_float_model_if_quantization_is_slower_than_min_speedup(np_array, tmpdir):
+    model = FakeModel()
+    quantized_model = FakeModel()
+    warmup_samples = str(tmpdir.join('warmup.npy'))
+    np.save(warmup_samples, np.zeros((3, 2)))
+
+    with patch.dict('os.environ', {QUANTIZE_MODEL_ENV: 'linear', QUANTIZATION_MIN_SPEEDUP_ENV: '1',
+                                   WARMUP_SAMPLES_ENV: warmup_samples}), \
+            patch('chainer_framework.quantization.quantize', return_value=quantized_model), \
+            patch('chainer_framework.quantization.report', return_value={'relative_error': 0.01, 'speedup': 0.8}):
+        predict_fn(np_array, model)
+
+        assert _prepared_models[id(model)][1] is model
+
+
+def test_predict_fn_runs_accelerated_model_with_ideep(np_array):
+    model = FakeModel()
+    accelerated_model = MagicMock(return_value=Variable(np_array * 3))
+
+    with patch('chainer_framework.acceleration.enabled', return_value=True) as enabled, \
+            patch('chainer_framework.acceleration.accelerate', return_value=accelerated_model) as accelerate, \
+            patch('chainer_framework.acceleration.using_ideep') as using_ideep:
+        prediction = predict_fn(np_array, model)
+
+    assert enabled.call_args[0] == ('auto',)
+    assert accelerate.call_args[1] == {'copy_shared': False}
+    assert using_ideep.called
+    assert _prepared_models[id(model)][1:] == (accelerated_model, True)
+    assert np.array_equal(prediction, np_array * 3)
+
+
+def test_predict_fn_accelerates_shared_models_in_ideep_mode(np_array):
+    model = FakeModel()
+
+    with patch.dict('os.environ', {CPU_ACCELERATION_ENV: 'ideep'}), \
+            patch('chainer_framework.acceleration.enabled', return_value=True), \
+            patch('chainer_framework.acceleration.accelerate', return_value=model) as accelerate:
+        predict_fn(np_array, model)
+
+    assert accelerate.call_args[1] == {'copy_shared': True}
+
+
+def test_predict_fn_without_cpu_acceleration(np_array):
+    model = FakeModel()
+
+    with patch.dict('os.environ', {CPU_ACCELERATION_ENV: 'none'}), \
+            patch('chainer_framework.acceleration.accelerate') as accelerate:
+        predict_fn(np_array, model)
+
+    assert not accelerate.called
+    assert _prepared_models[id(model)][1:] == (model, False)
+
+
+def test_engine_caches_responses():
+    transformer = MagicMock()
+    transform_fn = transformer.transform_fn
+
+    with patch.dict('os.environ', {response_cache.CACHE_BYTES_ENV: '1024'}), \
+            patch('chainer_framework.serving.ServingEngine.transformer', return_value=transformer), \
+            patch('chainer_framework.response_cache.cached') as mock_cached:
+        assert engine.transformer(MagicMock()) == transformer
+
+        mock_cached.assert_called_once_with(transform_fn)
+        assert transformer.transform_fn == mock_cached.return_value
+
+
+def test_engine_pins_workers():
+    transformer = MagicMock()
+    transform_fn = transformer.transform_fn
+
+    with patch.dict('os.environ', {threads.CPU_AFFINITY_ENV: 'true'}), \
+            patch('chainer_framework.serving.ServingEngine.transformer', return_value=transformer), \
+            patch('chainer_framework.threads.pinned') as mock_pinned:
+        engine.transformer(MagicMock())
+
+        mock_pinned.assert_called_once_with(transform_fn)
+        assert transformer.transform_fn == mock_pinned.return_value
+
+
+@pytest.mark.parametrize('content_type, serialize', [
+    (JSON_CONTENT_TYPE, lambda array: json.dumps(array.tolist()).encode('utf-8')),
+    (CSV_CONTENT_TYPE, lambda array: csv.dumps(array).encode('utf-8')),
+    (NPY_CONTENT_TYPE, npy.dumps),
+    (recordio.CONTENT_TYPE, recordio.dumps)])
+@pytest.mark.parametrize('encoding', compression.encodings())
+def test_input_fn_compressed(content_type, serialize, encoding):
+    array = np.arange(20000, dtype=np.float32).reshape(-1, 4)
+    data = compression.compress(serialize(array), encoding)
+
+    deserialized_np_array = input_fn(data, compression.with_encoding(content_type, encoding))
+
+    assert np.array_equal(array, deserialized_np_array)
+
+
+def test_input_fn_unsupported_encoding(np_array):
+    with pytest.raises(UnsupportedContentTypeError):
+        input_fn(npy.dumps(np_array), 'application/x-npy; content-encoding=br')
+
+
+def test_output_fn_compressed():
+    array = np.ones((1000, 4))
+
+    output_data, content_type = output_fn(array, 'text/csv; content-encoding=gzip')
+
+    assert content_type == 'text/csv; content-encoding=gzip'
+    assert compression.decompressed_stream(output_data, 'gzip').read().decode('utf-8') == csv.dumps(array.tolist())
+
+
+def test_output_fn_does_not_compress_small_responses(np_array):
+    output_data, content_type = output_fn(np_array, 'text/csv; content-encoding=gzip')
+
+    assert content_type == CSV_CONTENT_TYPE
+    assert output_data == csv.dumps(np_array.tolist())
+
+
+def test_output_fn_compression_settings():
+    array = np.ones((1000, 4))
+
+    with patch.dict('os.environ', {COMPRESSION_MIN_BYTES_ENV: '100000', COMPRESSION_LEVEL_ENV: '1'}):
+        _, content_type = output_fn(array, 'application/json; content-encoding=deflate')
+        assert content_type == JSON_CONTENT_TYPE
+
+    with patch.dict('os.environ', {COMPRESSION_MIN_BYTES_ENV: '0', COMPRESSION_LEVEL_ENV: '1'}), \
+            patch('chainer_framework.serialization.compression.compress') as mock_compress:
+        output_fn(array, 'application/json; content-encoding=deflate')
+        mock_compress.assert_called_once_with(json.dumps(array.tolist()).encode('utf-8'), 'deflate', 1)
+
+
+def test_output_fn_unsupported_encoding(np_array):
+    with pytest.raises(UnsupportedAcceptTypeError):
+        output_fn(np_array, 'text/csv; content-encoding=br')
+
+
+def test_output_fn_top_k():
+    prediction = np.array([[0.1, 0.6, 0.3], [0.5, 0.2, 0.3]])
+
+    output_data, content_type = output_fn(prediction, 'application/json; output=top-k; k=2')
+
+    assert content_type == JSON_CONTENT_TYPE
+    assert json.loads(output_data) == {'indices': [[1, 2], [0, 2]], 'scores': [[0.6, 0.3], [0.5, 0.3]]}
+
+    output_data, content_type = output_fn(prediction, 'text/csv; output=top-k; k=1')
+
+    assert content_type == CSV_CONTENT_TYPE
+    assert np.allclose(csv.loads(output_data), [[1, 0.6], [0, 0.5]])
+
+
+def test_output_fn_argmax_compressed():
+    prediction = np.random.RandomState(0).rand(1000, 10)
+
+    with patch.dict('os.environ', {COMPRESSION_MIN_BYTES_ENV: '0'}):
+        output_data, content_type = output_fn(prediction, 'application/x-npy; output=argmax; content-encoding=gzip')
+
+    assert content_type == 'application/x-npy; content-encoding=gzip'
+    decompressed = compression.decompressed_stream(output_data, 'gzip').read()
+    assert np.array_equal(npy.loads(decompressed), prediction.argmax(axis=1))
+
+
+def test_output_fn_default_output():
+    prediction = np.array([[1., 2.], [3., 1.]], dtype=np.float32)
+
+    with patch.dict('os.environ', {OUTPUT_ENV: 'output=softmax'}):
+        output_data, _ = output_fn(prediction, JSON_CONTENT_TYPE)
+        assert np.allclose(json.loads(output_data), np.exp(prediction) / np.exp(prediction).sum(axis=1, keepdims=True))
+
+        output_data, _ = output_fn(prediction, 'application/json; output=argmax')
+        assert json.loads(output_data) == [1, 0]
+
+
+def test_output_fn_invalid_output():
+    with pytest.raises(UnsupportedAcceptTypeError):
+        output_fn(np.ones((2, 2)), 'application/json; output=top-k; k=0')
+
+
+def test_input_fn_recordio_protobuf():
+    array = np.arange(24, dtype=np.float32).reshape(4, 2, 3)
+
+    deserialized_np_array = input_fn(recordio.dumps(array), recordio.CONTENT_TYPE)
+
+    assert deserialized_np_array.dtype == np.float32
+    assert np.array_equal(array, deserialized_np_array)
+
+
+def test_output_fn_recordio_protobuf(np_array):
+    output_data, content_type = output_fn(np_array.astype(np.float32), recordio.CONTENT_TYPE)
+
+    assert content_type == recordio.CONTENT_TYPE
+    assert np.array_equal(np_array, recordio.loads(output_data))
+
+
+def test_transform_fn_recordio_protobuf(np_array):
+    output_data, content_type = transform_fn(FakeModel(), recordio.dumps(np_array), recordio.CONTENT_TYPE,
+                                             recordio.CONTENT_TYPE)
+
+    assert content_type == recordio.CONTENT_TYPE
+    assert np.array_equal(fake_predict(np_array), recordio.loads(output_data))
+
+
+def test_arrow():
+    pytest.importorskip('pyarrow')
+    array = np.arange(12, dtype=np.float32).reshape(4, 3)
+
+    output_data, content_type = transform_fn(FakeModel(), arrow.dumps(array), arrow.CONTENT_TYPE, arrow.CONTENT_TYPE)
+
+    assert content_type == arrow.CONTENT_TYPE
+    assert np.array_equal(fake_predict(array), arrow.loads(output_data))
+
+
+def test_arrow_without_pyarrow(np_array):
+    with patch('chainer_framework.serialization.arrow.pyarrow', None):
+        with pytest.raises(UnsupportedContentTypeError):
+            input_fn(b'', arrow.CONTENT_TYPE)
+        with pytest.raises(UnsupportedAcceptTypeError):
+            output_fn(np_array, arrow.CONTENT_TYPE)
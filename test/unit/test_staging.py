@@ -0,0 +1,101 @@
+import multiprocessing
+import os
+import sys
+import tarfile
+
+import pytest
+from mock import MagicMock, patch
+
+from chainer_framework import staging
+
+SCRIPT = 'staged_user_script.py'
+
+
+@pytest.fixture()
+def archive(tmpdir):
+    source_dir = tmpdir.mkdir('source')
+    source_dir.join(SCRIPT).write('def train():\n    return "trained"\n')
+    source_dir.join('requirements.txt').write('six\n')
+
+    archive = str(tmpdir.join('sourcedir.tar.gz'))
+    with tarfile.open(archive, 'w:gz') as tar:
+        for name in os.listdir(str(source_dir)):
+            tar.add(str(source_dir.join(name)), arcname=name)
+    return archive
+
+
+@pytest.fixture()
+def cache_dir(tmpdir):
+    return str(tmpdir.join('cache'))
+
+
+def _stage_in_process(args):
+    archive, cache_dir = args
+    return staging._stage(archive, None, cache_dir)
+
+
+def test_stage_extracts_archive(archive, cache_dir):
+    code_dir = staging.stage(archive, cache_dir=cache_dir)
+
+    assert os.path.isfile(os.path.join(code_dir, SCRIPT))
+    assert code_dir == os.path.join(cache_dir, staging._sha256(archive), 'code')
+
+
+def test_stage_reuses_staged_archive(archive, cache_dir):
+    first_code_dir, first_staged = staging._stage(archive, None, cache_dir)
+    second_code_dir, second_staged = staging._stage('file://' + archive, None, cache_dir)
+    third_code_dir, third_staged = staging._stage(archive, None, cache_dir)
+
+    assert first_code_dir == second_code_dir == third_code_dir
+    # a different URL of the same archive is fetched to compute its digest, but not extracted again
+    assert [first_staged, second_staged, third_staged] == [True, False, False]
+    assert sorted(os.listdir(cache_dir)) == sorted([staging._sha256(archive), staging._LOCK_FILE,
+                                                    staging._INDEX_FILE])
+
+
+def test_stage_once_per_host_with_several_processes(archive, cache_dir):
+    pool = multiprocessing.Pool(4)
+    try:
+        results = pool.map(_stage_in_process, [(archive, cache_dir)] * 8)
+    finally:
+        pool.close()
+        pool.join()
+
+    assert len(set(code_dir for code_dir, _ in results)) == 1
+    assert sum(staged for _, staged in results) == 1
+
+
+def test_stage_builds_and_installs_requirement_wheels(archive, cache_dir):
+    with patch('subprocess.check_call') as mock_check_call:
+        code_dir = staging.stage(archive, 'requirements.txt', cache_dir)
+
+    requirements = os.path.join(code_dir, 'requirements.txt')
+    wheel_dir = os.path.join(os.path.dirname(code_dir), 'wheels')
+    assert mock_check_call.call_args_list[0][0][0] == [sys.executable, '-m', 'pip', 'wheel', '-r', requirements,
+                                                       '-w', wheel_dir]
+    assert mock_check_call.call_args_list[1][0][0] == [sys.executable, '-m', 'pip', 'install', '--no-index',
+                                                       '--find-links', wheel_dir, '-r', requirements]
+
+
+def test_stage_downloads_from_s3(cache_dir, archive):
+    def download(url, path):
+        with open(archive, 'rb') as source, open(path, 'wb') as target:
+            target.write(source.read())
+
+    with patch('container_support.download_s3_resource', side_effect=download) as mock_download:
+        code_dir = staging.stage('s3://bucket/sourcedir.tar.gz', cache_dir=cache_dir)
+
+    assert mock_download.call_args[0][0] == 's3://bucket/sourcedir.tar.gz'
+    assert os.path.isfile(os.path.join(code_dir, SCRIPT))
+
+
+def test_import_user_module(archive, cache_dir):
+    env = MagicMock()
+    env.user_script_archive = archive
+    env.user_script_name = SCRIPT
+    env.user_requirements_file = None
+
+    with patch.object(sys, 'path', list(sys.path)):
+        user_module = staging.import_user_module(env, cache_dir)
+
+    assert user_module.train() == 'trained'
@@ -0,0 +1,135 @@
+import json
+import os
+import shutil
+import tempfile
+
+import pytest
+from mock import MagicMock, patch
+
+from chainer_framework.straggler import StragglerMonitor, TIMELINE_FILE_NAME, _find_stragglers
+
+
+@pytest.fixture()
+def out_dir():
+    d = tempfile.mkdtemp()
+    yield d
+    shutil.rmtree(d)
+
+
+@pytest.fixture()
+def comm():
+    comm = MagicMock()
+    comm.rank = 0
+    comm.allreduce_grad = MagicMock()
+    return comm
+
+
+def _record(rank, host, step_time, comm_time):
+    return {'rank': rank, 'host': host, 'step_time': step_time, 'comm_time': comm_time}
+
+
+def _trainer(iteration, out):
+    trainer = MagicMock()
+    trainer.updater.iteration = iteration
+    trainer.out = out
+    return trainer
+
+
+def test_find_stragglers_flags_slow_compute():
+    records = [_record(0, 'algo-1', 1.0, 0.5),
+               _record(1, 'algo-1', 1.0, 0.5),
+               _record(2, 'algo-2', 1.0, 0.0),
+               _record(3, 'algo-2', 1.0, 0.5)]
+
+    assert _find_stragglers(records, factor=1.5) == [2]
+
+
+def test_find_stragglers_does_not_flag_ranks_waiting_in_allreduce():
+    records = [_record(0, 'algo-1', 2.0, 0.5),
+               _record(1, 'algo-1', 2.0, 0.5),
+               _record(2, 'algo-2', 2.0, 1.5)]
+
+    assert _find_stragglers(records, factor=1.5) == []
+
+
+def test_find_stragglers_with_two_ranks_flags_only_the_slow_rank():
+    # the healthy rank 0 spends most of the step waiting in the allreduce for rank 1
+    records = [_record(0, 'algo-1', 3.0, 2.0),
+               _record(1, 'algo-2', 3.0, 0.1)]
+
+    assert _find_stragglers(records, factor=1.5) == [1]
+
+
+def test_find_stragglers_ignores_zero_medians():
+    records = [_record(0, 'algo-1', 1.0, 0.0),
+               _record(1, 'algo-1', 1.0, 0.0),
+               _record(2, 'algo-2', 1.0, 0.01)]
+
+    assert _find_stragglers(records, factor=1.5) == []
+
+
+def test_monitor_times_allreduce_grad(comm):
+    allreduce_grad = comm.allreduce_grad
+    monitor = StragglerMonitor(comm)
+
+    comm.allreduce_grad('model')
+
+    allreduce_grad.assert_called_once_with('model')
+    assert monitor._comm_time > 0
+
+
+def test_monitor_gathers_every_interval(comm, out_dir):
+    comm.mpi_comm.gather.return_value = [_record(0, 'algo-1', 1.0, 0.5)]
+    monitor = StragglerMonitor(comm, interval=2)
+
+    for iteration in range(1, 5):
+        monitor(_trainer(iteration, out_dir))
+
+    assert comm.mpi_comm.gather.call_count == 2
+    with open(os.path.join(out_dir, TIMELINE_FILE_NAME)) as f:
+        entries = [json.loads(line) for line in f]
+    assert [entry['iteration'] for entry in entries] == [2, 4]
+    assert entries[0]['hosts']['algo-1'][0]['rank'] == 0
+
+
+def test_monitor_does_not_write_timeline_on_other_ranks(comm, out_dir):
+    comm.rank = 1
+    comm.mpi_comm.gather.return_value = None
+    monitor = StragglerMonitor(comm, interval=1)
+
+    monitor(_trainer(1, out_dir))
+    monitor(_trainer(2, out_dir))
+
+    comm.mpi_comm.gather.assert_called_once()
+    assert not os.path.exists(os.path.join(out_dir, TIMELINE_FILE_NAME))
+
+
+def test_monitor_warns_after_patience(comm, out_dir):
+    comm.mpi_comm.gather.return_value = [_record(0, 'algo-1', 1.0, 0.5),
+                                         _record(1, 'algo-1', 1.0, 0.5),
+                                         _record(2, 'algo-2', 1.0, 0.0)]
+    monitor = StragglerMonitor(comm, interval=1, patience=2, out=out_dir)
+
+    with patch('chainer_framework.straggler.logger') as mock_logger:
+        for iteration in range(1, 4):
+            monitor(_trainer(iteration, None))
+
+        assert mock_logger.warning.call_count == 1
+        assert 'algo-2' in mock_logger.warning.call_args[0][0]
+
+
+def test_monitor_warns_once_and_logs_recovery(comm, out_dir):
+    slow = [_record(0, 'algo-1', 1.0, 0.5), _record(1, 'algo-1', 1.0, 0.5), _record(2, 'algo-2', 1.0, 0.0)]
+    recovered = [_record(0, 'algo-1', 1.0, 0.0), _record(1, 'algo-1', 1.0, 0.0), _record(2, 'algo-2', 1.0, 0.0)]
+    comm.mpi_comm.gather.side_effect = [slow] * 4 + [recovered]
+    monitor = StragglerMonitor(comm, interval=1, patience=2, out=out_dir)
+
+    with patch('chainer_framework.straggler.logger') as mock_logger:
+        for iteration in range(1, 7):
+            monitor(_trainer(iteration, None))
+
+        assert mock_logger.warning.call_count == 1
+        assert mock_logger.info.call_count == 1
+        assert 'rank 2 on host algo-2 is no longer' in mock_logger.info.call_args[0][0]
+    with open(os.path.join(out_dir, TIMELINE_FILE_NAME)) as f:
+        assert [json.loads(line)['stragglers'] for line in f] == [[], [2], [2], [2], []]
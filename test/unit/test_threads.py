@@ -0,0 +1,141 @@
+import json
+import os
+
+import pytest
+from mock import call, patch
+
+from chainer_framework import threads
+
+
+@pytest.fixture(autouse=True)
+def cgroup(tmpdir):
+    with patch.object(threads, '_CGROUP_V2_CPU_MAX', str(tmpdir.join('cpu.max'))), \
+            patch.object(threads, '_CGROUP_V1_CPU_QUOTA', str(tmpdir.join('cpu.cfs_quota_us'))), \
+            patch.object(threads, '_CGROUP_V1_CPU_PERIOD', str(tmpdir.join('cpu.cfs_period_us'))), \
+            patch.object(threads, '_SLOT_LOCK_DIR', str(tmpdir.join('slots'))), \
+            patch.object(threads, '_pinned_pid', None), \
+            patch.object(threads, '_slot_lock', None):
+        yield tmpdir
+
+
+def test_cpu_quota_without_cgroup_limits():
+    assert threads.cpu_quota() is None
+
+
+def test_cpu_quota_cgroup_v2(cgroup):
+    cgroup.join('cpu.max').write('250000 100000\n')
+    assert threads.cpu_quota() == 2.5
+
+    cgroup.join('cpu.max').write('max 100000\n')
+    assert threads.cpu_quota() is None
+
+
+def test_cpu_quota_cgroup_v1(cgroup):
+    cgroup.join('cpu.cfs_quota_us').write('400000\n')
+    cgroup.join('cpu.cfs_period_us').write('100000\n')
+    assert threads.cpu_quota() == 4.0
+
+    cgroup.join('cpu.cfs_quota_us').write('-1\n')
+    assert threads.cpu_quota() is None
+
+
+def test_plan_splits_cpus():
+    layout = threads.plan(4, cpus=range(16), quota=None)
+
+    assert layout.threads == 4
+    assert layout.budget == 16
+    assert layout.cpu_sets == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11], [12, 13, 14, 15]]
+
+
+def test_plan_is_limited_by_quota():
+    layout = threads.plan(2, cpus=range(16), quota=3.5)
+
+    assert layout.budget == 4
+    assert layout.threads == 2
+    assert layout.cpu_sets == [list(range(8)), list(range(8, 16))]
+
+
+def test_plan_with_more_processes_than_cpus():
+    layout = threads.plan(3, cpus=[0, 1], quota=None)
+
+    assert layout.threads == 1
+    assert layout.cpu_sets == [[0], [1], [0]]
+
+
+def test_plan_with_threads():
+    assert threads.plan(4, threads='8', cpus=range(16), quota=None).threads == 8
+
+
+def test_configure_keeps_thread_counts_already_set():
+    with patch.dict('os.environ', {'OMP_NUM_THREADS': '3'}, clear=True):
+        threads.configure(threads.plan(2, cpus=range(8), quota=None))
+
+        assert os.environ['OMP_NUM_THREADS'] == '3'
+        assert os.environ['OPENBLAS_NUM_THREADS'] == '4'
+        assert os.environ['MKL_NUM_THREADS'] == '4'
+
+
+@pytest.mark.parametrize('command, threads_per_process', [('serve', '2'), ('train', '8')])
+def test_configure_entry_point(command, threads_per_process):
+    with patch.dict('os.environ', {'SAGEMAKER_MODEL_SERVER_WORKERS': '4'}, clear=True), \
+            patch('chainer_framework.threads.available_cpus', return_value=list(range(8))):
+        threads.configure_entry_point(command)
+
+        assert os.environ['OPENBLAS_NUM_THREADS'] == threads_per_process
+
+
+def test_describe():
+    layout = threads.plan(2, cpus=range(4), quota=None)
+
+    assert json.loads(threads.describe(layout)) == {'processes': 2, 'threads': 2, 'budget': 4,
+                                                    'cpu_sets': [[0, 1], [2, 3]], 'quota': None}
+    assert json.loads(threads.describe())['pid'] == os.getpid()
+
+
+def test_pin_sets_the_affinity_of_all_threads(tmpdir):
+    tmpdir.join('tasks', '100').ensure()
+    tmpdir.join('tasks', '101').ensure()
+
+    with patch.object(threads, '_TASKS_DIR', str(tmpdir.join('tasks'))), \
+            patch('os.sched_setaffinity', create=True) as sched_setaffinity:
+        threads.pin([2, 3])
+
+    assert sorted(sched_setaffinity.call_args_list) == [call(100, [2, 3]), call(101, [2, 3])]
+
+
+def test_claim_slot():
+    assert threads.claim_slot(2) == 0
+    first_lock = threads._slot_lock
+
+    assert threads.claim_slot(2) == 1
+    assert threads.claim_slot(2) is None
+
+    first_lock.close()
+    assert threads.claim_slot(2) == 0
+
+
+def test_pin_serving_worker_once():
+    with patch.dict('os.environ', {threads.CPU_AFFINITY_ENV: 'true', 'SAGEMAKER_MODEL_SERVER_WORKERS': '2'}), \
+            patch('chainer_framework.threads.available_cpus', return_value=[0, 1, 2, 3]), \
+            patch('chainer_framework.threads.pin') as pin:
+        threads.pinned(lambda x: x * 2)(3)
+        assert threads.pinned(lambda x: x * 2)(4) == 8
+
+    pin.assert_called_once_with([0, 1])
+
+
+def test_pin_serving_worker_without_affinity():
+    with patch('chainer_framework.threads.pin') as pin:
+        threads.pin_serving_worker()
+
+    assert not pin.called
+
+
+def test_pin_mpi_process():
+    with patch.dict('os.environ', {threads.CPU_AFFINITY_ENV: 'true', 'OMPI_COMM_WORLD_LOCAL_RANK': '1',
+                                   'OMPI_COMM_WORLD_LOCAL_SIZE': '2'}), \
+            patch('chainer_framework.threads.available_cpus', return_value=[0, 1, 2, 3]), \
+            patch('chainer_framework.threads.pin') as pin:
+        threads.pin_mpi_process()
+
+    pin.assert_called_once_with([2, 3])
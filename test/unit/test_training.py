@@ -7,28 +7,35 @@ from mock import MagicMock, patch, call
 
 import chainer
 import chainer.links as L
+import numpy as np
 from chainer import serializers
 
 from chainer_framework.training import _CHANGE_HOSTNAME_LIBRARY, _MPI_IS_RUNNING, _MPI_IS_FINISHED, \
     MODEL_FILE_NAME, train, _change_hostname, _get_master_host_name, _run_training, \
     _run_mpi_on_all_nodes, _get_mpi_command, _start_ssh_daemon, _wait_for_training_to_finish, _default_save, \
-    _wait_for_worker_nodes_to_start_sshd, _can_connect, _wait_for_mpi_to_start_running, _wait_until_mpi_stops_running
+    _wait_for_worker_nodes_to_start_sshd, _can_connect, _wait_for_mpi_to_start_running, _wait_until_mpi_stops_running, \
+    _MPI_SCRIPT, _COLLECTIVES_BENCHMARK_MODULE, _get_mpi_transport_options, _HOSTNAME_ENV, _get_bootstrap_pipeline, \
+    _stage_user_module, _prefetch_channel_data, _MPI_HOSTFILE, _MPI_LAUNCH_TIME_ENV, _is_large_cluster_launch, \
+    _write_hostfile, _write_known_hosts, _log_launch_latency
 from chainer_framework.timeout import TimeoutError
 
 
 @pytest.fixture()
-def master_node_distributed_training_env():
+def master_node_distributed_training_env(tmpdir):
     env = MagicMock()
+    env.output_data_dir = str(tmpdir)
     env.current_host = 'algo-1'
     env.hosts = ['algo-1', 'algo-2']
     env.hyperparameters = {}
     env.network_interface_name = "ethmock"
+    env.available_gpus = 0
     return env
 
 
 @pytest.fixture()
-def worker_node_distributed_training_env():
+def worker_node_distributed_training_env(tmpdir):
     env = MagicMock()
+    env.output_data_dir = str(tmpdir)
     env.current_host = 'algo-2'
     env.hosts = ['algo-1', 'algo-2']
     env.hyperparameters = {}
@@ -36,8 +43,9 @@ def worker_node_distributed_training_env():
 
 
 @pytest.fixture()
-def single_machine_training_env():
+def single_machine_training_env(tmpdir):
     env = MagicMock()
+    env.output_data_dir = str(tmpdir)
     env.current_host = 'algo-1'
     env.hosts = ['algo-1']
     env.hyperparameters = {}
@@ -112,6 +120,51 @@ def test_default_save(single_machine_training_env):
     serializers.load_npz(os.path.join(model_path), loaded_model)
 
 
+def test_default_save_mmap_model(single_machine_training_env):
+    single_machine_training_env.hyperparameters['save_mmap_model'] = True
+    model = DummyModel()
+
+    with patch('chainer_framework.artifacts.save') as mock_save:
+        _default_save(single_machine_training_env, model)
+
+        assert os.path.exists(os.path.join(single_machine_training_env.model_dir, MODEL_FILE_NAME))
+        mock_save.assert_called_once_with(model, single_machine_training_env.model_dir, None)
+
+
+def test_default_save_float16(single_machine_training_env):
+    single_machine_training_env.hyperparameters['model_dtype'] = 'float16'
+    model = L.Linear(3, 2)
+
+    _default_save(single_machine_training_env, model)
+
+    with np.load(os.path.join(single_machine_training_env.model_dir, MODEL_FILE_NAME)) as saved:
+        assert saved['W'].dtype == np.float16
+        assert saved['b'].dtype == np.float16
+    loaded_model = L.Linear(3, 2)
+    serializers.load_npz(os.path.join(single_machine_training_env.model_dir, MODEL_FILE_NAME), loaded_model)
+    assert loaded_model.W.array.dtype == np.float32
+    np.testing.assert_allclose(loaded_model.W.array, model.W.array, rtol=1e-3)
+
+
+def test_default_save_unsupported_model_dtype(single_machine_training_env):
+    single_machine_training_env.hyperparameters['model_dtype'] = 'int4'
+
+    with patch('chainer_framework.artifacts.save_npz') as mock_save_npz:
+        _default_save(single_machine_training_env, DummyModel())
+
+        assert mock_save_npz.call_args[0][2] is None
+
+
+def test_train_rejects_unsupported_model_dtype_before_training(single_machine_training_env, user_module):
+    single_machine_training_env.hyperparameters['model_dtype'] = 'int4'
+
+    with patch('chainer_framework.training._run_training') as mock_run_training:
+        with pytest.raises(ValueError):
+            train(user_module, single_machine_training_env)
+
+        mock_run_training.assert_not_called()
+
+
 def test_warn_when_no_model_is_saved(single_machine_training_env, user_module, training_state):
     def user_module_train():
         training_state.trained = True
@@ -155,51 +208,191 @@ def test_distributed_training_dont_save_model_on_worker_nodes(worker_node_distri
 def test_distributed_training_from_master_node(master_node_distributed_training_env, user_module):
     with patch('chainer_framework.training._change_hostname') as mock_change_hostname, \
          patch('chainer_framework.training._wait_for_worker_nodes_to_start_sshd') as mock_wait_for_sshd, \
+         patch('chainer_framework.training._stage_user_module') as mock_stage_user_module, \
          patch ('chainer_framework.training._run_mpi_on_all_nodes') as mock_run_mpi_on_all_nodes:
 
         train(user_module, master_node_distributed_training_env)
 
+        mock_stage_user_module.assert_called_once_with(master_node_distributed_training_env)
+
         mock_change_hostname.assert_called_once_with(master_node_distributed_training_env.current_host)
         mock_wait_for_sshd.assert_called_once_with([host for host in master_node_distributed_training_env.hosts
                                                     if host != master_node_distributed_training_env.current_host])
-        mock_run_mpi_on_all_nodes.assert_called_once_with(master_node_distributed_training_env)
+        mock_run_mpi_on_all_nodes.assert_called_once_with(master_node_distributed_training_env, None)
 
 
 def test_distributed_training_from_master_node(master_node_distributed_training_env, user_module):
     with patch('chainer_framework.training._change_hostname') as mock_change_hostname, \
          patch('chainer_framework.training._wait_for_worker_nodes_to_start_sshd') as mock_wait_for_sshd, \
+         patch('chainer_framework.training._stage_user_module') as mock_stage_user_module, \
          patch ('chainer_framework.training._run_mpi_on_all_nodes') as mock_run_mpi_on_all_nodes:
 
         train(user_module, master_node_distributed_training_env)
 
+        mock_stage_user_module.assert_called_once_with(master_node_distributed_training_env)
+
         mock_change_hostname.assert_called_once_with(master_node_distributed_training_env.current_host)
         mock_wait_for_sshd.assert_called_once_with([host for host in master_node_distributed_training_env.hosts
                                                     if host != master_node_distributed_training_env.current_host])
-        mock_run_mpi_on_all_nodes.assert_called_once_with(master_node_distributed_training_env)
+        mock_run_mpi_on_all_nodes.assert_called_once_with(master_node_distributed_training_env, None)
+
+
+def test_train_writes_lifecycle_trace(single_machine_training_env, user_module):
+    with patch('chainer_framework.training._run_training'), \
+            patch('chainer_framework.lifecycle.write_trace') as mock_write_trace:
+        train(user_module, single_machine_training_env)
+
+        mock_write_trace.assert_called_once_with(single_machine_training_env.output_data_dir, 'algo-1', ['algo-1'])
+
+
+def test_benchmark_collectives_from_master_node(single_machine_training_env, user_module):
+    single_machine_training_env.hyperparameters['benchmark_collectives'] = True
+    with patch('chainer_framework.training._change_hostname'), \
+         patch('chainer_framework.training._wait_for_worker_nodes_to_start_sshd'), \
+         patch('chainer_framework.training._stage_user_module'), \
+         patch('chainer_framework.training._run_mpi_on_all_nodes') as mock_run_mpi_on_all_nodes:
+
+        train(user_module, single_machine_training_env)
+
+        mock_run_mpi_on_all_nodes.assert_called_once_with(single_machine_training_env, _COLLECTIVES_BENCHMARK_MODULE)
+        user_module.train.assert_not_called()
 
 
 def test_distributed_training_from_worker_node(worker_node_distributed_training_env, user_module):
     with patch('chainer_framework.training._change_hostname') as mock_change_hostname, \
          patch('chainer_framework.training._start_ssh_daemon') as mock_start_ssh_daemon, \
+         patch('chainer_framework.training._stage_user_module') as mock_stage_user_module, \
          patch('chainer_framework.training._wait_for_training_to_finish') as mock_wait_for_training_to_finish:
 
         train(user_module, worker_node_distributed_training_env)
 
+        mock_stage_user_module.assert_called_once_with(worker_node_distributed_training_env)
+
         mock_change_hostname.assert_called_once_with(worker_node_distributed_training_env.current_host)
         mock_start_ssh_daemon.assert_called_once()
         mock_wait_for_training_to_finish.assert_called_once_with(worker_node_distributed_training_env)
 
 
-def test_change_hostname(single_machine_training_env):
-    with patch('os.system') as mock_system:
+def test_change_hostname(single_machine_training_env, tmpdir):
+    ssh_environment_file = str(tmpdir.join('environment'))
+    with patch('chainer_framework.training._SSH_ENVIRONMENT_FILE', ssh_environment_file), \
+            patch.dict('os.environ'):
         _change_hostname(single_machine_training_env.current_host)
-        mock_system.assert_called_with("change-hostname.sh {}".format(single_machine_training_env.current_host))
+
+        assert os.environ[_HOSTNAME_ENV] == single_machine_training_env.current_host
+        with open(ssh_environment_file) as f:
+            assert f.read() == "{}={}\n".format(_HOSTNAME_ENV, single_machine_training_env.current_host)
+
+
+def test_bootstrap_pipeline_prefetches_channel_data(worker_node_distributed_training_env):
+    worker_node_distributed_training_env.hyperparameters['prefetch_channel_data'] = True
+    with patch('chainer_framework.training._change_hostname'), \
+         patch('chainer_framework.training._start_ssh_daemon'), \
+         patch('chainer_framework.training._stage_user_module'), \
+         patch('chainer_framework.training._prefetch_channel_data') as mock_prefetch_channel_data:
+
+        timings = _get_bootstrap_pipeline(worker_node_distributed_training_env, is_master=False).run()
+
+        mock_prefetch_channel_data.assert_called_once_with(worker_node_distributed_training_env)
+        assert sorted(timings) == ['change_hostname', 'prefetch_channel_data', 'stage_user_module', 'start_sshd']
+
+
+def test_stage_user_module(single_machine_training_env):
+    with patch('chainer_framework.staging.stage') as mock_stage, patch('compileall.compile_dir') as mock_compile_dir:
+        _stage_user_module(single_machine_training_env)
+
+        mock_stage.assert_called_once_with(single_machine_training_env.user_script_archive,
+                                           single_machine_training_env.user_requirements_file)
+        mock_compile_dir.assert_called_once_with(mock_stage.return_value, quiet=1)
+
+
+def test_prefetch_channel_data(single_machine_training_env, tmpdir):
+    tmpdir.join('train.csv').write('1,2,3')
+    single_machine_training_env.channel_dirs = {'train': str(tmpdir)}
+
+    with patch('chainer_framework.training.open', create=True) as mock_open:
+        mock_open.return_value.__enter__.return_value.read.side_effect = ['1,2,3', '']
+
+        _prefetch_channel_data(single_machine_training_env)
+
+        mock_open.assert_called_once_with(str(tmpdir.join('train.csv')), 'rb')
 
 
 def test_run_mpi_on_all_nodes(master_node_distributed_training_env):
-    with patch('subprocess.check_call') as mock_check_call:
+    with patch('subprocess.check_call') as mock_check_call, patch.dict('os.environ'):
         _run_mpi_on_all_nodes(master_node_distributed_training_env)
         mock_check_call.assert_called_with(shlex.split(_get_mpi_command(master_node_distributed_training_env)))
+        assert _MPI_LAUNCH_TIME_ENV in os.environ
+
+
+def test_run_mpi_on_all_nodes_writes_hostfile_for_large_clusters(master_node_distributed_training_env):
+    master_node_distributed_training_env.hyperparameters['mpi_launch_mode'] = 'large_cluster'
+    with patch('subprocess.check_call'), patch.dict('os.environ'), \
+            patch('chainer_framework.training._write_hostfile') as mock_write_hostfile:
+        _run_mpi_on_all_nodes(master_node_distributed_training_env)
+
+        mock_write_hostfile.assert_called_once_with(['algo-1', 'algo-2'], 1, _MPI_HOSTFILE)
+
+
+def test_is_large_cluster_launch(master_node_distributed_training_env):
+    assert not _is_large_cluster_launch(master_node_distributed_training_env)
+
+    master_node_distributed_training_env.hosts = ['algo-{}'.format(i) for i in range(1, 33)]
+    assert _is_large_cluster_launch(master_node_distributed_training_env)
+
+    master_node_distributed_training_env.hyperparameters['mpi_launch_mode'] = 'default'
+    assert not _is_large_cluster_launch(master_node_distributed_training_env)
+
+    master_node_distributed_training_env.hyperparameters['mpi_launch_mode'] = 'unknown'
+    with pytest.raises(ValueError):
+        _is_large_cluster_launch(master_node_distributed_training_env)
+
+
+def test_write_hostfile(tmpdir):
+    hostfile = str(tmpdir.join('hostfile'))
+
+    _write_hostfile(['algo-1', 'algo-2'], 8, hostfile)
+
+    with open(hostfile) as f:
+        assert f.read() == "algo-1 slots=8\nalgo-2 slots=8\n"
+
+
+def test_write_known_hosts(tmpdir):
+    tmpdir.join('ssh_host_rsa_key.pub').write('ssh-rsa AAAArsa root@build\n')
+    tmpdir.join('ssh_host_ed25519_key.pub').write('ssh-ed25519 AAAAed25519 root@build\n')
+    known_hosts = str(tmpdir.join('known_hosts'))
+
+    with patch('chainer_framework.training._SSH_HOST_KEY_FILES', str(tmpdir.join('ssh_host_*_key.pub'))), \
+            patch('chainer_framework.training._SSH_KNOWN_HOSTS_FILE', known_hosts):
+        _write_known_hosts(['algo-1', 'algo-2'])
+
+    with open(known_hosts) as f:
+        assert f.read() == "algo-1,algo-2 ssh-ed25519 AAAAed25519\nalgo-1,algo-2 ssh-rsa AAAArsa\n"
+
+
+def test_bootstrap_pipeline_writes_known_hosts_for_large_clusters(master_node_distributed_training_env):
+    master_node_distributed_training_env.hyperparameters['mpi_launch_mode'] = 'large_cluster'
+    with patch('chainer_framework.training._change_hostname'), \
+         patch('chainer_framework.training._wait_for_worker_nodes_to_start_sshd'), \
+         patch('chainer_framework.training._stage_user_module'), \
+         patch('chainer_framework.training._write_known_hosts') as mock_write_known_hosts:
+
+        timings = _get_bootstrap_pipeline(master_node_distributed_training_env, is_master=True).run()
+
+        mock_write_known_hosts.assert_called_once_with(master_node_distributed_training_env.hosts)
+        assert 'write_known_hosts' in timings
+
+
+def test_log_launch_latency():
+    mock_mpi = MagicMock()
+    mock_mpi.MPI.COMM_WORLD.gather.return_value = [3.0, 1.0, 2.0]
+
+    with patch.dict('sys.modules', {'mpi4py': mock_mpi}), patch.dict('os.environ', {_MPI_LAUNCH_TIME_ENV: '100.0'}), \
+            patch('time.time', return_value=101.5), patch('chainer_framework.training.logger') as mock_logger:
+        _log_launch_latency()
+
+        mock_mpi.MPI.COMM_WORLD.gather.assert_called_once_with(1.5, root=0)
+        assert "first 1.00 seconds, median 2.00 seconds, last 3.00 seconds" in mock_logger.info.call_args[0][0]
 
 
 def test_get_mpi_command(master_node_distributed_training_env):
@@ -219,6 +412,71 @@ def test_get_mpi_command(master_node_distributed_training_env):
     assert "-np 2" in mpi_command
 
 
+def test_get_mpi_command_budgets_threads(master_node_distributed_training_env):
+    master_node_distributed_training_env.hyperparameters['process_slots_per_host'] = 4
+
+    with patch('chainer_framework.threads.available_cpus', return_value=list(range(16))), \
+            patch('chainer_framework.threads.cpu_quota', return_value=None):
+        mpi_command = _get_mpi_command(master_node_distributed_training_env)
+
+    assert "-x MKL_NUM_THREADS=4 -x OMP_NUM_THREADS=4 -x OPENBLAS_NUM_THREADS=4 --bind-to none" in mpi_command
+    assert "SAGEMAKER_CHAINER_CPU_AFFINITY" not in mpi_command
+
+
+def test_get_mpi_command_with_threads_per_process_and_cpu_affinity(master_node_distributed_training_env):
+    master_node_distributed_training_env.hyperparameters.update({'threads_per_process': 2, 'cpu_affinity': True})
+
+    mpi_command = _get_mpi_command(master_node_distributed_training_env)
+
+    assert "-x OMP_NUM_THREADS=2" in mpi_command
+    assert "-x SAGEMAKER_CHAINER_CPU_AFFINITY=true" in mpi_command
+
+
+def test_get_mpi_command_passes_launch_time(master_node_distributed_training_env):
+    mpi_command = _get_mpi_command(master_node_distributed_training_env)
+
+    assert "-x {}".format(_MPI_LAUNCH_TIME_ENV) in mpi_command
+    assert "plm_rsh_no_tree_spawn" not in mpi_command
+
+
+def test_get_mpi_command_for_large_clusters(master_node_distributed_training_env):
+    master_node_distributed_training_env.hosts = ['algo-{}'.format(i) for i in range(1, 101)]
+    master_node_distributed_training_env.hyperparameters['mpi_ssh_concurrency'] = 64
+
+    mpi_command = _get_mpi_command(master_node_distributed_training_env)
+
+    assert "--hostfile {}".format(_MPI_HOSTFILE) in mpi_command
+    assert "algo-100" not in mpi_command
+    assert "-mca plm_rsh_num_concurrent 64" in mpi_command
+    assert "plm_rsh_no_tree_spawn" not in mpi_command
+    assert "routed" not in mpi_command
+    assert "-np 100" in mpi_command
+
+
+def test_get_mpi_command_for_large_clusters_with_routed_radix(master_node_distributed_training_env):
+    master_node_distributed_training_env.hyperparameters['mpi_launch_mode'] = 'large_cluster'
+    master_node_distributed_training_env.hyperparameters['mpi_routed_radix'] = 16
+
+    mpi_command = _get_mpi_command(master_node_distributed_training_env)
+
+    assert "-mca routed_radix 16" in mpi_command
+    assert "plm_rsh_num_concurrent" not in mpi_command
+
+
+def test_get_mpi_command_with_rsh_agent(master_node_distributed_training_env):
+    master_node_distributed_training_env.hyperparameters['mpi_rsh_agent'] = '/agent.sh'
+
+    mpi_command = _get_mpi_command(master_node_distributed_training_env)
+
+    assert "-mca plm_rsh_agent /agent.sh" in mpi_command
+
+
+def test_get_mpi_command_with_module(master_node_distributed_training_env):
+    mpi_command = _get_mpi_command(master_node_distributed_training_env, _COLLECTIVES_BENCHMARK_MODULE)
+
+    assert mpi_command.endswith("{} {}".format(_MPI_SCRIPT, _COLLECTIVES_BENCHMARK_MODULE))
+
+
 def test_get_mpi_command_with_gpus(master_node_distributed_training_env):
     master_node_distributed_training_env.available_gpus = 4
 
@@ -252,6 +510,65 @@ def test_get_mpi_command_with_additional_mpi_options(master_node_distributed_tra
     assert another_mpi_option in mpi_command
 
 
+def test_get_mpi_command_with_one_process_slot_per_host(master_node_distributed_training_env):
+    mpi_command = _get_mpi_command(master_node_distributed_training_env)
+
+    assert "-mca btl ^openib" in mpi_command
+    assert "vader" not in mpi_command
+    assert "-mca btl_tcp_sndbuf 0" in mpi_command
+    assert "-mca btl_tcp_rcvbuf 0" in mpi_command
+    assert "eager_limit" not in mpi_command
+
+
+def test_get_mpi_command_uses_shared_memory_with_several_process_slots(master_node_distributed_training_env):
+    master_node_distributed_training_env.hyperparameters['process_slots_per_host'] = 4
+
+    mpi_command = _get_mpi_command(master_node_distributed_training_env)
+
+    assert "-mca btl self,vader,tcp" in mpi_command
+    assert "-mca btl_vader_single_copy_mechanism none" in mpi_command
+
+
+def test_get_mpi_command_with_network_interfaces(master_node_distributed_training_env):
+    master_node_distributed_training_env.hyperparameters['mpi_network_interfaces'] = ['eth0', 'eth1']
+
+    mpi_command = _get_mpi_command(master_node_distributed_training_env)
+
+    assert "-mca btl_tcp_if_include eth0,eth1" in mpi_command
+    assert "-x NCCL_SOCKET_IFNAME=eth0,eth1" in mpi_command
+    assert "-mca oob_tcp_if_include ethmock" in mpi_command
+
+
+def test_get_mpi_transport_options_from_model_size(master_node_distributed_training_env):
+    master_node_distributed_training_env.hyperparameters['mpi_model_size_mb'] = 0.5
+    small_model_options = dict(_get_mpi_transport_options(master_node_distributed_training_env, 1))
+
+    master_node_distributed_training_env.hyperparameters['mpi_model_size_mb'] = 500
+    large_model_options = dict(_get_mpi_transport_options(master_node_distributed_training_env, 1))
+
+    assert small_model_options['btl_tcp_eager_limit'] == 1024 * 1024
+    assert small_model_options['btl_tcp_sndbuf'] < large_model_options['btl_tcp_sndbuf']
+    assert large_model_options['btl_tcp_rcvbuf'] == 4 * 1024 * 1024
+    assert large_model_options['btl_tcp_rndv_eager_limit'] == large_model_options['btl_tcp_eager_limit']
+
+
+def test_get_mpi_transport_options_overrides(master_node_distributed_training_env):
+    master_node_distributed_training_env.hyperparameters.update({'mpi_model_size_mb': 500,
+                                                                 'mpi_btl': 'self,tcp',
+                                                                 'mpi_tcp_sndbuf': 1024,
+                                                                 'mpi_tcp_eager_limit': 2048,
+                                                                 'mpi_tcp_links': 2})
+
+    options = dict(_get_mpi_transport_options(master_node_distributed_training_env, 8))
+
+    assert options['btl'] == 'self,tcp'
+    assert 'btl_vader_single_copy_mechanism' not in options
+    assert options['btl_tcp_sndbuf'] == 1024
+    assert options['btl_tcp_rcvbuf'] == 4 * 1024 * 1024
+    assert options['btl_tcp_eager_limit'] == 2048
+    assert options['btl_tcp_links'] == 2
+
+
 def test_start_ssh_daemon():
     with patch('subprocess.Popen') as mock_popen:
 
@@ -262,12 +579,15 @@ def test_start_ssh_daemon():
 
 def test_wait_for_training_to_finish(worker_node_distributed_training_env):
     with patch('chainer_framework.training._wait_for_mpi_to_start_running') as mock_wait_for_mpi_to_start_running, \
-         patch('chainer_framework.training._wait_until_mpi_stops_running') as mock_wait_until_mpi_stops_running:
+         patch('chainer_framework.training._wait_until_mpi_stops_running') as mock_wait_until_mpi_stops_running, \
+         patch('chainer_framework.lifecycle.save_events') as mock_save_events:
 
         _wait_for_training_to_finish(worker_node_distributed_training_env)
 
         mock_wait_for_mpi_to_start_running.assert_called_once()
         mock_wait_until_mpi_stops_running.assert_called_once()
+        # saved before mpirun starts processes on this host and once they are running
+        assert mock_save_events.call_count == 2
 
 
 def test_wait_for_mpi_to_start_running():
@@ -301,6 +621,17 @@ def test_wait_for_worker_nodes_to_start_sshd(master_node_distributed_training_en
         assert mock_can_connect.call_count == 3
 
 
+def test_wait_for_worker_nodes_to_start_sshd_probes_hosts_concurrently():
+    hosts = ['algo-{}'.format(i) for i in range(2, 6)]
+    with patch('chainer_framework.training._can_connect') as mock_can_connect, patch('time.sleep'):
+        mock_can_connect.side_effect = lambda host, port, s: host != 'algo-3' or mock_can_connect.call_count > 4
+
+        _wait_for_worker_nodes_to_start_sshd(hosts)
+
+        assert hosts == []
+        assert mock_can_connect.call_count == 5
+
+
 def test_wait_for_worker_nodes_to_start_sshd_timeout(master_node_distributed_training_env):
     with patch('chainer_framework.training._can_connect') as mock_can_connect:
         hosts = [host for host in master_node_distributed_training_env.hosts
@@ -0,0 +1,310 @@
+"""Simulates a multi-host training cluster on one Linux machine, without Docker.
+
+:class:`LocalCluster` runs ``chainer_framework.training.train`` for each of the hosts algo-1 ... algo-N in its own
+process group, the way the training entry point of the container runs it, so that the multi-host path (hostname
+change, waiting for sshd, mpirun and the /mpi_is_running and /mpi_is_finished files) runs in seconds. What differs
+from a cluster of containers:
+
+* every host has a directory under the root of the cluster that replaces /opt/ml, and that also holds the files real
+  hosts keep elsewhere: mpi_is_running, mpi_is_finished, mpi_hostfile, the ssh environment and known hosts files,
+  the staging cache and the lifecycle event files.
+* the hostname of a host is faked for the processes mpirun starts on it by the change hostname library of the image,
+  built from docker/<version>/base/changehostname.c with gcc. Without gcc, all hosts have the hostname of the machine,
+  and ChainerMN counts all ranks as ranks of one host.
+* instead of starting sshd, a worker host listens on a free local port, which it writes to ``<root>/sshd/<host>``,
+  and the master host probes that port.
+* instead of ssh, mpirun starts processes with an rsh agent that runs them in the process group of their host, with
+  the environment of their host. :meth:`LocalCluster.kill` kills a process group, like losing a host.
+* every process started by mpirun runs what ``python -m chainer_framework.training`` runs, from the directory of its
+  host. The benchmark_collectives hyperparameter isn't supported.
+
+OpenMPI, mpi4py and ChainerMN must be installed.
+
+Usage::
+
+    with LocalCluster(2, 'test/resources/failure_scenarios', 'failure_script.py', {'node_to_fail': 1}) as cluster:
+        cluster.start()
+        exit_codes = cluster.wait(timeout=120)
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import traceback
+from functools import partial
+from multiprocessing import Process
+
+from container_support import ContainerEnvironment
+from container_support.environment import TrainingEnvironment
+from mock import patch
+
+from chainer_framework import lifecycle, staging, threads, training
+
+logger = logging.getLogger(__name__)
+
+# set by the rsh agent for the processes mpirun starts on a simulated host
+HOST_DIR_ENV = 'SAGEMAKER_LOCAL_CLUSTER_HOST_DIR'
+
+_REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_AGENT = """#!{python}
+# runs the command mpirun starts on a host in the process group and with the environment of that host
+import os
+import sys
+
+host = sys.argv[1]
+host_dir = os.path.join({root!r}, host)
+with open(os.path.join(host_dir, 'pgid')) as f:
+    os.setpgid(0, int(f.read()))
+os.environ['{host_dir_env}'] = host_dir
+os.environ['{hostname_env}'] = host
+os.environ['LD_PRELOAD'] = {change_hostname_library!r}
+# keeps the OpenMPI session files and shared memory segments of the hosts apart, even if they have the same hostname
+os.environ['OMPI_MCA_orte_tmpdir_base'] = host_dir
+os.environ['OMPI_MCA_btl_vader_backing_directory'] = host_dir
+os.execv('/bin/sh', ['/bin/sh', '-c', ' '.join(sys.argv[2:])])
+"""
+
+# the same steps as /mpi_script.sh in the container
+_MPI_SCRIPT = """#!/bin/sh
+touch "${host_dir_env}/mpi_is_running"
+cd {repository_dir} && {python} -m mpi4py -m test.utils.local_cluster --rank "${host_dir_env}"
+EXIT_CODE=$?
+touch "${host_dir_env}/mpi_is_finished"
+exit $EXIT_CODE
+"""
+
+
+class LocalCluster(object):
+    """Runs the hosts of a distributed training job as process groups of this machine.
+
+    Args:
+        num_hosts (int): number of hosts, named algo-1 to algo-<num_hosts>.
+        source_dir (str): directory of the user code, archived as the sagemaker_submit_directory.
+        user_script (str): name of the user script in source_dir.
+        hyperparameters (dict): hyperparameters of the job, in addition to the sagemaker_* ones.
+        channels (dict): names of the input data channels and the directories their data is linked from.
+        root (str): directory to create the directories of the hosts in, a new temporary directory if not given.
+    """
+
+    def __init__(self, num_hosts, source_dir, user_script, hyperparameters=None, channels=None, root=None):
+        self.hosts = ['algo-{}'.format(i) for i in range(1, num_hosts + 1)]
+        self.root = root or tempfile.mkdtemp()
+        self._processes = {}
+
+        os.makedirs(os.path.join(self.root, 'sshd'))
+        archive = os.path.join(self.root, 'sourcedir.tar.gz')
+        with tarfile.open(archive, 'w:gz') as tar:
+            tar.add(source_dir, '.')
+
+        self.change_hostname_library = _build_change_hostname_library(self.root)
+        self.agent = _write_script(os.path.join(self.root, 'agent.py'),
+                                   _AGENT.format(python=sys.executable, root=self.root, host_dir_env=HOST_DIR_ENV,
+                                                 hostname_env=training._HOSTNAME_ENV,
+                                                 change_hostname_library=self.change_hostname_library))
+        _write_script(os.path.join(self.root, 'mpi_script.sh'),
+                      _MPI_SCRIPT.format(python=sys.executable, repository_dir=_REPOSITORY_DIR,
+                                         host_dir_env=HOST_DIR_ENV))
+
+        hyperparameters = dict(hyperparameters or {}, mpi_rsh_agent=self.agent)
+        hyperparameters.update({ContainerEnvironment.SAGEMAKER_REGION_PARAM_NAME: 'us-west-2',
+                                ContainerEnvironment.USER_SCRIPT_NAME_PARAM: user_script,
+                                ContainerEnvironment.USER_SCRIPT_ARCHIVE_PARAM: archive})
+        for host in self.hosts:
+            _create_host_dir(self.host_dir(host), host, self.hosts, hyperparameters, channels or {})
+
+    def host_dir(self, host):
+        """Returns the directory that replaces /opt/ml on a host."""
+        return os.path.join(self.root, host)
+
+    def start(self, hosts=None):
+        """Starts training on the given hosts, all hosts if not given.
+
+        Hosts can be started later, for example to delay the sshd of a worker host.
+        """
+        # the hosts share one machine, so the PMIx shared memory store can't be used
+        os.environ['PMIX_MCA_gds'] = 'hash'
+        for host in hosts or self.hosts:
+            process = Process(target=_run_host, args=(self.root, host, self.change_hostname_library))
+            process.start()
+            self._processes[host] = process
+
+    def wait(self, timeout=None):
+        """Waits until all started hosts exit.
+
+        Returns:
+            dict: the exit code of every started host, None for those still running after the timeout.
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        for process in self._processes.values():
+            process.join(max(deadline - time.time(), 0) if deadline is not None else None)
+        return {host: process.exitcode for host, process in self._processes.items()}
+
+    def kill(self, host):
+        """Kills all processes of a host: its training process, and the processes mpirun started on it."""
+        process = self._processes.get(host)
+        if process is not None and process.exitcode is None:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                # the process group is already gone
+                pass
+            process.join()
+
+    def trace(self):
+        """Returns the lifecycle trace the master host wrote, see :mod:`chainer_framework.lifecycle`."""
+        master = self.hosts[0]
+        output_data_dir = os.path.join(self.host_dir(master), 'output', 'data', master if len(self.hosts) > 1 else '')
+        with open(os.path.join(output_data_dir, lifecycle.TRACE_FILE_NAME)) as f:
+            return json.load(f)
+
+    def close(self):
+        """Kills all hosts and removes the directories of the cluster."""
+        for host in self._processes:
+            self.kill(host)
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+
+def _build_change_hostname_library(root):
+    """Builds the change hostname library like the Dockerfiles do, and returns its path, or '' without gcc."""
+    source = sorted(glob.glob(os.path.join(_REPOSITORY_DIR, 'docker', '*', 'base', 'changehostname.c')))[-1]
+    library = os.path.join(root, 'libchangehostname.so')
+    try:
+        subprocess.check_call(['gcc', '-o', library, '-shared', '-fPIC', '-Wall', source, '-ldl'])
+    except OSError:
+        logger.warning('gcc was not found: all simulated hosts have the hostname of this machine')
+        return ''
+    return library
+
+
+def _write_script(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+    os.chmod(path, 0o755)
+    return path
+
+
+def _write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def _create_host_dir(host_dir, host, hosts, hyperparameters, channels):
+    config_dir = os.path.join(host_dir, 'input', 'config')
+    os.makedirs(config_dir)
+    for directory in [os.path.join('input', 'data'), os.path.join('output', 'data'), 'model']:
+        os.makedirs(os.path.join(host_dir, directory))
+    for channel, channel_dir in channels.items():
+        os.symlink(os.path.abspath(channel_dir), os.path.join(host_dir, 'input', 'data', channel))
+
+    _write_json(os.path.join(config_dir, TrainingEnvironment.RESOURCE_CONFIG_FILE),
+                {'current_host': host, 'hosts': hosts, 'network_interface_name': 'lo'})
+    _write_json(os.path.join(config_dir, TrainingEnvironment.HYPERPARAMETERS_FILE),
+                {name: json.dumps(value) for name, value in hyperparameters.items()})
+    _write_json(os.path.join(config_dir, TrainingEnvironment.INPUT_DATA_CONFIG_FILE),
+                {channel: {} for channel in channels})
+
+
+def _host_dir_patches(host_dir):
+    """Patches the paths of the per-host files that both the training process and the mpirun processes use."""
+    return [patch.object(staging, 'DEFAULT_CACHE_DIR', os.path.join(host_dir, 'staging')),
+            patch.object(lifecycle, 'LAUNCHER_EVENTS_FILE', os.path.join(host_dir, 'lifecycle_launcher.json')),
+            patch.object(lifecycle, 'RANK_EVENTS_FILE', os.path.join(host_dir, 'lifecycle_ranks.json'))]
+
+
+def _run_host(root, host, change_hostname_library):
+    """Runs in the process of a host, like the training entry point of the container."""
+    os.setpgid(0, 0)
+    host_dir = os.path.join(root, host)
+    with open(os.path.join(host_dir, 'pgid.tmp'), 'w') as f:
+        f.write(str(os.getpgid(0)))
+    os.rename(os.path.join(host_dir, 'pgid.tmp'), os.path.join(host_dir, 'pgid'))
+
+    patches = _host_dir_patches(host_dir) + [
+        patch.object(training, '_MPI_SCRIPT', os.path.join(root, 'mpi_script.sh')),
+        patch.object(training, '_MPI_IS_RUNNING', os.path.join(host_dir, 'mpi_is_running')),
+        patch.object(training, '_MPI_IS_FINISHED', os.path.join(host_dir, 'mpi_is_finished')),
+        patch.object(training, '_MPI_HOSTFILE', os.path.join(host_dir, 'mpi_hostfile')),
+        patch.object(training, '_CHANGE_HOSTNAME_LIBRARY', change_hostname_library),
+        patch.object(training, '_SSH_ENVIRONMENT_FILE', os.path.join(host_dir, 'ssh_environment')),
+        patch.object(training, '_SSH_KNOWN_HOSTS_FILE', os.path.join(host_dir, 'known_hosts')),
+        patch.object(training, '_start_ssh_daemon', partial(_start_sshd, root, host)),
+        patch.object(training, '_can_connect_to_sshd', partial(_can_connect_to_sshd, root))]
+    for p in patches:
+        p.start()
+
+    exit_code = 0
+    try:
+        env = TrainingEnvironment(host_dir)
+        training.train(staging.import_user_module(env), env)
+        env.write_success_file()
+    except Exception as e:
+        message = 'uncaught exception during training: {}\n{}\n'.format(e, traceback.format_exc())
+        sys.stderr.write(message)
+        TrainingEnvironment.write_failure_file(message, host_dir)
+        exit_code = 1
+    finally:
+        # like the container, so that threads that are still running don't keep the host alive
+        os._exit(exit_code)
+
+
+def _start_sshd(root, host):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(128)
+
+    def accept():
+        while True:
+            sock.accept()[0].close()
+
+    thread = threading.Thread(target=accept)
+    thread.daemon = True
+    thread.start()
+    with open(os.path.join(root, 'sshd', host), 'w') as f:
+        f.write(str(sock.getsockname()[1]))
+
+
+def _can_connect_to_sshd(root, host):
+    try:
+        with open(os.path.join(root, 'sshd', host)) as f:
+            port = int(f.read())
+    except (IOError, ValueError):
+        # sshd hasn't started, or is writing its port
+        return False
+    return training._can_connect('127.0.0.1', port, socket.socket(socket.AF_INET, socket.SOCK_STREAM))
+
+
+def _rank(host_dir):
+    """Runs in every process started by mpirun, like ``python -m chainer_framework.training``."""
+    for p in _host_dir_patches(host_dir):
+        p.start()
+
+    threads.pin_mpi_process()
+    env = TrainingEnvironment(host_dir)
+    with lifecycle.span('import_user_module'):
+        user_module = staging.import_user_module(env)
+    training._log_launch_latency()
+    training._run_training(env, user_module)
+    lifecycle.gather_mpi_events(env.current_host)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rank', metavar='HOST_DIR', required=True)
+    _rank(parser.parse_args().rank)